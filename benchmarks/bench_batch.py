@@ -0,0 +1,56 @@
+import io
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nesrs.batch
+import nesrs.cartridge
+import nesrs.cpu
+from bench_cpu import ALU_LOOP, INDIRECT_LOOP, TIGHT_LOOP
+
+STEPS = 2000
+
+
+def create_cpu_memory(program):
+    prg_rom = bytearray(0x4000)
+    prg_rom[0:len(program)] = program
+    prg_rom[0x3FFC:0x3FFE] = bytes([0x00, 0xC0])
+    rom = b'NES\x1a' + bytes([1, 1, 0, 0]) + bytes(8) + bytes(prg_rom) + bytes(0x2000)
+    return nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(rom)))
+
+
+def bench(program, machines):
+    # Emulated cycles per second summed over the machines, each starts with different RAM so they drift apart
+    batch = nesrs.batch.BatchCPU(create_cpu_memory(program), machines)
+    batch.turn_on()
+    batch.memory[:, 0:0x800] = (nesrs.batch.np.arange(machines)[:, None] * 7 +
+                                nesrs.batch.np.arange(0x800)[None, :]) & 0xFF
+    start = time.perf_counter()
+    batch.run(STEPS)
+    return batch.cycles.sum() / (time.perf_counter() - start)
+
+
+def bench_cpu(program):
+    cpu = nesrs.cpu.CPU(create_cpu_memory(program))
+    cpu.turn_on()
+    start = time.perf_counter()
+    cycles = 0
+    for _ in range(STEPS * 10):
+        cpu.execute_op()
+        cycles += cpu.op_cycles
+    return cycles / (time.perf_counter() - start)
+
+
+def main():
+    print('%-12s %10s %14s %8s' % ('workload', 'machines', 'MHz (total)', 'vs CPU'))
+    for name, program in (('tight_loop', TIGHT_LOOP), ('alu', ALU_LOOP), ('indirect', INDIRECT_LOOP)):
+        cpu = bench_cpu(program)
+        print('%-12s %10s %14.3f %7.2fx' % (name, 'CPU', cpu / 1e6, 1.0))
+        for machines in (64, 1024, 8192):
+            total = bench(program, machines)
+            print('%-12s %10d %14.3f %7.2fx' % (name, machines, total / 1e6, total / cpu))
+
+
+if __name__ == '__main__':
+    main()
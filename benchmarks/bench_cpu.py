@@ -0,0 +1,231 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nesrs.cartridge
+import nesrs.cpu
+
+CYCLES = 1000000
+REPEAT = 3
+# Slower than the baseline by more than this is a regression
+THRESHOLD = 0.05
+
+NESTEST_ROM = os.path.join(os.path.dirname(__file__), '..', 'tests', 'nestest.nes')
+# Ops of the nestest automation run that nestest.log covers
+NESTEST_OPS = 8991
+
+# C000: LDX #$00
+# C002: LDA $0200,X
+# C005: STA $0300,X
+# C008: INX
+# C009: BNE $C002
+# C00B: JMP $C000
+TIGHT_LOOP = bytes([
+    0xA2, 0x00, 0xBD, 0x00, 0x02, 0x9D, 0x00, 0x03, 0xE8, 0xD0, 0xF7, 0x4C, 0x00, 0xC0,
+])
+
+# C000: CLC
+# C001: LDA #$00
+# C003: ADC #$37
+# C005: SBC #$12
+# C007: ADC $10
+# C009: SBC $11
+# C00B: STA $10
+# C00D: INC $11
+# C00F: JMP $C003
+ALU_LOOP = bytes([
+    0x18, 0xA9, 0x00, 0x69, 0x37, 0xE9, 0x12, 0x65, 0x10, 0xE5, 0x11, 0x85, 0x10, 0xE6, 0x11, 0x4C, 0x03, 0xC0,
+])
+
+# C000: LDA #$00, STA $10, LDA #$02, STA $11
+# C008: LDY #$00
+# C00A: LDA ($10),Y
+# C00C: ADC #$01
+# C00E: STA ($10),Y
+# C010: INY
+# C011: BNE $C00A
+# C013: LDA $11, EOR #$01, STA $11
+# C019: JMP $C008
+INDIRECT_LOOP = bytes([
+    0xA9, 0x00, 0x85, 0x10, 0xA9, 0x02, 0x85, 0x11, 0xA0, 0x00, 0xB1, 0x10, 0x69, 0x01, 0x91, 0x10, 0xC8,
+    0xD0, 0xF7, 0xA5, 0x11, 0x49, 0x01, 0x85, 0x11, 0x4C, 0x08, 0xC0,
+])
+
+# C000: CLI
+# C001: INX
+# C002: JMP $C001
+# C100: PHA, INC $20, PLA, RTI (the NMI and IRQ handler)
+INTERRUPT_LOOP = bytes([0x58, 0xE8, 0x4C, 0x01, 0xC0])
+INTERRUPT_HANDLER = bytes([0x48, 0xE6, 0x20, 0x68, 0x40])
+# CPU cycles between IRQs and between NMIs
+IRQ_PERIOD = 64
+NMI_PERIOD = 1000
+
+
+def create_cpu(program):
+    prg_rom = bytearray(0x4000)
+    prg_rom[0:len(program)] = program
+    prg_rom[0x100:0x100 + len(INTERRUPT_HANDLER)] = INTERRUPT_HANDLER
+    prg_rom[0x3FFA:0x4000] = bytes([0x00, 0xC1, 0x00, 0xC0, 0x00, 0xC1])
+    rom = b'NES\x1a' + bytes([1, 1, 0, 0]) + bytes(8) + bytes(prg_rom) + bytes(0x2000)
+
+    cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(rom))))
+    cpu.turn_on()
+    return cpu
+
+
+def create_nestest_cpu():
+    with open(NESTEST_ROM, 'rb') as rom_file:
+        cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(rom_file)))
+    cpu.turn_on()
+    # The automation mode entry point
+    cpu._s = 0xFD
+    cpu._p = 0x24
+    cpu._pc = 0xC000
+    return cpu
+
+
+def run_program(program):
+    def run(cycles):
+        cpu = create_cpu(program)
+        execute_op = cpu.execute_op
+        total_cycles = 0
+        instructions = 0
+        while total_cycles < cycles:
+            execute_op()
+            total_cycles += cpu.op_cycles
+            instructions += 1
+        return total_cycles, instructions
+
+    return run
+
+
+def run_interrupts(cycles):
+    cpu = create_cpu(INTERRUPT_LOOP)
+    execute_op = cpu.execute_op
+    total_cycles = 0
+    instructions = 0
+    next_irq = IRQ_PERIOD
+    next_nmi = NMI_PERIOD
+    while total_cycles < cycles:
+        execute_op()
+        total_cycles += cpu.op_cycles
+        instructions += 1
+        if total_cycles >= next_irq:
+            cpu.irq()
+            next_irq += IRQ_PERIOD
+        if total_cycles >= next_nmi:
+            cpu.nmi()
+            next_nmi += NMI_PERIOD
+    return total_cycles, instructions
+
+
+def run_nestest(cycles):
+    # Reruns the automation from the start until the cycles are reached
+    total_cycles = 0
+    instructions = 0
+    while total_cycles < cycles:
+        cpu = create_nestest_cpu()
+        execute_op = cpu.execute_op
+        for _ in range(NESTEST_OPS):
+            execute_op()
+            total_cycles += cpu.op_cycles
+        instructions += NESTEST_OPS
+    return total_cycles, instructions
+
+
+WORKLOADS = [
+    ('nestest', run_nestest),
+    ('tight_loop', run_program(TIGHT_LOOP)),
+    ('alu', run_program(ALU_LOOP)),
+    ('indirect_indexed', run_program(INDIRECT_LOOP)),
+    ('interrupts', run_interrupts),
+]
+
+
+def bench(run, cycles, repeat):
+    # Best of repeat runs
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total_cycles, instructions = run(cycles)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed / total_cycles < best[2] / best[0]:
+            best = (total_cycles, instructions, elapsed)
+
+    total_cycles, instructions, elapsed = best
+    return {
+        'cycles': total_cycles,
+        'instructions': instructions,
+        'seconds': elapsed,
+        'mhz': total_cycles / elapsed / 1e6,
+        'instructions_per_second': instructions / elapsed,
+    }
+
+
+def compare(results, baseline, threshold):
+    # Names of the workloads slower than the baseline by more than threshold
+    regressions = []
+    print('%-18s %10s %10s %8s' % ('workload', 'MHz', 'baseline', 'ratio'))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['mhz'] / baseline[name]['mhz']
+        regressed = ratio < 1.0 - threshold
+        if regressed:
+            regressions.append(name)
+        print('%-18s %10.3f %10.3f %7.2fx%s' % (name, result['mhz'], baseline[name]['mhz'], ratio,
+                                                 ' REGRESSION' if regressed else ''))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the CPU core on reproducible workloads')
+    parser.add_argument('workloads', nargs='*', help='all of them by default')
+    parser.add_argument('--cycles', type=int, default=CYCLES)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--json', help='writes the results to this file')
+    parser.add_argument('--baseline', help='compares with the results of an earlier --json run')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    names = [name for name, _ in WORKLOADS]
+    for name in args.workloads:
+        if name not in names:
+            parser.error('unknown workload %s, one of %s' % (name, ', '.join(names)))
+
+    results = {}
+    print('%-18s %10s %16s' % ('workload', 'MHz', 'instructions/s'))
+    for name, run in WORKLOADS:
+        if args.workloads and name not in args.workloads:
+            continue
+        if run is run_nestest and not os.path.exists(NESTEST_ROM):
+            print('%-18s %10s' % (name, 'skipped, no tests/nestest.nes'))
+            continue
+        results[name] = bench(run, args.cycles, args.repeat)
+        print('%-18s %10.3f %16.0f' % (name, results[name]['mhz'], results[name]['instructions_per_second']))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'python': platform.python_version(), 'implementation': platform.python_implementation(),
+                       'machine': platform.machine(), 'cycles': args.cycles, 'results': results},
+                      json_file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as json_file:
+            baseline = json.load(json_file)['results']
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
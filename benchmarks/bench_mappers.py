@@ -0,0 +1,68 @@
+import io
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nesrs.cartridge
+import nesrs.cpu
+
+READS = 100000
+SWITCHES = 10000
+
+
+def create_cpu_memory(mapper):
+    header = bytearray(16)
+    header[0:4] = b'NES\x1a'
+    header[4] = 8  # 128Kb PRG ROM
+    header[5] = 4  # 32Kb CHR ROM
+    header[6] = (mapper & 0x0F) << 4
+    header[7] = mapper & 0xF0
+    rom = bytes(header) + bytes(i & 0xFF for i in range(8 * 0x4000 + 4 * 0x2000))
+
+    return nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(rom)))
+
+
+def switch_banks(mapper, cpu_memory, i):
+    write_memory = cpu_memory.write_memory
+    if mapper == 1:
+        for bit in range(5):
+            write_memory(0xE000, (i >> bit) & 0x01)
+    elif mapper == 4:
+        write_memory(0x8000, 0x06)
+        write_memory(0x8001, i)
+    else:
+        write_memory(0x8000, i)
+
+
+def bench_reads(cpu_memory):
+    read_memory = cpu_memory.read_memory
+    addresses = [0x8000 + ((i * 263) & 0x7FFF) for i in range(READS)]
+
+    def reads():
+        for address in addresses:
+            read_memory(address)
+
+    return min(timeit.repeat(reads, number=1, repeat=5)) / READS
+
+
+def bench_switches(mapper, cpu_memory):
+    def switches():
+        for i in range(SWITCHES):
+            switch_banks(mapper, cpu_memory, i)
+
+    return min(timeit.repeat(switches, number=1, repeat=3)) / SWITCHES
+
+
+def main():
+    print('%-8s %16s %16s %16s' % ('mapper', 'read (ns)', 'read after (ns)', 'switch (us)'))
+    for mapper, name in ((0, 'NROM'), (1, 'MMC1'), (2, 'UxROM'), (3, 'CNROM'), (4, 'MMC3'), (7, 'AxROM')):
+        cpu_memory = create_cpu_memory(mapper)
+        read = bench_reads(cpu_memory)
+        switch = bench_switches(mapper, cpu_memory) if mapper != 0 else 0
+        read_after = bench_reads(cpu_memory)
+        print('%-8s %16.1f %16.1f %16.2f' % (name, read * 1e9, read_after * 1e9, switch * 1e6))
+
+
+if __name__ == '__main__':
+    main()
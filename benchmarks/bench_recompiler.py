@@ -0,0 +1,75 @@
+import io
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nesrs.cartridge
+import nesrs.cpu
+import nesrs.recompiler
+
+CYCLES = 2000000
+
+# C000: LDA #$00
+# C002: STA $10
+# C004: LDA #$02
+# C006: STA $11
+# C008: LDX #$00
+# C00A: LDY #$00
+# C00C: LDA $0200,X
+# C00F: ADC #$03
+# C011: STA $0200,X
+# C014: STA ($10),Y
+# C016: JSR $C020
+# C019: INX
+# C01A: BNE $C00C
+# C01C: INY
+# C01D: JMP $C00C
+# C020: PHA
+# C021: PLA
+# C022: RTS
+PROGRAM = bytes([
+    0xA9, 0x00, 0x85, 0x10, 0xA9, 0x02, 0x85, 0x11, 0xA2, 0x00, 0xA0, 0x00,
+    0xBD, 0x00, 0x02, 0x69, 0x03, 0x9D, 0x00, 0x02, 0x91, 0x10, 0x20, 0x20, 0xC0,
+    0xE8, 0xD0, 0xF0, 0xC8, 0x4C, 0x0C, 0xC0,
+    0x48, 0x68, 0x60,
+])
+
+
+def create_cpu():
+    prg_rom = bytearray(0x4000)
+    prg_rom[0:len(PROGRAM)] = PROGRAM
+    prg_rom[0x3FFC:0x3FFE] = bytes([0x00, 0xC0])
+    rom = b'NES\x1a' + bytes([1, 1, 0, 0]) + bytes(8) + bytes(prg_rom) + bytes(0x2000)
+
+    cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(rom))))
+    cpu.turn_on()
+    return cpu
+
+
+def bench(cpu, execute):
+    best = 0.0
+    for _ in range(3):
+        cycles = 0
+        start = time.perf_counter()
+        while cycles < CYCLES:
+            execute()
+            cycles += cpu.op_cycles
+        best = max(best, cycles / (time.perf_counter() - start))
+
+    return best
+
+
+def main():
+    cpu = create_cpu()
+    interpreter = bench(cpu, cpu.execute_op)
+    cpu = create_cpu()
+    recompiler = bench(cpu, nesrs.recompiler.Recompiler(cpu).execute_block)
+
+    print('%-12s %16s' % ('cpu', 'cycles/s'))
+    print('%-12s %16.0f' % ('interpreter', interpreter))
+    print('%-12s %16.0f %.2fx' % ('recompiler', recompiler, recompiler / interpreter))
+
+
+if __name__ == '__main__':
+    main()
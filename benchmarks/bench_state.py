@@ -0,0 +1,44 @@
+import io
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nesrs.cartridge
+import nesrs.nes
+
+SNAPSHOTS = 10000
+
+
+def create_nes(mapper):
+    header = bytearray(16)
+    header[0:4] = b'NES\x1a'
+    header[4] = 8  # 128Kb PRG ROM
+    header[5] = 0  # 8Kb CHR RAM
+    header[6] = ((mapper & 0x0F) << 4) | 0x02  # Battery backed PRG RAM
+    header[7] = mapper & 0xF0
+    prg_rom = bytearray(8 * 0x4000)
+    prg_rom[-6:] = bytes([0x00, 0xC0, 0x00, 0xC0, 0x00, 0xC0])
+    rom = bytes(header) + bytes(prg_rom)
+
+    nes = nesrs.nes.NES(nesrs.cartridge.read_ines_rom(io.BytesIO(rom)))
+    nes.run_frame()
+    return nes
+
+
+def bench(function):
+    return min(timeit.repeat(function, number=SNAPSHOTS, repeat=3)) / SNAPSHOTS
+
+
+def main():
+    print('%-8s %10s %16s %16s' % ('mapper', 'bytes', 'snapshot (us)', 'restore (us)'))
+    for mapper, name in ((0, 'NROM'), (1, 'MMC1'), (4, 'MMC3')):
+        nes = create_nes(mapper)
+        state = nes.save_state()
+        snapshot = bench(nes.save_state)
+        restore = bench(lambda: nes.load_state(state))
+        print('%-8s %10d %16.2f %16.2f' % (name, len(state), snapshot * 1e6, restore * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,739 @@
+import struct
+
+from nesrs.scheduler import NEVER
+from nesrs.state import pack_state, unpack_state
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional, only audio synthesis (a sample rate) needs it
+    np = None
+
+# NTSC CPU clock, Hz
+CPU_FREQUENCY = 1789773
+
+LENGTH_TABLE = [
+    10, 254, 20, 2, 40, 4, 80, 6, 160, 8, 60, 10, 14, 12, 26, 14,
+    12, 16, 24, 18, 48, 20, 96, 22, 192, 24, 72, 26, 16, 28, 32, 30,
+]
+
+# Pulse waveforms, in output order
+DUTY_TABLE = [
+    [0, 1, 0, 0, 0, 0, 0, 0],
+    [0, 1, 1, 0, 0, 0, 0, 0],
+    [0, 1, 1, 1, 1, 0, 0, 0],
+    [1, 0, 0, 1, 1, 1, 1, 1],
+]
+
+TRIANGLE_TABLE = list(range(15, -1, -1)) + list(range(16))
+
+# CPU cycles per noise shift and per DMC output bit
+NOISE_PERIODS = [4, 8, 16, 32, 64, 96, 128, 160, 202, 254, 380, 508, 762, 1016, 2034, 4068]
+DMC_RATES = [428, 380, 340, 320, 286, 254, 226, 214, 190, 160, 142, 128, 106, 84, 72, 54]
+
+# Frame counter sequences, (CPU cycles since the sequence started, FRAME_* clocks), and their lengths
+FRAME_QUARTER = 0x01
+FRAME_HALF = 0x02
+FRAME_IRQ = 0x04
+FOUR_STEP_SEQUENCE = [(7457, FRAME_QUARTER), (14913, FRAME_QUARTER | FRAME_HALF), (22371, FRAME_QUARTER),
+                      (29829, FRAME_QUARTER | FRAME_HALF | FRAME_IRQ)]
+FOUR_STEP_CYCLES = 29830
+FIVE_STEP_SEQUENCE = [(7457, FRAME_QUARTER), (14913, FRAME_QUARTER | FRAME_HALF), (22371, FRAME_QUARTER),
+                      (37281, FRAME_QUARTER | FRAME_HALF)]
+FIVE_STEP_CYCLES = 37282
+
+# Writes that change when the APU raises an IRQ or fetches DMC samples are applied right away, the others are
+# only recorded until the next synchronization
+_IMMEDIATE_REGISTERS = frozenset([0x4010, 0x4013, 0x4015, 0x4017])
+
+# volume, constant, loop, start, divider, decay
+ENVELOPE_STATE = struct.Struct('<B??BBB')
+# enabled, length, duty, sweep enabled, sweep period, sweep negate, sweep shift, sweep divider, sweep reload,
+# timer, phase
+PULSE_STATE = struct.Struct('<?BB?B?BB?Hd')
+# enabled, length, control, linear reload, linear counter, linear reload flag, timer, phase
+TRIANGLE_STATE = struct.Struct('<?B?BB?Hd')
+# enabled, length, short mode, period, shift register, phase
+NOISE_STATE = struct.Struct('<?B?HHd')
+# irq enabled, loop, rate, level, sample address, sample length, address, bytes remaining, irq, byte, byte start,
+# byte end, has byte, levels
+DMC_STATE = struct.Struct('<??HBHHHH?BQQ?9B')
+# cycle, next sample, frame mode, irq inhibit, irq, step, sequence start
+APU_STATE = struct.Struct('<QdB??BQ')
+
+
+def _build_mix_tables():
+    # Non-linear mixer, indexed by pulse1 + pulse2 and by 3 * triangle + 2 * noise + dmc
+    pulse = [0.0] + [95.52 / (8128.0 / n + 100) for n in range(1, 31)]
+    tnd = [0.0] + [163.67 / (24329.0 / n + 100) for n in range(1, 203)]
+    return pulse, tnd
+
+
+PULSE_MIX, TND_MIX = _build_mix_tables()
+
+if np is not None:
+    _DUTY_ARRAY = np.array(DUTY_TABLE, dtype=np.intp)
+    _TRIANGLE_ARRAY = np.array(TRIANGLE_TABLE, dtype=np.intp)
+    _PULSE_MIX_ARRAY = np.array(PULSE_MIX)
+    _TND_MIX_ARRAY = np.array(TND_MIX)
+
+
+class _LfsrCycles(object):
+    # The noise shift register only moves around cycles of states, the cycle of a state is built the first time
+    # it's needed so a segment just indexes it
+
+    def __init__(self, short_mode):
+        self._tap = 6 if short_mode else 1
+        # [(states, positions)], positions[state] is the index of state in states or -1
+        self._cycles = []
+
+    def find(self, register):
+        for states, positions in self._cycles:
+            if positions[register] >= 0:
+                return states, int(positions[register])
+
+        states = [register]
+        value = self._shift(register)
+        while value != register:
+            states.append(value)
+            value = self._shift(value)
+        states = np.array(states, dtype=np.intp)
+        positions = np.full(0x8000, -1, dtype=np.intp)
+        positions[states] = np.arange(len(states))
+        self._cycles.append((states, positions))
+
+        return states, 0
+
+    def _shift(self, register):
+        feedback = (register ^ (register >> self._tap)) & 0x01
+        return (register >> 1) | (feedback << 14)
+
+
+class Envelope(object):
+
+    def __init__(self):
+        self.volume = 0
+        self.constant = False
+        self.loop = False
+        self._start = False
+        self._divider = 0
+        self._decay = 0
+
+    def write_control(self, value):
+        # --LC VVVV
+        self.loop = value & 0x20 != 0
+        self.constant = value & 0x10 != 0
+        self.volume = value & 0x0F
+
+    def restart(self):
+        self._start = True
+
+    def clock(self):
+        if self._start:
+            self._start = False
+            self._decay = 15
+            self._divider = self.volume
+        elif self._divider == 0:
+            self._divider = self.volume
+            if self._decay > 0:
+                self._decay -= 1
+            elif self.loop:
+                self._decay = 15
+        else:
+            self._divider -= 1
+
+    def output(self):
+        return self.volume if self.constant else self._decay
+
+    def save_state(self):
+        return ENVELOPE_STATE.pack(self.volume, self.constant, self.loop, self._start, self._divider, self._decay)
+
+    def load_state(self, data):
+        (self.volume, self.constant, self.loop, self._start, self._divider,
+         self._decay) = ENVELOPE_STATE.unpack(data)
+
+
+class Pulse(object):
+
+    def __init__(self, is_pulse1):
+        # Pulse 1 negates sweeps in ones' complement
+        self._negate_offset = 1 if is_pulse1 else 0
+
+        self.enabled = False
+        self.length = 0
+        self.envelope = Envelope()
+        self._duty = 0
+        self._sweep_enabled = False
+        self._sweep_period = 0
+        self._sweep_negate = False
+        self._sweep_shift = 0
+        self._sweep_divider = 0
+        self._sweep_reload = False
+        self._timer = 0
+        # Position in the 8 step sequence, 0 - 1
+        self._phase = 0.0
+
+    def write(self, register, value):
+        if register == 0:
+            self._duty = value >> 6
+            self.envelope.write_control(value)
+        elif register == 1:
+            self._sweep_enabled = value & 0x80 != 0
+            self._sweep_period = (value >> 4) & 0x07
+            self._sweep_negate = value & 0x08 != 0
+            self._sweep_shift = value & 0x07
+            self._sweep_reload = True
+        elif register == 2:
+            self._timer = (self._timer & 0x0700) | value
+        else:
+            self._timer = (self._timer & 0x00FF) | ((value & 0x07) << 8)
+            if self.enabled:
+                self.length = LENGTH_TABLE[value >> 3]
+            self.envelope.restart()
+            self._phase = 0.0
+
+    def clock_length(self):
+        if self.length > 0 and not self.envelope.loop:
+            self.length -= 1
+
+    def clock_sweep(self):
+        if self._sweep_divider == 0 and self._sweep_enabled and self._sweep_shift > 0 and not self._is_muted():
+            self._timer = self._sweep_target()
+        if self._sweep_divider == 0 or self._sweep_reload:
+            self._sweep_divider = self._sweep_period
+            self._sweep_reload = False
+        else:
+            self._sweep_divider -= 1
+
+    def output(self, times, cycles):
+        # Output at times (CPU cycles since the segment start) of a cycles long segment
+        period = 16.0 * (self._timer + 1)
+        if self.length == 0 or self._is_muted():
+            output = 0
+        else:
+            steps = ((self._phase + times / period) * 8).astype(np.intp) & 0x07
+            output = _DUTY_ARRAY[self._duty, steps] * self.envelope.output()
+        self._phase = (self._phase + cycles / period) % 1.0
+
+        return output
+
+    def _sweep_target(self):
+        change = self._timer >> self._sweep_shift
+        if self._sweep_negate:
+            return self._timer - change - self._negate_offset
+        return self._timer + change
+
+    def _is_muted(self):
+        return self._timer < 8 or self._sweep_target() > 0x7FF
+
+    def save_state(self):
+        return self.envelope.save_state() + PULSE_STATE.pack(
+            self.enabled, self.length, self._duty, self._sweep_enabled, self._sweep_period, self._sweep_negate,
+            self._sweep_shift, self._sweep_divider, self._sweep_reload, self._timer, self._phase)
+
+    def load_state(self, data):
+        self.envelope.load_state(data[:ENVELOPE_STATE.size])
+        (self.enabled, self.length, self._duty, self._sweep_enabled, self._sweep_period, self._sweep_negate,
+         self._sweep_shift, self._sweep_divider, self._sweep_reload, self._timer,
+         self._phase) = PULSE_STATE.unpack(data[ENVELOPE_STATE.size:])
+
+
+class Triangle(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.length = 0
+        # Length counter halt and linear counter control
+        self._control = False
+        self._linear_reload = 0
+        self._linear_counter = 0
+        self._linear_reload_flag = False
+        self._timer = 0
+        # Position in the 32 step sequence, 0 - 1
+        self._phase = 0.0
+
+    def write(self, register, value):
+        if register == 0:
+            self._control = value & 0x80 != 0
+            self._linear_reload = value & 0x7F
+        elif register == 2:
+            self._timer = (self._timer & 0x0700) | value
+        elif register == 3:
+            self._timer = (self._timer & 0x00FF) | ((value & 0x07) << 8)
+            if self.enabled:
+                self.length = LENGTH_TABLE[value >> 3]
+            self._linear_reload_flag = True
+
+    def clock_length(self):
+        if self.length > 0 and not self._control:
+            self.length -= 1
+
+    def clock_linear_counter(self):
+        if self._linear_reload_flag:
+            self._linear_counter = self._linear_reload
+        elif self._linear_counter > 0:
+            self._linear_counter -= 1
+        if not self._control:
+            self._linear_reload_flag = False
+
+    def output(self, times, cycles):
+        # The sequencer stops, holding its output, without length or linear counter. Ultrasonic periods are
+        # stopped as well instead of being played as a ~7.5 average.
+        if self.length == 0 or self._linear_counter == 0 or self._timer < 2:
+            return TRIANGLE_TABLE[int(self._phase * 32) & 0x1F]
+
+        period = 32.0 * (self._timer + 1)
+        steps = ((self._phase + times / period) * 32).astype(np.intp) & 0x1F
+        self._phase = (self._phase + cycles / period) % 1.0
+
+        return _TRIANGLE_ARRAY[steps]
+
+    def save_state(self):
+        return TRIANGLE_STATE.pack(self.enabled, self.length, self._control, self._linear_reload,
+                                   self._linear_counter, self._linear_reload_flag, self._timer, self._phase)
+
+    def load_state(self, data):
+        (self.enabled, self.length, self._control, self._linear_reload, self._linear_counter,
+         self._linear_reload_flag, self._timer, self._phase) = TRIANGLE_STATE.unpack(data)
+
+
+class Noise(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.length = 0
+        self.envelope = Envelope()
+        self._short_mode = False
+        self._period = NOISE_PERIODS[0]
+        self._shift_register = 1
+        # Position in the current shift, 0 - 1
+        self._phase = 0.0
+
+        self._lfsr_cycles = None
+
+    def write(self, register, value):
+        if register == 0:
+            self.envelope.write_control(value)
+        elif register == 2:
+            self._short_mode = value & 0x80 != 0
+            self._period = NOISE_PERIODS[value & 0x0F]
+        elif register == 3:
+            if self.enabled:
+                self.length = LENGTH_TABLE[value >> 3]
+            self.envelope.restart()
+
+    def clock_length(self):
+        if self.length > 0 and not self.envelope.loop:
+            self.length -= 1
+
+    def output(self, times, cycles):
+        if self._lfsr_cycles is None:
+            self._lfsr_cycles = (_LfsrCycles(False), _LfsrCycles(True))
+        states, position = self._lfsr_cycles[self._short_mode].find(self._shift_register)
+
+        if self.length == 0:
+            output = 0
+        else:
+            shifts = (self._phase + times / self._period).astype(np.intp)
+            # The channel is silent while bit 0 is set
+            output = (1 - (states[(position + shifts) % len(states)] & 0x01)) * self.envelope.output()
+
+        phase = self._phase + cycles / self._period
+        shifts = int(phase)
+        self._phase = phase - shifts
+        self._shift_register = int(states[(position + shifts) % len(states)])
+
+        return output
+
+    def save_state(self):
+        return self.envelope.save_state() + NOISE_STATE.pack(self.enabled, self.length, self._short_mode,
+                                                             self._period, self._shift_register, self._phase)
+
+    def load_state(self, data):
+        self.envelope.load_state(data[:ENVELOPE_STATE.size])
+        (self.enabled, self.length, self._short_mode, self._period, self._shift_register,
+         self._phase) = NOISE_STATE.unpack(data[ENVELOPE_STATE.size:])
+
+
+class Dmc(object):
+    # Plays 1 bit delta samples fetched from CPU memory a byte at a time. A byte is fetched when the previous one
+    # ends, its 8 bits then move the output level over the next 8 * rate CPU cycles.
+
+    def __init__(self):
+        self.irq_enabled = False
+        self.loop = False
+        self.rate = DMC_RATES[0]
+        self.level = 0
+        self.sample_address = 0xC000
+        self.sample_length = 1
+        self.address = 0xC000
+        self.bytes_remaining = 0
+        self.irq = False
+
+        # The byte being played, from byte_start to byte_end, None when the output unit is silent
+        self.byte = None
+        self.byte_start = 0
+        self.byte_end = NEVER
+        # Output level after each of the bits of byte
+        self._levels = None
+
+        # (start, CPU cycles per bit, levels) of what played since the last output call, so bytes don't split
+        # the synthesis of the other channels
+        self._pieces = [self._piece()]
+
+    def write(self, register, value, cycle):
+        if register == 0:
+            self.irq_enabled = value & 0x80 != 0
+            self.loop = value & 0x40 != 0
+            self.rate = DMC_RATES[value & 0x0F]
+            if not self.irq_enabled:
+                self.irq = False
+        elif register == 1:
+            self.level = value & 0x7F
+            if self.byte is not None:
+                # The rest of the byte moves the new level
+                self._levels = self._build_levels(min(8, (cycle - self.byte_start) // self._byte_rate()))
+            self._pieces[-1] = self._piece()
+        elif register == 2:
+            self.sample_address = 0xC000 | (value << 6)
+        else:
+            self.sample_length = (value << 4) | 1
+
+    def restart(self):
+        self.address = self.sample_address
+        self.bytes_remaining = self.sample_length
+
+    def start_byte(self, value, cycle):
+        # A byte fetched at cycle, or None when there's nothing to play
+        if self._levels is not None:
+            self.level = self._levels[8]
+
+        self.byte = value
+        if value is None:
+            self._levels = None
+            self.byte_start = cycle
+            self.byte_end = NEVER
+        else:
+            self.byte_start = cycle
+            self.byte_end = cycle + 8 * self.rate
+            self._levels = self._build_levels(0)
+        self._pieces.append(self._piece())
+
+    def next_fetch(self):
+        # Next fetch of the current address, a fetch done only to end the byte that plays has no CPU side effect
+        return self.byte_end if self.bytes_remaining > 0 else NEVER
+
+    def output(self, times, start):
+        pieces = self._pieces
+        self._pieces = [pieces[-1]]
+        if len(pieces) == 1 and self._levels is None:
+            return self.level
+
+        starts = np.array([piece[0] for piece in pieces], dtype=np.float64) - start
+        rates = np.array([piece[1] for piece in pieces], dtype=np.float64)
+        levels = np.array([piece[2] for piece in pieces], dtype=np.intp)
+        index = np.searchsorted(starts, times, side='right') - 1
+        bits = ((times - starts[index]) // rates[index]).astype(np.intp)
+        return levels[index, np.minimum(bits, 8)]
+
+    def skip_output(self):
+        self._pieces = [self._pieces[-1]]
+
+    def _byte_rate(self):
+        return (self.byte_end - self.byte_start) >> 3
+
+    def _piece(self):
+        if self._levels is None:
+            return self.byte_start, 1, [self.level] * 9
+        return self.byte_start, self._byte_rate(), self._levels
+
+    def _build_levels(self, first_bit):
+        # Levels after 0 - 8 bits of the byte, the bits before first_bit are played already
+        level = self.level
+        levels = [level] * 9
+        for bit in range(first_bit, 8):
+            if (self.byte >> bit) & 0x01 != 0:
+                if level <= 125:
+                    level += 2
+            elif level >= 2:
+                level -= 2
+            levels[bit + 1] = level
+
+        return levels
+
+    def save_state(self):
+        has_byte = self.byte is not None
+        return DMC_STATE.pack(self.irq_enabled, self.loop, self.rate, self.level, self.sample_address,
+                              self.sample_length, self.address, self.bytes_remaining, self.irq,
+                              self.byte if has_byte else 0, self.byte_start, self.byte_end, has_byte,
+                              *(self._levels if has_byte else [0] * 9))
+
+    def load_state(self, data):
+        state = DMC_STATE.unpack(data)
+        (self.irq_enabled, self.loop, self.rate, self.level, self.sample_address, self.sample_length, self.address,
+         self.bytes_remaining, self.irq, byte, self.byte_start, self.byte_end, has_byte) = state[:13]
+        self.byte = byte if has_byte else None
+        self._levels = list(state[13:]) if has_byte else None
+        self._pieces = [self._piece()]
+
+
+class APU(object):
+    # Pulse 1 and 2, triangle, noise and DMC channels with the frame counter, on the CPU cycles of the scheduler.
+    #
+    # Register writes are only recorded with their cycle, the APU catches up when it's synchronized: at its own
+    # events on the scheduler (frame IRQ, DMC sample fetches), when $4015 is read or written and at the end of every
+    # frame. Catching up replays the writes in order and, with a sample rate, synthesizes the audio between two
+    # changes (a write or a frame counter step) in one block with NumPy.
+
+    def __init__(self, scheduler, sample_rate=None):
+        if sample_rate is not None and np is None:
+            raise ImportError('Audio synthesis requires numpy')
+
+        self._scheduler = scheduler
+        self.sample_rate = sample_rate
+        # Called with True when the frame or DMC IRQ asserts the /IRQ line, with False when both are acknowledged
+        self.irq_handler = None
+        # Called with an address for every DMC sample byte, returns the byte
+        self.dma_reader = None
+
+        self.pulse1 = Pulse(True)
+        self.pulse2 = Pulse(False)
+        self.triangle = Triangle()
+        self.noise = Noise()
+        self.dmc = Dmc()
+
+        # CPU cycle the APU has caught up to, and the writes after it: [(cycle, address, value)]
+        self._cycle = scheduler.cycles
+        self._writes = []
+
+        self._frame_mode = 0
+        self._frame_irq_inhibit = False
+        self._frame_irq = False
+        self._frame_sequence = FOUR_STEP_SEQUENCE
+        self._frame_step = 0
+        self._frame_start = self._cycle
+        # The level last given to irq_handler
+        self._irq = False
+
+        # CPU cycles per sample, the CPU cycle of the next sample and the blocks synthesized since read_samples
+        self._sample_cycles = CPU_FREQUENCY / sample_rate if sample_rate is not None else None
+        self._next_sample = float(self._cycle)
+        self._samples = []
+
+        self._event = None
+        self._schedule()
+
+    #
+    # CPU bus, 0x4000 - 0x4017
+    #
+    def read_status(self):
+        # $4015, reading acknowledges the frame IRQ
+        self.synchronize()
+        dmc = self.dmc
+        status = ((0x01 if self.pulse1.length > 0 else 0) | (0x02 if self.pulse2.length > 0 else 0) |
+                  (0x04 if self.triangle.length > 0 else 0) | (0x08 if self.noise.length > 0 else 0) |
+                  (0x10 if dmc.bytes_remaining > 0 else 0) | (0x40 if self._frame_irq else 0) |
+                  (0x80 if dmc.irq else 0))
+        self._frame_irq = False
+        self._update_irq()
+
+        return status
+
+    def write_register(self, address, value):
+        self._writes.append((self._scheduler.cycles, address, value))
+        if address in _IMMEDIATE_REGISTERS:
+            self.synchronize()
+
+    def synchronize(self):
+        # Catches up to the current cycle of the scheduler
+        for cycle, address, value in self._writes:
+            self._run_to(cycle)
+            self._write(address, value)
+        self._writes = []
+        self._run_to(self._scheduler.cycles)
+        self._schedule()
+
+    def read_samples(self):
+        # int16 samples synthesized since the previous call, up to the last synchronization
+        samples = np.concatenate(self._samples) if self._samples else np.zeros(0, dtype=np.int16)
+        self._samples = []
+
+        return samples
+
+    #
+    # Save states
+    #
+    def save_state(self):
+        self.synchronize()
+        registers = APU_STATE.pack(self._cycle, self._next_sample, self._frame_mode, self._frame_irq_inhibit,
+                                   self._frame_irq, self._frame_step, self._frame_start)
+        return pack_state(b'APU ', registers, self.pulse1.save_state(), self.pulse2.save_state(),
+                          self.triangle.save_state(), self.noise.save_state(), self.dmc.save_state())
+
+    def load_state(self, data):
+        registers, pulse1, pulse2, triangle, noise, dmc = unpack_state(b'APU ', data, 6)
+        (self._cycle, self._next_sample, self._frame_mode, self._frame_irq_inhibit, self._frame_irq,
+         self._frame_step, self._frame_start) = APU_STATE.unpack(registers)
+        self._frame_sequence = FIVE_STEP_SEQUENCE if self._frame_mode != 0 else FOUR_STEP_SEQUENCE
+        self.pulse1.load_state(pulse1)
+        self.pulse2.load_state(pulse2)
+        self.triangle.load_state(triangle)
+        self.noise.load_state(noise)
+        self.dmc.load_state(dmc)
+        # The CPU state holds the level of the line
+        self._irq = self._frame_irq or self.dmc.irq
+        self._writes = []
+        self._samples = []
+        self._schedule()
+
+    #
+    # Timeline
+    #
+    def _schedule(self):
+        # One event at the next point the APU affects the CPU: a frame IRQ or a DMC fetch
+        cycle = self.dmc.next_fetch()
+        if self._frame_mode == 0 and not self._frame_irq_inhibit:
+            cycle = min(cycle, self._frame_start + FOUR_STEP_SEQUENCE[-1][0])
+
+        if self._event is not None:
+            if self._event.cycle == cycle and not self._event.is_cancelled:
+                return
+            self._scheduler.cancel(self._event)
+        self._event = self._scheduler.schedule(cycle, self.synchronize) if cycle != NEVER else None
+
+    def _run_to(self, cycle):
+        dmc = self.dmc
+        while True:
+            frame_cycle = self._frame_start + self._frame_sequence[self._frame_step][0]
+            end = min(frame_cycle, cycle)
+            while dmc.byte_end <= end:
+                self._next_dmc_byte(dmc.byte_end)
+            if frame_cycle > cycle:
+                break
+
+            self._synthesize(frame_cycle)
+            self._clock_frame_counter()
+        self._synthesize(cycle)
+
+    def _clock_frame_counter(self):
+        clocks = self._frame_sequence[self._frame_step][1]
+        self._frame_step += 1
+        if self._frame_step == len(self._frame_sequence):
+            self._frame_step = 0
+            self._frame_start += FIVE_STEP_CYCLES if self._frame_mode != 0 else FOUR_STEP_CYCLES
+
+        self._clock(clocks)
+        if clocks & FRAME_IRQ != 0 and not self._frame_irq_inhibit:
+            self._frame_irq = True
+            self._update_irq()
+
+    def _clock(self, clocks):
+        if clocks & FRAME_QUARTER != 0:
+            self.pulse1.envelope.clock()
+            self.pulse2.envelope.clock()
+            self.noise.envelope.clock()
+            self.triangle.clock_linear_counter()
+        if clocks & FRAME_HALF != 0:
+            self.pulse1.clock_length()
+            self.pulse2.clock_length()
+            self.triangle.clock_length()
+            self.noise.clock_length()
+            self.pulse1.clock_sweep()
+            self.pulse2.clock_sweep()
+
+    def _next_dmc_byte(self, cycle):
+        dmc = self.dmc
+        if dmc.bytes_remaining == 0:
+            dmc.start_byte(None, cycle)
+            return
+
+        value = self.dma_reader(dmc.address) if self.dma_reader is not None else 0
+        dmc.address = dmc.address + 1 if dmc.address < 0xFFFF else 0x8000
+        dmc.bytes_remaining -= 1
+        if dmc.bytes_remaining == 0:
+            if dmc.loop:
+                dmc.restart()
+            elif dmc.irq_enabled:
+                dmc.irq = True
+                self._update_irq()
+        dmc.start_byte(value, cycle)
+
+    def _write(self, address, value):
+        if address < 0x4004:
+            self.pulse1.write(address & 0x03, value)
+        elif address < 0x4008:
+            self.pulse2.write(address & 0x03, value)
+        elif address < 0x400C:
+            self.triangle.write(address & 0x03, value)
+        elif address < 0x4010:
+            self.noise.write(address & 0x03, value)
+        elif address < 0x4014:
+            self.dmc.write(address & 0x03, value, self._cycle)
+        elif address == 0x4015:
+            self._write_status(value)
+        elif address == 0x4017:
+            self._write_frame_counter(value)
+        if address >= 0x4010:
+            # Acknowledges and disables IRQs
+            self._update_irq()
+
+    def _write_status(self, value):
+        for bit, channel in enumerate((self.pulse1, self.pulse2, self.triangle, self.noise)):
+            channel.enabled = value & (1 << bit) != 0
+            if not channel.enabled:
+                channel.length = 0
+
+        dmc = self.dmc
+        dmc.irq = False
+        if value & 0x10 == 0:
+            dmc.bytes_remaining = 0
+        elif dmc.bytes_remaining == 0:
+            dmc.restart()
+            if dmc.byte is None:
+                # The output unit is idle, the first byte is fetched right away
+                self._next_dmc_byte(self._cycle)
+
+    def _write_frame_counter(self, value):
+        # The sequence restarts at the write, in 5 step mode with a quarter and a half frame clock
+        self._frame_mode = value >> 7
+        self._frame_irq_inhibit = value & 0x40 != 0
+        if self._frame_irq_inhibit:
+            self._frame_irq = False
+        self._frame_sequence = FIVE_STEP_SEQUENCE if self._frame_mode != 0 else FOUR_STEP_SEQUENCE
+        self._frame_step = 0
+        self._frame_start = self._cycle
+        if self._frame_mode != 0:
+            self._clock(FRAME_QUARTER | FRAME_HALF)
+
+    def _update_irq(self):
+        # The frame and DMC IRQ flags hold the /IRQ line asserted until they're acknowledged
+        irq = self._frame_irq or self.dmc.irq
+        if irq != self._irq and self.irq_handler is not None:
+            self.irq_handler(irq)
+        self._irq = irq
+
+    #
+    # Synthesis
+    #
+    def _synthesize(self, cycle):
+        start = self._cycle
+        self._cycle = cycle
+        if self._sample_cycles is None:
+            self.dmc.skip_output()
+            return
+        if cycle == start:
+            return
+
+        cycles = cycle - start
+        count = int(np.ceil((cycle - self._next_sample) / self._sample_cycles)) if self._next_sample < cycle else 0
+        times = self._next_sample - start + np.arange(count) * self._sample_cycles
+        self._next_sample += count * self._sample_cycles
+
+        pulse = self.pulse1.output(times, cycles) + self.pulse2.output(times, cycles)
+        tnd = (3 * self.triangle.output(times, cycles) + 2 * self.noise.output(times, cycles) +
+               self.dmc.output(times, start))
+        if count == 0:
+            return
+
+        mix = _PULSE_MIX_ARRAY[pulse] + _TND_MIX_ARRAY[tnd]
+        self._samples.append(np.broadcast_to(mix * 32767, (count,)).astype(np.int16))
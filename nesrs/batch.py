@@ -0,0 +1,658 @@
+from functools import partial
+
+from nesrs.cpu import (ADC_FLAGS, ADC_RESULTS, ASL_FLAGS, ASL_RESULTS, B_FLAG, C_FLAG, COMPARE_FLAGS, D_FLAG, I_FLAG,
+                       IRQ_PENDING, LSR_FLAGS, LSR_RESULTS, N_FLAG, NMI_PENDING, NOT_NVZ, NOT_NVZC, NOT_NZ, NOT_NZC,
+                       NZ_FLAGS, OP_CODES, OP_CYCLES, R_FLAG, RESET_PENDING, ROL_FLAGS, ROL_RESULTS, ROR_FLAGS,
+                       ROR_RESULTS, V_FLAG, Z_FLAG, CpuAddressingMode, _NEXT_INTERRUPT)
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional, only BatchCPU needs it
+    np = None
+
+
+def _table(data):
+    return np.frombuffer(data, dtype=np.uint8).astype(np.int32)
+
+
+class BatchCPU(object):
+    # N independent CPUs on the same cartridge, stepped in lockstep: every step executes one op (or services one
+    # interrupt) on every machine. The registers are arrays with an element per machine, and each step groups the
+    # machines by op code and runs each op once as array operations on its group, the ALU lookup tables of nesrs.cpu
+    # indexed by arrays. Results are the same as N CPUs running execute_op, cycles included.
+    #
+    # Memory is the memory map of the CpuMemory given, frozen: RAM and every other page with a write view (PRG RAM)
+    # are copied per machine, read only pages (PRG ROM) are shared, and pages behind handlers (PPU, APU, I/O and
+    # mapper registers) read 0 and ignore writes. Bank switching is not emulated, the banks mapped when the batch is
+    # created stay mapped.
+
+    def __init__(self, cpu_memory, count):
+        if np is None:
+            raise ImportError('BatchCPU requires numpy')
+
+        self.count = count
+        self.a = np.zeros(count, dtype=np.int32)
+        self.x = np.zeros(count, dtype=np.int32)
+        self.y = np.zeros(count, dtype=np.int32)
+        self.s = np.zeros(count, dtype=np.int32)
+        self.p = np.zeros(count, dtype=np.int32)
+        self.pc = np.zeros(count, dtype=np.int32)
+        self.op_cycles = np.zeros(count, dtype=np.int32)
+        # CPU cycles since turn_on
+        self.cycles = np.zeros(count, dtype=np.int64)
+        # Bitmasks of nesrs.cpu *_PENDING
+        self.pending_interrupts = np.zeros(count, dtype=np.int32)
+
+        self._map_memory(cpu_memory)
+
+        self._op_cycles_table = np.array(OP_CYCLES, dtype=np.int32)
+        self._next_interrupt = np.array(_NEXT_INTERRUPT, dtype=np.int32)
+        self._nz_flags = _table(NZ_FLAGS)
+        self._adc_results = _table(ADC_RESULTS)
+        self._adc_flags = _table(ADC_FLAGS)
+        self._compare_flags = _table(COMPARE_FLAGS)
+        self._asl_results = _table(ASL_RESULTS)
+        self._asl_flags = _table(ASL_FLAGS)
+        self._lsr_results = _table(LSR_RESULTS)
+        self._lsr_flags = _table(LSR_FLAGS)
+        self._rol_results = _table(ROL_RESULTS)
+        self._rol_flags = _table(ROL_FLAGS)
+        self._ror_results = _table(ROR_RESULTS)
+        self._ror_flags = _table(ROR_FLAGS)
+
+        self._op_table = self._build_op_table()
+
+    def _map_memory(self, cpu_memory):
+        # Per machine bytes: the 2Kb of RAM, a page for every other writable page, then a byte that stays 0 for
+        # the reads of the other addresses and a byte the writes to them are dropped into. An address reads
+        # memory[machine, read_index] | rom, one of the two is always 0.
+        writable_pages = [page for page in range(0x20, 0x100) if cpu_memory._write_pages[page] is not None]
+        size = 0x800 + len(writable_pages) * 0x100
+        zero = size
+        sink = size + 1
+
+        self.memory = np.zeros((self.count, size + 2), dtype=np.uint8)
+        self._read_index = np.full(0x10000, zero, dtype=np.intp)
+        self._write_index = np.full(0x10000, sink, dtype=np.intp)
+        self._rom = np.zeros(0x10000, dtype=np.int32)
+
+        offsets = np.arange(0x100, dtype=np.intp)
+        for page in range(0x20):
+            self._read_index[page << 8:(page + 1) << 8] = ((page & 0x07) << 8) + offsets
+            self._write_index[page << 8:(page + 1) << 8] = ((page & 0x07) << 8) + offsets
+        self.memory[:, 0:0x800] = np.frombuffer(bytes(cpu_memory._ram), dtype=np.uint8)
+
+        for i, page in enumerate(writable_pages):
+            start = 0x800 + i * 0x100
+            self._write_index[page << 8:(page + 1) << 8] = start + offsets
+            if cpu_memory._read_pages[page] is not None:
+                self._read_index[page << 8:(page + 1) << 8] = start + offsets
+                self.memory[:, start:start + 0x100] = np.frombuffer(bytes(cpu_memory._read_pages[page]),
+                                                                    dtype=np.uint8)
+
+        for page in range(0x20, 0x100):
+            view = cpu_memory._read_pages[page]
+            if view is not None and cpu_memory._write_pages[page] is None:
+                self._rom[page << 8:(page + 1) << 8] = np.frombuffer(bytes(view), dtype=np.uint8)
+
+    #
+    # Actions
+    #
+    def turn_on(self):
+        self.op_cycles[:] = 7
+        self.cycles[:] = 0
+        self.a[:] = 0x00
+        self.x[:] = 0x00
+        self.y[:] = 0x00
+        self.s[:] = 0xFF
+        self.p[:] = B_FLAG | R_FLAG | I_FLAG
+        self.pc[:] = (self._rom[0xFFFD] << 8) | self._rom[0xFFFC]
+        self.pending_interrupts[:] = 0
+
+    def reset(self, machines=slice(None)):
+        self.pending_interrupts[machines] |= RESET_PENDING
+
+    def nmi(self, machines=slice(None)):
+        self.pending_interrupts[machines] |= NMI_PENDING
+
+    def irq(self, machines=slice(None)):
+        self.pending_interrupts[machines] |= IRQ_PENDING
+
+    def step(self):
+        # One op or interrupt on every machine, op_cycles holds the cycles each took
+        interrupted = np.flatnonzero(self.pending_interrupts)
+        if len(interrupted) == 0:
+            machines = np.arange(self.count)
+        else:
+            self._execute_pending_interrupt_ops(interrupted)
+            if len(interrupted) == self.count:
+                self.cycles += self.op_cycles
+                return
+            # The machines that serviced an interrupt don't execute an op
+            executing = np.ones(self.count, dtype=bool)
+            executing[interrupted] = False
+            machines = np.flatnonzero(executing)
+
+        pc = self.pc[machines]
+        op_codes = self._read(machines, pc & 0xFFFF)
+        self.pc[machines] = (pc + 1) & 0xFFFF
+        self.op_cycles[machines] = self._op_cycles_table[op_codes]
+
+        # Groups of machines by op code
+        order = np.argsort(op_codes, kind='stable')
+        sorted_op_codes = op_codes[order]
+        starts = np.flatnonzero(np.diff(sorted_op_codes)) + 1
+        op_table = self._op_table
+        for op_code, group in zip(sorted_op_codes[np.concatenate(([0], starts))], np.split(machines[order], starts)):
+            op_table[op_code](group)
+
+        self.cycles += self.op_cycles
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.step()
+
+    def machine_state(self, machine):
+        # (a, x, y, s, p, pc) of one machine, the layout of the CPU registers
+        return (int(self.a[machine]), int(self.x[machine]), int(self.y[machine]), int(self.s[machine]),
+                int(self.p[machine]), int(self.pc[machine]))
+
+    def ram(self, machine):
+        return bytes(self.memory[machine, 0:0x800])
+
+    def _execute_pending_interrupt_ops(self, machines):
+        interrupts = self._next_interrupt[self.pending_interrupts[machines]]
+        self.pending_interrupts[machines] &= ~interrupts
+        self.op_cycles[machines] = 0
+
+        reset = machines[interrupts == RESET_PENDING]
+        if len(reset) != 0:
+            self.pending_interrupts[reset] = 0
+            self.op_cycles[reset] = 7
+            self.a[reset] = 0x00
+            self.x[reset] = 0x00
+            self.y[reset] = 0x00
+            self.s[reset] = 0xFF
+            self.p[reset] = Z_FLAG | R_FLAG
+            self.pc[reset] = (self._rom[0xFFFD] << 8) | self._rom[0xFFFC]
+
+        nmi = machines[interrupts == NMI_PENDING]
+        if len(nmi) != 0:
+            self._interrupt(nmi, 0xFFFA)
+
+        # An IRQ while interrupts are disabled is dropped
+        irq = machines[(interrupts == IRQ_PENDING) & ((self.p[machines] & I_FLAG) == 0)]
+        if len(irq) != 0:
+            self._interrupt(irq, 0xFFFE)
+
+    def _interrupt(self, m, vector):
+        self.op_cycles[m] = 7
+        pc = self.pc[m]
+        self._push(m, (pc >> 8) & 0xFF)
+        self._push(m, pc & 0xFF)
+        self._push(m, self.p[m] & ~B_FLAG)
+        # NMI and IRQ handlers run with interrupts disabled
+        self.p[m] = (self.p[m] & ~D_FLAG) | I_FLAG
+        self.pc[m] = (self._rom[vector + 1] << 8) | self._rom[vector]
+
+    #
+    # Memory
+    #
+    def _read(self, m, address):
+        return self.memory[m, self._read_index[address]] | self._rom[address]
+
+    def _write(self, m, address, value):
+        self.memory[m, self._write_index[address]] = value
+
+    def _fetch(self, m):
+        # The byte at PC, PC moves past it
+        pc = self.pc[m]
+        self.pc[m] = (pc + 1) & 0xFFFF
+        return self._read(m, pc)
+
+    def _fetch_word(self, m):
+        pc = self.pc[m]
+        self.pc[m] = (pc + 2) & 0xFFFF
+        return (self._read(m, (pc + 1) & 0xFFFF) << 8) | self._read(m, pc)
+
+    def _push(self, m, value):
+        s = self.s[m]
+        self._write(m, 0x0100 | s, value)
+        self.s[m] = (s - 1) & 0xFF
+
+    def _pop(self, m):
+        s = (self.s[m] + 1) & 0xFF
+        self.s[m] = s
+        return self._read(m, 0x0100 | s)
+
+    #
+    # Addressing modes, each returns the addresses of the machines m
+    #
+    def _calculate_memory_address_imm(self, m):
+        pc = self.pc[m]
+        self.pc[m] = (pc + 1) & 0xFFFF
+        return pc
+
+    def _calculate_memory_address_abs(self, m):
+        return self._fetch_word(m)
+
+    def _calculate_memory_address_zp(self, m):
+        return self._fetch(m)
+
+    def _calculate_memory_address_zpx(self, m):
+        return (self._fetch(m) + self.x[m]) & 0xFF
+
+    def _calculate_memory_address_zpy(self, m):
+        return (self._fetch(m) + self.y[m]) & 0xFF
+
+    def _calculate_memory_address_absx(self, m):
+        return (self._fetch_word(m) + self.x[m]) & 0xFFFF
+
+    def _calculate_memory_address_absx_(self, m):
+        return self._page_crossing(m, self._fetch_word(m), self.x[m])
+
+    def _calculate_memory_address_absy(self, m):
+        return (self._fetch_word(m) + self.y[m]) & 0xFFFF
+
+    def _calculate_memory_address_absy_(self, m):
+        return self._page_crossing(m, self._fetch_word(m), self.y[m])
+
+    def _calculate_memory_address_rel(self, m):
+        offset = self._fetch(m)
+        return (self.pc[m] + offset - ((offset & 0x80) << 1)) & 0xFFFF
+
+    def _calculate_memory_address_indx(self, m):
+        address = (self._fetch(m) + self.x[m]) & 0xFF
+        return (self._read(m, (address + 1) & 0xFF) << 8) | self._read(m, address)
+
+    def _calculate_memory_address_ind_y(self, m):
+        low = self._fetch(m)
+        address = (self._read(m, (low + 1) & 0xFF) << 8) | self._read(m, low)
+        return (address + self.y[m]) & 0xFFFF
+
+    def _calculate_memory_address_ind_y_(self, m):
+        low = self._fetch(m)
+        address = (self._read(m, (low + 1) & 0xFF) << 8) | self._read(m, low)
+        return self._page_crossing(m, address, self.y[m])
+
+    def _calculate_memory_address_ind(self, m):
+        address = self._fetch_word(m)
+        return (self._read(m, (address + 1) & 0xFFFF) << 8) | self._read(m, address)
+
+    def _calculate_memory_address_ind_(self, m):
+        address = self._fetch_word(m)
+        next_address = (address & 0xFF00) | ((address + 1) & 0x00FF)
+        return (self._read(m, next_address) << 8) | self._read(m, address)
+
+    def _page_crossing(self, m, address, index):
+        result_address = (address + index) & 0xFFFF
+        self.op_cycles[m] += ((address ^ result_address) & 0xFF00) != 0
+        return result_address
+
+    #
+    # Ops, each runs on the machines m
+    #
+    def _build_op_table(self):
+        address_calculators = {
+            CpuAddressingMode.IMM: self._calculate_memory_address_imm,
+            CpuAddressingMode.ABS: self._calculate_memory_address_abs,
+            CpuAddressingMode.ZP: self._calculate_memory_address_zp,
+            CpuAddressingMode.ZPX: self._calculate_memory_address_zpx,
+            CpuAddressingMode.ZPY: self._calculate_memory_address_zpy,
+            CpuAddressingMode.ABSX: self._calculate_memory_address_absx,
+            CpuAddressingMode.ABSX_: self._calculate_memory_address_absx_,
+            CpuAddressingMode.ABSY: self._calculate_memory_address_absy,
+            CpuAddressingMode.ABSY_: self._calculate_memory_address_absy_,
+            CpuAddressingMode.REL: self._calculate_memory_address_rel,
+            CpuAddressingMode.INDX: self._calculate_memory_address_indx,
+            CpuAddressingMode.IND_Y: self._calculate_memory_address_ind_y,
+            CpuAddressingMode.IND_Y_: self._calculate_memory_address_ind_y_,
+            CpuAddressingMode.IND: self._calculate_memory_address_ind,
+            CpuAddressingMode.IND_: self._calculate_memory_address_ind_,
+        }
+
+        # Same dispatch as CPU._build_op_table, op codes missing from OP_CODES do nothing
+        op_table = [self._op_unsupported] * 256
+        for op_code, (op, mode) in OP_CODES.items():
+            if mode == CpuAddressingMode.IMPL:
+                op_table[op_code] = getattr(self, '_op_' + op)
+            elif mode == CpuAddressingMode.ACC:
+                op_table[op_code] = getattr(self, '_op_' + op + '_acc')
+            else:
+                op_table[op_code] = partial(getattr(self, '_op_' + op), calculate_address=address_calculators[mode])
+
+        return op_table
+
+    def _set_nz(self, m, value):
+        self.p[m] = (self.p[m] & NOT_NZ) | self._nz_flags[value]
+
+    def _op_unsupported(self, m):
+        pass
+
+    def _op_nop(self, m):
+        pass
+
+    def _op_dop(self, m, calculate_address):
+        calculate_address(m)
+
+    def _op_top(self, m, calculate_address):
+        calculate_address(m)
+
+    # Loads and stores
+    def _op_lda(self, m, calculate_address):
+        value = self._read(m, calculate_address(m))
+        self.a[m] = value
+        self._set_nz(m, value)
+
+    def _op_ldx(self, m, calculate_address):
+        value = self._read(m, calculate_address(m))
+        self.x[m] = value
+        self._set_nz(m, value)
+
+    def _op_ldy(self, m, calculate_address):
+        value = self._read(m, calculate_address(m))
+        self.y[m] = value
+        self._set_nz(m, value)
+
+    def _op_lax(self, m, calculate_address):
+        value = self._read(m, calculate_address(m))
+        self.a[m] = value
+        self.x[m] = value
+        self._set_nz(m, value)
+
+    def _op_sta(self, m, calculate_address):
+        self._write(m, calculate_address(m), self.a[m])
+
+    def _op_stx(self, m, calculate_address):
+        self._write(m, calculate_address(m), self.x[m])
+
+    def _op_sty(self, m, calculate_address):
+        self._write(m, calculate_address(m), self.y[m])
+
+    def _op_aax(self, m, calculate_address):
+        self._write(m, calculate_address(m), self.a[m] & self.x[m])
+
+    # Transfers
+    def _op_tax(self, m):
+        self.x[m] = self.a[m]
+        self._set_nz(m, self.x[m])
+
+    def _op_tay(self, m):
+        self.y[m] = self.a[m]
+        self._set_nz(m, self.y[m])
+
+    def _op_tsx(self, m):
+        self.x[m] = self.s[m]
+        self._set_nz(m, self.x[m])
+
+    def _op_txa(self, m):
+        self.a[m] = self.x[m]
+        self._set_nz(m, self.a[m])
+
+    def _op_txs(self, m):
+        self.s[m] = self.x[m]
+
+    def _op_tya(self, m):
+        self.a[m] = self.y[m]
+        self._set_nz(m, self.a[m])
+
+    # ALU
+    def _adc(self, m, value):
+        index = ((self.p[m] & C_FLAG) << 16) | (self.a[m] << 8) | value
+        self.p[m] = (self.p[m] & NOT_NVZC) | self._adc_flags[index]
+        self.a[m] = self._adc_results[index]
+
+    def _op_adc(self, m, calculate_address):
+        self._adc(m, self._read(m, calculate_address(m)))
+
+    def _op_sbc(self, m, calculate_address):
+        # A - value - borrow is A + ~value + carry
+        self._adc(m, self._read(m, calculate_address(m)) ^ 0xFF)
+
+    def _op_and(self, m, calculate_address):
+        a = self.a[m] & self._read(m, calculate_address(m))
+        self.a[m] = a
+        self._set_nz(m, a)
+
+    def _op_ora(self, m, calculate_address):
+        a = self.a[m] | self._read(m, calculate_address(m))
+        self.a[m] = a
+        self._set_nz(m, a)
+
+    def _op_eor(self, m, calculate_address):
+        a = self.a[m] ^ self._read(m, calculate_address(m))
+        self.a[m] = a
+        self._set_nz(m, a)
+
+    def _op_bit(self, m, calculate_address):
+        value = self._read(m, calculate_address(m))
+        self.p[m] = ((self.p[m] & NOT_NVZ) | (value & (N_FLAG | V_FLAG)) |
+                     (self._nz_flags[self.a[m] & value] & Z_FLAG))
+
+    def _compare(self, m, register, calculate_address):
+        value = self._read(m, calculate_address(m))
+        self.p[m] = (self.p[m] & NOT_NZC) | self._compare_flags[(register << 8) | value]
+
+    def _op_cmp(self, m, calculate_address):
+        self._compare(m, self.a[m], calculate_address)
+
+    def _op_cpx(self, m, calculate_address):
+        self._compare(m, self.x[m], calculate_address)
+
+    def _op_cpy(self, m, calculate_address):
+        self._compare(m, self.y[m], calculate_address)
+
+    # Increments and decrements
+    def _op_inc(self, m, calculate_address):
+        address = calculate_address(m)
+        value = (self._read(m, address) + 1) & 0xFF
+        self._set_nz(m, value)
+        self._write(m, address, value)
+
+    def _op_dec(self, m, calculate_address):
+        address = calculate_address(m)
+        value = (self._read(m, address) - 1) & 0xFF
+        self._set_nz(m, value)
+        self._write(m, address, value)
+
+    def _op_inx(self, m):
+        x = (self.x[m] + 1) & 0xFF
+        self.x[m] = x
+        self._set_nz(m, x)
+
+    def _op_iny(self, m):
+        y = (self.y[m] + 1) & 0xFF
+        self.y[m] = y
+        self._set_nz(m, y)
+
+    def _op_dex(self, m):
+        x = (self.x[m] - 1) & 0xFF
+        self.x[m] = x
+        self._set_nz(m, x)
+
+    def _op_dey(self, m):
+        y = (self.y[m] - 1) & 0xFF
+        self.y[m] = y
+        self._set_nz(m, y)
+
+    # Shifts, the tables are indexed by (carry << 8) | value
+    def _shift(self, m, value, results, flags, carry_in):
+        index = ((self.p[m] & C_FLAG) << 8) | value if carry_in else value
+        self.p[m] = (self.p[m] & NOT_NZC) | flags[index]
+        return results[index]
+
+    def _shift_memory(self, m, calculate_address, results, flags, carry_in):
+        address = calculate_address(m)
+        self._write(m, address, self._shift(m, self._read(m, address), results, flags, carry_in))
+
+    def _op_asl_acc(self, m):
+        self.a[m] = self._shift(m, self.a[m], self._asl_results, self._asl_flags, False)
+
+    def _op_asl(self, m, calculate_address):
+        self._shift_memory(m, calculate_address, self._asl_results, self._asl_flags, False)
+
+    def _op_lsr_acc(self, m):
+        self.a[m] = self._shift(m, self.a[m], self._lsr_results, self._lsr_flags, False)
+
+    def _op_lsr(self, m, calculate_address):
+        self._shift_memory(m, calculate_address, self._lsr_results, self._lsr_flags, False)
+
+    def _op_rol_acc(self, m):
+        self.a[m] = self._shift(m, self.a[m], self._rol_results, self._rol_flags, True)
+
+    def _op_rol(self, m, calculate_address):
+        self._shift_memory(m, calculate_address, self._rol_results, self._rol_flags, True)
+
+    def _op_ror_acc(self, m):
+        self.a[m] = self._shift(m, self.a[m], self._ror_results, self._ror_flags, True)
+
+    def _op_ror(self, m, calculate_address):
+        self._shift_memory(m, calculate_address, self._ror_results, self._ror_flags, True)
+
+    # Unofficial read-modify-write ops
+    def _op_dcp(self, m, calculate_address):
+        address = calculate_address(m)
+        value = (self._read(m, address) - 1) & 0xFF
+        self.p[m] = (self.p[m] & NOT_NZC) | self._compare_flags[(self.a[m] << 8) | value]
+        self._write(m, address, value)
+
+    def _op_isc(self, m, calculate_address):
+        address = calculate_address(m)
+        value = (self._read(m, address) + 1) & 0xFF
+        self._adc(m, value ^ 0xFF)
+        self._write(m, address, value)
+
+    def _op_slo(self, m, calculate_address):
+        address = calculate_address(m)
+        value = self._read(m, address)
+        result = self._asl_results[value]
+        a = self.a[m] | result
+        self.a[m] = a
+        self.p[m] = (self.p[m] & NOT_NZC) | self._nz_flags[a] | (self._asl_flags[value] & C_FLAG)
+        self._write(m, address, result)
+
+    def _op_rla(self, m, calculate_address):
+        address = calculate_address(m)
+        index = ((self.p[m] & C_FLAG) << 8) | self._read(m, address)
+        result = self._rol_results[index]
+        a = self.a[m] & result
+        self.a[m] = a
+        self.p[m] = (self.p[m] & NOT_NZC) | self._nz_flags[a] | (self._rol_flags[index] & C_FLAG)
+        self._write(m, address, result)
+
+    def _op_sre(self, m, calculate_address):
+        address = calculate_address(m)
+        value = self._read(m, address)
+        result = self._lsr_results[value]
+        a = self.a[m] ^ result
+        self.a[m] = a
+        # Z comes from the shifted value, not from A
+        self.p[m] = (self.p[m] & NOT_NZC) | (a & N_FLAG) | self._lsr_flags[value]
+        self._write(m, address, result)
+
+    def _op_rra(self, m, calculate_address):
+        address = calculate_address(m)
+        value = self._read(m, address)
+        result = self._ror_results[((self.p[m] & C_FLAG) << 8) | value]
+        index = ((value & 0x01) << 16) | (self.a[m] << 8) | result
+        self.p[m] = (self.p[m] & NOT_NVZC) | self._adc_flags[index]
+        self.a[m] = self._adc_results[index]
+        self._write(m, address, result)
+
+    # Flags
+    def _op_clc(self, m):
+        self.p[m] &= ~C_FLAG
+
+    def _op_cld(self, m):
+        self.p[m] &= ~D_FLAG
+
+    def _op_cli(self, m):
+        self.p[m] &= ~I_FLAG
+
+    def _op_clv(self, m):
+        self.p[m] &= ~V_FLAG
+
+    def _op_sec(self, m):
+        self.p[m] |= C_FLAG
+
+    def _op_sed(self, m):
+        self.p[m] |= D_FLAG
+
+    def _op_sei(self, m):
+        self.p[m] |= I_FLAG
+
+    # Branches, taken ones take a cycle more and another one when they cross a page
+    def _branch(self, m, taken, calculate_address):
+        address = calculate_address(m)
+        m = m[taken]
+        if len(m) != 0:
+            address = address[taken]
+            self.op_cycles[m] += 1 + (((self.pc[m] ^ address) & 0xFF00) != 0)
+            self.pc[m] = address
+
+    def _op_bcc(self, m, calculate_address):
+        self._branch(m, (self.p[m] & C_FLAG) == 0, calculate_address)
+
+    def _op_bcs(self, m, calculate_address):
+        self._branch(m, (self.p[m] & C_FLAG) != 0, calculate_address)
+
+    def _op_beq(self, m, calculate_address):
+        self._branch(m, (self.p[m] & Z_FLAG) != 0, calculate_address)
+
+    def _op_bmi(self, m, calculate_address):
+        self._branch(m, (self.p[m] & N_FLAG) != 0, calculate_address)
+
+    def _op_bne(self, m, calculate_address):
+        self._branch(m, (self.p[m] & Z_FLAG) == 0, calculate_address)
+
+    def _op_bpl(self, m, calculate_address):
+        self._branch(m, (self.p[m] & N_FLAG) == 0, calculate_address)
+
+    def _op_bvc(self, m, calculate_address):
+        self._branch(m, (self.p[m] & V_FLAG) == 0, calculate_address)
+
+    def _op_bvs(self, m, calculate_address):
+        self._branch(m, (self.p[m] & V_FLAG) != 0, calculate_address)
+
+    # Jumps and the stack
+    def _op_jmp(self, m, calculate_address):
+        self.pc[m] = calculate_address(m)
+
+    def _op_jsr(self, m, calculate_address):
+        address = calculate_address(m)
+        pc = (self.pc[m] - 1) & 0xFFFF
+        self._push(m, (pc >> 8) & 0xFF)
+        self._push(m, pc & 0xFF)
+        self.pc[m] = address
+
+    def _op_rts(self, m):
+        low = self._pop(m)
+        self.pc[m] = (((self._pop(m) << 8) | low) + 1) & 0xFFFF
+
+    def _op_rti(self, m):
+        self.p[m] = (self._pop(m) & ~B_FLAG) | R_FLAG
+        low = self._pop(m)
+        self.pc[m] = (self._pop(m) << 8) | low
+
+    def _op_brk(self, m):
+        pc = (self.pc[m] + 1) & 0xFFFF
+        self._push(m, (pc >> 8) & 0xFF)
+        self._push(m, pc & 0xFF)
+        self.p[m] |= B_FLAG
+        self._push(m, self.p[m])
+        self.pc[m] = (self._rom[0xFFFF] << 8) | self._rom[0xFFFE]
+
+    def _op_pha(self, m):
+        self._push(m, self.a[m])
+
+    def _op_php(self, m):
+        self._push(m, self.p[m] | B_FLAG)
+
+    def _op_pla(self, m):
+        a = self._pop(m)
+        self.a[m] = a
+        self._set_nz(m, a)
+
+    def _op_plp(self, m):
+        self.p[m] = (self._pop(m) & ~B_FLAG) | R_FLAG
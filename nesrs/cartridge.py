@@ -1,55 +1,329 @@
+from enum import Enum
+import mmap
+import struct
 
-def read_ines_rom(rom_file):
-    headers = rom_file.read(16)
-    # Read trainer
-    if headers[6] & 0x04 != 0:
-        rom_file.read(512)
-    # Read PRG ROM
-    prg_rom = []
-    if headers[4] > 0:
-        for x in range(headers[4] * 16):
-            prg_rom.append(rom_file.read(1024))
-    # Read CHR ROM
-    chr_rom = []
-    if headers[5] > 0:
-        for x in range(headers[5] * 8):
-            chr_rom.append(rom_file.read(1024))
-
-    prg_ram = [0 for x in range((headers[8] if headers[8] > 0 else 1) * 8 * 1024)]
+from nesrs.state import pack_state, unpack_state, load_buffer
+
+# PRG ROM map (4 x 8Kb banks), CHR map (8 x 1Kb banks), PRG RAM enabled, mirroring
+CARTRIDGE_STATE = struct.Struct('<4H8H?B')
+
+
+class Mirroring(Enum):
+    HORIZONTAL = 0
+    VERTICAL = 1
+    FOUR_SCREEN = 2
+    SINGLE_SCREEN_LOW = 3
+    SINGLE_SCREEN_HIGH = 4
+
+
+class INesHeader(object):
+    __slots__ = (
+        'is_nes2',
+        'mapper',
+        'submapper',
+        'mirroring',
+        'has_battery',
+        'has_trainer',
+        'console_type',
+        'timing',
+        'prg_rom_size',
+        'chr_rom_size',
+        'prg_ram_size',
+        'prg_nvram_size',
+        'chr_ram_size',
+        'chr_nvram_size',
+    )
+
+
+def _nes2_rom_size(lsb, msb, unit):
+    if msb == 0x0F:
+        # Exponent-multiplier notation
+        return (1 << (lsb >> 2)) * ((lsb & 0x03) * 2 + 1)
+
+    return ((msb << 8) | lsb) * unit
+
+
+def _nes2_ram_size(shift):
+    return 64 << shift if shift > 0 else 0
+
+
+def parse_ines_header(data):
+    if len(data) < 16 or bytes(data[0:4]) != b'NES\x1a':
+        raise ValueError('Not an iNES file')
+
+    header = INesHeader()
+    header.is_nes2 = (data[7] & 0x0C) == 0x08
+    header.has_battery = (data[6] & 0x02) != 0
+    header.has_trainer = (data[6] & 0x04) != 0
+    if data[6] & 0x08 != 0:
+        header.mirroring = Mirroring.FOUR_SCREEN
+    elif data[6] & 0x01 != 0:
+        header.mirroring = Mirroring.VERTICAL
+    else:
+        header.mirroring = Mirroring.HORIZONTAL
+
+    if header.is_nes2:
+        header.mapper = ((data[8] & 0x0F) << 8) | (data[7] & 0xF0) | (data[6] >> 4)
+        header.submapper = data[8] >> 4
+        header.console_type = data[7] & 0x03
+        header.timing = data[12] & 0x03
+        header.prg_rom_size = _nes2_rom_size(data[4], data[9] & 0x0F, 16 * 1024)
+        header.chr_rom_size = _nes2_rom_size(data[5], data[9] >> 4, 8 * 1024)
+        header.prg_ram_size = _nes2_ram_size(data[10] & 0x0F)
+        header.prg_nvram_size = _nes2_ram_size(data[10] >> 4)
+        header.chr_ram_size = _nes2_ram_size(data[11] & 0x0F)
+        header.chr_nvram_size = _nes2_ram_size(data[11] >> 4)
+    else:
+        # Old dumping tools wrote garbage (e.g. "DiskDude!") in bytes 7-15, the upper mapper nibble can't be
+        # trusted then
+        mapper_high = data[7] & 0xF0 if not any(data[12:16]) else 0
+        header.mapper = mapper_high | (data[6] >> 4)
+        header.submapper = 0
+        header.console_type = data[7] & 0x03
+        header.timing = 0
+        header.prg_rom_size = data[4] * 16 * 1024
+        header.chr_rom_size = data[5] * 8 * 1024
+        prg_ram_size = (data[8] if data[8] > 0 else 1) * 8 * 1024
+        header.prg_ram_size = 0 if header.has_battery else prg_ram_size
+        header.prg_nvram_size = prg_ram_size if header.has_battery else 0
+        header.chr_ram_size = 8 * 1024 if header.chr_rom_size == 0 else 0
+        header.chr_nvram_size = 0
+
+    return header
+
+
+def read_ines_rom(rom_file, use_mmap=False):
+    # PRG and CHR ROM are zero-copy views into a single read of the file (or into a read-only map of it,
+    # which stays valid after rom_file is closed)
+    if use_mmap:
+        rom = memoryview(mmap.mmap(rom_file.fileno(), 0, access=mmap.ACCESS_READ))
+    else:
+        rom = memoryview(rom_file.read())
+
+    header = parse_ines_header(rom[0:16])
+
+    offset = 16
+    # Skip trainer
+    if header.has_trainer:
+        offset += 512
+    # PRG ROM
+    prg_rom = rom[offset:offset + header.prg_rom_size]
+    offset += header.prg_rom_size
+    # CHR ROM
+    chr_rom = rom[offset:offset + header.chr_rom_size]
+    if len(prg_rom) == 0 or len(prg_rom) != header.prg_rom_size or len(chr_rom) != header.chr_rom_size:
+        raise ValueError('Truncated iNES file')
+
+    # At least 8Kb of PRG RAM is always present at 0x6000 - 0x7FFF
+    prg_ram = bytearray(max(header.prg_ram_size + header.prg_nvram_size, 8 * 1024))
 
     chr_mem = chr_rom
     is_chr_mem_ram = False
     if len(chr_rom) == 0:
-        chr_mem = [[0 for y in range(1024)] for x in range(8)]
+        chr_mem = bytearray(max(header.chr_ram_size + header.chr_nvram_size, 8 * 1024))
         is_chr_mem_ram = True
 
-    return Cartridge(prg_rom, prg_ram, chr_mem, is_chr_mem_ram)
+    from nesrs.mappers import MAPPERS
+    if header.mapper not in MAPPERS:
+        raise ValueError('Unsupported mapper %d' % header.mapper)
+
+    return MAPPERS[header.mapper](prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header)
 
 
 class Cartridge(object):
+    # NROM (mapper 0) and the base of all the other mappers in nesrs.mappers.
+    #
+    # PRG ROM is mapped in 8Kb banks (_prg_rom_map, 4 slots for 0x8000 - 0xFFFF) and CHR memory in 1Kb banks
+    # (_chr_map, 8 slots for 0x0000 - 0x1FFF). Mappers change the maps only through the _set_*_bank methods,
+    # which re-point the affected CPU pages and CHR views, so reads never do any bank arithmetic.
+
+    # Whether clock_scanline may raise an IRQ, the PPU then has to be caught up at every scanline
+    has_scanline_irq = False
 
-    def __init__(self, prg_rom, prg_ram, chr_mem, is_chr_mem_ram):
+    def __init__(self, prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header=None):
+        self.header = header
         self._prg_rom = prg_rom
         self._prg_ram = prg_ram
         self._chr_mem = chr_mem
         self._is_chr_mem_ram = is_chr_mem_ram
 
-        self._prg_rom_map = [i & (len(self._prg_rom) - 1) for i in range(32)]
+        self.mirroring = header.mirroring if header is not None else Mirroring.HORIZONTAL
+        # Called by mappers that raise IRQs with True when they assert the /IRQ line, with False when the IRQ is
+        # acknowledged
+        self.irq_handler = None
+        self._irq = False
+        # Called with no arguments right before the CHR banks or the mirroring change
+        self.ppu_mapping_listener = None
+        # Called with the slot (0 - 3, 8Kb from 0x8000) right after the PRG ROM bank of a slot changes
+        self.prg_mapping_listener = None
+
+        self._prg_rom_pages = [prg_rom[i:i + 0x100] for i in range(0, len(prg_rom), 0x100)]
+        self._prg_rom_bank_count = len(prg_rom) >> 13 if len(prg_rom) >= 0x2000 else 1
+        self._prg_rom_map = [i % self._prg_rom_bank_count for i in range(4)]
+        # The same views every time PRG RAM is enabled, the recompiler caches blocks per page view
+        prg_ram = memoryview(prg_ram)
+        self._prg_ram_pages = [prg_ram[i:i + 0x100] for i in range(0, 0x2000, 0x100)]
+        self._prg_ram_enabled = True
+
+        chr_mem = memoryview(chr_mem)
+        self._chr_pages = [chr_mem[i:i + 0x400] for i in range(0, len(chr_mem), 0x400)]
+        self._chr_map = [i % len(self._chr_pages) for i in range(8)]
+        self._chr_banks = [self._chr_pages[bank] for bank in self._chr_map]
+
+        self._cpu_memory = None
+
+    def map_prg_memory(self, cpu_memory):
+        # PRG RAM and PRG ROM pages are read (and PRG RAM written) by the CPU without calling the cartridge
+        self._cpu_memory = cpu_memory
 
+        self._update_prg_ram_pages()
+        for slot in range(4):
+            self._update_prg_rom_pages(slot)
+
+    def _update_prg_ram_pages(self):
+        if self._cpu_memory is None:
+            return
+
+        for page in range(0x60, 0x80):
+            view = self._prg_ram_pages[page & 0x1F] if self._prg_ram_enabled else None
+            self._cpu_memory.map_read_page(page, view)
+            self._cpu_memory.map_write_page(page, view)
+
+    def _update_prg_rom_pages(self, slot):
+        if self._cpu_memory is None:
+            return
+
+        bank = self._prg_rom_map[slot]
+        self._cpu_memory.map_read_pages(0x80 + (slot << 5), self._prg_rom_pages[bank << 5:(bank + 1) << 5])
+        if self.prg_mapping_listener is not None:
+            self.prg_mapping_listener(slot)
+
+    #
+    # Bank switching
+    #
+    def _set_prg_bank_8k(self, slot, bank):
+        bank %= self._prg_rom_bank_count
+        if self._prg_rom_map[slot] != bank:
+            self._prg_rom_map[slot] = bank
+            self._update_prg_rom_pages(slot)
+
+    def _set_prg_bank_16k(self, slot, bank):
+        self._set_prg_bank_8k(slot * 2, bank * 2)
+        self._set_prg_bank_8k(slot * 2 + 1, bank * 2 + 1)
+
+    def _set_prg_bank_32k(self, bank):
+        self._set_prg_bank_16k(0, bank * 2)
+        self._set_prg_bank_16k(1, bank * 2 + 1)
+
+    def _set_prg_ram_enabled(self, enabled):
+        if self._prg_ram_enabled != enabled:
+            self._prg_ram_enabled = enabled
+            self._update_prg_ram_pages()
+
+    def _set_chr_bank_1k(self, slot, bank):
+        bank %= len(self._chr_pages)
+        if self._chr_map[slot] == bank:
+            return
+
+        if self.ppu_mapping_listener is not None:
+            self.ppu_mapping_listener()
+        self._chr_map[slot] = bank
+        self._chr_banks[slot] = self._chr_pages[bank]
+
+    def _set_chr_bank_4k(self, slot, bank):
+        for i in range(4):
+            self._set_chr_bank_1k(slot * 4 + i, bank * 4 + i)
+
+    def _set_chr_bank_8k(self, bank):
+        for i in range(8):
+            self._set_chr_bank_1k(i, bank * 8 + i)
+
+    def _set_mirroring(self, mirroring):
+        if self.mirroring != mirroring:
+            if self.ppu_mapping_listener is not None:
+                self.ppu_mapping_listener()
+            self.mirroring = mirroring
+
+    def _set_irq(self, asserted):
+        if asserted != self._irq:
+            self._irq = asserted
+            if self.irq_handler is not None:
+                self.irq_handler(asserted)
+
+    #
+    # Save states
+    #
+    def save_state(self):
+        mapping = CARTRIDGE_STATE.pack(*self._prg_rom_map, *self._chr_map, self._prg_ram_enabled,
+                                       self.mirroring.value)
+        chr_ram = self._chr_mem if self._is_chr_mem_ram else b''
+        return pack_state(b'CART', mapping, self._save_registers(), self._prg_ram, chr_ram)
+
+    def load_state(self, data):
+        mapping, registers, prg_ram, chr_ram = unpack_state(b'CART', data, 4)
+        mapping = CARTRIDGE_STATE.unpack(mapping)
+
+        # Only the CPU pages of banks that differ are re-pointed
+        for slot in range(4):
+            if self._prg_rom_map[slot] != mapping[slot]:
+                self._prg_rom_map[slot] = mapping[slot]
+                self._update_prg_rom_pages(slot)
+        self._set_prg_ram_enabled(mapping[12])
+        self._chr_map[:] = mapping[4:12]
+        self._chr_banks[:] = [self._chr_pages[bank] for bank in self._chr_map]
+        self.mirroring = Mirroring(mapping[13])
+
+        self._load_registers(registers)
+        load_buffer(self._prg_ram, prg_ram)
+        if self._is_chr_mem_ram:
+            load_buffer(self._chr_mem, chr_ram)
+
+    def _save_registers(self):
+        # Mapper registers that are not already captured by the bank maps
+        return b''
+
+    def _load_registers(self, data):
+        pass
+
+    #
+    # CPU bus
+    #
     def read_prg_memory(self, cpu_address):
         if 0x4020 <= cpu_address <= 0x5FFF:
             # Expansion ROM
             return 0
         elif 0x6000 <= cpu_address <= 0x7FFF:
             # RAM
-            return self._prg_ram[cpu_address & 0x1FFF];
+            return self._prg_ram[cpu_address & 0x1FFF] if self._prg_ram_enabled else 0
         elif 0x8000 <= cpu_address:
             # ROM
-            return self._prg_rom[self._prg_rom_map[(cpu_address & 0x7FFF) >> 10]][(cpu_address & 0x03FF)]
+            return self._prg_rom[(self._prg_rom_map[(cpu_address & 0x7FFF) >> 13] << 13) | (cpu_address & 0x1FFF)]
 
         return 0
 
     def write_prg_memory(self, cpu_address, value):
         if 0x6000 <= cpu_address <= 0x7FFF:
             # RAM
-            self._prg_ram[cpu_address & 0x1FFF] = value
\ No newline at end of file
+            if self._prg_ram_enabled:
+                self._prg_ram[cpu_address & 0x1FFF] = value
+        elif 0x8000 <= cpu_address:
+            # ROM, mapper registers
+            self._write_register(cpu_address, value)
+
+    def _write_register(self, cpu_address, value):
+        # NROM has no registers
+        pass
+
+    #
+    # PPU bus
+    #
+    def read_chr_memory(self, ppu_address):
+        return self._chr_banks[ppu_address >> 10][ppu_address & 0x03FF]
+
+    def write_chr_memory(self, ppu_address, value):
+        if self._is_chr_mem_ram:
+            self._chr_banks[ppu_address >> 10][ppu_address & 0x03FF] = value
+
+    def clock_scanline(self):
+        # Called by the PPU once per rendered scanline, for mappers that count them
+        pass
@@ -0,0 +1,74 @@
+from nesrs.state import pack_state, unpack_state
+
+# Buttons, in the order the shift register reports them
+BUTTON_A = 0x01
+BUTTON_B = 0x02
+BUTTON_SELECT = 0x04
+BUTTON_START = 0x08
+BUTTON_UP = 0x10
+BUTTON_DOWN = 0x20
+BUTTON_LEFT = 0x40
+BUTTON_RIGHT = 0x80
+
+# Upper bits of $4016/$4017 reads, left on the data bus by the address high byte
+OPEN_BUS = 0x40
+
+
+class Controller(object):
+    # Standard controller. Writing 1 to $4016 keeps reloading the shift register from the buttons, writing 0 latches
+    # them, then every read shifts out one button, A first, and 1s once all 8 are out.
+    #
+    # The buttons come from the buttons attribute, or from a movie port (one byte per frame, see nesrs.movie) indexed
+    # by the PPU frame, so playback needs no per-frame code.
+
+    def __init__(self):
+        self.buttons = 0
+        self._strobe = 0
+        self._shift = 0
+
+        self._movie_frames = None
+        self._ppu = None
+        self._first_frame = 0
+
+    def play(self, frames, ppu, first_frame):
+        # frames[i] are the buttons while ppu.frame == first_frame + i, none after the last one
+        self._movie_frames = frames
+        self._ppu = ppu
+        self._first_frame = first_frame
+
+    def stop(self):
+        self._movie_frames = None
+        self._ppu = None
+
+    def write(self, value):
+        if self._strobe != 0:
+            self._shift = self._current_buttons()
+        self._strobe = value & 0x01
+        if self._strobe != 0:
+            self._shift = self._current_buttons()
+
+    def read(self):
+        if self._strobe != 0:
+            self._shift = self._current_buttons()
+        bit = self._shift & 0x01
+        self._shift = (self._shift >> 1) | 0x80
+
+        return bit | OPEN_BUS
+
+    def _current_buttons(self):
+        frames = self._movie_frames
+        if frames is None:
+            return self.buttons
+
+        frame = self._ppu.frame - self._first_frame
+        return frames[frame] if 0 <= frame < len(frames) else 0
+
+    #
+    # Save states
+    #
+    def save_state(self):
+        return pack_state(b'CTRL', bytes([self.buttons, self._strobe, self._shift]))
+
+    def load_state(self, data):
+        registers, = unpack_state(b'CTRL', data, 1)
+        self.buttons, self._strobe, self._shift = registers
@@ -0,0 +1,185 @@
+import argparse
+import struct
+
+from nesrs.cartridge import read_ines_rom
+from nesrs.cpu import OP_CODES, CpuAddressingMode
+from nesrs.disasm import BRANCH, disassemble
+
+# Bits of a coverage byte
+EXECUTED = 0x01
+NOT_TAKEN = 0x02
+TAKEN = 0x04
+
+# "NCOV", version, PRG ROM size
+COVERAGE_HEADER = struct.Struct('<4sBI')
+COVERAGE_VERSION = 1
+
+
+class Coverage(object):
+    # A byte per PRG ROM offset, so code in every bank is told apart, then a byte per CPU address in 0x0000 - 0x7FFF
+    # (RAM, PRG RAM). Bit 0 is set when an instruction starting there ran, bits 1 and 2 when a branch there was not
+    # taken or taken. An executed op costs one index and one store: _pages follows the PRG ROM bank mapping of the
+    # cartridge and holds a 256 byte view of the data for every CPU page.
+
+    def __init__(self, prg_rom_size, data=None):
+        self.prg_rom_size = prg_rom_size
+        self.data = data if data is not None else bytearray(prg_rom_size + 0x8000)
+        if len(self.data) != prg_rom_size + 0x8000:
+            raise ValueError('Coverage data does not match the PRG ROM size')
+
+        self._cartridge = None
+        self._pages = None
+
+    def ram_index(self, address):
+        # Index in data of a CPU address below 0x8000
+        return self.prg_rom_size + address
+
+    #
+    # Collection
+    #
+    def attach(self, cartridge):
+        # Follows the PRG ROM banks of the cartridge, for the CPU running it (CPU.set_coverage)
+        self._cartridge = cartridge
+        data = memoryview(self.data)
+        self._pages = [data[self.ram_index(page << 8):self.ram_index(page << 8) + 0x100] for page in range(0x80)]
+        self._pages += [None] * 0x80
+        for slot in range(4):
+            self._map_slot(slot)
+        cartridge.prg_mapping_listener = self._map_slot
+
+    def _map_slot(self, slot):
+        data = memoryview(self.data)
+        # PRG ROM smaller than 8Kb is mirrored in the slot
+        bank_size = min(0x2000, self.prg_rom_size)
+        start = (self._cartridge._prg_rom_map[slot] << 13) % self.prg_rom_size
+        for page in range(0x20):
+            offset = start + ((page << 8) % bank_size)
+            self._pages[0x80 + (slot << 5) + page] = data[offset:offset + 0x100]
+
+    def instrument(self, cpu, op_table):
+        # The op table with every op wrapped by a marking closure
+        if self._pages is None:
+            self.attach(cpu._cpu_memory._cartridge)
+
+        branches = set(op_code for op_code, (_, mode) in OP_CODES.items() if mode == CpuAddressingMode.REL)
+        return [self._cover_branch(cpu, op) if op_code in branches else self._cover_op(cpu, op)
+                for op_code, op in enumerate(op_table)]
+
+    def _cover_op(self, cpu, op):
+        pages = self._pages
+
+        def covered():
+            pc = cpu._pc - 1
+            pages[pc >> 8][pc & 0xFF] = EXECUTED
+            op()
+
+        return covered
+
+    def _cover_branch(self, cpu, op):
+        pages = self._pages
+
+        def covered():
+            pc = cpu._pc - 1
+            op()
+            # Taken branches take 3 or 4 cycles
+            pages[pc >> 8][pc & 0xFF] |= EXECUTED | (TAKEN if cpu.op_cycles > 2 else NOT_TAKEN)
+
+        return covered
+
+    def clear(self):
+        self.data[:] = bytes(len(self.data))
+
+    #
+    # Merging
+    #
+    def merge(self, other):
+        # Union with another Coverage (or its data) of the same ROM
+        other_data = other.data if isinstance(other, Coverage) else other
+        if len(other_data) != len(self.data):
+            raise ValueError('Coverage of another ROM')
+        merged = int.from_bytes(self.data, 'little') | int.from_bytes(other_data, 'little')
+        self.data[:] = merged.to_bytes(len(self.data), 'little')
+
+    def save(self, path):
+        with open(path, 'wb') as coverage_file:
+            coverage_file.write(COVERAGE_HEADER.pack(b'NCOV', COVERAGE_VERSION, self.prg_rom_size))
+            coverage_file.write(self.data)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as coverage_file:
+            data = coverage_file.read()
+
+        if len(data) < COVERAGE_HEADER.size:
+            raise ValueError('Truncated coverage')
+        tag, version, prg_rom_size = COVERAGE_HEADER.unpack_from(data)
+        if tag != b'NCOV':
+            raise ValueError('Not a coverage file')
+        if version != COVERAGE_VERSION:
+            raise ValueError('Unsupported coverage version %d' % version)
+        return Coverage(prg_rom_size, bytearray(data[COVERAGE_HEADER.size:]))
+
+    #
+    # Report
+    #
+    def executed_offsets(self):
+        # PRG ROM offsets of the instructions that ran
+        data = self.data
+        return [offset for offset in range(self.prg_rom_size) if data[offset]]
+
+    def report(self, disassembly):
+        # Instructions and branch directions of the disassembly that ran, and the blocks that never did
+        data = self.data
+        instructions = 0
+        executed = 0
+        branches = 0
+        directions = 0
+        missed = []
+        for address in sorted(disassembly.blocks):
+            block = disassembly.blocks[address]
+            block_executed = 0
+            for instruction_address in disassembly.block_instructions(block):
+                if data[disassembly.rom_offset(instruction_address)] & EXECUTED:
+                    block_executed += 1
+            instructions += block.instruction_count
+            executed += block_executed
+            if block_executed == 0:
+                missed.append(address)
+
+            if block.exit == BRANCH:
+                branches += 1
+                last = disassembly.block_instructions(block)[-1]
+                outcomes = data[disassembly.rom_offset(last)]
+                directions += ((outcomes & TAKEN) != 0) + ((outcomes & NOT_TAKEN) != 0)
+
+        lines = ['Instructions %d / %d (%.1f%%)' % (executed, instructions, _percent(executed, instructions)),
+                 'Branch directions %d / %d (%.1f%%)' % (directions, 2 * branches, _percent(directions, 2 * branches)),
+                 'Blocks never executed %d / %d' % (len(missed), len(disassembly.blocks))]
+        for address in missed:
+            lines.append('  %04X bank %d' % (address, disassembly.blocks[address].bank))
+        return '\n'.join(lines)
+
+
+def _percent(count, total):
+    return 100.0 * count / total if total else 100.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merges coverage files and reports them against the disassembly')
+    parser.add_argument('rom')
+    parser.add_argument('coverage', nargs='+')
+    parser.add_argument('--output', help='writes the merged coverage to this file')
+    args = parser.parse_args()
+
+    with open(args.rom, 'rb') as rom_file:
+        cartridge = read_ines_rom(rom_file)
+    coverage = Coverage(len(cartridge._prg_rom))
+    for path in args.coverage:
+        coverage.merge(Coverage.load(path))
+    if args.output:
+        coverage.save(args.output)
+    print(coverage.report(disassemble(cartridge)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,8 @@
+import struct
 from enum import Enum
+from functools import partial
+
+from nesrs.state import pack_state, unpack_state, load_buffer
 
 C_FLAG = 0x01
 Z_FLAG = 0x02
@@ -29,16 +33,105 @@ OP_CYCLES = [
    ]
 
 
+# Masks that clear the flags an op rebuilds
+NOT_NZ = 0xFF & ~(N_FLAG | Z_FLAG)
+NOT_NZC = 0xFF & ~(N_FLAG | Z_FLAG | C_FLAG)
+NOT_NVZ = 0xFF & ~(N_FLAG | V_FLAG | Z_FLAG)
+NOT_NVZC = 0xFF & ~(N_FLAG | V_FLAG | Z_FLAG | C_FLAG)
+
+
 def is_page_boundary_crossed(address1, address2):
     return (address1 >> 8) != (address2 >> 8)
 
 
+#
+# ALU lookup tables. Every op that rebuilds N, Z, C or V does it with one lookup in a table built at import,
+# the flag tables hold only the flags the op changes.
+#
+def _build_nz_flags():
+    return bytes((value & N_FLAG) | (Z_FLAG if value == 0 else 0) for value in range(0x100))
+
+
+def _build_adc_tables():
+    # Indexed by (carry << 16) | (a << 8) | value. SBC is ADC of the inverted value.
+    results = bytearray(0x20000)
+    flags = bytearray(0x20000)
+    index = 0
+    for carry in range(2):
+        for a in range(0x100):
+            for value in range(0x100):
+                res = a + value + carry
+                results[index] = res & 0xFF
+                flags[index] = (NZ_FLAGS[res & 0xFF] |
+                                (V_FLAG if (~(a ^ value) & (a ^ res) & 0x80) != 0 else 0) |
+                                (C_FLAG if res > 0xFF else 0))
+                index += 1
+
+    return bytes(results), bytes(flags)
+
+
+def _build_compare_flags():
+    # Indexed by (register << 8) | value
+    return bytes(NZ_FLAGS[(register - value) & 0xFF] | (C_FLAG if register >= value else 0)
+                 for register in range(0x100) for value in range(0x100))
+
+
+def _build_shift_tables(shift):
+    # Indexed by (carry << 8) | value, shift(value, carry) returns (result, carry out)
+    results = bytearray(0x200)
+    flags = bytearray(0x200)
+    for carry in range(2):
+        for value in range(0x100):
+            res, carry_out = shift(value, carry)
+            results[(carry << 8) | value] = res
+            flags[(carry << 8) | value] = NZ_FLAGS[res] | carry_out
+
+    return bytes(results), bytes(flags)
+
+
+NZ_FLAGS = _build_nz_flags()
+# N and Z of LazyFlagsCPU._nz, N is bit 7 or 8
+LAZY_NZ_FLAGS = bytes((N_FLAG if value & 0x180 else 0) | (Z_FLAG if value & 0xFF == 0 else 0)
+                      for value in range(0x200))
+ADC_RESULTS, ADC_FLAGS = _build_adc_tables()
+COMPARE_FLAGS = _build_compare_flags()
+ASL_RESULTS, ASL_FLAGS = _build_shift_tables(lambda value, carry: ((value << 1) & 0xFF, value >> 7))
+LSR_RESULTS, LSR_FLAGS = _build_shift_tables(lambda value, carry: (value >> 1, value & 0x01))
+ROL_RESULTS, ROL_FLAGS = _build_shift_tables(lambda value, carry: (((value << 1) & 0xFF) | carry, value >> 7))
+ROR_RESULTS, ROR_FLAGS = _build_shift_tables(lambda value, carry: ((value >> 1) | (carry << 7), value & 0x01))
+
+
 class InterruptType(Enum):
     RESET = 0
     NMI = 1
     IRQ = 2
 
 
+# Pending interrupts are a bitmask, the highest bit set is the one serviced next: RESET > NMI > IRQ.
+# InterruptType stays the public name of each.
+IRQ_PENDING = 0x01
+NMI_PENDING = 0x02
+RESET_PENDING = 0x04
+# Sources holding the /IRQ line low (CPU.set_irq_line)
+IRQ_SOURCE_APU = 0x01
+IRQ_SOURCE_CARTRIDGE = 0x02
+INTERRUPT_MASKS = {
+    InterruptType.RESET: RESET_PENDING,
+    InterruptType.NMI: NMI_PENDING,
+    InterruptType.IRQ: IRQ_PENDING,
+}
+# Pending bitmask -> the interrupt serviced next
+_NEXT_INTERRUPT = [0, IRQ_PENDING, NMI_PENDING, NMI_PENDING] + [RESET_PENDING] * 4
+
+
+class StopReason(Enum):
+    CYCLES = 0
+    INSTRUCTIONS = 1
+    PC = 2
+    BREAKPOINT = 3
+    PREDICATE = 4
+
+
 class CpuAddressingMode(Enum):
     # 1. Accumulator addressing - ACC
     ACC = 0
@@ -83,44 +176,530 @@ class CpuAddressingMode(Enum):
     IND_ = 16  # isPageWrappingAllowed - FALSE
 
 
+# Op code -> (op, addressing mode). Resolved once per CPU into a flat dispatch table.
+OP_CODES = {
+    # 1. ADC
+    0x69: ('adc', CpuAddressingMode.IMM),
+    0x65: ('adc', CpuAddressingMode.ZP),
+    0x75: ('adc', CpuAddressingMode.ZPX),
+    0x6D: ('adc', CpuAddressingMode.ABS),
+    0x7D: ('adc', CpuAddressingMode.ABSX_),
+    0x79: ('adc', CpuAddressingMode.ABSY_),
+    0x61: ('adc', CpuAddressingMode.INDX),
+    0x71: ('adc', CpuAddressingMode.IND_Y_),
+
+    # 2. AND
+    0x29: ('and', CpuAddressingMode.IMM),
+    0x25: ('and', CpuAddressingMode.ZP),
+    0x35: ('and', CpuAddressingMode.ZPX),
+    0x2D: ('and', CpuAddressingMode.ABS),
+    0x3D: ('and', CpuAddressingMode.ABSX_),
+    0x39: ('and', CpuAddressingMode.ABSY_),
+    0x21: ('and', CpuAddressingMode.INDX),
+    0x31: ('and', CpuAddressingMode.IND_Y_),
+
+    # 3. ASL
+    0x0A: ('asl', CpuAddressingMode.ACC),
+    0x06: ('asl', CpuAddressingMode.ZP),
+    0x16: ('asl', CpuAddressingMode.ZPX),
+    0x0E: ('asl', CpuAddressingMode.ABS),
+    0x1E: ('asl', CpuAddressingMode.ABSX),
+
+    # 4. BCC
+    0x90: ('bcc', CpuAddressingMode.REL),
+
+    # 5. BCS
+    0xB0: ('bcs', CpuAddressingMode.REL),
+
+    # 6. BEQ
+    0xF0: ('beq', CpuAddressingMode.REL),
+
+    # 7. BIT
+    0x24: ('bit', CpuAddressingMode.ZP),
+    0x2C: ('bit', CpuAddressingMode.ABS),
+
+    # 8. BMI
+    0x30: ('bmi', CpuAddressingMode.REL),
+
+    # 9. BNE
+    0xD0: ('bne', CpuAddressingMode.REL),
+
+    # 10. BPL
+    0x10: ('bpl', CpuAddressingMode.REL),
+
+    # 11. BRK
+    0x00: ('brk', CpuAddressingMode.IMPL),
+
+    # 12. BVC
+    0x50: ('bvc', CpuAddressingMode.REL),
+
+    # 13. BVS
+    0x70: ('bvs', CpuAddressingMode.REL),
+
+    # 14. CLC
+    0x18: ('clc', CpuAddressingMode.IMPL),
+
+    # 15. CLD
+    0xD8: ('cld', CpuAddressingMode.IMPL),
+
+    # 16. CLI
+    0x58: ('cli', CpuAddressingMode.IMPL),
+
+    # 17. CLV
+    0xB8: ('clv', CpuAddressingMode.IMPL),
+
+    # 18. CMP
+    0xC9: ('cmp', CpuAddressingMode.IMM),
+    0xC5: ('cmp', CpuAddressingMode.ZP),
+    0xD5: ('cmp', CpuAddressingMode.ZPX),
+    0xCD: ('cmp', CpuAddressingMode.ABS),
+    0xDD: ('cmp', CpuAddressingMode.ABSX_),
+    0xD9: ('cmp', CpuAddressingMode.ABSY_),
+    0xC1: ('cmp', CpuAddressingMode.INDX),
+    0xD1: ('cmp', CpuAddressingMode.IND_Y_),
+
+    # 19. CPX
+    0xE0: ('cpx', CpuAddressingMode.IMM),
+    0xE4: ('cpx', CpuAddressingMode.ZP),
+    0xEC: ('cpx', CpuAddressingMode.ABS),
+
+    # 20. CPY
+    0xC0: ('cpy', CpuAddressingMode.IMM),
+    0xC4: ('cpy', CpuAddressingMode.ZP),
+    0xCC: ('cpy', CpuAddressingMode.ABS),
+
+    # 21. DEC
+    0xC6: ('dec', CpuAddressingMode.ZP),
+    0xD6: ('dec', CpuAddressingMode.ZPX),
+    0xCE: ('dec', CpuAddressingMode.ABS),
+    0xDE: ('dec', CpuAddressingMode.ABSX),
+
+    # 22. DEX
+    0xCA: ('dex', CpuAddressingMode.IMPL),
+
+    # 23. DEY
+    0x88: ('dey', CpuAddressingMode.IMPL),
+
+    # 24. EOR
+    0x49: ('eor', CpuAddressingMode.IMM),
+    0x45: ('eor', CpuAddressingMode.ZP),
+    0x55: ('eor', CpuAddressingMode.ZPX),
+    0x4D: ('eor', CpuAddressingMode.ABS),
+    0x5D: ('eor', CpuAddressingMode.ABSX_),
+    0x59: ('eor', CpuAddressingMode.ABSY_),
+    0x41: ('eor', CpuAddressingMode.INDX),
+    0x51: ('eor', CpuAddressingMode.IND_Y_),
+
+    # 25. INC
+    0xE6: ('inc', CpuAddressingMode.ZP),
+    0xF6: ('inc', CpuAddressingMode.ZPX),
+    0xEE: ('inc', CpuAddressingMode.ABS),
+    0xFE: ('inc', CpuAddressingMode.ABSX),
+
+    # 26. INX
+    0xE8: ('inx', CpuAddressingMode.IMPL),
+
+    # 27. INY
+    0xC8: ('iny', CpuAddressingMode.IMPL),
+
+    # 28. JMP
+    0x4C: ('jmp', CpuAddressingMode.ABS),
+    0x6C: ('jmp', CpuAddressingMode.IND_),
+
+    # 29. JSR
+    0x20: ('jsr', CpuAddressingMode.ABS),
+
+    # 30. LDA
+    0xA9: ('lda', CpuAddressingMode.IMM),
+    0xA5: ('lda', CpuAddressingMode.ZP),
+    0xB5: ('lda', CpuAddressingMode.ZPX),
+    0xAD: ('lda', CpuAddressingMode.ABS),
+    0xBD: ('lda', CpuAddressingMode.ABSX_),
+    0xB9: ('lda', CpuAddressingMode.ABSY_),
+    0xA1: ('lda', CpuAddressingMode.INDX),
+    0xB1: ('lda', CpuAddressingMode.IND_Y_),
+
+    # 31. LDX
+    0xA2: ('ldx', CpuAddressingMode.IMM),
+    0xA6: ('ldx', CpuAddressingMode.ZP),
+    0xB6: ('ldx', CpuAddressingMode.ZPY),
+    0xAE: ('ldx', CpuAddressingMode.ABS),
+    0xBE: ('ldx', CpuAddressingMode.ABSY_),
+
+    # 32. LDY
+    0xA0: ('ldy', CpuAddressingMode.IMM),
+    0xA4: ('ldy', CpuAddressingMode.ZP),
+    0xB4: ('ldy', CpuAddressingMode.ZPX),
+    0xAC: ('ldy', CpuAddressingMode.ABS),
+    0xBC: ('ldy', CpuAddressingMode.ABSX_),
+
+    # 33. LSR
+    0x4A: ('lsr', CpuAddressingMode.ACC),
+    0x46: ('lsr', CpuAddressingMode.ZP),
+    0x56: ('lsr', CpuAddressingMode.ZPX),
+    0x4E: ('lsr', CpuAddressingMode.ABS),
+    0x5E: ('lsr', CpuAddressingMode.ABSX),
+
+    # 34. NOP
+    0xEA: ('nop', CpuAddressingMode.IMPL),
+
+    # 35. ORA
+    0x09: ('ora', CpuAddressingMode.IMM),
+    0x05: ('ora', CpuAddressingMode.ZP),
+    0x15: ('ora', CpuAddressingMode.ZPX),
+    0x0D: ('ora', CpuAddressingMode.ABS),
+    0x1D: ('ora', CpuAddressingMode.ABSX_),
+    0x19: ('ora', CpuAddressingMode.ABSY_),
+    0x01: ('ora', CpuAddressingMode.INDX),
+    0x11: ('ora', CpuAddressingMode.IND_Y_),
+
+    # 36. PHA
+    0x48: ('pha', CpuAddressingMode.IMPL),
+
+    # 37. PHP
+    0x08: ('php', CpuAddressingMode.IMPL),
+
+    # 38. PLA
+    0x68: ('pla', CpuAddressingMode.IMPL),
+
+    # 39. PLP
+    0x28: ('plp', CpuAddressingMode.IMPL),
+
+    # 40. ROL
+    0x2A: ('rol', CpuAddressingMode.ACC),
+    0x26: ('rol', CpuAddressingMode.ZP),
+    0x36: ('rol', CpuAddressingMode.ZPX),
+    0x2E: ('rol', CpuAddressingMode.ABS),
+    0x3E: ('rol', CpuAddressingMode.ABSX),
+
+    # 41. ROR
+    0x6A: ('ror', CpuAddressingMode.ACC),
+    0x66: ('ror', CpuAddressingMode.ZP),
+    0x76: ('ror', CpuAddressingMode.ZPX),
+    0x6E: ('ror', CpuAddressingMode.ABS),
+    0x7E: ('ror', CpuAddressingMode.ABSX),
+
+    # 42. RTI
+    0x40: ('rti', CpuAddressingMode.IMPL),
+
+    # 43. RTS
+    0x60: ('rts', CpuAddressingMode.IMPL),
+
+    # 44. SBC
+    0xE9: ('sbc', CpuAddressingMode.IMM),
+    0xE5: ('sbc', CpuAddressingMode.ZP),
+    0xF5: ('sbc', CpuAddressingMode.ZPX),
+    0xED: ('sbc', CpuAddressingMode.ABS),
+    0xFD: ('sbc', CpuAddressingMode.ABSX_),
+    0xF9: ('sbc', CpuAddressingMode.ABSY_),
+    0xE1: ('sbc', CpuAddressingMode.INDX),
+    0xF1: ('sbc', CpuAddressingMode.IND_Y_),
+
+    # 45. SEC
+    0x38: ('sec', CpuAddressingMode.IMPL),
+
+    # 46. SED
+    0xF8: ('sed', CpuAddressingMode.IMPL),
+
+    # 47. SEI
+    0x78: ('sei', CpuAddressingMode.IMPL),
+
+    # 48. STA
+    0x85: ('sta', CpuAddressingMode.ZP),
+    0x95: ('sta', CpuAddressingMode.ZPX),
+    0x8D: ('sta', CpuAddressingMode.ABS),
+    0x9D: ('sta', CpuAddressingMode.ABSX),
+    0x99: ('sta', CpuAddressingMode.ABSY),
+    0x81: ('sta', CpuAddressingMode.INDX),
+    0x91: ('sta', CpuAddressingMode.IND_Y),
+
+    # 49. STX
+    0x86: ('stx', CpuAddressingMode.ZP),
+    0x96: ('stx', CpuAddressingMode.ZPY),
+    0x8E: ('stx', CpuAddressingMode.ABS),
+
+    # 50. STY
+    0x84: ('sty', CpuAddressingMode.ZP),
+    0x94: ('sty', CpuAddressingMode.ZPX),
+    0x8C: ('sty', CpuAddressingMode.ABS),
+
+    # 51. TAX
+    0xAA: ('tax', CpuAddressingMode.IMPL),
+
+    # 52. TAY
+    0xA8: ('tay', CpuAddressingMode.IMPL),
+
+    # 53. TSX
+    0xBA: ('tsx', CpuAddressingMode.IMPL),
+
+    # 54. TXA
+    0x8A: ('txa', CpuAddressingMode.IMPL),
+
+    # 55. TXS
+    0x9A: ('txs', CpuAddressingMode.IMPL),
+
+    # 56. TYA
+    0x98: ('tya', CpuAddressingMode.IMPL),
+
+    # Unofficial opcodes
+
+    # DOP
+    0x04: ('dop', CpuAddressingMode.ZP),
+    0x14: ('dop', CpuAddressingMode.ZPX),
+    0x34: ('dop', CpuAddressingMode.ZPX),
+    0x44: ('dop', CpuAddressingMode.ZP),
+    0x54: ('dop', CpuAddressingMode.ZPX),
+    0x64: ('dop', CpuAddressingMode.ZP),
+    0x74: ('dop', CpuAddressingMode.ZPX),
+    0x80: ('dop', CpuAddressingMode.IMM),
+    0x82: ('dop', CpuAddressingMode.IMM),
+    0x89: ('dop', CpuAddressingMode.IMM),
+    0xC2: ('dop', CpuAddressingMode.IMM),
+    0xD4: ('dop', CpuAddressingMode.ZPX),
+    0xE2: ('dop', CpuAddressingMode.IMM),
+    0xF4: ('dop', CpuAddressingMode.ZPX),
+
+    # TOP
+    0x0C: ('top', CpuAddressingMode.ABS),
+    0x1C: ('top', CpuAddressingMode.ABSX_),
+    0x3C: ('top', CpuAddressingMode.ABSX_),
+    0x5C: ('top', CpuAddressingMode.ABSX_),
+    0x7C: ('top', CpuAddressingMode.ABSX_),
+    0xDC: ('top', CpuAddressingMode.ABSX_),
+    0xFC: ('top', CpuAddressingMode.ABSX_),
+
+    # LAX
+    0xA7: ('lax', CpuAddressingMode.ZP),
+    0xB7: ('lax', CpuAddressingMode.ZPY),
+    0xAF: ('lax', CpuAddressingMode.ABS),
+    0xBF: ('lax', CpuAddressingMode.ABSY),
+    0xA3: ('lax', CpuAddressingMode.INDX),
+    0xB3: ('lax', CpuAddressingMode.IND_Y_),
+
+    # AAX
+    0x87: ('aax', CpuAddressingMode.ZP),
+    0x97: ('aax', CpuAddressingMode.ZPY),
+    0x83: ('aax', CpuAddressingMode.INDX),
+    0x8F: ('aax', CpuAddressingMode.ABS),
+
+    # SBC
+    0xEB: ('sbc', CpuAddressingMode.IMM),
+
+    # DCP
+    0xC7: ('dcp', CpuAddressingMode.ZP),
+    0xD7: ('dcp', CpuAddressingMode.ZPX),
+    0xCF: ('dcp', CpuAddressingMode.ABS),
+    0xDF: ('dcp', CpuAddressingMode.ABSX),
+    0xDB: ('dcp', CpuAddressingMode.ABSY),
+    0xC3: ('dcp', CpuAddressingMode.INDX),
+    0xD3: ('dcp', CpuAddressingMode.IND_Y),
+
+    # ISC
+    0xE7: ('isc', CpuAddressingMode.ZP),
+    0xF7: ('isc', CpuAddressingMode.ZPX),
+    0xEF: ('isc', CpuAddressingMode.ABS),
+    0xFF: ('isc', CpuAddressingMode.ABSX),
+    0xFB: ('isc', CpuAddressingMode.ABSY),
+    0xE3: ('isc', CpuAddressingMode.INDX),
+    0xF3: ('isc', CpuAddressingMode.IND_Y),
+
+    # SLO
+    0x07: ('slo', CpuAddressingMode.ZP),
+    0x17: ('slo', CpuAddressingMode.ZPX),
+    0x0F: ('slo', CpuAddressingMode.ABS),
+    0x1F: ('slo', CpuAddressingMode.ABSX),
+    0x1B: ('slo', CpuAddressingMode.ABSY),
+    0x03: ('slo', CpuAddressingMode.INDX),
+    0x13: ('slo', CpuAddressingMode.IND_Y),
+
+    # RLA
+    0x27: ('rla', CpuAddressingMode.ZP),
+    0x37: ('rla', CpuAddressingMode.ZPX),
+    0x2F: ('rla', CpuAddressingMode.ABS),
+    0x3F: ('rla', CpuAddressingMode.ABSX),
+    0x3B: ('rla', CpuAddressingMode.ABSY),
+    0x23: ('rla', CpuAddressingMode.INDX),
+    0x33: ('rla', CpuAddressingMode.IND_Y),
+
+    # SRE
+    0x47: ('sre', CpuAddressingMode.ZP),
+    0x57: ('sre', CpuAddressingMode.ZPX),
+    0x4F: ('sre', CpuAddressingMode.ABS),
+    0x5F: ('sre', CpuAddressingMode.ABSX),
+    0x5B: ('sre', CpuAddressingMode.ABSY),
+    0x43: ('sre', CpuAddressingMode.INDX),
+    0x53: ('sre', CpuAddressingMode.IND_Y),
+
+    # RRA
+    0x67: ('rra', CpuAddressingMode.ZP),
+    0x77: ('rra', CpuAddressingMode.ZPX),
+    0x6F: ('rra', CpuAddressingMode.ABS),
+    0x7F: ('rra', CpuAddressingMode.ABSX),
+    0x7B: ('rra', CpuAddressingMode.ABSY),
+    0x63: ('rra', CpuAddressingMode.INDX),
+    0x73: ('rra', CpuAddressingMode.IND_Y),
+}
+
+
+# CPU cycles DMA halts the CPU for: OAM DMA copies 256 bytes in 512 cycles after one wait cycle (and one more to
+# align with a read cycle when it starts on an odd cycle), a DMC sample fetch steals 4 cycles
+OAM_DMA_CYCLES = 513
+DMC_DMA_CYCLES = 4
+
+# a, x, y, s, p, pc, op cycles, pending interrupts (bitmask of *_PENDING), IRQ line (bitmask of IRQ_SOURCE_*)
+CPU_STATE = struct.Struct('<5BHBBB')
+
+
 class CpuMemory(object):
+    # The 64Kb address space is split in 256 pages of 256 bytes. A page is either backed by a memoryview
+    # that is indexed directly (RAM and its mirrors, PRG ROM, PRG RAM) or, when its view is None, by a
+    # handler called with the full address (registers, expansion area, mapper registers).
+
     def __init__(self, cartridge):
-        self._ram = [0 for i in range(0x800)]  # 2Kb
+        self._ram = bytearray(0x800)  # 2Kb
         self._cartridge = cartridge
 
+        self._read_pages = [None] * 0x100
+        self._write_pages = [None] * 0x100
+        self._read_handlers = [self._read_unmapped] * 0x100
+        self._write_handlers = [self._write_unmapped] * 0x100
+        self._ppu = None
+        self._apu = None
+        self._controllers = None
+
+        # Called with (cycles, align) when DMA halts the CPU, align when one more cycle is taken on odd cycles
+        self.stall_handler = None
+
+        # RAM, mirrored 4 times in 0x0000 - 0x1FFF
+        ram = memoryview(self._ram)
+        for page in range(0x00, 0x20):
+            view = ram[(page & 0x07) << 8:((page & 0x07) + 1) << 8]
+            self.map_read_page(page, view)
+            self.map_write_page(page, view)
+
+        # Cartridge, the expansion area shares page 0x40 with the I/O registers
+        self.set_read_handler(0x40, 0x40, self._read_io)
+        self.set_write_handler(0x40, 0x40, self._write_io)
+        self.set_read_handler(0x41, 0xFF, cartridge.read_prg_memory)
+        self.set_write_handler(0x41, 0xFF, cartridge.write_prg_memory)
+        cartridge.map_prg_memory(self)
+
     def read_memory(self, address):
-        decoded_address = self._decode_cpu_address(address)
+        page = self._read_pages[address >> 8]
+        if page is not None:
+            return page[address & 0xFF]
+
+        return self._read_handlers[address >> 8](address)
 
-        if 0x0 <= decoded_address <= 0x07FF:
-            # RAM
-            return self._ram[decoded_address]
+    def write_memory(self, address, value):
+        page = self._write_pages[address >> 8]
+        if page is not None:
+            page[address & 0xFF] = value
+        else:
+            self._write_handlers[address >> 8](address, value)
+
+    #
+    # Page mapping
+    #
+    def map_read_page(self, page, view):
+        self._read_pages[page] = view
+
+    def map_read_pages(self, first_page, views):
+        self._read_pages[first_page:first_page + len(views)] = views
+
+    def map_write_page(self, page, view):
+        self._write_pages[page] = view
+
+    def set_read_handler(self, first_page, last_page, handler):
+        for page in range(first_page, last_page + 1):
+            self._read_handlers[page] = handler
+
+    def set_write_handler(self, first_page, last_page, handler):
+        for page in range(first_page, last_page + 1):
+            self._write_handlers[page] = handler
+
+    def get_read_handler(self, page):
+        return self._read_handlers[page]
+
+    def get_write_handler(self, page):
+        return self._write_handlers[page]
+
+    def connect_ppu(self, ppu):
+        # PPU registers, mirrored every 8 bytes in 0x2000 - 0x3FFF
+        self.set_read_handler(0x20, 0x3F, ppu.read_register)
+        self.set_write_handler(0x20, 0x3F, ppu.write_register)
+        self._ppu = ppu
 
-        elif 0x4020 <= decoded_address:
-            # Cartridge
-            return self._cartridge.read_prg_memory(decoded_address)
+    def connect_apu(self, apu):
+        self._apu = apu
+
+    def connect_controllers(self, controller1, controller2):
+        self._controllers = (controller1, controller2)
+
+    def _read_io(self, address):
+        if address >= 0x4020:
+            return self._cartridge.read_prg_memory(address)
+        elif address == 0x4016 or address == 0x4017:
+            if self._controllers is not None:
+                return self._controllers[address - 0x4016].read()
+        elif address == 0x4015 and self._apu is not None:
+            return self._apu.read_status()
 
         return 0
 
-    def write_memory(self, address, value):
-        decoded_address = self._decode_cpu_address(address)
+    def _write_io(self, address, value):
+        if address == 0x4014:
+            self._oam_dma(value)
+        elif address >= 0x4020:
+            self._cartridge.write_prg_memory(address, value)
+        elif address == 0x4016:
+            # The strobe goes to both ports
+            if self._controllers is not None:
+                self._controllers[0].write(value)
+                self._controllers[1].write(value)
+        elif self._apu is not None and address < 0x4018:
+            self._apu.write_register(address, value)
+
+    #
+    # DMA
+    #
+    def read_dma(self, address):
+        # DMC sample fetch
+        if self.stall_handler is not None:
+            self.stall_handler(DMC_DMA_CYCLES, False)
+
+        return self.read_memory(address)
+
+    def _oam_dma(self, page):
+        # Page 0xXX00 - 0xXXFF to OAM, a view is passed as is and copied in one slice
+        data = self._read_pages[page]
+        if data is None:
+            address = page << 8
+            data = bytes([self.read_memory(address | i) for i in range(0x100)])
+
+        if self._ppu is not None:
+            self._ppu.write_oam_dma(data)
+        if self.stall_handler is not None:
+            self.stall_handler(OAM_DMA_CYCLES, True)
+
+    #
+    # Save states
+    #
+    def save_state(self):
+        # Only the RAM, the page tables are rebuilt from the cartridge state
+        return pack_state(b'CMEM', self._ram)
 
-        if 0x0 <= decoded_address <= 0x07FF:
-            # RAM
-            self._ram[decoded_address] = value;
-        elif 0x4020 <= decoded_address:
-            # Cartridge
-            self._cartridge.write_prg_memory(decoded_address, value)
+    def load_state(self, data):
+        ram, = unpack_state(b'CMEM', data, 1)
+        load_buffer(self._ram, ram)
 
     @staticmethod
-    def _decode_cpu_address(address):
-        if address < 0x2000:
-            # RAM
-            address = address & 0x07FF
-        elif address < 0x4000:
-            # PPU Registers
-            address = 0x2000 | (address & 0x0007)
+    def _read_unmapped(address):
+        return 0
 
-        return address
+    @staticmethod
+    def _write_unmapped(address, value):
+        pass
 
 
 class CPU(object):
@@ -135,390 +714,20 @@ class CPU(object):
         self._p = 0x00
         self._pc = 0x00
         self.op_cycles = 0
-        self._pending_interrupt = None
-
-        self._addressing_mode_map = {
-            CpuAddressingMode.ACC: lambda: 0,
-            CpuAddressingMode.IMPL: lambda: 0,
-            CpuAddressingMode.IMM: lambda: self._calculate_memory_address_imm(),
-            CpuAddressingMode.ABS: lambda: self._calculate_memory_address_abs(),
-            CpuAddressingMode.ZP: lambda: self._calculate_memory_address_zp(),
-            CpuAddressingMode.ZPX: lambda: self._calculate_memory_address_zpx(),
-            CpuAddressingMode.ZPY: lambda: self._calculate_memory_address_zpy(),
-            CpuAddressingMode.ABSX: lambda: self._calculate_memory_address_absx(False),
-            CpuAddressingMode.ABSX_: lambda: self._calculate_memory_address_absx(True),
-            CpuAddressingMode.ABSY: lambda: self._calculate_memory_address_absy(False),
-            CpuAddressingMode.ABSY_: lambda: self._calculate_memory_address_absy(True),
-            CpuAddressingMode.REL: lambda: self._calculate_memory_address_rel(),
-            CpuAddressingMode.INDX: lambda: self._calculate_memory_address_indx_(),
-            CpuAddressingMode.IND_Y: lambda: self._calculate_memory_address_ind_y(False),
-            CpuAddressingMode.IND_Y_: lambda: self._calculate_memory_address_ind_y(True),
-            CpuAddressingMode.IND: lambda: self._calculate_memory_address_ind(False),
-            CpuAddressingMode.IND_: lambda: self. _calculate_memory_address_ind(True)
-        }
+        self._pending_interrupts = 0
+        # IRQ_SOURCE_* bits of the sources asserting the /IRQ line
+        self._irq_line = 0
 
-        self._op_code_map = {
-            # 1. ADC
-            0x69: lambda: self._op_adc(CpuAddressingMode.IMM),
-            0x65: lambda: self._op_adc(CpuAddressingMode.ZP),
-            0x75: lambda: self._op_adc(CpuAddressingMode.ZPX),
-            0x6D: lambda: self._op_adc(CpuAddressingMode.ABS),
-            0x7D: lambda: self._op_adc(CpuAddressingMode.ABSX_),
-            0x79: lambda: self._op_adc(CpuAddressingMode.ABSY_),
-            0x61: lambda: self._op_adc(CpuAddressingMode.INDX),
-            0x71: lambda: self._op_adc(CpuAddressingMode.IND_Y_),
-
-            # 2. AND
-            0x29: lambda: self._op_and(CpuAddressingMode.IMM),
-            0x25: lambda: self._op_and(CpuAddressingMode.ZP),
-            0x35: lambda: self._op_and(CpuAddressingMode.ZPX),
-            0x2D: lambda: self._op_and(CpuAddressingMode.ABS),
-            0x3D: lambda: self._op_and(CpuAddressingMode.ABSX_),
-            0x39: lambda: self._op_and(CpuAddressingMode.ABSY_),
-            0x21: lambda: self._op_and(CpuAddressingMode.INDX),
-            0x31: lambda: self._op_and(CpuAddressingMode.IND_Y_),
-
-            # 3. ASL
-            0x0A: lambda: self._op_asl(CpuAddressingMode.ACC),
-            0x06: lambda: self._op_asl(CpuAddressingMode.ZP),
-            0x16: lambda: self._op_asl(CpuAddressingMode.ZPX),
-            0x0E: lambda: self._op_asl(CpuAddressingMode.ABS),
-            0x1E: lambda: self._op_asl(CpuAddressingMode.ABSX),
-
-            # 4. BCC
-            0x90: lambda: self._op_bcc(CpuAddressingMode.REL),
-
-            # 5. BCS
-            0xB0: lambda: self._op_bcs(CpuAddressingMode.REL),
-
-            # 6. BEQ
-            0xF0: lambda: self._op_beq(CpuAddressingMode.REL),
-
-            # 7. BIT
-            0x24: lambda: self._op_bit(CpuAddressingMode.ZP),
-            0x2C: lambda: self._op_bit(CpuAddressingMode.ABS),
-
-            # 8. BMI
-            0x30: lambda: self._op_bmi(CpuAddressingMode.REL),
-
-            # 9. BNE
-            0xD0: lambda: self._op_bne(CpuAddressingMode.REL),
-
-            # 10. BPL
-            0x10: lambda: self._op_bpl(CpuAddressingMode.REL),
-
-            # 11. BRK
-            0x00: lambda: self._op_brk(),
-
-            # 12. BVC
-            0x50: lambda: self._op_bvc(CpuAddressingMode.REL),
-
-            # 13. BVS
-            0x70: lambda: self._op_bvs(CpuAddressingMode.REL),
-
-            # 14. CLC
-            0x18: lambda: self._op_clc(),
-
-            # 15. CLD
-            0xD8: lambda: self._op_cld(),
-
-            # 16. CLI
-            0x58: lambda: self._op_cli(),
-
-            # 17. CLV
-            0xB8: lambda: self._op_clv(),
-
-            # 18. CMP
-            0xC9: lambda: self._op_cmp(CpuAddressingMode.IMM),
-            0xC5: lambda: self._op_cmp(CpuAddressingMode.ZP),
-            0xD5: lambda: self._op_cmp(CpuAddressingMode.ZPX),
-            0xCD: lambda: self._op_cmp(CpuAddressingMode.ABS),
-            0xDD: lambda: self._op_cmp(CpuAddressingMode.ABSX_),
-            0xD9: lambda: self._op_cmp(CpuAddressingMode.ABSY_),
-            0xC1: lambda: self._op_cmp(CpuAddressingMode.INDX),
-            0xD1: lambda: self._op_cmp(CpuAddressingMode.IND_Y_),
-
-            # 19. CPX
-            0xE0: lambda: self._op_cpx(CpuAddressingMode.IMM),
-            0xE4: lambda: self._op_cpx(CpuAddressingMode.ZP),
-            0xEC: lambda: self._op_cpx(CpuAddressingMode.ABS),
-
-            # 20. CPY
-            0xC0: lambda: self._op_cpy(CpuAddressingMode.IMM),
-            0xC4: lambda: self._op_cpy(CpuAddressingMode.ZP),
-            0xCC: lambda: self._op_cpy(CpuAddressingMode.ABS),
-
-            # 21. DEC
-            0xC6: lambda: self._op_dec(mode=CpuAddressingMode.ZP),
-            0xD6: lambda: self._op_dec(mode=CpuAddressingMode.ZPX),
-            0xCE: lambda: self._op_dec(mode=CpuAddressingMode.ABS),
-            0xDE: lambda: self._op_dec(mode=CpuAddressingMode.ABSX),
-
-            # 22. DEX
-            0xCA: lambda: self._op_dex(),
-
-            # 23. DEY
-            0x88: lambda: self._op_dey(),
-
-            # 24. EOR
-            0x49: lambda: self._op_eor(CpuAddressingMode.IMM),
-            0x45: lambda: self._op_eor(CpuAddressingMode.ZP),
-            0x55: lambda: self._op_eor(CpuAddressingMode.ZPX),
-            0x4D: lambda: self._op_eor(CpuAddressingMode.ABS),
-            0x5D: lambda: self._op_eor(CpuAddressingMode.ABSX_),
-            0x59: lambda: self._op_eor(CpuAddressingMode.ABSY_),
-            0x41: lambda: self._op_eor(CpuAddressingMode.INDX),
-            0x51: lambda: self._op_eor(CpuAddressingMode.IND_Y_),
-
-            # 25. INC
-            0xE6: lambda: self._op_inc(CpuAddressingMode.ZP),
-            0xF6: lambda: self._op_inc(CpuAddressingMode.ZPX),
-            0xEE: lambda: self._op_inc(CpuAddressingMode.ABS),
-            0xFE: lambda: self._op_inc(CpuAddressingMode.ABSX),
-
-            # 26. INX
-            0xE8: lambda: self._op_inx(),
-
-            # 27. INY
-            0xC8: lambda: self._op_iny(),
-
-            # 28. JMP
-            0x4C: lambda: self._op_jmp(CpuAddressingMode.ABS),
-            0x6C: lambda: self._op_jmp(CpuAddressingMode.IND_),
-
-            # 29. JSR
-            0x20: lambda: self._op_jsr(CpuAddressingMode.ABS),
-
-            # 30. LDA
-            0xA9: lambda: self._op_lda(CpuAddressingMode.IMM),
-            0xA5: lambda: self._op_lda(CpuAddressingMode.ZP),
-            0xB5: lambda: self._op_lda(CpuAddressingMode.ZPX),
-            0xAD: lambda: self._op_lda(CpuAddressingMode.ABS),
-            0xBD: lambda: self._op_lda(CpuAddressingMode.ABSX_),
-            0xB9: lambda: self._op_lda(CpuAddressingMode.ABSY_),
-            0xA1: lambda: self._op_lda(CpuAddressingMode.INDX),
-            0xB1: lambda: self._op_lda(CpuAddressingMode.IND_Y_),
-
-            # 31. LDX
-            0xA2: lambda: self._op_ldx(CpuAddressingMode.IMM),
-            0xA6: lambda: self._op_ldx(CpuAddressingMode.ZP),
-            0xB6: lambda: self._op_ldx(CpuAddressingMode.ZPY),
-            0xAE: lambda: self._op_ldx(CpuAddressingMode.ABS),
-            0xBE: lambda: self._op_ldx(CpuAddressingMode.ABSY_),
-
-            # 32. LDY
-            0xA0: lambda: self._op_ldy(CpuAddressingMode.IMM),
-            0xA4: lambda: self._op_ldy(CpuAddressingMode.ZP),
-            0xB4: lambda: self._op_ldy(CpuAddressingMode.ZPX),
-            0xAC: lambda: self._op_ldy(CpuAddressingMode.ABS),
-            0xBC: lambda: self._op_ldy(CpuAddressingMode.ABSX_),
-
-            # 33. LSR
-            0x4A: lambda: self._op_lsr(CpuAddressingMode.ACC),
-            0x46: lambda: self._op_lsr(CpuAddressingMode.ZP),
-            0x56: lambda: self._op_lsr(CpuAddressingMode.ZPX),
-            0x4E: lambda: self._op_lsr(CpuAddressingMode.ABS),
-            0x5E: lambda: self._op_lsr(CpuAddressingMode.ABSX),
-
-            # 34. NOP
-            0xEA: lambda: None,
-
-            # 35. ORA
-            0x09: lambda: self._op_ora(CpuAddressingMode.IMM),
-            0x05: lambda: self._op_ora(CpuAddressingMode.ZP),
-            0x15: lambda: self._op_ora(CpuAddressingMode.ZPX),
-            0x0D: lambda: self._op_ora(CpuAddressingMode.ABS),
-            0x1D: lambda: self._op_ora(CpuAddressingMode.ABSX_),
-            0x19: lambda: self._op_ora(CpuAddressingMode.ABSY_),
-            0x01: lambda: self._op_ora(CpuAddressingMode.INDX),
-            0x11: lambda: self._op_ora(CpuAddressingMode.IND_Y_),
-
-            # 36. PHA
-            0x48: lambda: self._op_pha(),
-
-            # 37. PHP
-            0x08: lambda: self._op_php(),
-
-            # 38. PLA
-            0x68: lambda: self._op_pla(),
-
-            # 39. PLP
-            0x28: lambda: self._op_plp(),
-
-            # 40. ROL
-            0x2A: lambda: self._op_rol(CpuAddressingMode.ACC),
-            0x26: lambda: self._op_rol(CpuAddressingMode.ZP),
-            0x36: lambda: self._op_rol(CpuAddressingMode.ZPX),
-            0x2E: lambda: self._op_rol(CpuAddressingMode.ABS),
-            0x3E: lambda: self._op_rol(CpuAddressingMode.ABSX),
-
-            # 41. ROR
-            0x6A: lambda: self._op_ror(CpuAddressingMode.ACC),
-            0x66: lambda: self._op_ror(CpuAddressingMode.ZP),
-            0x76: lambda: self._op_ror(CpuAddressingMode.ZPX),
-            0x6E: lambda: self._op_ror(CpuAddressingMode.ABS),
-            0x7E: lambda: self._op_ror(CpuAddressingMode.ABSX),
-
-            # 42. RTI
-            0x40: lambda: self._op_rti(),
-
-            # 43. RTS
-            0x60: lambda: self._op_rts(),
-
-            # 44. SBC
-            0xE9: lambda: self._op_sbc(CpuAddressingMode.IMM),
-            0xE5: lambda: self._op_sbc(CpuAddressingMode.ZP),
-            0xF5: lambda: self._op_sbc(CpuAddressingMode.ZPX),
-            0xED: lambda: self._op_sbc(CpuAddressingMode.ABS),
-            0xFD: lambda: self._op_sbc(CpuAddressingMode.ABSX_),
-            0xF9: lambda: self._op_sbc(CpuAddressingMode.ABSY_),
-            0xE1: lambda: self._op_sbc(CpuAddressingMode.INDX),
-            0xF1: lambda: self._op_sbc(CpuAddressingMode.IND_Y_),
-
-            # 45. SEC
-            0x38: lambda: self._op_sec(),
-
-            # 46. SED
-            0xF8: lambda: self._op_sed(),
-
-            # 47. SEI
-            0x78: lambda: self._op_sei(),
-
-            # 48. STA
-            0x85: lambda: self._op_sta(CpuAddressingMode.ZP),
-            0x95: lambda: self._op_sta(CpuAddressingMode.ZPX),
-            0x8D: lambda: self._op_sta(CpuAddressingMode.ABS),
-            0x9D: lambda: self._op_sta(CpuAddressingMode.ABSX),
-            0x99: lambda: self._op_sta(CpuAddressingMode.ABSY),
-            0x81: lambda: self._op_sta(CpuAddressingMode.INDX),
-            0x91: lambda: self._op_sta(CpuAddressingMode.IND_Y),
-
-            # 49. STX
-            0x86: lambda: self._op_stx(CpuAddressingMode.ZP),
-            0x96: lambda: self._op_stx(CpuAddressingMode.ZPY),
-            0x8E: lambda: self._op_stx(CpuAddressingMode.ABS),
-
-            # 50. STY
-            0x84: lambda: self._op_sty(CpuAddressingMode.ZP),
-            0x94: lambda: self._op_sty(CpuAddressingMode.ZPX),
-            0x8C: lambda: self._op_sty(CpuAddressingMode.ABS),
-
-            # 51. TAX
-            0xAA: lambda: self._op_tax(),
-
-            # 52. TAY
-            0xA8: lambda: self._op_tay(),
-
-            # 53. TSX
-            0xBA: lambda: self._op_tsx(),
-
-            # 54. TXA
-            0x8A: lambda: self._op_txa(),
-
-            # 55. TXS
-            0x9A: lambda: self._op_txs(),
-
-            # 56. TYA
-            0x98: lambda: self._op_tya(),
-
-            # Unofficial opcodes
-
-            # DOP
-            0x04: lambda: self._op_dop(CpuAddressingMode.ZP),
-            0x14: lambda: self._op_dop(CpuAddressingMode.ZPX),
-            0x34: lambda: self._op_dop(CpuAddressingMode.ZPX),
-            0x44: lambda: self._op_dop(CpuAddressingMode.ZP),
-            0x54: lambda: self._op_dop(CpuAddressingMode.ZPX),
-            0x64: lambda: self._op_dop(CpuAddressingMode.ZP),
-            0x74: lambda: self._op_dop(CpuAddressingMode.ZPX),
-            0x80: lambda: self._op_dop(CpuAddressingMode.IMM),
-            0x82: lambda: self._op_dop(CpuAddressingMode.IMM),
-            0x89: lambda: self._op_dop(CpuAddressingMode.IMM),
-            0xC2: lambda: self._op_dop(CpuAddressingMode.IMM),
-            0xD4: lambda: self._op_dop(CpuAddressingMode.ZPX),
-            0xE2: lambda: self._op_dop(CpuAddressingMode.IMM),
-            0xF4: lambda: self._op_dop(CpuAddressingMode.ZPX),
-
-            # TOP
-            0x0C: lambda: self._op_top(CpuAddressingMode.ABS),
-            0x1C: lambda: self._op_top(CpuAddressingMode.ABSX_),
-            0x3C: lambda: self._op_top(CpuAddressingMode.ABSX_),
-            0x5C: lambda: self._op_top(CpuAddressingMode.ABSX_),
-            0x7C: lambda: self._op_top(CpuAddressingMode.ABSX_),
-            0xDC: lambda: self._op_top(CpuAddressingMode.ABSX_),
-            0xFC: lambda: self._op_top(CpuAddressingMode.ABSX_),
-
-            # LAX
-            0xA7: lambda: self._op_lax(CpuAddressingMode.ZP),
-            0xB7: lambda: self._op_lax(CpuAddressingMode.ZPY),
-            0xAF: lambda: self._op_lax(CpuAddressingMode.ABS),
-            0xBF: lambda: self._op_lax(CpuAddressingMode.ABSY),
-            0xA3: lambda: self._op_lax(CpuAddressingMode.INDX),
-            0xB3: lambda: self._op_lax(CpuAddressingMode.IND_Y_),
-
-            # AAX
-            0x87: lambda: self._op_aax(CpuAddressingMode.ZP),
-            0x97: lambda: self._op_aax(CpuAddressingMode.ZPY),
-            0x83: lambda: self._op_aax(CpuAddressingMode.INDX),
-            0x8F: lambda: self._op_aax(CpuAddressingMode.ABS),
-
-            # SBC
-            0xEB: lambda: self._op_sbc(CpuAddressingMode.IMM),
-
-            # DCP
-            0xC7: lambda: self._op_dcp(CpuAddressingMode.ZP),
-            0xD7: lambda: self._op_dcp(CpuAddressingMode.ZPX),
-            0xCF: lambda: self._op_dcp(CpuAddressingMode.ABS),
-            0xDF: lambda: self._op_dcp(CpuAddressingMode.ABSX),
-            0xDB: lambda: self._op_dcp(CpuAddressingMode.ABSY),
-            0xC3: lambda: self._op_dcp(CpuAddressingMode.INDX),
-            0xD3: lambda: self._op_dcp(CpuAddressingMode.IND_Y),
-
-            # ISC
-            0xE7: lambda: self._op_isc(CpuAddressingMode.ZP),
-            0xF7: lambda: self._op_isc(CpuAddressingMode.ZPX),
-            0xEF: lambda: self._op_isc(CpuAddressingMode.ABS),
-            0xFF: lambda: self._op_isc(CpuAddressingMode.ABSX),
-            0xFB: lambda: self._op_isc(CpuAddressingMode.ABSY),
-            0xE3: lambda: self._op_isc(CpuAddressingMode.INDX),
-            0xF3: lambda: self._op_isc(CpuAddressingMode.IND_Y),
-
-            # SLO
-            0x07: lambda: self._op_slo(CpuAddressingMode.ZP),
-            0x17: lambda: self._op_slo(CpuAddressingMode.ZPX),
-            0x0F: lambda: self._op_slo(CpuAddressingMode.ABS),
-            0x1F: lambda: self._op_slo(CpuAddressingMode.ABSX),
-            0x1B: lambda: self._op_slo(CpuAddressingMode.ABSY),
-            0x03: lambda: self._op_slo(CpuAddressingMode.INDX),
-            0x13: lambda: self._op_slo(CpuAddressingMode.IND_Y),
-
-            # RLA
-            0x27: lambda: self._op_rla(CpuAddressingMode.ZP),
-            0x37: lambda: self._op_rla(CpuAddressingMode.ZPX),
-            0x2F: lambda: self._op_rla(CpuAddressingMode.ABS),
-            0x3F: lambda: self._op_rla(CpuAddressingMode.ABSX),
-            0x3B: lambda: self._op_rla(CpuAddressingMode.ABSY),
-            0x23: lambda: self._op_rla(CpuAddressingMode.INDX),
-            0x33: lambda: self._op_rla(CpuAddressingMode.IND_Y),
-
-            # SRE
-            0x47: lambda: self._op_sre(CpuAddressingMode.ZP),
-            0x57: lambda: self._op_sre(CpuAddressingMode.ZPX),
-            0x4F: lambda: self._op_sre(CpuAddressingMode.ABS),
-            0x5F: lambda: self._op_sre(CpuAddressingMode.ABSX),
-            0x5B: lambda: self._op_sre(CpuAddressingMode.ABSY),
-            0x43: lambda: self._op_sre(CpuAddressingMode.INDX),
-            0x53: lambda: self._op_sre(CpuAddressingMode.IND_Y),
-
-            # RRA
-            0x67: lambda: self._op_rra(CpuAddressingMode.ZP),
-            0x77: lambda: self._op_rra(CpuAddressingMode.ZPX),
-            0x6F: lambda: self._op_rra(CpuAddressingMode.ABS),
-            0x7F: lambda: self._op_rra(CpuAddressingMode.ABSX),
-            0x7B: lambda: self._op_rra(CpuAddressingMode.ABSY),
-            0x63: lambda: self._op_rra(CpuAddressingMode.INDX),
-            0x73: lambda: self._op_rra(CpuAddressingMode.IND_Y),
-        }
+        self._read_memory = cpu_memory.read_memory
+        self._write_memory = cpu_memory.write_memory
+
+        self._profiler = None
+        self._coverage = None
+        # The op table counts or marks every op, the recompiler runs ops through it rather than blocks
+        self._instrumented = False
+        self._op_table = self._build_op_table()
+        # Called with the op code when an op missing from OP_CODES (KIL, or an unofficial op) runs, the PC is past it
+        self.unsupported_op_handler = None
 
     #
     # Actions
@@ -533,39 +742,141 @@ class CPU(object):
         self._pc = self._read_memory(0xFFFD) << 8 | self._read_memory(0xFFFC)
 
     def reset(self):
-        self._request_interrupt(InterruptType.RESET)
+        self._pending_interrupts |= RESET_PENDING
+
+    def save_state(self):
+        return pack_state(b'CPU ', CPU_STATE.pack(self._a, self._x, self._y, self._s, self._p, self._pc,
+                                                  self.op_cycles, self._pending_interrupts, self._irq_line))
+
+    def load_state(self, data):
+        registers, = unpack_state(b'CPU ', data, 1)
+        (self._a, self._x, self._y, self._s, self._p, self._pc, self.op_cycles,
+         self._pending_interrupts, self._irq_line) = CPU_STATE.unpack(registers)
 
     def nmi(self):
-        self._request_interrupt(InterruptType.NMI)
+        self._pending_interrupts |= NMI_PENDING
 
     def irq(self):
-        self._request_interrupt(InterruptType.IRQ)
+        # A single IRQ request, dropped when interrupts are disabled at the time it would be serviced
+        self._pending_interrupts |= IRQ_PENDING
+
+    def set_irq_line(self, source, asserted):
+        # The level an IRQ source drives the /IRQ line to. The line stays asserted until the source is acknowledged,
+        # an IRQ masked by the I flag is taken once CLI, PLP or RTI enable interrupts.
+        if asserted:
+            self._irq_line |= source
+            self._pending_interrupts |= IRQ_PENDING
+        else:
+            self._irq_line &= ~source
+            if self._irq_line == 0:
+                self._pending_interrupts &= ~IRQ_PENDING
+
+    def _poll_irq_line(self):
+        # Called after the I flag is cleared
+        if self._irq_line and not self._p & I_FLAG:
+            self._pending_interrupts |= IRQ_PENDING
+
+    @property
+    def pending_interrupt(self):
+        # The InterruptType serviced next, None when nothing is pending
+        next_interrupt = _NEXT_INTERRUPT[self._pending_interrupts]
+        for interrupt_type, mask in INTERRUPT_MASKS.items():
+            if mask == next_interrupt:
+                return interrupt_type
+        return None
 
     def execute_op(self):
-        if self._pending_interrupt is not None:
+        if self._pending_interrupts:
             self._execute_pending_interrupt_op()
         else:
             op_code = self._read_memory(self._pc)
-            self._pc += 1
+            self._pc = (self._pc + 1) & 0xFFFF
             self.op_cycles = OP_CYCLES[op_code]
-            self._execute_op(op_code)
+            self._op_table[op_code]()
+
+    def run(self, cycles=None, instructions=None, until_pc=None, breakpoints=None, predicate=None):
+        # Executes ops until one of the given limits is reached and returns (cycles executed, StopReason).
+        # The cycle budget may be overshot by the last op. PC targets, breakpoints and the predicate are
+        # checked after every op, so a run that starts on a breakpoint still executes that op.
+        if cycles is None and instructions is None and until_pc is None and not breakpoints and predicate is None:
+            raise ValueError('run() needs at least one stop condition')
+
+        max_cycles = cycles if cycles is not None else float('inf')
+        max_instructions = instructions if instructions is not None else float('inf')
+        breakpoints = frozenset(breakpoints) if breakpoints else None
+
+        op_table = self._op_table
+        op_cycles_table = OP_CYCLES
+        read_memory = self._read_memory
+        execute_pending_interrupt_op = self._execute_pending_interrupt_op
+
+        total_cycles = 0
+        total_instructions = 0
+        while True:
+            if self._pending_interrupts:
+                execute_pending_interrupt_op()
+            else:
+                pc = self._pc
+                op_code = read_memory(pc)
+                self._pc = (pc + 1) & 0xFFFF
+                self.op_cycles = op_cycles_table[op_code]
+                op_table[op_code]()
+
+            total_cycles += self.op_cycles
+            total_instructions += 1
+
+            if total_cycles >= max_cycles:
+                return total_cycles, StopReason.CYCLES
+            if total_instructions >= max_instructions:
+                return total_cycles, StopReason.INSTRUCTIONS
+            if self._pc == until_pc:
+                return total_cycles, StopReason.PC
+            if breakpoints is not None and self._pc in breakpoints:
+                return total_cycles, StopReason.BREAKPOINT
+            if predicate is not None and predicate(self):
+                return total_cycles, StopReason.PREDICATE
+
+    def run_until(self, target, cycles=None, instructions=None):
+        # Target is either a PC or a predicate called with the CPU after every op
+        if callable(target):
+            return self.run(cycles=cycles, instructions=instructions, predicate=target)
+
+        return self.run(cycles=cycles, instructions=instructions, until_pc=target)
+
+    def set_profiler(self, profiler):
+        # Counts every op in a nesrs.profiler.Profiler, None stops profiling. The op table is swapped, so execution
+        # without a profiler doesn't pay for it.
+        self._profiler = profiler
+        self._instrument_op_table()
+
+    def set_coverage(self, coverage):
+        # Marks the executed PCs and branch outcomes in a nesrs.coverage.Coverage, None stops. Same swap as
+        # set_profiler, both can be on. A recompiler (nesrs.recompiler) runs the ops through the interpreter meanwhile.
+        self._coverage = coverage
+        self._instrument_op_table()
+
+    def _instrument_op_table(self):
+        op_table = self._build_op_table()
+        if self._profiler is not None:
+            op_table = self._profiler.instrument(self, op_table)
+        if self._coverage is not None:
+            op_table = self._coverage.instrument(self, op_table)
+        self._op_table = op_table
+        self._instrumented = self._profiler is not None or self._coverage is not None
 
     def _request_interrupt(self, interrupt_type):
-        if self._pending_interrupt is None:
-            self._pending_interrupt = interrupt_type
-        elif self._pending_interrupt == InterruptType.IRQ:
-            self._pending_interrupt = interrupt_type
-        elif self._pending_interrupt == InterruptType.NMI:
-            if interrupt_type == InterruptType.RESET:
-                self._pending_interrupt = interrupt_type
-        elif self._pending_interrupt == InterruptType.RESET:
-            # Already requested
-            pass
+        self._pending_interrupts |= INTERRUPT_MASKS[interrupt_type]
 
     def _execute_pending_interrupt_op(self):
+        # Services the highest priority interrupt, the others stay pending: an IRQ requested with an NMI is taken
+        # once the NMI handler enables interrupts again. A reset drops everything else, an IRQ while interrupts are disabled is dropped (an asserted
+        # /IRQ line is polled again when they're enabled).
         self.op_cycles = 0
+        interrupt = _NEXT_INTERRUPT[self._pending_interrupts]
+        self._pending_interrupts &= ~interrupt
 
-        if self._pending_interrupt == InterruptType.RESET:
+        if interrupt == RESET_PENDING:
+            self._pending_interrupts = 0
             self.op_cycles = 7
             self._a = 0x00
             self._x = 0x00
@@ -574,34 +885,23 @@ class CPU(object):
             self._p = Z_FLAG | R_FLAG
             self._pc = (self._read_memory(0xFFFD) << 8) | self._read_memory(0xFFFC)
 
-        elif self._pending_interrupt == InterruptType.NMI:
+        elif interrupt == NMI_PENDING:
             self.op_cycles = 7
             self._push((self._pc >> 8) & 0xFF)
             self._push(self._pc & 0x00FF)
             self._push(self._p & ~B_FLAG)
-            self._p = self._p & ~D_FLAG
+            self._p = (self._p & ~D_FLAG) | I_FLAG
             self._pc = (self._read_memory(0xFFFB) << 8) | self._read_memory(0xFFFA)
 
-        elif self._pending_interrupt == InterruptType.IRQ and ((self._p & I_FLAG) == 0):
+        elif (self._p & I_FLAG) == 0:
             self.op_cycles = 7
             self._push((self._pc >> 8) & 0xFF)
             self._push(self._pc & 0x00FF)
             self._push(self._p & ~B_FLAG)
-            self._p = self._p & ~D_FLAG
-            self._p = self._p & ~I_FLAG
+            # The handler runs with interrupts disabled, an asserted /IRQ line is polled again when they're enabled
+            self._p = (self._p & ~D_FLAG) | I_FLAG
             self._pc = (self._read_memory(0xFFFF) << 8) | self._read_memory(0xFFFE)
 
-        self._pending_interrupt = None
-
-    #
-    # Memory management
-    #
-    def _read_memory(self, address):
-        return self._cpu_memory.read_memory(address)
-
-    def _write_memory(self, address, value):
-        self._cpu_memory.write_memory(address, value)
-
     #
     # Addressing modes
     #
@@ -611,57 +911,73 @@ class CPU(object):
     # 3. Immediate addressing - IMM
     def _calculate_memory_address_imm(self):
         result = self._pc
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         return result
 
     # 4. Absolute addressing - ABS
     def _calculate_memory_address_abs(self):
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         high = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         return 0xFFFF & ((high << 8) | low)
 
     # 5. Zero page addressing - ZP
     def _calculate_memory_address_zp(self):
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         return low
 
     # 6. Indexed zero page addressing with register X - ZP,X
     def _calculate_memory_address_zpx(self):
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         return 0x00FF & (self._x + low)
 
     # 7. Indexed zero page addressing with register Y - ZP,Y
     def _calculate_memory_address_zpy(self):
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         return 0x00FF & (self._y + low)
 
     # 8. Indexed absolute addressing with register X - ABS,X
-    def _calculate_memory_address_absx(self, count_additional_cycle_on_page_boundary_crossed):
+    def _calculate_memory_address_absx(self):
+        low = self._read_memory(self._pc)
+        self._pc = (self._pc + 1) & 0xFFFF
+        high = self._read_memory(self._pc)
+        self._pc = (self._pc + 1) & 0xFFFF
+        return 0xFFFF & (((high << 8) | low) + self._x)
+
+    def _calculate_memory_address_absx_(self):
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         high = self._read_memory(self._pc)
-        self._pc += 1
-        address = 0xFFFF & ((high << 8) | low)
+        self._pc = (self._pc + 1) & 0xFFFF
+        address = (high << 8) | low
         result_address = 0xFFFF & (address + self._x)
-        if count_additional_cycle_on_page_boundary_crossed and is_page_boundary_crossed(address, result_address):
+        if (address ^ result_address) & 0xFF00:
+            # Page boundary crossed
             self.op_cycles += 1
 
         return result_address
 
     # 9. Indexed absolute addressing with register Y - ABS,Y
-    def _calculate_memory_address_absy(self, count_additional_cycle_on_page_boundary_crossed):
+    def _calculate_memory_address_absy(self):
+        low = self._read_memory(self._pc)
+        self._pc = (self._pc + 1) & 0xFFFF
+        high = self._read_memory(self._pc)
+        self._pc = (self._pc + 1) & 0xFFFF
+        return 0xFFFF & (((high << 8) | low) + self._y)
+
+    def _calculate_memory_address_absy_(self):
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         high = self._read_memory(self._pc)
-        self._pc += 1
-        address = 0xFFFF & ((high << 8) | low)
+        self._pc = (self._pc + 1) & 0xFFFF
+        address = (high << 8) | low
         result_address = 0xFFFF & (address + self._y)
-        if count_additional_cycle_on_page_boundary_crossed and is_page_boundary_crossed(address, result_address):
+        if (address ^ result_address) & 0xFF00:
+            # Page boundary crossed
             self.op_cycles += 1
 
         return result_address
@@ -669,146 +985,168 @@ class CPU(object):
     # 10. Relative addressing - REL
     def _calculate_memory_address_rel(self):
         inc = self._read_memory(self._pc)
-        self._pc += 1
-        is_positive = True
+        self._pc = (self._pc + 1) & 0xFFFF
         if inc & 0x80 == 0:
             # Positive or Zero
-            offset = inc & 0x7F
-        else:
-            # Negative
-            offset = 0x7F + 1 - (inc & 0x7F)
-            is_positive = False
+            return 0xFFFF & (self._pc + inc)
 
-        address = self._pc + offset if is_positive else self._pc - offset
-
-        return 0xFFFF & address
+        # Negative
+        return 0xFFFF & (self._pc + inc - 0x100)
 
     # 11. Indexed indirect (pre-indexed) addressing with register X - (IND,X)
-    def _calculate_memory_address_indx_(self):
+    def _calculate_memory_address_indx(self):
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         address = 0x00FF & (low + self._x)
         next_address = 0x00FF & (address + 1)
-        return 0xFFFF & ((self._read_memory(next_address) << 8) | self._read_memory(address))
+        return (self._read_memory(next_address) << 8) | self._read_memory(address)
 
     # 12. Indirect indexed (post-indexed) addressing with register Y - (IND),Y
-    def _calculate_memory_address_ind_y(self, count_additional_cycle_on_page_boundary_crossed):
+    def _calculate_memory_address_ind_y(self):
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         low_address = self._read_memory(low)
         high_address = self._read_memory(0x00FF & (low + 1))
-        address = 0xFFFF & ((high_address << 8) | low_address)
+        return 0xFFFF & (((high_address << 8) | low_address) + self._y)
+
+    def _calculate_memory_address_ind_y_(self):
+        low = self._read_memory(self._pc)
+        self._pc = (self._pc + 1) & 0xFFFF
+        low_address = self._read_memory(low)
+        high_address = self._read_memory(0x00FF & (low + 1))
+        address = (high_address << 8) | low_address
         result_address = 0xFFFF & (address + self._y)
-        if count_additional_cycle_on_page_boundary_crossed and is_page_boundary_crossed(address, result_address):
+        if (address ^ result_address) & 0xFF00:
+            # Page boundary crossed
             self.op_cycles += 1
 
         return result_address
 
     # 13. Absolute indirect addressing - IND
-    def _calculate_memory_address_ind(self, is_page_wrapping_not_allowed):
+    def _calculate_memory_address_ind(self):
+        # Page wrapping allowed
         low = self._read_memory(self._pc)
-        self._pc += 1
+        self._pc = (self._pc + 1) & 0xFFFF
         high = self._read_memory(self._pc)
-        self._pc += 1
-        address = 0xFFFF & ((high << 8) | low)
-        next_address = address + 1
-        if (address & 0xFF) == 0xFF:
-            if is_page_wrapping_not_allowed:
-                next_address = address & 0xFF00
-
-        return 0xFFFF & ((self._read_memory(next_address) << 8) | self._read_memory(address))
+        self._pc = (self._pc + 1) & 0xFFFF
+        address = (high << 8) | low
+        return 0xFFFF & ((self._read_memory(0xFFFF & (address + 1)) << 8) | self._read_memory(address))
 
-    def _calculate_memory_address(self, addressing_mode):
-        address = self._addressing_mode_map[addressing_mode]()
-
-        return address
+    def _calculate_memory_address_ind_(self):
+        # Page wrapping not allowed, the high byte is read from the start of the same page
+        low = self._read_memory(self._pc)
+        self._pc = (self._pc + 1) & 0xFFFF
+        high = self._read_memory(self._pc)
+        self._pc = (self._pc + 1) & 0xFFFF
+        address = (high << 8) | low
+        next_address = (address & 0xFF00) | ((address + 1) & 0x00FF)
+        return (self._read_memory(next_address) << 8) | self._read_memory(address)
 
     #
     # Stack manipulations
     #
     def _push(self, value):
         self._write_memory(0x0100 | self._s, value)
-        self._s = 0xFF if self._s == 0x00 else self._s - 1
+        self._s = (self._s - 1) & 0xFF
 
     def _pop(self):
-        self._s = 0x00 if self._s == 0xFF else self._s + 1
+        self._s = (self._s + 1) & 0xFF
 
         return self._read_memory(0x0100 | self._s)
 
     #
     # Ops
     #
-    def _execute_op(self, op_code):
-        try:
-            self._op_code_map[op_code]()
-        except KeyError:
-            pass
-
-    def _op_adc(self, mode):
-        address = self._calculate_memory_address(mode)
-        value = self._read_memory(address)
+    def _build_op_table(self):
+        address_calculators = {
+            CpuAddressingMode.IMM: self._calculate_memory_address_imm,
+            CpuAddressingMode.ABS: self._calculate_memory_address_abs,
+            CpuAddressingMode.ZP: self._calculate_memory_address_zp,
+            CpuAddressingMode.ZPX: self._calculate_memory_address_zpx,
+            CpuAddressingMode.ZPY: self._calculate_memory_address_zpy,
+            CpuAddressingMode.ABSX: self._calculate_memory_address_absx,
+            CpuAddressingMode.ABSX_: self._calculate_memory_address_absx_,
+            CpuAddressingMode.ABSY: self._calculate_memory_address_absy,
+            CpuAddressingMode.ABSY_: self._calculate_memory_address_absy_,
+            CpuAddressingMode.REL: self._calculate_memory_address_rel,
+            CpuAddressingMode.INDX: self._calculate_memory_address_indx,
+            CpuAddressingMode.IND_Y: self._calculate_memory_address_ind_y,
+            CpuAddressingMode.IND_Y_: self._calculate_memory_address_ind_y_,
+            CpuAddressingMode.IND: self._calculate_memory_address_ind,
+            CpuAddressingMode.IND_: self._calculate_memory_address_ind_,
+        }
+
+        # Op codes without an entry in OP_CODES (KIL and the rest of the unofficial ones) are ignored
+        op_table = [self._op_unsupported] * 256
+        for op_code, (op, mode) in OP_CODES.items():
+            if mode == CpuAddressingMode.IMPL:
+                op_table[op_code] = getattr(self, '_op_' + op)
+            elif mode == CpuAddressingMode.ACC:
+                op_table[op_code] = getattr(self, '_op_' + op + '_acc')
+            else:
+                op_table[op_code] = partial(getattr(self, '_op_' + op), address_calculators[mode])
 
-        res = self._a + value + (1 if (self._p & C_FLAG) != 0 else 0)
+        return op_table
 
-        self._p = self._p & ~(N_FLAG | V_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (res & N_FLAG)  # N
-        self._p = self._p | (V_FLAG if (~(self._a ^ value) & (self._a ^ (res & 0xFF)) & 0x80) != 0 else 0)  # V
-        self._p = self._p | (Z_FLAG if (res & 0xFF) == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if res > 0xFF else 0)  # C
+    def _op_unsupported(self):
+        if self.unsupported_op_handler is not None:
+            self.unsupported_op_handler(self._read_memory((self._pc - 1) & 0xFFFF))
 
-        self._a = res & 0xFF
+    def _op_nop(self):
+        pass
 
-    def _op_and(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_adc(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+
+        index = ((self._p & C_FLAG) << 16) | (self._a << 8) | value
+        self._p = (self._p & NOT_NVZC) | ADC_FLAGS[index]
+        self._a = ADC_RESULTS[index]
+
+    def _op_and(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
 
         self._a = self._a & value
-        self._p = self._p & ~(N_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (self._a & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if self._a == 0 else 0)  # Z
+        self._p = (self._p & NOT_NZ) | NZ_FLAGS[self._a]
 
-    def _op_asl(self, mode):
-        if mode == CpuAddressingMode.ACC:
-            self._a = self._op_asl_int(self._a)
-        else:
-            address = self._calculate_memory_address(mode)
-            value = self._read_memory(address)
+    def _op_asl_acc(self):
+        self._a = self._op_asl_int(self._a)
 
-            new_value = self._op_asl_int(value)
-            self._write_memory(address, new_value)
+    def _op_asl(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
 
-    def _op_asl_int(self, value):
-        res = (value << 1) & 0xFF
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (res & 0x80) > 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if res == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if (value & 0x80) > 0 else 0)  # C
+        new_value = self._op_asl_int(value)
+        self._write_memory(address, new_value)
 
-        return res
+    def _op_asl_int(self, value):
+        self._p = (self._p & NOT_NZC) | ASL_FLAGS[value]
+        return ASL_RESULTS[value]
 
-    def _op_bcc(self, mode):
-        self._op_branch((self._p & C_FLAG) == 0, self._calculate_memory_address(mode))
+    def _op_bcc(self, calculate_address):
+        self._op_branch((self._p & C_FLAG) == 0, calculate_address())
 
-    def _op_bcs(self, mode):
-        self._op_branch((self._p & C_FLAG) != 0, self._calculate_memory_address(mode))
+    def _op_bcs(self, calculate_address):
+        self._op_branch((self._p & C_FLAG) != 0, calculate_address())
 
-    def _op_beq(self, mode):
-        self._op_branch((self._p & Z_FLAG) != 0, self._calculate_memory_address(mode))
+    def _op_beq(self, calculate_address):
+        self._op_branch((self._p & Z_FLAG) != 0, calculate_address())
 
-    def _op_bmi(self, mode):
-        self._op_branch((self._p & N_FLAG) != 0, self._calculate_memory_address(mode))
+    def _op_bmi(self, calculate_address):
+        self._op_branch((self._p & N_FLAG) != 0, calculate_address())
 
-    def _op_bne(self, mode):
-        self._op_branch((self._p & Z_FLAG) == 0, self._calculate_memory_address(mode))
+    def _op_bne(self, calculate_address):
+        self._op_branch((self._p & Z_FLAG) == 0, calculate_address())
 
-    def _op_bpl(self, mode):
-        self._op_branch((self._p & N_FLAG) == 0, self._calculate_memory_address(mode))
+    def _op_bpl(self, calculate_address):
+        self._op_branch((self._p & N_FLAG) == 0, calculate_address())
 
-    def _op_bvc(self, mode):
-        self._op_branch((self._p & V_FLAG) == 0, self._calculate_memory_address(mode))
+    def _op_bvc(self, calculate_address):
+        self._op_branch((self._p & V_FLAG) == 0, calculate_address())
 
-    def _op_bvs(self, mode):
-        self._op_branch((self._p & V_FLAG) != 0, self._calculate_memory_address(mode))
+    def _op_bvs(self, calculate_address):
+        self._op_branch((self._p & V_FLAG) != 0, calculate_address())
 
     def _op_branch(self, condition, jump_address):
         if condition:
@@ -819,17 +1157,15 @@ class CPU(object):
 
             self._pc = jump_address
 
-    def _op_bit(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_bit(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
 
-        self._p = self._p & ~(N_FLAG | V_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (value & 0x80) != 0 else 0)  # N
-        self._p = self._p | (V_FLAG if (value & 0x40) != 0 else 0)  # V
-        self._p = self._p | (Z_FLAG if (self._a & value) == 0 else 0)  # Z
+        self._p = (self._p & NOT_NVZ) | (value & (N_FLAG | V_FLAG)) | (NZ_FLAGS[self._a & value] & Z_FLAG)
 
     def _op_brk(self):
-        self._pc += 1  # skip next bite (usually it is a NOP or number that is analyzed by the interrupt handler)
+        # skip next bite (usually it is a NOP or number that is analyzed by the interrupt handler)
+        self._pc = (self._pc + 1) & 0xFFFF
         self._push(self._pc >> 8)  # push high bits
         self._push(self._pc & 0xFF)  # push low bits
         self._p = self._p | B_FLAG  # B
@@ -844,143 +1180,124 @@ class CPU(object):
 
     def _op_cli(self):
         self._p = self._p & ~I_FLAG
+        self._poll_irq_line()
 
     def _op_clv(self):
         self._p = self._p & ~V_FLAG
 
-    def _op_cmp(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_cmp(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
         self._op_compare(self._a, value)
 
-    def _op_cpx(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_cpx(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
         self._op_compare(self._x, value)
 
-    def _op_cpy(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_cpy(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
         self._op_compare(self._y, value)
 
     def _op_compare(self, register, value):
-        res = (register - value) & 0xFF
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (res & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if res == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if register >= value else 0)  # C
-
-    def _op_dec(self, mode=None, value=None):
-        if mode is not None:
-            address = self._calculate_memory_address(mode)
+        self._p = (self._p & NOT_NZC) | COMPARE_FLAGS[(register << 8) | value]
+
+    def _op_dec(self, calculate_address=None, value=None):
+        if calculate_address is not None:
+            address = calculate_address()
             value = self._read_memory(address)
 
         result = (value - 1) & 0xFF
-        self._p = self._p & ~(N_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (result & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if result == 0 else 0)  # Z
+        self._p = (self._p & NOT_NZ) | NZ_FLAGS[result]
 
-        if mode is not None:
+        if calculate_address is not None:
             self._write_memory(address, result)
 
         return result
 
     def _op_dex(self):
-        self._x = self._op_dec(mode=None, value=self._x)
+        self._x = self._op_dec(calculate_address=None, value=self._x)
 
     def _op_dey(self):
-        self._y = self._op_dec(mode=None, value=self._y)
+        self._y = self._op_dec(calculate_address=None, value=self._y)
 
-    def _op_eor(self, mode=None, value=None):
-        if mode is not None:
-            address = self._calculate_memory_address(mode)
+    def _op_eor(self, calculate_address=None, value=None):
+        if calculate_address is not None:
+            address = calculate_address()
             value = self._read_memory(address)
 
         self._a = self._a ^ value
-        self._p = self._p & ~(N_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (self._a & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if self._a == 0 else 0)  # Z
+        self._p = (self._p & NOT_NZ) | NZ_FLAGS[self._a]
 
-    def _op_inc(self, mode=None, value=None):
-        if mode is not None:
-            address = self._calculate_memory_address(mode)
+    def _op_inc(self, calculate_address=None, value=None):
+        if calculate_address is not None:
+            address = calculate_address()
             value = self._read_memory(address)
 
         result = (value + 1) & 0xFF
-        self._p = self._p & ~(N_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (result & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if result == 0 else 0)  # Z
+        self._p = (self._p & NOT_NZ) | NZ_FLAGS[result]
 
-        if mode is not None:
+        if calculate_address is not None:
             self._write_memory(address, result)
 
         return result
 
     def _op_inx(self):
-        self._x = self._op_inc(mode=None, value=self._x)
+        self._x = self._op_inc(calculate_address=None, value=self._x)
 
     def _op_iny(self):
-        self._y = self._op_inc(mode=None, value=self._y)
+        self._y = self._op_inc(calculate_address=None, value=self._y)
 
-    def _op_jmp(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_jmp(self, calculate_address):
+        address = calculate_address()
         self._pc = address
 
-    def _op_jsr(self, mode):
-        address = self._calculate_memory_address(mode)
-        self._pc -= 1
+    def _op_jsr(self, calculate_address):
+        address = calculate_address()
+        self._pc = (self._pc - 1) & 0xFFFF
         self._push(self._pc >> 8)
         self._push(self._pc & 0xFF)
         self._pc = address
 
-    def _op_lda(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_lda(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
         self._a = self._op_load(value)
 
-    def _op_ldx(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_ldx(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
         self._x = self._op_load(value)
 
-    def _op_ldy(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_ldy(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
         self._y = self._op_load(value)
 
     def _op_load(self, value):
-        self._p = self._p & ~(N_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (value & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if value == 0 else 0)  # Z
+        self._p = (self._p & NOT_NZ) | NZ_FLAGS[value]
         return value
 
-    def _op_lsr(self, mode):
-        if mode == CpuAddressingMode.ACC:
-            address = 0
-            value = self._a
-        else:
-            address = self._calculate_memory_address(mode)
-            value = self._read_memory(address)
+    def _op_lsr_acc(self):
+        self._a = self._op_lsr_int(self._a)
 
-        result = 0x7F & (value >> 1)
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # clear flags
-        self._p = self._p | (Z_FLAG if result == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if (value & 0x01) != 0 else 0)  # C
+    def _op_lsr(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+        self._write_memory(address, self._op_lsr_int(value))
 
-        if mode == CpuAddressingMode.ACC:
-            self._a = result
-        else:
-            self._write_memory(address, result)
+    def _op_lsr_int(self, value):
+        self._p = (self._p & NOT_NZC) | LSR_FLAGS[value]
+        return LSR_RESULTS[value]
 
-    def _op_ora(self, mode=None, value=None):
-        if mode is not None:
-            address = self._calculate_memory_address(mode)
+    def _op_ora(self, calculate_address=None, value=None):
+        if calculate_address is not None:
+            address = calculate_address()
             value = self._read_memory(address)
 
         self._a = self._a | value
-        self._p = self._p & ~(N_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (self._a & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if self._a == 0 else 0)  # Z
+        self._p = (self._p & NOT_NZ) | NZ_FLAGS[self._a]
 
     def _op_pha(self):
         self._push(self._a)
@@ -990,53 +1307,37 @@ class CPU(object):
 
     def _op_pla(self):
         self._a = self._pop()
-
-        self._p = self._p & ~(N_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG & self._a)  # N
-        self._p = self._p | (Z_FLAG if self._a == 0 else 0)  # Z
+        self._p = (self._p & NOT_NZ) | NZ_FLAGS[self._a]
 
     def _op_plp(self):
         self._p = self._pop() & ~B_FLAG | R_FLAG
+        self._poll_irq_line()
 
-    def _op_rol(self, mode):
-        if mode == CpuAddressingMode.ACC:
-            address = 0
-            value = self._a
-        else:
-            address = self._calculate_memory_address(mode)
-            value = self._read_memory(address)
+    def _op_rol_acc(self):
+        self._a = self._op_rol_int(self._a)
 
-        res = (value << 1) & 0xFF
-        res = res | (1 if (self._p & C_FLAG) != 0 else 0)
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (res & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if res == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if (value & 0x80) != 0 else 0)  # C
+    def _op_rol(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+        self._write_memory(address, self._op_rol_int(value))
 
-        if mode == CpuAddressingMode.ACC:
-            self._a = res
-        else:
-            self._write_memory(address, res)
+    def _op_rol_int(self, value):
+        index = ((self._p & C_FLAG) << 8) | value
+        self._p = (self._p & NOT_NZC) | ROL_FLAGS[index]
+        return ROL_RESULTS[index]
 
-    def _op_ror(self, mode):
-        if mode == CpuAddressingMode.ACC:
-            address = 0
-            value = self._a
-        else:
-            address = self._calculate_memory_address(mode)
-            value = self._read_memory(address)
+    def _op_ror_acc(self):
+        self._a = self._op_ror_int(self._a)
 
-        res = (value >> 1) & 0xFF
-        res = res | (0x80 if (self._p & C_FLAG) != 0 else 0)
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (res & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if res == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if (value & 0x01) != 0 else 0)  # C
+    def _op_ror(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+        self._write_memory(address, self._op_ror_int(value))
 
-        if mode == CpuAddressingMode.ACC:
-            self._a = res
-        else:
-            self._write_memory(address, res)
+    def _op_ror_int(self, value):
+        index = ((self._p & C_FLAG) << 8) | value
+        self._p = (self._p & NOT_NZC) | ROR_FLAGS[index]
+        return ROR_RESULTS[index]
 
     def _op_rti(self):
         self._p = self._pop() & ~B_FLAG
@@ -1044,26 +1345,21 @@ class CPU(object):
         pcl = self._pop()
         pch = self._pop()
         self._pc = (pch << 8) | pcl
+        self._poll_irq_line()
 
     def _op_rts(self):
         pcl = self._pop()
         pch = self._pop()
-        self._pc = (pch << 8) | pcl
-        self._pc += 1
+        self._pc = (((pch << 8) | pcl) + 1) & 0xFFFF
 
-    def _op_sbc(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_sbc(self, calculate_address):
+        address = calculate_address()
         value = self._read_memory(address)
 
-        result = self._a - value - (0 if (self._p & C_FLAG) != 0 else 1)
-
-        self._p = self._p & ~(N_FLAG | V_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (result & N_FLAG)  # N
-        self._p = self._p | (V_FLAG if ((self._a ^ value) & (self._a ^ (0xFF & result)) & 0x80) != 0 else 0)  # V
-        self._p = self._p | (Z_FLAG if (result & 0xFF) == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if (result & 0x100) == 0 else 0)  # C
-
-        self._a = 0xFF & result
+        # A - value - borrow is A + ~value + carry
+        index = ((self._p & C_FLAG) << 16) | (self._a << 8) | (value ^ 0xFF)
+        self._p = (self._p & NOT_NVZC) | ADC_FLAGS[index]
+        self._a = ADC_RESULTS[index]
 
     def _op_sec(self):
         self._p = self._p | C_FLAG
@@ -1074,16 +1370,16 @@ class CPU(object):
     def _op_sei(self):
         self._p = self._p | I_FLAG
 
-    def _op_sta(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_sta(self, calculate_address):
+        address = calculate_address()
         self._write_memory(address, self._a)
 
-    def _op_stx(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_stx(self, calculate_address):
+        address = calculate_address()
         self._write_memory(address, self._x)
 
-    def _op_sty(self, mode):
-        address = self._calculate_memory_address(mode)
+    def _op_sty(self, calculate_address):
+        address = calculate_address()
         self._write_memory(address, self._y)
 
     def _op_tax(self):
@@ -1110,133 +1406,310 @@ class CPU(object):
         self._transfer(self._a)
 
     def _transfer(self, to_register):
-        self._p = self._p & ~(N_FLAG | Z_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (to_register & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if to_register == 0 else 0)  # Z
+        self._p = (self._p & NOT_NZ) | NZ_FLAGS[to_register]
 
-    def _op_dop(self, mode):
+    def _op_dop(self, calculate_address):
         # DOP double NOP
-        self._read_memory(self._calculate_memory_address(mode))
+        self._read_memory(calculate_address())
 
-    def _op_top(self, mode):
+    def _op_top(self, calculate_address):
         # TOP triple NOP
-        self._read_memory(self._calculate_memory_address(mode))
+        self._read_memory(calculate_address())
 
-    def _op_lax(self, mode):
+    def _op_lax(self, calculate_address):
         # LAX Load accumulator and X register with memory Status flags: N,Z
 
-        address = self._calculate_memory_address(mode)
+        address = calculate_address()
         self._a = self._op_load(self._read_memory(address))
         self._x = self._a
 
-    def _op_aax(self, mode):
+    def _op_aax(self, calculate_address):
         # AAX (SAX) [AXS] AND X register with accumulator and store result in memory.
-        address = self._calculate_memory_address(mode)
+        address = calculate_address()
 
         result = self._a & self._x
         self._write_memory(address, result)
 
-    def _op_dcp(self, mode):
+    def _op_dcp(self, calculate_address):
         # DCP (DCP) [DCM]
-        address = self._calculate_memory_address(mode)
+        address = calculate_address()
 
         value = self._read_memory(address)
         value = 0xFF & (value - 1)
 
-        value_to_test = self._a - value
-
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (value_to_test & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if (value_to_test == 0) else 0)  # Z
-        self._p = self._p | (C_FLAG if (value_to_test & 0x100) == 0 else 0)  # C
+        self._p = (self._p & NOT_NZC) | COMPARE_FLAGS[(self._a << 8) | value]
 
         self._write_memory(address, value)
 
-    def _op_isc(self, mode):
+    def _op_isc(self, calculate_address):
         # ISC (ISB) [INS] Increase memory by one, then subtract memory from accumulator (with borrow).
 
-        address = self._calculate_memory_address(mode)
+        address = calculate_address()
 
         value = self._read_memory(address)
         value = 0xFF & (value + 1)
 
-        result = self._a - value - (0 if (self._p & C_FLAG) != 0 else 1)
-
-        self._p = self._p & ~(N_FLAG | V_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (V_FLAG if ((self._a ^ value) & (self._a ^ (result & 0xFF)) & 0x80) != 0 else 0)  # V
-        self._p = self._p | (C_FLAG if (result & 0x100) == 0 else 0)  # C
-        self._a = result & 0xFF
-        self._p = self._p | (Z_FLAG if (self._a & 0xFF) == 0 else 0)  # Z
-        self._p = self._p | (self._a & N_FLAG)  # N
+        index = ((self._p & C_FLAG) << 16) | (self._a << 8) | (value ^ 0xFF)
+        self._p = (self._p & NOT_NVZC) | ADC_FLAGS[index]
+        self._a = ADC_RESULTS[index]
 
         self._write_memory(address, value)
 
-    def _op_slo(self, mode):
+    def _op_slo(self, calculate_address):
         # SLO (SLO) [ASO] Shift left one bit in memory, then OR accumulator with memory.
-        address = self._calculate_memory_address(mode)
+        address = calculate_address()
 
         value = self._read_memory(address)
-        result = (value << 1) & 0xFF
+        result = ASL_RESULTS[value]
 
         self._a = self._a | result
-
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (self._a & N_FLAG)  # N
-        self._p = self._p | (Z_FLAG if self._a == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if (value & 0x80) != 0 else 0)  # C
+        self._p = (self._p & NOT_NZC) | NZ_FLAGS[self._a] | (ASL_FLAGS[value] & C_FLAG)
 
         self._write_memory(address, result)
 
-    def _op_rla(self, mode):
+    def _op_rla(self, calculate_address):
         # RLA (RLA) [RLA] Rotate one bit left in memory, then AND accumulator with memory.
-        address = self._calculate_memory_address(mode)
+        address = calculate_address()
 
         value = self._read_memory(address)
 
-        res = (value << 1) & 0xFF
-        res = res | (1 if (self._p & C_FLAG) != 0 else 0)
+        index = ((self._p & C_FLAG) << 8) | value
+        res = ROL_RESULTS[index]
 
         self._a = self._a & res
-
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (N_FLAG if (self._a & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if self._a == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if (value & 0x80) != 0 else 0)  # C
+        self._p = (self._p & NOT_NZC) | NZ_FLAGS[self._a] | (ROL_FLAGS[index] & C_FLAG)
 
         self._write_memory(address, res)
 
-    def _op_sre(self, mode):
+    def _op_sre(self, calculate_address):
         # SRE (SRE) [LSE] Shift right one bit in memory, then EOR accumulator with memory.
-        address = self._calculate_memory_address(mode)
+        address = calculate_address()
 
         value = self._read_memory(address)
 
-        res = 0x7F & (value >> 1)
+        res = LSR_RESULTS[value]
         self._a = self._a ^ res
 
-        self._p = self._p & ~(N_FLAG | Z_FLAG | C_FLAG)  # clear flags
-        self._p = self._p | (N_FLAG if (self._a & 0x80) != 0 else 0)  # N
-        self._p = self._p | (Z_FLAG if res == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if (value & 0x01) != 0 else 0)  # C
+        # Z comes from the shifted value, not from A
+        self._p = (self._p & NOT_NZC) | (self._a & N_FLAG) | LSR_FLAGS[value]
 
         self._write_memory(address, res)
 
-    def _op_rra(self, mode):
+    def _op_rra(self, calculate_address):
         # RRA (RRA) [RRA] Rotate one bit right in memory, then add memory to accumulator (with carry).
-        address = self._calculate_memory_address(mode)
+        address = calculate_address()
 
         value1 = self._read_memory(address)
-        value = (value1 >> 1) & 0xFF
-        value = value | (0x80 if (self._p & C_FLAG) != 0 else 0)
+        value = ROR_RESULTS[((self._p & C_FLAG) << 8) | value1]
+
+        index = ((value1 & 0x01) << 16) | (self._a << 8) | value
+        self._p = (self._p & NOT_NVZC) | ADC_FLAGS[index]
+        self._a = ADC_RESULTS[index]
+
+        self._write_memory(address, value)
+
+
+class LazyFlagsCPU(CPU):
+    # CPU that defers N and Z. Ops that set them store the value the flags come from in _nz instead of updating the
+    # status register, and _p is only assembled when it's read: by PHP, BRK and interrupt pushes, or from the
+    # outside (save states, traces, the recompiler). Branches test _nz directly.
+    #
+    # _flags holds the other flags, its N and Z bits are stale. N is set when bit 7 or bit 8 of _nz is set and Z
+    # when its low byte is 0, bit 8 covers the ops whose N is set while Z is set too (BIT).
+
+    def __init__(self, cpu_memory):
+        self._flags = 0x00
+        self._nz = 0x01
+        super(LazyFlagsCPU, self).__init__(cpu_memory)
+
+    @property
+    def _p(self):
+        return (self._flags & NOT_NZ) | LAZY_NZ_FLAGS[self._nz]
+
+    @_p.setter
+    def _p(self, p):
+        self._flags = p
+        self._nz = ((p & N_FLAG) << 1) | (0 if p & Z_FLAG else 1)
+
+    def _op_adc(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+
+        index = ((self._flags & C_FLAG) << 16) | (self._a << 8) | value
+        self._flags = ADC_FLAGS[index] | (self._flags & NOT_NVZC)
+        self._a = self._nz = ADC_RESULTS[index]
+
+    def _op_sbc(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+
+        index = ((self._flags & C_FLAG) << 16) | (self._a << 8) | (value ^ 0xFF)
+        self._flags = ADC_FLAGS[index] | (self._flags & NOT_NVZC)
+        self._a = self._nz = ADC_RESULTS[index]
+
+    def _op_and(self, calculate_address):
+        self._a = self._nz = self._a & self._read_memory(calculate_address())
+
+    def _op_ora(self, calculate_address):
+        self._a = self._nz = self._a | self._read_memory(calculate_address())
+
+    def _op_eor(self, calculate_address):
+        self._a = self._nz = self._a ^ self._read_memory(calculate_address())
 
-        res = self._a + value + (1 if (value1 & 0x01) != 0 else 0)
+    def _op_bit(self, calculate_address):
+        value = self._read_memory(calculate_address())
+        self._flags = (self._flags & ~V_FLAG) | (value & V_FLAG)
+        self._nz = ((value & N_FLAG) << 1) | (self._a & value)
 
-        self._p = self._p & ~(N_FLAG | V_FLAG | Z_FLAG | C_FLAG)  # Clear flags
-        self._p = self._p | (res & N_FLAG)  # N
-        self._p = self._p | (V_FLAG if (~(self._a ^ value) & (self._a ^ (res & 0xFF)) & 0x80) != 0 else 0)  # V
-        self._p = self._p | (Z_FLAG if (res & 0xFF) == 0 else 0)  # Z
-        self._p = self._p | (C_FLAG if res > 0xFF else 0)  # C
+    def _op_asl_int(self, value):
+        self._flags = (self._flags & ~C_FLAG) | (value >> 7)
+        self._nz = ASL_RESULTS[value]
+        return self._nz
+
+    def _op_lsr_int(self, value):
+        self._flags = (self._flags & ~C_FLAG) | (value & 0x01)
+        self._nz = LSR_RESULTS[value]
+        return self._nz
+
+    def _op_rol_int(self, value):
+        self._nz = ROL_RESULTS[((self._flags & C_FLAG) << 8) | value]
+        self._flags = (self._flags & ~C_FLAG) | (value >> 7)
+        return self._nz
+
+    def _op_ror_int(self, value):
+        self._nz = ROR_RESULTS[((self._flags & C_FLAG) << 8) | value]
+        self._flags = (self._flags & ~C_FLAG) | (value & 0x01)
+        return self._nz
+
+    def _op_compare(self, register, value):
+        self._flags = (self._flags & ~C_FLAG) | (C_FLAG if register >= value else 0)
+        self._nz = (register - value) & 0xFF
 
-        self._a = res & 0xFF
+    def _op_dec(self, calculate_address=None, value=None):
+        if calculate_address is None:
+            self._nz = (value - 1) & 0xFF
+            return self._nz
+
+        address = calculate_address()
+        self._nz = (self._read_memory(address) - 1) & 0xFF
+        self._write_memory(address, self._nz)
+
+    def _op_inc(self, calculate_address=None, value=None):
+        if calculate_address is None:
+            self._nz = (value + 1) & 0xFF
+            return self._nz
+
+        address = calculate_address()
+        self._nz = (self._read_memory(address) + 1) & 0xFF
+        self._write_memory(address, self._nz)
+
+    def _op_load(self, value):
+        self._nz = value
+        return value
+
+    def _op_pla(self):
+        self._a = self._nz = self._pop()
+
+    def _transfer(self, to_register):
+        self._nz = to_register
+
+    def _op_bcc(self, calculate_address):
+        self._op_branch((self._flags & C_FLAG) == 0, calculate_address())
+
+    def _op_bcs(self, calculate_address):
+        self._op_branch((self._flags & C_FLAG) != 0, calculate_address())
+
+    def _op_beq(self, calculate_address):
+        self._op_branch((self._nz & 0xFF) == 0, calculate_address())
+
+    def _op_bmi(self, calculate_address):
+        self._op_branch((self._nz & 0x180) != 0, calculate_address())
+
+    def _op_bne(self, calculate_address):
+        self._op_branch((self._nz & 0xFF) != 0, calculate_address())
+
+    def _op_bpl(self, calculate_address):
+        self._op_branch((self._nz & 0x180) == 0, calculate_address())
+
+    def _op_bvc(self, calculate_address):
+        self._op_branch((self._flags & V_FLAG) == 0, calculate_address())
+
+    def _op_bvs(self, calculate_address):
+        self._op_branch((self._flags & V_FLAG) != 0, calculate_address())
+
+    def _op_clc(self):
+        self._flags = self._flags & ~C_FLAG
+
+    def _op_cld(self):
+        self._flags = self._flags & ~D_FLAG
+
+    def _op_cli(self):
+        self._flags = self._flags & ~I_FLAG
+        self._poll_irq_line()
+
+    def _op_clv(self):
+        self._flags = self._flags & ~V_FLAG
+
+    def _op_sec(self):
+        self._flags = self._flags | C_FLAG
+
+    def _op_sed(self):
+        self._flags = self._flags | D_FLAG
+
+    def _op_sei(self):
+        self._flags = self._flags | I_FLAG
+
+    def _op_dcp(self, calculate_address):
+        address = calculate_address()
+        value = (self._read_memory(address) - 1) & 0xFF
+
+        self._op_compare(self._a, value)
+        self._write_memory(address, value)
+
+    def _op_isc(self, calculate_address):
+        address = calculate_address()
+        value = (self._read_memory(address) + 1) & 0xFF
+
+        index = ((self._flags & C_FLAG) << 16) | (self._a << 8) | (value ^ 0xFF)
+        self._flags = ADC_FLAGS[index] | (self._flags & NOT_NVZC)
+        self._a = self._nz = ADC_RESULTS[index]
+        self._write_memory(address, value)
+
+    def _op_slo(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+        result = ASL_RESULTS[value]
+
+        self._flags = (self._flags & ~C_FLAG) | (value >> 7)
+        self._a = self._nz = self._a | result
+        self._write_memory(address, result)
+
+    def _op_rla(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+        result = ROL_RESULTS[((self._flags & C_FLAG) << 8) | value]
+
+        self._flags = (self._flags & ~C_FLAG) | (value >> 7)
+        self._a = self._nz = self._a & result
+        self._write_memory(address, result)
+
+    def _op_sre(self, calculate_address):
+        address = calculate_address()
+        value = self._read_memory(address)
+        result = LSR_RESULTS[value]
+
+        self._flags = (self._flags & ~C_FLAG) | (value & 0x01)
+        self._a = self._a ^ result
+        # N comes from A and Z from the shifted value
+        self._nz = ((self._a & N_FLAG) << 1) | result
+        self._write_memory(address, result)
+
+    def _op_rra(self, calculate_address):
+        address = calculate_address()
+        value1 = self._read_memory(address)
+        value = ROR_RESULTS[((self._flags & C_FLAG) << 8) | value1]
 
+        index = ((value1 & 0x01) << 16) | (self._a << 8) | value
+        self._flags = ADC_FLAGS[index] | (self._flags & NOT_NVZC)
+        self._a = self._nz = ADC_RESULTS[index]
         self._write_memory(address, value)
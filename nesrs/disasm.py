@@ -0,0 +1,319 @@
+import argparse
+import hashlib
+import os
+import struct
+
+from nesrs.cartridge import read_ines_rom
+from nesrs.cpu import OP_CODES, CpuAddressingMode
+from nesrs.recompiler import OPERAND_LENGTHS
+
+# Instruction length by op code, op codes missing from OP_CODES are 1 byte like CPU._op_unsupported
+INSTRUCTION_LENGTHS = bytes(1 + OPERAND_LENGTHS[OP_CODES[op_code][1]] if op_code in OP_CODES else 1
+                            for op_code in range(256))
+
+_OPERAND_FORMATS = {
+    CpuAddressingMode.ACC: 'A',
+    CpuAddressingMode.IMPL: '',
+    CpuAddressingMode.IMM: '#$%02X',
+    CpuAddressingMode.ZP: '$%02X',
+    CpuAddressingMode.ZPX: '$%02X,X',
+    CpuAddressingMode.ZPY: '$%02X,Y',
+    CpuAddressingMode.REL: '$%04X',
+    CpuAddressingMode.INDX: '($%02X,X)',
+    CpuAddressingMode.IND_Y: '($%02X),Y',
+    CpuAddressingMode.IND_Y_: '($%02X),Y',
+    CpuAddressingMode.ABS: '$%04X',
+    CpuAddressingMode.ABSX: '$%04X,X',
+    CpuAddressingMode.ABSX_: '$%04X,X',
+    CpuAddressingMode.ABSY: '$%04X,Y',
+    CpuAddressingMode.ABSY_: '$%04X,Y',
+    CpuAddressingMode.IND: '($%04X)',
+    CpuAddressingMode.IND_: '($%04X)',
+}
+
+# How a block ends
+FALLTHROUGH = 0  # The next instruction starts another block
+JUMP = 1  # JMP absolute
+BRANCH = 2  # Conditional branch, taken and not taken
+CALL = 3  # JSR, the target and the return address
+RETURN = 4  # RTS, RTI
+INDIRECT = 5  # JMP indirect, the target is only known at run time
+HALT = 6  # BRK, or an op code missing from OP_CODES (KIL, or data)
+
+# "NCFG", version, reset, NMI and IRQ vectors, block count
+CFG_HEADER = struct.Struct('<4sBHHHI')
+# Address, bank, end address, instruction count, exit, successor count, then the successors as <H
+CFG_BLOCK = struct.Struct('<HBIHBB')
+CFG_VERSION = 1
+
+
+class InstructionTable(object):
+    # The instruction decoded at every offset of PRG ROM. The lengths come from one translate of the whole
+    # buffer, op codes and operands are read from it when asked for.
+
+    def __init__(self, prg_rom):
+        self.prg_rom = bytes(prg_rom)
+        self.lengths = self.prg_rom.translate(INSTRUCTION_LENGTHS)
+
+    def __len__(self):
+        return len(self.prg_rom)
+
+    def instruction(self, offset):
+        # (op code, operand, length), the operand is None for 1 byte instructions
+        prg_rom = self.prg_rom
+        length = self.lengths[offset]
+        if length == 1:
+            return prg_rom[offset], None, 1
+        elif length == 2:
+            return prg_rom[offset], prg_rom[(offset + 1) % len(prg_rom)], 2
+        return prg_rom[offset], prg_rom[(offset + 1) % len(prg_rom)] | (prg_rom[(offset + 2) % len(prg_rom)] << 8), 3
+
+
+class Block(object):
+    __slots__ = ('address', 'bank', 'end', 'instruction_count', 'exit', 'successors')
+
+    def __init__(self, address, bank, end, instruction_count, exit, successors):
+        self.address = address
+        self.bank = bank
+        # Address right after the last instruction
+        self.end = end
+        self.instruction_count = instruction_count
+        self.exit = exit
+        # Addresses the block may continue at, including addresses outside PRG ROM
+        self.successors = successors
+
+
+class Disassembly(object):
+    # Control flow graph of the code reachable from the reset, NMI and IRQ vectors, with PRG ROM banks mapped the
+    # way the cartridge maps them at power on. Code running in a bank mapped later (or in RAM) is only reached
+    # through the addresses the graph leads to, jump tables and other indirect jumps end their block.
+
+    def __init__(self, cartridge, table=None):
+        self._cartridge = cartridge
+        self._prg_rom_map = list(cartridge._prg_rom_map)
+        self.table = table if table is not None else InstructionTable(cartridge._prg_rom)
+        self.rom_hash = rom_hash(cartridge)
+        self.vectors = tuple(self._read_word(vector) for vector in (0xFFFC, 0xFFFA, 0xFFFE))
+        # Block address -> Block
+        self.blocks = {}
+
+    #
+    # ROM addresses
+    #
+    def rom_offset(self, address):
+        # Offset in PRG ROM of a CPU address in 0x8000 - 0xFFFF
+        return (self._prg_rom_map[(address & 0x7FFF) >> 13] << 13) | (address & 0x1FFF)
+
+    def bank(self, address):
+        return self._prg_rom_map[(address & 0x7FFF) >> 13]
+
+    def _read_word(self, address):
+        prg_rom = self.table.prg_rom
+        return prg_rom[self.rom_offset(address)] | (prg_rom[self.rom_offset((address + 1) & 0xFFFF)] << 8)
+
+    def instruction(self, address):
+        # (op code, operand, length) of the instruction at a CPU address in PRG ROM
+        return self.table.instruction(self.rom_offset(address))
+
+    def format_instruction(self, address):
+        # "C000  4C F5 C5  JMP $C5F5"
+        op_code, operand, length = self.instruction(address)
+        code = ' '.join('%02X' % self.table.prg_rom[self.rom_offset((address + i) & 0xFFFF)] for i in range(length))
+        if op_code not in OP_CODES:
+            return '%04X  %-8s  .DB $%02X' % (address, code, op_code)
+
+        name, mode = OP_CODES[op_code]
+        if mode == CpuAddressingMode.REL:
+            operand = _branch_target(address, operand)
+        operand_format = _OPERAND_FORMATS[mode]
+        text = name.upper() + (' ' + (operand_format % operand if '%' in operand_format else operand_format)
+                               if operand_format else '')
+        return '%04X  %-8s  %s' % (address, code, text)
+
+    #
+    # Control flow graph
+    #
+    def build(self):
+        # Finds the instructions reachable from the vectors and the leaders (the targets and the instructions after
+        # branches and calls), then cuts the blocks at the leaders
+        leaders = set(address for address in self.vectors if address >= 0x8000)
+        visited = set()
+        pending = sorted(leaders)
+        while pending:
+            address = pending.pop()
+            while address >= 0x8000 and address not in visited:
+                visited.add(address)
+                exit, next_address, successors = self._step(address)
+                for successor in successors:
+                    if successor >= 0x8000 and successor not in visited:
+                        pending.append(successor)
+                    leaders.add(successor)
+                if exit != FALLTHROUGH:
+                    break
+                address = next_address
+
+        self.blocks = {}
+        for leader in leaders:
+            if leader >= 0x8000:
+                self.blocks[leader] = self._cut_block(leader, leaders)
+
+        return self
+
+    def _step(self, address):
+        # (exit, address of the next instruction, successors) of one instruction, exit is FALLTHROUGH for
+        # instructions that don't end a block
+        op_code, operand, length = self.instruction(address)
+        next_address = (address + length) & 0xFFFF
+        if op_code not in OP_CODES:
+            return HALT, next_address, ()
+
+        name, mode = OP_CODES[op_code]
+        if mode == CpuAddressingMode.REL:
+            return BRANCH, next_address, (_branch_target(address, operand), next_address)
+        elif name == 'jmp':
+            if mode == CpuAddressingMode.ABS:
+                return JUMP, next_address, (operand,)
+            return INDIRECT, next_address, ()
+        elif name == 'jsr':
+            return CALL, next_address, (operand, next_address)
+        elif name == 'rts' or name == 'rti':
+            return RETURN, next_address, ()
+        elif name == 'brk':
+            return HALT, next_address, ()
+
+        return FALLTHROUGH, next_address, ()
+
+    def _cut_block(self, address, leaders):
+        start = address
+        count = 0
+        while True:
+            exit, next_address, successors = self._step(address)
+            count += 1
+            if exit != FALLTHROUGH:
+                break
+            if next_address in leaders or next_address < 0x8000:
+                successors = (next_address,)
+                break
+            address = next_address
+
+        return Block(start, self.bank(start), next_address if next_address > start else 0x10000, count, exit,
+                     tuple(successors))
+
+    def block_instructions(self, block):
+        # CPU addresses of the instructions of a block
+        addresses = []
+        address = block.address
+        for _ in range(block.instruction_count):
+            addresses.append(address)
+            address = (address + self.instruction(address)[2]) & 0xFFFF
+        return addresses
+
+    def listing(self):
+        # Lines of the blocks in address order
+        for address in sorted(self.blocks):
+            block = self.blocks[address]
+            yield ''
+            yield '; block %04X bank %d -> %s' % (address, block.bank,
+                                                 ' '.join('%04X' % successor for successor in block.successors))
+            for instruction_address in self.block_instructions(block):
+                yield self.format_instruction(instruction_address)
+
+    #
+    # Disk cache
+    #
+    def save(self, path):
+        parts = [CFG_HEADER.pack(b'NCFG', CFG_VERSION, self.vectors[0], self.vectors[1], self.vectors[2],
+                                 len(self.blocks))]
+        for address in sorted(self.blocks):
+            block = self.blocks[address]
+            parts.append(CFG_BLOCK.pack(block.address, block.bank, block.end, block.instruction_count, block.exit,
+                                        len(block.successors)))
+            parts.append(struct.pack('<%dH' % len(block.successors), *block.successors))
+
+        # Written aside and renamed, processes sharing the cache never read half a file
+        temporary_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary_path, 'wb') as cfg_file:
+            cfg_file.write(b''.join(parts))
+        os.replace(temporary_path, path)
+
+    def load(self, path):
+        with open(path, 'rb') as cfg_file:
+            data = cfg_file.read()
+
+        if len(data) < CFG_HEADER.size:
+            raise ValueError('Truncated control flow graph')
+        tag, version, reset, nmi, irq, count = CFG_HEADER.unpack_from(data)
+        if tag != b'NCFG':
+            raise ValueError('Not a control flow graph')
+        if version != CFG_VERSION:
+            raise ValueError('Unsupported control flow graph version %d' % version)
+
+        blocks = {}
+        offset = CFG_HEADER.size
+        for _ in range(count):
+            address, bank, end, instruction_count, exit, successor_count = CFG_BLOCK.unpack_from(data, offset)
+            offset += CFG_BLOCK.size
+            successors = struct.unpack_from('<%dH' % successor_count, data, offset)
+            offset += 2 * successor_count
+            blocks[address] = Block(address, bank, end, instruction_count, exit, successors)
+
+        self.vectors = (reset, nmi, irq)
+        self.blocks = blocks
+        return self
+
+
+def rom_hash(cartridge):
+    # Cache key: PRG ROM and the mapper, which decides the power on banks
+    mapper = cartridge.header.mapper if cartridge.header is not None else 0
+    return '%s-%d' % (hashlib.sha1(cartridge._prg_rom).hexdigest(), mapper)
+
+
+def default_cache_dir():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'nesrs', 'disasm')
+
+
+def disassemble(cartridge, cache_dir=None):
+    # The Disassembly of a cartridge, from the cache when it was built before. A cache_dir of False disables it.
+    disassembly = Disassembly(cartridge)
+    if cache_dir is False:
+        return disassembly.build()
+
+    cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+    path = os.path.join(cache_dir, disassembly.rom_hash + '.cfg')
+    try:
+        return disassembly.load(path)
+    except (OSError, ValueError, struct.error):
+        pass
+
+    disassembly.build()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        disassembly.save(path)
+    except OSError:
+        # A cache that can't be written only costs the next start a rebuild
+        pass
+    return disassembly
+
+
+def _branch_target(address, offset):
+    return (address + 2 + offset - ((offset & 0x80) << 1)) & 0xFFFF
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Disassembles the code reachable from the vectors of a ROM')
+    parser.add_argument('rom')
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+
+    with open(args.rom, 'rb') as rom_file:
+        cartridge = read_ines_rom(rom_file)
+    disassembly = disassemble(cartridge, False if args.no_cache else args.cache_dir)
+    print('; reset %04X nmi %04X irq %04X, %d blocks' % (disassembly.vectors + (len(disassembly.blocks),)))
+    for line in disassembly.listing():
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from nesrs.cartridge import read_ines_rom
+from nesrs.coverage import Coverage
+from nesrs.movie import Movie
+from nesrs.nes import NES
+from nesrs.ppu import PpuMode
+
+# CPU cycles run between two timeout checks when a job has a cycle budget
+CYCLES_PER_CHECK = 29781
+
+
+class Job(object):
+    # A ROM run for a number of frames or CPU cycles. input_script is a list of (frame, cpu_address, value) writes
+    # applied before the given frame starts (frame 0 is the first one), e.g. pokes of the RAM a game polls its input
+    # into. movie_path is a movie (see nesrs.movie) the controllers play from the first frame. With coverage the
+    # result holds the nesrs.coverage data of the run. Jobs are pickled to the workers.
+
+    def __init__(self, rom_path, frames=None, cycles=None, input_script=None, timeout=None, ppu_mode=PpuMode.FAST,
+                 movie_path=None, coverage=False):
+        if frames is None and cycles is None:
+            raise ValueError('A frame or cycle budget is required')
+
+        self.rom_path = rom_path
+        self.frames = frames
+        self.cycles = cycles
+        self.input_script = sorted(input_script or [], key=lambda write: write[0])
+        # Seconds of emulation after which the job fails
+        self.timeout = timeout
+        self.ppu_mode = ppu_mode
+        self.movie_path = movie_path
+        self.coverage = coverage
+
+
+class JobResult(object):
+
+    def __init__(self, job, ram_hash=None, framebuffer_hash=None, frames=0, cycles=0, wall_time=0.0, error=None,
+                 coverage=None):
+        self.job = job
+        self.ram_hash = ram_hash
+        self.framebuffer_hash = framebuffer_hash
+        self.frames = frames
+        self.cycles = cycles
+        self.wall_time = wall_time
+        # None when the job completed, otherwise a description of the failure
+        self.error = error
+        # Coverage.data of the run, for jobs with coverage
+        self.coverage = coverage
+
+    @property
+    def is_ok(self):
+        return self.error is None
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def run_job(job):
+    # Runs in a worker process, every job gets its own Cartridge, CpuMemory, CPU and PPU
+    start = time.perf_counter()
+    deadline = start + job.timeout if job.timeout is not None else None
+
+    nes = None
+    try:
+        with open(job.rom_path, 'rb') as rom_file:
+            nes = NES(read_ines_rom(rom_file), job.ppu_mode)
+        if job.movie_path is not None:
+            nes.play_movie(Movie.load(job.movie_path))
+        coverage = None
+        if job.coverage:
+            coverage = Coverage(len(nes.cartridge._prg_rom))
+            nes.cpu.set_coverage(coverage)
+        ppu = nes.ppu
+        write_memory = nes.cpu_memory.write_memory
+        script = job.input_script
+        script_index = 0
+
+        while True:
+            if job.frames is not None and ppu.frame >= job.frames:
+                break
+            if job.cycles is not None and nes.cycles >= job.cycles:
+                break
+            if deadline is not None and time.perf_counter() > deadline:
+                raise JobTimeout('Timed out after %d frames' % ppu.frame)
+
+            while script_index < len(script) and script[script_index][0] <= ppu.frame:
+                write_memory(script[script_index][1], script[script_index][2])
+                script_index += 1
+
+            if job.cycles is not None:
+                nes.run_cycles(min(CYCLES_PER_CHECK, job.cycles - nes.cycles))
+            else:
+                nes.run_frame()
+    except Exception as e:
+        return JobResult(job,
+                         frames=nes.ppu.frame if nes is not None else 0,
+                         cycles=nes.cycles if nes is not None else 0,
+                         wall_time=time.perf_counter() - start,
+                         error='%s: %s' % (type(e).__name__, e))
+
+    return JobResult(job,
+                     ram_hash=hashlib.sha1(nes.cpu_memory._ram).hexdigest(),
+                     framebuffer_hash=hashlib.sha1(nes.ppu.framebuffer).hexdigest(),
+                     frames=nes.ppu.frame,
+                     cycles=nes.cycles,
+                     wall_time=time.perf_counter() - start,
+                     coverage=bytes(coverage.data) if coverage is not None else None)
+
+
+def run_farm(jobs, max_workers=None):
+    # Runs the jobs across processes and yields a JobResult for each one as soon as it completes.
+    # A job that raises or times out fails alone. No more jobs than workers are submitted at once, so the jobs in
+    # flight when a worker process dies are known: they are run again first in a fresh pool, the queued jobs follow.
+    # A job in flight in two pools that died is run alone in a single worker pool, so only the job that kills its
+    # worker fails.
+    max_workers = max_workers or os.cpu_count()
+    # (job, pools that died while it was in flight)
+    queued = collections.deque((job, 0) for job in jobs)
+    isolated = []
+
+    while queued:
+        retried = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            is_broken = False
+            while in_flight or (queued and not is_broken):
+                while queued and not is_broken and len(in_flight) < max_workers:
+                    job, strikes = queued.popleft()
+                    in_flight[executor.submit(run_job, job)] = (job, strikes)
+
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    job, strikes = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        is_broken = True
+                        if strikes == 0:
+                            retried.append((job, 1))
+                        else:
+                            isolated.append(job)
+                        continue
+                    except Exception as e:
+                        result = JobResult(job, error='%s: %s' % (type(e).__name__, e))
+                    yield result
+        queued.extendleft(reversed(retried))
+
+    for job in isolated:
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_job, job).result()
+        except BrokenProcessPool:
+            result = JobResult(job, error='Worker process died')
+        except Exception as e:
+            result = JobResult(job, error='%s: %s' % (type(e).__name__, e))
+        yield result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs ROMs headless across processes')
+    parser.add_argument('roms', nargs='+')
+    parser.add_argument('--frames', type=int)
+    parser.add_argument('--cycles', type=int)
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--movie')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--coverage', help='writes the union of the coverage of the runs to this file, one ROM only')
+    args = parser.parse_args()
+    if args.frames is None and args.cycles is None:
+        parser.error('--frames or --cycles is required')
+    if args.coverage and len(set(args.roms)) != 1:
+        parser.error('--coverage needs runs of a single ROM')
+
+    jobs = [Job(rom, frames=args.frames, cycles=args.cycles, timeout=args.timeout, movie_path=args.movie,
+                coverage=args.coverage is not None)
+            for rom in args.roms]
+    coverage = None
+    for result in run_farm(jobs, args.workers):
+        if result.coverage is not None:
+            if coverage is None:
+                coverage = Coverage(len(result.coverage) - 0x8000, bytearray(result.coverage))
+            else:
+                coverage.merge(result.coverage)
+        if result.is_ok:
+            print('%s ok frames=%d cycles=%d ram=%s framebuffer=%s %.2fs' % (
+                result.job.rom_path, result.frames, result.cycles, result.ram_hash, result.framebuffer_hash,
+                result.wall_time))
+        else:
+            print('%s failed frames=%d cycles=%d %s' % (result.job.rom_path, result.frames, result.cycles,
+                                                        result.error))
+    if coverage is not None:
+        coverage.save(args.coverage)
+
+
+if __name__ == '__main__':
+    main()
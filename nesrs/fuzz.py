@@ -0,0 +1,352 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import random
+import time
+
+from nesrs.cartridge import read_ines_rom
+from nesrs.coverage import Coverage
+from nesrs.cpu import OP_CODES
+from nesrs.movie import Movie
+from nesrs.nes import NES
+
+# KIL op codes, the 6502 locks up until a reset
+JAM_OP_CODES = frozenset([0x02, 0x12, 0x22, 0x32, 0x42, 0x52, 0x62, 0x72, 0x92, 0xB2, 0xD2, 0xF2])
+
+WARMUP_FRAMES = 60
+MAX_FRAMES = 600
+# Frames between the snapshots kept for an input of the corpus
+SNAPSHOT_INTERVAL = 16
+# Inputs whose snapshots are kept by a worker, the others are run again from the start of the input
+SNAPSHOT_CACHE = 32
+# Mutated inputs every worker runs per round
+ROUND_ITERATIONS = 500
+
+
+class GuestCrash(Exception):
+
+    def __init__(self, op_code, pc):
+        super(GuestCrash, self).__init__('Op code %02X at %04X' % (op_code, pc))
+        self.op_code = op_code
+        self.pc = pc
+
+
+class FuzzTarget(object):
+    # A ROM and how it's fuzzed. Inputs start after warmup_frames frames without buttons pressed, they hold the
+    # buttons of the controllers for every frame like a Movie. Running an op code in crash_op_codes is a crash.
+    # Targets are pickled to the workers.
+
+    def __init__(self, rom_path, warmup_frames=WARMUP_FRAMES, controllers=1, max_frames=MAX_FRAMES,
+                 snapshot_interval=SNAPSHOT_INTERVAL, crash_op_codes=JAM_OP_CODES):
+        self.rom_path = rom_path
+        self.warmup_frames = warmup_frames
+        self.controllers = controllers
+        self.max_frames = max_frames
+        self.snapshot_interval = snapshot_interval
+        self.crash_op_codes = frozenset(crash_op_codes)
+
+
+class Crash(object):
+
+    def __init__(self, target, data, op_code, pc, frame):
+        self.target = target
+        # The minimized input, it crashes on its last frame
+        self.data = data
+        self.op_code = op_code
+        self.pc = pc
+        # Input frame of the crash
+        self.frame = frame
+
+    @property
+    def key(self):
+        # Crashes are told apart by the op and where it ran
+        return self.op_code, self.pc
+
+    def movie(self):
+        # The input played from power on, warm up frames included
+        controllers = self.target.controllers
+        return Movie(bytearray(self.target.warmup_frames * controllers) + self.data, controllers)
+
+
+class Fuzzer(object):
+    # Runs inputs on one NES. Every run restores an in-memory save state: the state after the warm up, or the
+    # latest snapshot of the parent input taken before the first frame the mutation changed, so only the frames
+    # from there on run again. Branch coverage (nesrs.coverage) of the frames run decides which inputs are kept.
+
+    def __init__(self, target):
+        self.target = target
+        with open(target.rom_path, 'rb') as rom_file:
+            self.nes = NES(read_ines_rom(rom_file))
+        self.coverage = Coverage(len(self.nes.cartridge._prg_rom))
+        self.nes.cpu.set_coverage(self.coverage)
+        self.nes.cpu.unsupported_op_handler = self._on_unsupported_op
+
+        for _ in range(target.warmup_frames):
+            self.nes.run_frame()
+        self._base = self.nes.save_state()
+        self._base_frame = self.nes.ppu.frame
+        # Coverage of the warm up and of every input kept, as an int of the coverage bytes
+        self.known = int.from_bytes(self.coverage.data, 'little')
+
+        # Input -> {frame: save state before the frame}
+        self._snapshots = collections.OrderedDict()
+        # The input of the last run, cut after the crash frame, and its snapshots
+        self._last_run = None
+
+    def _on_unsupported_op(self, op_code):
+        if op_code in self.target.crash_op_codes:
+            raise GuestCrash(op_code, (self.nes.cpu._pc - 1) & 0xFFFF)
+
+    def run(self, data, parent=None, first_changed=0):
+        # Runs an input, parent is an input equal to data before frame first_changed. Returns the coverage of the
+        # frames run (an int) and the crash as (op code, pc, frame), or None.
+        nes = self.nes
+        controllers = self.target.controllers
+        interval = self.target.snapshot_interval
+        frame_count = len(data) // controllers
+
+        parent_snapshots = self._snapshots.get(parent, {}) if parent is not None else {}
+        start = max([frame for frame in parent_snapshots if frame <= first_changed], default=0)
+        snapshots = {frame: state for frame, state in parent_snapshots.items() if frame <= start}
+        nes.load_state(snapshots[start] if start else self._base)
+
+        self.coverage.clear()
+        nes.play_movie(Movie(data[start * controllers:], controllers))
+        crash = None
+        try:
+            for frame in range(start, frame_count):
+                if frame % interval == 0 and frame not in snapshots and frame != 0:
+                    snapshots[frame] = nes.save_state()
+                nes.run_frame()
+        except GuestCrash as e:
+            crash = (e.op_code, e.pc, nes.ppu.frame - self._base_frame)
+            data = data[:(crash[2] + 1) * controllers]
+            snapshots = {frame: state for frame, state in snapshots.items() if frame <= crash[2]}
+        nes.stop_movie()
+
+        if parent is not None and parent not in self._snapshots:
+            # Snapshots up to the first changed frame are the parent's too
+            self._remember(parent, {frame: state for frame, state in snapshots.items() if frame <= first_changed})
+        self._last_run = (data, snapshots)
+        return int.from_bytes(self.coverage.data, 'little'), crash
+
+    def keep(self):
+        # Keeps the snapshots of the last run, for the inputs mutated from it. Returns its input, cut after the crash
+        # frame when it crashed.
+        data, snapshots = self._last_run
+        self._remember(data, snapshots)
+        return data
+
+    def _remember(self, data, snapshots):
+        self._snapshots[data] = snapshots
+        self._snapshots.move_to_end(data)
+        while len(self._snapshots) > SNAPSHOT_CACHE:
+            self._snapshots.popitem(last=False)
+
+    def minimize(self, data, op_code, pc):
+        # Releases the buttons of ever smaller spans of frames, then the buttons left one by one, while the same op
+        # still crashes at the same PC, and cuts the input after the crash frame. Returns (input, crash frame).
+        controllers = self.target.controllers
+        _, crash = self.run(data)
+        if crash is None or crash[:2] != (op_code, pc):
+            raise ValueError('The input does not crash at %04X' % pc)
+        data, frame = self.keep(), crash[2]
+        span = max(1, (len(data) // controllers) // 2)
+        while True:
+            first = 0
+            while first < len(data) // controllers:
+                end = min(first + span, len(data) // controllers)
+                if any(data[first * controllers:end * controllers]):
+                    candidate = data[:first * controllers] + bytes((end - first) * controllers) + \
+                                data[end * controllers:]
+                    _, crash = self.run(candidate, data, first)
+                    if crash is not None and crash[:2] == (op_code, pc):
+                        data, frame = self.keep(), crash[2]
+                first += span
+            if span == 1:
+                break
+            span //= 2
+
+        for index in range(len(data)):
+            for button in range(8):
+                if index < len(data) and data[index] & (1 << button):
+                    candidate = data[:index] + bytes([data[index] & ~(1 << button)]) + data[index + 1:]
+                    _, crash = self.run(candidate, data, index // controllers)
+                    if crash is not None and crash[:2] == (op_code, pc):
+                        data, frame = self.keep(), crash[2]
+        return data, frame
+
+
+def mutate(data, rng, corpus, controllers, max_frames):
+    # A mutated copy of an input and the first frame it changed
+    data = bytearray(data)
+    frame_count = len(data) // controllers
+    frame = rng.randrange(frame_count)
+    port = rng.randrange(controllers)
+    length = min(rng.randint(1, 32), frame_count - frame)
+    kind = rng.randrange(7)
+    if kind == 0:
+        # Toggles a button
+        data[frame * controllers + port] ^= 1 << rng.randrange(8)
+    elif kind == 1:
+        # Holds buttons over a span of frames
+        buttons = 1 << rng.randrange(8) if rng.randrange(2) else rng.randrange(256)
+        for i in range(frame, frame + length):
+            data[i * controllers + port] = buttons
+    elif kind == 2:
+        # Random buttons
+        data[frame * controllers + port] = rng.randrange(256)
+    elif kind == 3 and frame_count < max_frames:
+        # Repeats a span of frames
+        data[frame * controllers:frame * controllers] = data[frame * controllers:(frame + length) * controllers]
+    elif kind == 4 and frame_count > length:
+        # Drops a span of frames
+        del data[frame * controllers:(frame + length) * controllers]
+    elif kind == 5 and frame_count < max_frames:
+        # Extends the input with random buttons
+        frame = frame_count
+        data.extend(rng.randrange(256) if rng.randrange(4) == 0 else 0 for _ in range(length * controllers))
+    else:
+        # Continues with the frames of another input of the corpus, also when the input can't grow or shrink
+        other = rng.choice(corpus)
+        frame = min(frame, len(other) // controllers)
+        data[frame * controllers:] = other[frame * controllers:]
+
+    del data[max_frames * controllers:]
+    if not data:
+        data = bytearray(controllers)
+    return bytes(data), min(frame, len(data) // controllers)
+
+
+# The Fuzzer of a worker process, kept across rounds
+_worker_fuzzer = None
+
+
+def fuzz_round(target, corpus, known, seed, iterations):
+    # Mutates inputs of the corpus in a worker process. Returns the inputs that added coverage as
+    # [(input, coverage bytes)], the crashes, the runs and the coverage the worker knows of.
+    global _worker_fuzzer
+    if _worker_fuzzer is None or vars(_worker_fuzzer.target) != vars(target):
+        _worker_fuzzer = Fuzzer(target)
+    fuzzer = _worker_fuzzer
+    fuzzer.known |= int.from_bytes(known, 'little')
+
+    rng = random.Random(seed)
+    corpus = list(corpus)
+    size = len(fuzzer.coverage.data)
+    found = []
+    crashes = {}
+    for _ in range(iterations):
+        parent = rng.choice(corpus)
+        data, first_changed = mutate(parent, rng, corpus, target.controllers, target.max_frames)
+        coverage, crash = fuzzer.run(data, parent, first_changed)
+        if crash is None and coverage & ~fuzzer.known:
+            fuzzer.known |= coverage
+            data = fuzzer.keep()
+            corpus.append(data)
+            found.append((data, coverage.to_bytes(size, 'little')))
+        if crash is not None and crash[:2] not in crashes:
+            # Crashing inputs are not mutated further, their coverage still counts
+            fuzzer.known |= coverage
+            op_code, pc, _ = crash
+            data, frame = fuzzer.minimize(data, op_code, pc)
+            crashes[op_code, pc] = Crash(target, data, op_code, pc, frame)
+
+    return found, list(crashes.values()), iterations, fuzzer.known.to_bytes(size, 'little')
+
+
+class Campaign(object):
+    # The corpus, coverage and crashes of a target, fuzzed in rounds across worker processes. Every round the
+    # workers mutate the whole corpus, their new inputs are kept when they still add coverage once merged.
+
+    def __init__(self, target, initial_frames=60):
+        self.target = target
+        self.corpus = [bytes(min(initial_frames, target.max_frames) * target.controllers)]
+        with open(target.rom_path, 'rb') as rom_file:
+            self.coverage = Coverage(len(read_ines_rom(rom_file)._prg_rom))
+        # The coverage as an int, like Fuzzer.known
+        self.known = 0
+        # (op code, pc) -> Crash
+        self.crashes = {}
+        self.runs = 0
+
+    def run(self, iterations, max_workers=None, seed=None, round_iterations=ROUND_ITERATIONS, report=None):
+        # Runs about iterations mutated inputs, report is called with the campaign after every round
+        max_workers = max_workers or os.cpu_count()
+        rng = random.Random(seed)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            while iterations > 0:
+                known = self.known.to_bytes(len(self.coverage.data), 'little')
+                futures = []
+                for _ in range(max_workers):
+                    count = min(round_iterations, iterations)
+                    if count <= 0:
+                        break
+                    iterations -= count
+                    futures.append(executor.submit(fuzz_round, self.target, self.corpus, known,
+                                                   rng.getrandbits(64), count))
+                for future in concurrent.futures.as_completed(futures):
+                    self._merge(*future.result())
+                if report is not None:
+                    report(self)
+
+        return self
+
+    def _merge(self, found, crashes, runs, known):
+        # Inputs found by several workers at once are only kept while they add coverage
+        for data, coverage in found:
+            coverage = int.from_bytes(coverage, 'little')
+            if coverage & ~self.known:
+                self.known |= coverage
+                self.corpus.append(data)
+        self.known |= int.from_bytes(known, 'little')
+        self.coverage.data[:] = self.known.to_bytes(len(self.coverage.data), 'little')
+        for crash in crashes:
+            if crash.key not in self.crashes or len(crash.data) < len(self.crashes[crash.key].data):
+                self.crashes[crash.key] = crash
+        self.runs += runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuzzes the controller input of a ROM for KIL op codes')
+    parser.add_argument('rom')
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--warmup', type=int, default=WARMUP_FRAMES, help='frames before the input starts')
+    parser.add_argument('--frames', type=int, default=60, help='frames of the first input')
+    parser.add_argument('--max-frames', type=int, default=MAX_FRAMES)
+    parser.add_argument('--controllers', type=int, choices=(1, 2), default=1)
+    parser.add_argument('--unsupported', action='store_true',
+                        help='every op code missing from the CPU crashes, not only KIL')
+    parser.add_argument('--crashes', default='crashes', help='directory the crash movies are written to')
+    parser.add_argument('--coverage', help='writes the coverage of the corpus to this file')
+    args = parser.parse_args()
+
+    crash_op_codes = JAM_OP_CODES
+    if args.unsupported:
+        crash_op_codes = frozenset(op_code for op_code in range(256) if op_code not in OP_CODES)
+    target = FuzzTarget(args.rom, args.warmup, args.controllers, args.max_frames, crash_op_codes=crash_op_codes)
+    campaign = Campaign(target, args.frames)
+    start = time.perf_counter()
+
+    def report(campaign):
+        print('%8d runs %8.1f runs/s %6d inputs %6d covered %4d crashes' % (
+            campaign.runs, campaign.runs / (time.perf_counter() - start), len(campaign.corpus),
+            len(campaign.coverage.executed_offsets()), len(campaign.crashes)))
+
+    campaign.run(args.iterations, args.workers, args.seed, report=report)
+
+    if campaign.crashes:
+        os.makedirs(args.crashes, exist_ok=True)
+    for crash in campaign.crashes.values():
+        path = os.path.join(args.crashes, 'crash-%04X-%02X.nesm' % (crash.pc, crash.op_code))
+        crash.movie().save(path)
+        print('%02X at %04X on input frame %d: %s' % (crash.op_code, crash.pc, crash.frame, path))
+    if args.coverage:
+        campaign.coverage.save(args.coverage)
+
+
+if __name__ == '__main__':
+    main()
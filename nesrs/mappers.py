@@ -0,0 +1,219 @@
+import struct
+
+from nesrs.cartridge import Cartridge, Mirroring
+
+# Shift register, control, CHR bank 0, CHR bank 1, PRG bank
+MMC1_STATE = struct.Struct('<5B')
+# Bank select, R0 - R7, IRQ latch, IRQ counter, IRQ reload, IRQ enabled, IRQ asserted
+MMC3_STATE = struct.Struct('<9BBB???')
+
+# iNES mapper number -> Cartridge class
+MAPPERS = {
+    0: Cartridge,  # NROM
+}
+
+
+def mapper(number):
+    def register(cls):
+        MAPPERS[number] = cls
+        return cls
+
+    return register
+
+
+@mapper(1)
+class MMC1(Cartridge):
+    # SxROM. Registers are written one bit at a time through a 5 bit shift register.
+
+    def __init__(self, prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header=None):
+        super(MMC1, self).__init__(prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header)
+
+        self._shift_register = 0x10
+        self._control = 0x0C
+        self._chr_bank_0 = 0
+        self._chr_bank_1 = 0
+        self._prg_bank = 0
+        self._update_banks()
+
+    def _write_register(self, cpu_address, value):
+        if value & 0x80 != 0:
+            # Reset
+            self._shift_register = 0x10
+            self._control = self._control | 0x0C
+            self._update_banks()
+            return
+
+        is_complete = self._shift_register & 0x01
+        self._shift_register = (self._shift_register >> 1) | ((value & 0x01) << 4)
+        if not is_complete:
+            return
+
+        register = (cpu_address >> 13) & 0x03
+        if register == 0:
+            self._control = self._shift_register
+        elif register == 1:
+            self._chr_bank_0 = self._shift_register
+        elif register == 2:
+            self._chr_bank_1 = self._shift_register
+        else:
+            self._prg_bank = self._shift_register
+        self._shift_register = 0x10
+
+        self._update_banks()
+
+    def _save_registers(self):
+        return MMC1_STATE.pack(self._shift_register, self._control, self._chr_bank_0, self._chr_bank_1,
+                               self._prg_bank)
+
+    def _load_registers(self, data):
+        (self._shift_register, self._control, self._chr_bank_0, self._chr_bank_1,
+         self._prg_bank) = MMC1_STATE.unpack(data)
+
+    def _update_banks(self):
+        self._set_mirroring((Mirroring.SINGLE_SCREEN_LOW, Mirroring.SINGLE_SCREEN_HIGH,
+                             Mirroring.VERTICAL, Mirroring.HORIZONTAL)[self._control & 0x03])
+
+        # SUROM: bit 4 of the CHR bank selects the 256Kb PRG ROM half
+        outer_bank = self._chr_bank_0 & 0x10 if len(self._prg_rom) > 0x40000 else 0
+        prg_bank = outer_bank | (self._prg_bank & 0x0F)
+        prg_mode = (self._control >> 2) & 0x03
+        if prg_mode <= 1:
+            self._set_prg_bank_32k(prg_bank >> 1)
+        elif prg_mode == 2:
+            self._set_prg_bank_16k(0, outer_bank)
+            self._set_prg_bank_16k(1, prg_bank)
+        else:
+            self._set_prg_bank_16k(0, prg_bank)
+            self._set_prg_bank_16k(1, outer_bank | 0x0F)
+
+        self._set_prg_ram_enabled((self._prg_bank & 0x10) == 0)
+
+        if self._control & 0x10 != 0:
+            self._set_chr_bank_4k(0, self._chr_bank_0)
+            self._set_chr_bank_4k(1, self._chr_bank_1)
+        else:
+            self._set_chr_bank_8k(self._chr_bank_0 >> 1)
+
+
+@mapper(2)
+class UxROM(Cartridge):
+    # Switchable 16Kb bank at 0x8000, last 16Kb bank fixed at 0xC000
+
+    def __init__(self, prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header=None):
+        super(UxROM, self).__init__(prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header)
+
+        self._set_prg_bank_16k(0, 0)
+        self._set_prg_bank_16k(1, -1)
+
+    def _write_register(self, cpu_address, value):
+        self._set_prg_bank_16k(0, value)
+
+
+@mapper(3)
+class CNROM(Cartridge):
+    # Switchable 8Kb CHR ROM bank
+
+    def _write_register(self, cpu_address, value):
+        self._set_chr_bank_8k(value)
+
+
+@mapper(4)
+class MMC3(Cartridge):
+    # TxROM. 8Kb PRG ROM banks, 1Kb/2Kb CHR banks and a scanline IRQ counter clocked by the PPU.
+
+    has_scanline_irq = True
+
+    def __init__(self, prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header=None):
+        super(MMC3, self).__init__(prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header)
+
+        self._bank_select = 0
+        self._bank_registers = [0, 2, 4, 5, 6, 7, 0, 1]
+        self._irq_latch = 0
+        self._irq_counter = 0
+        self._irq_reload = False
+        self._irq_enabled = False
+        self._update_banks()
+
+    def _write_register(self, cpu_address, value):
+        register = cpu_address & 0xE001
+        if register == 0x8000:
+            self._bank_select = value
+            self._update_banks()
+        elif register == 0x8001:
+            self._bank_registers[self._bank_select & 0x07] = value
+            self._update_banks()
+        elif register == 0xA000:
+            if self.mirroring != Mirroring.FOUR_SCREEN:
+                self._set_mirroring(Mirroring.HORIZONTAL if value & 0x01 != 0 else Mirroring.VERTICAL)
+        elif register == 0xA001:
+            self._set_prg_ram_enabled((value & 0x80) != 0)
+        elif register == 0xC000:
+            self._irq_latch = value
+        elif register == 0xC001:
+            self._irq_counter = 0
+            self._irq_reload = True
+        elif register == 0xE000:
+            # Also acknowledges the IRQ, /IRQ is held low until then
+            self._irq_enabled = False
+            self._set_irq(False)
+        else:
+            self._irq_enabled = True
+
+    def _save_registers(self):
+        return MMC3_STATE.pack(self._bank_select, *self._bank_registers, self._irq_latch, self._irq_counter,
+                               self._irq_reload, self._irq_enabled, self._irq)
+
+    def _load_registers(self, data):
+        registers = MMC3_STATE.unpack(data)
+        self._bank_select = registers[0]
+        self._bank_registers[:] = registers[1:9]
+        # The CPU state holds the level of the line, irq_handler isn't called
+        self._irq_latch, self._irq_counter, self._irq_reload, self._irq_enabled, self._irq = registers[9:14]
+
+    def _update_banks(self):
+        r = self._bank_registers
+
+        if self._bank_select & 0x40 == 0:
+            self._set_prg_bank_8k(0, r[6])
+            self._set_prg_bank_8k(2, -2)
+        else:
+            self._set_prg_bank_8k(0, -2)
+            self._set_prg_bank_8k(2, r[6])
+        self._set_prg_bank_8k(1, r[7])
+        self._set_prg_bank_8k(3, -1)
+
+        # 2Kb banks R0, R1 and 1Kb banks R2 - R5, the two pattern tables are swapped by CHR A12 inversion
+        inversion = 4 if self._bank_select & 0x80 != 0 else 0
+        self._set_chr_bank_1k(0 ^ inversion, r[0] & 0xFE)
+        self._set_chr_bank_1k(1 ^ inversion, r[0] | 0x01)
+        self._set_chr_bank_1k(2 ^ inversion, r[1] & 0xFE)
+        self._set_chr_bank_1k(3 ^ inversion, r[1] | 0x01)
+        self._set_chr_bank_1k(4 ^ inversion, r[2])
+        self._set_chr_bank_1k(5 ^ inversion, r[3])
+        self._set_chr_bank_1k(6 ^ inversion, r[4])
+        self._set_chr_bank_1k(7 ^ inversion, r[5])
+
+    def clock_scanline(self):
+        if self._irq_counter == 0 or self._irq_reload:
+            self._irq_counter = self._irq_latch
+            self._irq_reload = False
+        else:
+            self._irq_counter -= 1
+
+        if self._irq_counter == 0 and self._irq_enabled:
+            self._set_irq(True)
+
+
+@mapper(7)
+class AxROM(Cartridge):
+    # Switchable 32Kb PRG ROM bank and single screen mirroring
+
+    def __init__(self, prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header=None):
+        super(AxROM, self).__init__(prg_rom, prg_ram, chr_mem, is_chr_mem_ram, header)
+
+        self.mirroring = Mirroring.SINGLE_SCREEN_LOW
+        self._set_prg_bank_32k(0)
+
+    def _write_register(self, cpu_address, value):
+        self._set_prg_bank_32k(value & 0x07)
+        self._set_mirroring(Mirroring.SINGLE_SCREEN_HIGH if value & 0x10 != 0 else Mirroring.SINGLE_SCREEN_LOW)
@@ -0,0 +1,61 @@
+import mmap
+import struct
+
+# "NESM", version, controller count, then one byte of buttons per controller per frame
+MOVIE_HEADER = struct.Struct('<4sBB')
+MOVIE_VERSION = 1
+
+
+class Movie(object):
+    # Input for a number of frames, frame i holds the buttons of every controller in order. Loaded movies are
+    # memory mapped and only read when a game latches its controllers.
+
+    def __init__(self, data=None, controllers=2):
+        if controllers not in (1, 2):
+            raise ValueError('A movie has 1 or 2 controllers, not %d' % controllers)
+
+        self.controllers = controllers
+        self.data = data if data is not None else bytearray()
+        if len(self.data) % controllers != 0:
+            raise ValueError('Movie data is not a whole number of frames')
+
+        self._mmap = None
+
+    @property
+    def frame_count(self):
+        return len(self.data) // self.controllers
+
+    def port(self, port):
+        # The buttons of one controller, a frame per byte
+        return memoryview(self.data)[port::self.controllers]
+
+    def append(self, *buttons):
+        if len(buttons) != self.controllers:
+            raise ValueError('Expected the buttons of %d controllers' % self.controllers)
+        self.data.extend(buttons)
+
+    def save(self, path):
+        with open(path, 'wb') as movie_file:
+            movie_file.write(MOVIE_HEADER.pack(b'NESM', MOVIE_VERSION, self.controllers))
+            movie_file.write(self.data)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as movie_file:
+            header = movie_file.read(MOVIE_HEADER.size)
+            if len(header) < MOVIE_HEADER.size:
+                raise ValueError('Truncated movie header')
+            tag, version, controllers = MOVIE_HEADER.unpack(header)
+            if tag != b'NESM':
+                raise ValueError('Not a movie file')
+            if version != MOVIE_VERSION:
+                raise ValueError('Unsupported movie version %d' % version)
+
+            movie_file.seek(0, 2)
+            if movie_file.tell() == MOVIE_HEADER.size:
+                return Movie(controllers=controllers)
+            data = mmap.mmap(movie_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        movie = Movie(memoryview(data)[MOVIE_HEADER.size:], controllers)
+        movie._mmap = data
+        return movie
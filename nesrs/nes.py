@@ -0,0 +1,241 @@
+import struct
+from functools import partial
+
+from nesrs.apu import APU
+from nesrs.controller import Controller
+from nesrs.cpu import CPU, IRQ_SOURCE_APU, IRQ_SOURCE_CARTRIDGE, CpuMemory, LazyFlagsCPU
+from nesrs.movie import Movie
+from nesrs.ppu import PPU, PpuMode
+from nesrs.ppu_numpy import NumpyPPU
+from nesrs.recompiler import Recompiler
+from nesrs.scheduler import Scheduler
+from nesrs.state import pack_state, unpack_state
+
+# CPU cycles since power on
+NES_STATE = struct.Struct('<Q')
+
+
+class NES(object):
+    # Cartridge, CPU, PPU and APU wired together on the master clock of a Scheduler. The CPU runs uninterrupted
+    # until the next deadline on the scheduler's timeline. The PPU runs 3 dots per CPU cycle but lazily: it's caught
+    # up at its own deadlines, the points it may raise an NMI or clock the mapper IRQ counter, and right before the
+    # CPU accesses its registers or the cartridge registers. The APU catches up the same way (see nesrs.apu), audio
+    # is synthesized with a sample rate only. Recompiled code (see nesrs.recompiler) runs whole blocks,
+    # which may overshoot a deadline by the rest of the block.
+
+    def __init__(self, cartridge, ppu_mode=PpuMode.FAST, recompile=False, lazy_flags=False, sample_rate=None):
+        self.cartridge = cartridge
+        self.cpu_memory = CpuMemory(cartridge)
+        self.cpu = LazyFlagsCPU(self.cpu_memory) if lazy_flags else CPU(self.cpu_memory)
+        self.ppu = NumpyPPU(cartridge) if ppu_mode == PpuMode.NUMPY else PPU(cartridge, ppu_mode)
+        self.scheduler = Scheduler()
+        self.apu = APU(self.scheduler, sample_rate)
+
+        self.cpu_memory.connect_ppu(self.ppu)
+        self.ppu.nmi_handler = self.cpu.nmi
+        cartridge.irq_handler = partial(self.cpu.set_irq_line, IRQ_SOURCE_CARTRIDGE)
+        self.cpu_memory.stall_handler = self._stall
+        self.cpu_memory.connect_apu(self.apu)
+        self.controllers = (Controller(), Controller())
+        self.cpu_memory.connect_controllers(*self.controllers)
+        # Movie run_frame appends the buttons of every frame to
+        self._recording = None
+        self.apu.irq_handler = partial(self.cpu.set_irq_line, IRQ_SOURCE_APU)
+        self.apu.dma_reader = self.cpu_memory.read_dma
+
+        # CPU cycles the PPU has run
+        self._ppu_cycles = 0
+        self._ppu_event = None
+        self._synchronize_handlers()
+        self._schedule_ppu()
+
+        self.recompiler = Recompiler(self.cpu) if recompile else None
+        self._execute = self.recompiler.execute_block if recompile else self.cpu.execute_op
+        self._untraced_execute = self._execute
+
+        self.cpu.turn_on()
+
+    @property
+    def cycles(self):
+        # CPU cycles since power on
+        return self.scheduler.cycles
+
+    def step(self):
+        # Executes a single op (a block when recompiling) and returns its cycles
+        self._execute()
+        op_cycles = self.cpu.op_cycles
+        scheduler = self.scheduler
+        scheduler.cycles += op_cycles
+        if scheduler.cycles >= scheduler.next_deadline:
+            scheduler.run_due()
+        self._catch_up_ppu()
+
+        return op_cycles
+
+    def run_frame(self):
+        # Runs until the PPU starts vertical blank, i.e. until ppu.framebuffer holds a new frame.
+        # Returns the CPU cycles executed.
+        cpu = self.cpu
+        ppu = self.ppu
+        scheduler = self.scheduler
+        execute = self._execute
+        frame = ppu.frame
+        recording = self._recording
+        if recording is not None:
+            recording.append(*[controller.buttons for controller in self.controllers[:recording.controllers]])
+
+        start = scheduler.cycles
+        while ppu.frame == frame:
+            while scheduler.cycles < scheduler.next_deadline:
+                execute()
+                scheduler.cycles += cpu.op_cycles
+            scheduler.run_due()
+        self.apu.synchronize()
+
+        return scheduler.cycles - start
+
+    def run_cycles(self, cycles):
+        # Runs at least the given number of CPU cycles, returns the CPU cycles executed
+        cpu = self.cpu
+        scheduler = self.scheduler
+        execute = self._execute
+
+        start = scheduler.cycles
+        end = start + cycles
+        # Puts the end on the timeline, the inner loop then only checks one deadline
+        event = scheduler.schedule(end, _stop)
+        while scheduler.cycles < end:
+            while scheduler.cycles < scheduler.next_deadline:
+                execute()
+                scheduler.cycles += cpu.op_cycles
+            scheduler.run_due()
+        scheduler.cancel(event)
+        self._catch_up_ppu()
+
+        return scheduler.cycles - start
+
+    def set_trace(self, recorder):
+        # Records the CPU state and cycle before every op (every block when recompiling) to a TraceRecorder,
+        # None stops tracing
+        if recorder is None:
+            self._execute = self._untraced_execute
+            return
+
+        cpu = self.cpu
+        scheduler = self.scheduler
+        execute = self._untraced_execute
+        record = recorder.record
+
+        def traced_execute():
+            record(cpu, scheduler.cycles)
+            execute()
+
+        self._execute = traced_execute
+
+    def play_movie(self, movie):
+        # The controllers follow the movie from the current frame on, their buttons attribute is ignored
+        for port, controller in enumerate(self.controllers):
+            if port < movie.controllers:
+                controller.play(movie.port(port), self.ppu, self.ppu.frame)
+            else:
+                controller.play(b'', self.ppu, self.ppu.frame)
+
+    def stop_movie(self):
+        for controller in self.controllers:
+            controller.stop()
+
+    def record_movie(self, controllers=2):
+        # Returns a Movie every run_frame call appends the buttons attribute of the controllers to, a movie played
+        # from the frame the recording started on replays it
+        self._recording = Movie(controllers=controllers)
+        return self._recording
+
+    def stop_recording(self):
+        self._recording = None
+
+    def save_state(self):
+        # The state of every component, for the same cartridge ROM
+        self.apu.synchronize()
+        self._catch_up_ppu()
+        return pack_state(b'NES ', NES_STATE.pack(self.cycles), self.cpu.save_state(), self.cpu_memory.save_state(),
+                          self.cartridge.save_state(), self.ppu.save_state(), self.apu.save_state(),
+                          self.controllers[0].save_state(), self.controllers[1].save_state())
+
+    def load_state(self, data):
+        (cycles, cpu, cpu_memory, cartridge, ppu, apu, controller1,
+         controller2) = unpack_state(b'NES ', data, 8)
+        self.scheduler.clear()
+        self.scheduler.cycles, = NES_STATE.unpack(cycles)
+        self.cartridge.load_state(cartridge)
+        self.cpu_memory.load_state(cpu_memory)
+        self.cpu.load_state(cpu)
+        self.ppu.load_state(ppu)
+        self.apu.load_state(apu)
+        self.controllers[0].load_state(controller1)
+        self.controllers[1].load_state(controller2)
+        self._ppu_cycles = self.scheduler.cycles
+        self._schedule_ppu()
+
+    def _stall(self, cycles, align):
+        # The CPU is halted while the cycles pass for everything else. The op writing $4014 isn't counted yet, the
+        # DMA starts on the cycle after its write, the last one of the op (cpu.op_cycles), and takes one more cycle
+        # when that's odd.
+        scheduler = self.scheduler
+        if align:
+            cycles += (scheduler.cycles + self.cpu.op_cycles) & 1
+        scheduler.cycles += cycles
+
+    #
+    # PPU synchronization
+    #
+    def _catch_up_ppu(self):
+        cycles = self.scheduler.cycles - self._ppu_cycles
+        if cycles != 0:
+            self._ppu_cycles = self.scheduler.cycles
+            self.ppu.run(cycles * 3)
+
+    def _schedule_ppu(self):
+        # The PPU never reaches its next NMI or mapper clock point before the event, at worst the event is early
+        dots = self.ppu.dots_until_interrupt(self.cartridge.has_scanline_irq)
+        self._ppu_event = self.scheduler.schedule(self._ppu_cycles + (dots + 2) // 3, self._on_ppu_event)
+
+    def _on_ppu_event(self):
+        self._catch_up_ppu()
+        self._schedule_ppu()
+
+    def _synchronize_handlers(self):
+        # The handlers of the PPU registers, and every write handler from the I/O registers up (mapper registers
+        # switch CHR banks and mirroring), catch the PPU up to the current cycle first. RAM and the pages backed by
+        # views don't affect the PPU and stay direct.
+        catch_up = self._catch_up_ppu
+        cpu_memory = self.cpu_memory
+
+        def synchronized_read(handler):
+            def read(address):
+                catch_up()
+                return handler(address)
+            return read
+
+        def synchronized_write(handler):
+            def write(address, value):
+                catch_up()
+                handler(address, value)
+            return write
+
+        reads = {}
+        writes = {}
+        for page in range(0x20, 0x100):
+            if page < 0x40:
+                handler = cpu_memory.get_read_handler(page)
+                if handler not in reads:
+                    reads[handler] = synchronized_read(handler)
+                cpu_memory.set_read_handler(page, page, reads[handler])
+
+            handler = cpu_memory.get_write_handler(page)
+            if handler not in writes:
+                writes[handler] = synchronized_write(handler)
+            cpu_memory.set_write_handler(page, page, writes[handler])
+
+
+def _stop():
+    pass
@@ -0,0 +1,653 @@
+import struct
+from enum import Enum
+from nesrs.cartridge import Mirroring
+from nesrs.state import pack_state, unpack_state, load_buffer
+
+FRAME_WIDTH = 256
+FRAME_HEIGHT = 240
+DOTS_PER_SCANLINE = 341
+SCANLINES_PER_FRAME = 262
+PRE_RENDER_SCANLINE = 261
+VBLANK_SCANLINE = 241
+
+# PPUCTRL
+CTRL_INCREMENT_32 = 0x04
+CTRL_SPRITE_TABLE = 0x08
+CTRL_BACKGROUND_TABLE = 0x10
+CTRL_SPRITE_SIZE_16 = 0x20
+CTRL_NMI = 0x80
+
+# PPUMASK
+MASK_GRAYSCALE = 0x01
+MASK_BACKGROUND_LEFT = 0x02
+MASK_SPRITES_LEFT = 0x04
+MASK_BACKGROUND = 0x08
+MASK_SPRITES = 0x10
+
+# PPUSTATUS
+STATUS_SPRITE_OVERFLOW = 0x20
+STATUS_SPRITE_0_HIT = 0x40
+STATUS_VBLANK = 0x80
+
+# Sprite line pixels are palette addresses (0x10 - 0x1F) with these flags
+SPRITE_BEHIND_BACKGROUND = 0x20
+SPRITE_0 = 0x40
+
+# 2C02 colors as (r, g, b)
+NES_PALETTE = [
+    (84, 84, 84), (0, 30, 116), (8, 16, 144), (48, 0, 136), (68, 0, 100), (92, 0, 48), (84, 4, 0), (60, 24, 0),
+    (32, 42, 0), (8, 58, 0), (0, 64, 0), (0, 60, 0), (0, 50, 60), (0, 0, 0), (0, 0, 0), (0, 0, 0),
+    (152, 150, 152), (8, 76, 196), (48, 50, 236), (92, 30, 228), (136, 20, 176), (160, 20, 100), (152, 34, 32),
+    (120, 60, 0), (84, 90, 0), (40, 114, 0), (8, 124, 0), (0, 118, 40), (0, 102, 120), (0, 0, 0), (0, 0, 0),
+    (0, 0, 0),
+    (236, 238, 236), (76, 154, 236), (120, 124, 236), (176, 98, 236), (228, 84, 236), (236, 88, 180),
+    (236, 106, 100), (212, 136, 32), (160, 170, 0), (116, 196, 0), (76, 208, 32), (56, 204, 108), (56, 180, 204),
+    (60, 60, 60), (0, 0, 0), (0, 0, 0),
+    (236, 238, 236), (168, 204, 236), (188, 188, 236), (212, 178, 236), (236, 174, 236), (236, 174, 212),
+    (236, 180, 176), (228, 196, 144), (204, 210, 120), (180, 222, 120), (168, 226, 144), (152, 226, 180),
+    (160, 214, 228), (160, 162, 160), (0, 0, 0), (0, 0, 0),
+]
+
+
+def _spread_bits(value):
+    # 8 bits -> 8 bytes (MSB first), each 0 or 1
+    result = 0
+    for i in range(8):
+        result = (result << 8) | ((value >> (7 - i)) & 0x01)
+    return result
+
+
+_SPREAD_BITS = [_spread_bits(value) for value in range(256)]
+
+# (high plane << 8) | low plane -> the 8 two bit pixels of a tile row, left to right
+TILE_ROWS = [(_SPREAD_BITS[low] | (_SPREAD_BITS[high] << 1)).to_bytes(8, 'big')
+             for high in range(256) for low in range(256)]
+
+# Tile row pixels -> palette addresses. Transparent pixels stay 0.
+BACKGROUND_ATTRIBUTES = [bytes([0, (p << 2) | 1, (p << 2) | 2, (p << 2) | 3]) + bytes(252) for p in range(4)]
+SPRITE_ATTRIBUTES = [bytes([0, 0x10 | (p << 2) | 1, 0x10 | (p << 2) | 2, 0x10 | (p << 2) | 3]) + bytes(252)
+                     for p in range(4)]
+
+NAMETABLE_OFFSETS = {
+    Mirroring.HORIZONTAL: [0x000, 0x000, 0x400, 0x400],
+    Mirroring.VERTICAL: [0x000, 0x400, 0x000, 0x400],
+    Mirroring.FOUR_SCREEN: [0x000, 0x400, 0x800, 0xC00],
+    Mirroring.SINGLE_SCREEN_LOW: [0x000, 0x000, 0x000, 0x000],
+    Mirroring.SINGLE_SCREEN_HIGH: [0x400, 0x400, 0x400, 0x400],
+}
+
+# ctrl, mask, status, OAM address, data buffer, I/O latch, v, t, fine x, w, scanline, dot, odd frame, frame,
+# fast mode event index and dot, dot mode latches and shifters
+PPU_STATE = struct.Struct('<6B2H2BHi?IBi4B4H')
+
+
+class PpuMode(Enum):
+    # Whole scanlines are rendered at once at dot 257, sprite 0 hit is reported at the end of its scanline
+    FAST = 0
+    # Background fetches, shifters and pixel output are emulated dot by dot
+    DOT = 1
+    # Fast mode timing with scanlines rendered in batches by NumPy (nesrs.ppu_numpy.NumpyPPU)
+    NUMPY = 2
+
+
+class PPU(object):
+
+    def __init__(self, cartridge, mode=PpuMode.FAST):
+        self._cartridge = cartridge
+        self.mode = mode
+        # Called with no arguments when an NMI should be raised (CPU.nmi)
+        self.nmi_handler = None
+
+        # Palette indices (0 - 63) of the last frame, row by row
+        self.framebuffer = bytearray(FRAME_WIDTH * FRAME_HEIGHT)
+        # Incremented when vertical blank starts, i.e. every time framebuffer holds a complete frame
+        self.frame = 0
+
+        self._vram = bytearray(0x1000)  # 2Kb on the board, 4Kb with four screen mirroring
+        self._palette = bytearray(0x20)
+        self._oam = bytearray(0x100)
+
+        self._ctrl = 0x00
+        self._mask = 0x00
+        self._status = 0x00
+        self._oam_address = 0x00
+        self._data_buffer = 0x00
+        self._io_latch = 0x00
+
+        # Loopy registers: current and temporary VRAM address, fine x scroll and write toggle
+        self._v = 0x0000
+        self._t = 0x0000
+        self._fine_x = 0
+        self._w = 0
+
+        self._scanline = 0
+        self._dot = 0
+        self._odd_frame = False
+
+        self._mirroring = None
+        self._nametable_offsets = None
+        self._update_mirroring()
+
+        # Palette address (0 - 31) -> palette index, rebuilt after palette or grayscale changes
+        self._color_table = None
+        self._update_color_table()
+
+        self._sprite_line = bytearray(FRAME_WIDTH)
+        self._sprite_line_xs = []
+
+        # Dot mode background pipeline
+        self._nametable_latch = 0
+        self._attribute_latch = 0
+        self._pattern_low_latch = 0
+        self._pattern_high_latch = 0
+        self._pattern_low_shifter = 0
+        self._pattern_high_shifter = 0
+        self._attribute_low_shifter = 0
+        self._attribute_high_shifter = 0
+
+        # Fast mode events: scanline -> [(dot after which the event fires, handler)]
+        self._events = []
+        for scanline in range(SCANLINES_PER_FRAME):
+            if scanline < FRAME_HEIGHT:
+                events = [(258, self._render_scanline), (261, self._clock_mapper)]
+            elif scanline == VBLANK_SCANLINE:
+                events = [(2, self._start_vblank)]
+            elif scanline == PRE_RENDER_SCANLINE:
+                events = [(2, self._end_vblank), (258, self._prepare_first_scanline), (261, self._clock_mapper)]
+            else:
+                events = []
+            self._events.append(events)
+        self._event_index = 0
+        self._next_event_dot = self._events[0][0][0]
+
+        self.run = self._run_dot if mode == PpuMode.DOT else self._run_fast
+
+    #
+    # CPU bus, 0x2000 - 0x3FFF
+    #
+    def read_register(self, cpu_address):
+        register = cpu_address & 0x07
+        if register == 2:
+            self._io_latch = (self._status & 0xE0) | (self._io_latch & 0x1F)
+            self._status &= ~STATUS_VBLANK
+            self._w = 0
+        elif register == 4:
+            self._io_latch = self._oam[self._oam_address]
+        elif register == 7:
+            address = self._v & 0x3FFF
+            if address < 0x3F00:
+                self._io_latch = self._data_buffer
+                self._data_buffer = self._read_vram(address)
+            else:
+                # Palette reads are not buffered, the buffer gets the nametable byte "under" the palette
+                self._io_latch = (self._io_latch & 0xC0) | self._read_vram(address)
+                self._data_buffer = self._read_vram(address - 0x1000)
+            self._increment_v()
+
+        return self._io_latch
+
+    def write_register(self, cpu_address, value):
+        self._io_latch = value
+        register = cpu_address & 0x07
+        if register == 0:
+            nmi_enabled = (self._ctrl & CTRL_NMI) == 0 and (value & CTRL_NMI) != 0
+            self._ctrl = value
+            self._t = (self._t & 0xF3FF) | ((value & 0x03) << 10)
+            if nmi_enabled and (self._status & STATUS_VBLANK) != 0:
+                self._raise_nmi()
+        elif register == 1:
+            self._mask = value
+            self._update_color_table()
+        elif register == 3:
+            self._oam_address = value
+        elif register == 4:
+            self._oam[self._oam_address] = value
+            self._oam_address = (self._oam_address + 1) & 0xFF
+        elif register == 5:
+            if self._w == 0:
+                self._t = (self._t & 0xFFE0) | (value >> 3)
+                self._fine_x = value & 0x07
+                self._w = 1
+            else:
+                self._t = (self._t & 0x8C1F) | ((value & 0x07) << 12) | ((value & 0xF8) << 2)
+                self._w = 0
+        elif register == 6:
+            if self._w == 0:
+                self._t = (self._t & 0x80FF) | ((value & 0x3F) << 8)
+                self._w = 1
+            else:
+                self._t = (self._t & 0xFF00) | value
+                self._v = self._t
+                self._w = 0
+        elif register == 7:
+            self._write_vram(self._v & 0x3FFF, value)
+            self._increment_v()
+
+    def write_oam_dma(self, data):
+        # OAM DMA, the 256 bytes go through OAMDATA, starting at OAMADDR and wrapping around to it
+        address = self._oam_address
+        self._oam[address:] = data[:0x100 - address]
+        self._oam[:address] = data[0x100 - address:]
+        self._io_latch = data[0xFF]
+
+    def _increment_v(self):
+        self._v = (self._v + (32 if self._ctrl & CTRL_INCREMENT_32 != 0 else 1)) & 0x7FFF
+
+    def _raise_nmi(self):
+        if self.nmi_handler is not None:
+            self.nmi_handler()
+
+    #
+    # PPU bus
+    #
+    def _read_vram(self, address):
+        if address < 0x2000:
+            return self._cartridge.read_chr_memory(address)
+        elif address < 0x3F00:
+            if self._cartridge.mirroring is not self._mirroring:
+                self._update_mirroring()
+            return self._vram[self._nametable_offsets[(address >> 10) & 0x03] | (address & 0x03FF)]
+
+        return self._palette[self._palette_address(address)]
+
+    def _write_vram(self, address, value):
+        if address < 0x2000:
+            self._cartridge.write_chr_memory(address, value)
+        elif address < 0x3F00:
+            if self._cartridge.mirroring is not self._mirroring:
+                self._update_mirroring()
+            self._vram[self._nametable_offsets[(address >> 10) & 0x03] | (address & 0x03FF)] = value
+        else:
+            self._palette[self._palette_address(address)] = value & 0x3F
+            self._update_color_table()
+
+    @staticmethod
+    def _palette_address(address):
+        address &= 0x1F
+        if address & 0x13 == 0x10:
+            # 0x3F10, 0x3F14, 0x3F18, 0x3F1C mirror the background entries
+            address &= 0x0F
+        return address
+
+    def _update_mirroring(self):
+        self._mirroring = self._cartridge.mirroring
+        self._nametable_offsets = NAMETABLE_OFFSETS[self._mirroring]
+
+    def _update_color_table(self):
+        palette = self._palette
+        color_mask = 0x30 if self._mask & MASK_GRAYSCALE != 0 else 0x3F
+        colors = [palette[address if address & 0x03 != 0 else 0] & color_mask for address in range(0x20)]
+        self._color_table = bytes(colors) + bytes(0xE0)
+
+    #
+    # Save states
+    #
+    def save_state(self):
+        # The framebuffer is output only and not part of the state
+        registers = PPU_STATE.pack(
+            self._ctrl, self._mask, self._status, self._oam_address, self._data_buffer, self._io_latch,
+            self._v, self._t, self._fine_x, self._w, self._scanline, self._dot, self._odd_frame, self.frame,
+            self._event_index, self._next_event_dot,
+            self._nametable_latch, self._attribute_latch, self._pattern_low_latch, self._pattern_high_latch,
+            self._pattern_low_shifter, self._pattern_high_shifter, self._attribute_low_shifter,
+            self._attribute_high_shifter)
+        return pack_state(b'PPU ', registers, self._vram, self._palette, self._oam, self._sprite_line)
+
+    def load_state(self, data):
+        registers, vram, palette, oam, sprite_line = unpack_state(b'PPU ', data, 5)
+        (self._ctrl, self._mask, self._status, self._oam_address, self._data_buffer, self._io_latch,
+         self._v, self._t, self._fine_x, self._w, self._scanline, self._dot, self._odd_frame, self.frame,
+         self._event_index, self._next_event_dot,
+         self._nametable_latch, self._attribute_latch, self._pattern_low_latch, self._pattern_high_latch,
+         self._pattern_low_shifter, self._pattern_high_shifter, self._attribute_low_shifter,
+         self._attribute_high_shifter) = PPU_STATE.unpack(registers)
+
+        load_buffer(self._vram, vram)
+        load_buffer(self._palette, palette)
+        load_buffer(self._oam, oam)
+        load_buffer(self._sprite_line, sprite_line)
+        self._sprite_line_xs = [x for x, pixel in enumerate(self._sprite_line) if pixel != 0] if any(sprite_line) else []
+
+        self._update_mirroring()
+        self._update_color_table()
+
+    #
+    # Timing
+    #
+    def is_rendering_enabled(self):
+        return (self._mask & (MASK_BACKGROUND | MASK_SPRITES)) != 0
+
+    def dots_until_interrupt(self, scanline_irq=False):
+        # Dots until the next point the PPU may raise an NMI (start of vertical blank) or, with scanline_irq, clock
+        # the mapper. Never more than the actual distance, so a caller that only catches the PPU up at that point
+        # doesn't miss an interrupt.
+        dots = self._dots_until(VBLANK_SCANLINE, 2)
+        if scanline_irq:
+            scanline = self._scanline
+            if (scanline < FRAME_HEIGHT or scanline == PRE_RENDER_SCANLINE) and self._dot < 261:
+                dots = min(dots, 261 - self._dot)
+            elif scanline < FRAME_HEIGHT - 1:
+                dots = min(dots, self._dots_until(scanline + 1, 261))
+            elif scanline == PRE_RENDER_SCANLINE:
+                dots = min(dots, self._dots_until(0, 261))
+            else:
+                dots = min(dots, self._dots_until(PRE_RENDER_SCANLINE, 261))
+
+        return dots
+
+    def _dots_until(self, scanline, dot):
+        # Dots until the given number of dots of scanline have run, counting the pre-render scanline as short
+        if scanline == self._scanline and dot > self._dot:
+            return dot - self._dot
+
+        lines = (scanline - self._scanline) % SCANLINES_PER_FRAME or SCANLINES_PER_FRAME
+        return lines * DOTS_PER_SCANLINE - self._dot + dot - 1
+
+    def _scanline_length(self):
+        if self._scanline == PRE_RENDER_SCANLINE and self._odd_frame and self.is_rendering_enabled():
+            # The idle dot at the end of the pre-render scanline is skipped on odd frames
+            return DOTS_PER_SCANLINE - 1
+        return DOTS_PER_SCANLINE
+
+    def _next_scanline(self):
+        self._scanline += 1
+        if self._scanline == SCANLINES_PER_FRAME:
+            self._scanline = 0
+            self._odd_frame = not self._odd_frame
+
+    def _start_vblank(self):
+        self._status |= STATUS_VBLANK
+        self.frame += 1
+        if self._ctrl & CTRL_NMI != 0:
+            self._raise_nmi()
+
+    def _end_vblank(self):
+        self._status &= ~(STATUS_VBLANK | STATUS_SPRITE_0_HIT | STATUS_SPRITE_OVERFLOW)
+
+    def _clock_mapper(self):
+        # Approximates the PPU A12 rise MMC3 counts, with background at 0x0000 and sprites at 0x1000
+        if self.is_rendering_enabled():
+            self._cartridge.clock_scanline()
+
+    #
+    # Scrolling
+    #
+    def _increment_coarse_x(self):
+        if (self._v & 0x001F) == 31:
+            self._v = (self._v & ~0x001F) ^ 0x0400
+        else:
+            self._v += 1
+
+    def _increment_y(self):
+        v = self._v
+        if (v & 0x7000) != 0x7000:
+            v += 0x1000
+        else:
+            v &= ~0x7000
+            coarse_y = (v & 0x03E0) >> 5
+            if coarse_y == 29:
+                coarse_y = 0
+                v ^= 0x0800
+            elif coarse_y == 31:
+                coarse_y = 0
+            else:
+                coarse_y += 1
+            v = (v & ~0x03E0) | (coarse_y << 5)
+        self._v = v
+
+    def _copy_x(self):
+        self._v = (self._v & ~0x041F) | (self._t & 0x041F)
+
+    def _copy_y(self):
+        self._v = (self._v & ~0x7BE0) | (self._t & 0x7BE0)
+
+    #
+    # Sprites
+    #
+    def _evaluate_sprites(self, scanline):
+        # Fills _sprite_line with the sprite pixels of the scanline, lower OAM indices win
+        sprite_line = self._sprite_line
+        for x in self._sprite_line_xs:
+            sprite_line[x] = 0
+        xs = self._sprite_line_xs = []
+
+        if self._mask & MASK_SPRITES == 0:
+            return
+
+        oam = self._oam
+        chr_banks = self._cartridge._chr_banks
+        height = 16 if self._ctrl & CTRL_SPRITE_SIZE_16 != 0 else 8
+        sprite_table = 0x1000 if self._ctrl & CTRL_SPRITE_TABLE != 0 else 0x0000
+        first_x = 0 if self._mask & MASK_SPRITES_LEFT != 0 else 8
+        count = 0
+        for i in range(0, 0x100, 4):
+            row = scanline - oam[i] - 1
+            if row < 0 or row >= height:
+                continue
+            if count == 8:
+                self._status |= STATUS_SPRITE_OVERFLOW
+                break
+            count += 1
+
+            tile = oam[i + 1]
+            attributes = oam[i + 2]
+            sprite_x = oam[i + 3]
+            if attributes & 0x80 != 0:
+                # Vertical flip
+                row = height - 1 - row
+            if height == 16:
+                table = (tile & 0x01) << 12
+                tile = (tile & 0xFE) | (row >> 3)
+                row &= 0x07
+            else:
+                table = sprite_table
+
+            address = table | (tile << 4) | row
+            bank = chr_banks[address >> 10]
+            pixels = TILE_ROWS[(bank[(address | 0x08) & 0x03FF] << 8) | bank[address & 0x03FF]]
+            if attributes & 0x40 != 0:
+                # Horizontal flip
+                pixels = pixels[::-1]
+            pixels = pixels.translate(SPRITE_ATTRIBUTES[attributes & 0x03])
+            flags = (SPRITE_BEHIND_BACKGROUND if attributes & 0x20 != 0 else 0) | (SPRITE_0 if i == 0 else 0)
+
+            for column in range(8):
+                x = sprite_x + column
+                if x < first_x or x >= FRAME_WIDTH:
+                    continue
+                pixel = pixels[column]
+                if pixel != 0 and sprite_line[x] == 0:
+                    sprite_line[x] = pixel | flags
+                    xs.append(x)
+
+    #
+    # Fast mode
+    #
+    def _run_fast(self, dots):
+        self._dot += dots
+        while self._dot >= self._next_event_dot:
+            events = self._events[self._scanline]
+            if self._event_index < len(events):
+                handler = events[self._event_index][1]
+                self._event_index += 1
+                handler()
+            else:
+                # End of scanline
+                self._dot -= self._scanline_length()
+                self._next_scanline()
+                self._event_index = 0
+                events = self._events[self._scanline]
+
+            if self._event_index < len(events):
+                self._next_event_dot = events[self._event_index][0]
+            else:
+                self._next_event_dot = self._scanline_length()
+
+    def _render_scanline(self):
+        scanline = self._scanline
+        line = self._fetch_background_line()
+
+        self._evaluate_sprites(scanline)
+        if self._sprite_line_xs:
+            sprite_line = self._sprite_line
+            is_background_enabled = self._mask & MASK_BACKGROUND != 0
+            for x in self._sprite_line_xs:
+                sprite = sprite_line[x]
+                background = line[x]
+                if background != 0:
+                    if sprite & SPRITE_0 != 0 and x != 255 and is_background_enabled:
+                        self._status |= STATUS_SPRITE_0_HIT
+                    if sprite & SPRITE_BEHIND_BACKGROUND != 0:
+                        continue
+                line[x] = sprite & 0x1F
+
+        start = scanline * FRAME_WIDTH
+        self.framebuffer[start:start + FRAME_WIDTH] = line.translate(self._color_table)
+
+        if self.is_rendering_enabled():
+            self._increment_y()
+            self._copy_x()
+
+    def _fetch_background_line(self):
+        # Palette addresses of the 256 background pixels of the scanline starting at v
+        if self._mask & MASK_BACKGROUND == 0:
+            return bytearray(FRAME_WIDTH)
+
+        if self._cartridge.mirroring is not self._mirroring:
+            self._update_mirroring()
+
+        v = self._v
+        vram = self._vram
+        nametable_offsets = self._nametable_offsets
+        chr_banks = self._cartridge._chr_banks
+        pattern_base = (0x1000 if self._ctrl & CTRL_BACKGROUND_TABLE != 0 else 0x0000) | ((v >> 12) & 0x07)
+
+        line = bytearray()
+        # 33 tiles cover the 256 pixels for any fine x
+        for tile_index in range(33):
+            offset = nametable_offsets[(v >> 10) & 0x03]
+            tile = vram[offset | (v & 0x03FF)]
+            attribute = vram[offset | 0x03C0 | ((v >> 4) & 0x38) | ((v >> 2) & 0x07)]
+            attribute = (attribute >> (((v >> 4) & 0x04) | (v & 0x02))) & 0x03
+
+            address = pattern_base | (tile << 4)
+            bank = chr_banks[address >> 10]
+            pixels = TILE_ROWS[(bank[(address | 0x08) & 0x03FF] << 8) | bank[address & 0x03FF]]
+            line += pixels.translate(BACKGROUND_ATTRIBUTES[attribute])
+
+            if (v & 0x001F) == 31:
+                v = (v & ~0x001F) ^ 0x0400
+            else:
+                v += 1
+
+        line = line[self._fine_x:self._fine_x + FRAME_WIDTH]
+        if self._mask & MASK_BACKGROUND_LEFT == 0:
+            line[0:8] = bytes(8)
+
+        return line
+
+    def _prepare_first_scanline(self):
+        if self.is_rendering_enabled():
+            self._copy_x()
+            self._copy_y()
+
+    #
+    # Dot mode
+    #
+    def _run_dot(self, dots):
+        for i in range(dots):
+            self._tick()
+
+    def _tick(self):
+        scanline = self._scanline
+        dot = self._dot
+
+        if scanline < FRAME_HEIGHT or scanline == PRE_RENDER_SCANLINE:
+            if self.is_rendering_enabled():
+                self._tick_rendering(scanline, dot)
+            elif scanline < FRAME_HEIGHT and 1 <= dot <= 256:
+                self.framebuffer[scanline * FRAME_WIDTH + dot - 1] = self._color_table[0]
+
+            if scanline == PRE_RENDER_SCANLINE and dot == 1:
+                self._end_vblank()
+        elif scanline == VBLANK_SCANLINE and dot == 1:
+            self._start_vblank()
+
+        self._dot = dot + 1
+        if self._dot >= self._scanline_length():
+            self._dot = 0
+            self._next_scanline()
+
+    def _tick_rendering(self, scanline, dot):
+        if (2 <= dot <= 257) or (322 <= dot <= 337):
+            self._pattern_low_shifter = (self._pattern_low_shifter << 1) & 0xFFFF
+            self._pattern_high_shifter = (self._pattern_high_shifter << 1) & 0xFFFF
+            self._attribute_low_shifter = (self._attribute_low_shifter << 1) & 0xFFFF
+            self._attribute_high_shifter = (self._attribute_high_shifter << 1) & 0xFFFF
+
+        if (1 <= dot <= 257) or (321 <= dot <= 337):
+            phase = (dot - 1) & 0x07
+            if phase == 0:
+                self._load_shifters()
+                self._nametable_latch = self._read_vram(0x2000 | (self._v & 0x0FFF))
+            elif phase == 2:
+                v = self._v
+                attribute = self._read_vram(0x23C0 | (v & 0x0C00) | ((v >> 4) & 0x38) | ((v >> 2) & 0x07))
+                self._attribute_latch = (attribute >> (((v >> 4) & 0x04) | (v & 0x02))) & 0x03
+            elif phase == 4:
+                self._pattern_low_latch = self._cartridge.read_chr_memory(self._background_pattern_address())
+            elif phase == 6:
+                self._pattern_high_latch = self._cartridge.read_chr_memory(self._background_pattern_address() | 0x08)
+            elif phase == 7:
+                self._increment_coarse_x()
+
+        if scanline < FRAME_HEIGHT and 1 <= dot <= 256:
+            self._output_pixel(scanline, dot - 1)
+
+        if dot == 256:
+            self._increment_y()
+        elif dot == 257:
+            self._copy_x()
+            # Sprites of the next scanline
+            self._evaluate_sprites(scanline + 1 if scanline < FRAME_HEIGHT else 0)
+        elif dot == 260:
+            self._cartridge.clock_scanline()
+        elif scanline == PRE_RENDER_SCANLINE and 280 <= dot <= 304:
+            self._copy_y()
+
+    def _background_pattern_address(self):
+        return ((0x1000 if self._ctrl & CTRL_BACKGROUND_TABLE != 0 else 0x0000) | (self._nametable_latch << 4) |
+                ((self._v >> 12) & 0x07))
+
+    def _load_shifters(self):
+        self._pattern_low_shifter = (self._pattern_low_shifter & 0xFF00) | self._pattern_low_latch
+        self._pattern_high_shifter = (self._pattern_high_shifter & 0xFF00) | self._pattern_high_latch
+        self._attribute_low_shifter = ((self._attribute_low_shifter & 0xFF00) |
+                                       (0xFF if self._attribute_latch & 0x01 != 0 else 0x00))
+        self._attribute_high_shifter = ((self._attribute_high_shifter & 0xFF00) |
+                                        (0xFF if self._attribute_latch & 0x02 != 0 else 0x00))
+
+    def _output_pixel(self, scanline, x):
+        mask = self._mask
+
+        background = 0
+        if mask & MASK_BACKGROUND != 0 and (x >= 8 or mask & MASK_BACKGROUND_LEFT != 0):
+            bit = 0x8000 >> self._fine_x
+            pixel = ((1 if self._pattern_low_shifter & bit != 0 else 0) |
+                     (2 if self._pattern_high_shifter & bit != 0 else 0))
+            if pixel != 0:
+                background = ((4 if self._attribute_low_shifter & bit != 0 else 0) |
+                              (8 if self._attribute_high_shifter & bit != 0 else 0) | pixel)
+
+        color = background
+        sprite = self._sprite_line[x]
+        if sprite != 0:
+            if background == 0:
+                color = sprite & 0x1F
+            else:
+                if sprite & SPRITE_0 != 0 and x != 255 and mask & MASK_BACKGROUND != 0:
+                    self._status |= STATUS_SPRITE_0_HIT
+                if sprite & SPRITE_BEHIND_BACKGROUND == 0:
+                    color = sprite & 0x1F
+
+        self.framebuffer[scanline * FRAME_WIDTH + x] = self._color_table[color]
@@ -0,0 +1,245 @@
+from nesrs.ppu import (PPU, PpuMode, FRAME_WIDTH, FRAME_HEIGHT, CTRL_BACKGROUND_TABLE, CTRL_SPRITE_TABLE,
+                       CTRL_SPRITE_SIZE_16, MASK_BACKGROUND, MASK_BACKGROUND_LEFT, MASK_SPRITES, MASK_SPRITES_LEFT,
+                       STATUS_SPRITE_OVERFLOW, STATUS_SPRITE_0_HIT, SPRITE_BEHIND_BACKGROUND, SPRITE_0)
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional, only PpuMode.NUMPY needs it
+    np = None
+
+
+class TileCache(object):
+    # Every tile of the CHR memory decoded to an 8x8 array of 2 bit pixels. CHR ROM is decoded exactly once,
+    # CHR RAM tiles are decoded again after they are written.
+
+    def __init__(self, cartridge):
+        self._cartridge = cartridge
+        self._chr = np.frombuffer(cartridge._chr_mem, dtype=np.uint8)
+        self.tiles = self._decode(self._chr)
+        self._dirty_tiles = set()
+
+        # Pattern table tile (0x000 - 0x1FF, i.e. PPU address >> 4) -> index in tiles
+        self.pattern_tables = None
+        self._chr_map = None
+
+    @staticmethod
+    def _decode(chr_mem):
+        bits = np.unpackbits(chr_mem.reshape(-1, 2, 8, 1), axis=3)
+        return bits[:, 0] | (bits[:, 1] << 1)
+
+    def invalidate(self, ppu_address):
+        # The CHR RAM byte at ppu_address is about to be written
+        bank = self._cartridge._chr_map[ppu_address >> 10]
+        self._dirty_tiles.add((bank << 6) | ((ppu_address & 0x03FF) >> 4))
+
+    def invalidate_all(self):
+        self._dirty_tiles.clear()
+        self.tiles = self._decode(self._chr)
+
+    def update(self):
+        if self._dirty_tiles:
+            dirty = np.array(sorted(self._dirty_tiles), dtype=np.intp)
+            self._dirty_tiles.clear()
+            self.tiles[dirty] = self._decode(self._chr.reshape(-1, 16)[dirty])
+
+        chr_map = self._cartridge._chr_map
+        if chr_map != self._chr_map:
+            self._chr_map = list(chr_map)
+            tiles = np.arange(0x200)
+            self.pattern_tables = (np.array(chr_map, dtype=np.intp)[tiles >> 6] << 6) | (tiles & 0x3F)
+
+
+class NumpyPPU(PPU):
+    # Fast mode timing, but visible scanlines are only recorded at dot 257 and rendered in batches with NumPy: when
+    # vertical blank starts, or earlier when something the pending scanlines depend on is about to change
+    # (PPUCTRL, PPUMASK, OAM, VRAM, palette, CHR banks or mirroring). Sprite 0 hit and sprite overflow are still
+    # reported at the end of their scanline.
+
+    def __init__(self, cartridge):
+        if np is None:
+            raise ImportError('PpuMode.NUMPY requires numpy')
+
+        super(NumpyPPU, self).__init__(cartridge, PpuMode.NUMPY)
+
+        self._tile_cache = TileCache(cartridge)
+        # (scanline, v, fine x) of the scanlines that are not rendered yet
+        self._pending_lines = []
+        # Sprites on each visible scanline, rebuilt after OAM or sprite size changes
+        self._sprite_counts = None
+
+        self._frame_pixels = np.frombuffer(self.framebuffer, dtype=np.uint8).reshape(FRAME_HEIGHT, FRAME_WIDTH)
+        self._vram_array = np.frombuffer(self._vram, dtype=np.uint8)
+        self._oam_array = np.frombuffer(self._oam, dtype=np.uint8).reshape(64, 4)
+
+        cartridge.ppu_mapping_listener = self._flush
+
+    def write_register(self, cpu_address, value):
+        register = cpu_address & 0x07
+        if self._pending_lines and register in (0, 1, 4, 7):
+            self._flush()
+
+        super(NumpyPPU, self).write_register(cpu_address, value)
+
+        if register == 0 or register == 4:
+            self._sprite_counts = None
+
+    def write_oam_dma(self, data):
+        if self._pending_lines:
+            self._flush()
+        super(NumpyPPU, self).write_oam_dma(data)
+        self._sprite_counts = None
+
+    def load_state(self, data):
+        # Scanlines pending when the state was saved are not rendered, the framebuffer is not part of the state
+        self._pending_lines = []
+        self._sprite_counts = None
+        super(NumpyPPU, self).load_state(data)
+        if self._cartridge._is_chr_mem_ram:
+            self._tile_cache.invalidate_all()
+
+    def _write_vram(self, address, value):
+        if address < 0x2000 and self._cartridge._is_chr_mem_ram:
+            self._tile_cache.invalidate(address)
+        super(NumpyPPU, self)._write_vram(address, value)
+
+    def _start_vblank(self):
+        self._flush()
+        super(NumpyPPU, self)._start_vblank()
+
+    def _render_scanline(self):
+        if self.is_rendering_enabled():
+            if self._mask & MASK_SPRITES != 0:
+                self._update_sprite_status()
+            self._pending_lines.append((self._scanline, self._v, self._fine_x))
+            self._increment_y()
+            self._copy_x()
+        else:
+            self._pending_lines.append((self._scanline, self._v, self._fine_x))
+
+    def _update_sprite_status(self):
+        scanline = self._scanline
+
+        if self._status & STATUS_SPRITE_OVERFLOW == 0:
+            if self._sprite_counts is None:
+                self._sprite_counts = self._count_sprites()
+            if self._sprite_counts[scanline] > 8:
+                self._status |= STATUS_SPRITE_OVERFLOW
+
+        if self._status & STATUS_SPRITE_0_HIT == 0 and self._mask & MASK_BACKGROUND != 0:
+            height = 16 if self._ctrl & CTRL_SPRITE_SIZE_16 != 0 else 8
+            if 0 <= scanline - self._oam[0] - 1 < height:
+                # Only the scanlines sprite 0 is on go through the scalar renderer
+                line = self._fetch_background_line()
+                self._evaluate_sprites(scanline)
+                sprite_line = self._sprite_line
+                for x in self._sprite_line_xs:
+                    if sprite_line[x] & SPRITE_0 != 0 and line[x] != 0 and x != 255:
+                        self._status |= STATUS_SPRITE_0_HIT
+                        break
+
+    def _count_sprites(self):
+        height = 16 if self._ctrl & CTRL_SPRITE_SIZE_16 != 0 else 8
+        rows = np.arange(FRAME_HEIGHT)[:, None] - self._oam_array[:, 0].astype(np.intp) - 1
+        return np.count_nonzero((rows >= 0) & (rows < height), axis=1).tolist()
+
+    def _flush(self):
+        if not self._pending_lines:
+            return
+
+        lines = np.array(self._pending_lines, dtype=np.intp)
+        self._pending_lines = []
+        self._tile_cache.update()
+
+        scanlines = lines[:, 0]
+        pixels = self._render_background(lines[:, 1], lines[:, 2])
+        sprites = self._render_sprites(scanlines)
+        if sprites is not None:
+            is_visible = (sprites != 0) & (((sprites & SPRITE_BEHIND_BACKGROUND) == 0) | (pixels == 0))
+            pixels = np.where(is_visible, sprites & 0x1F, pixels)
+
+        color_table = np.frombuffer(self._color_table, dtype=np.uint8)
+        self._frame_pixels[scanlines] = np.take(color_table, pixels)
+
+    def _render_background(self, vs, fine_xs):
+        # Palette addresses of the background pixels, one row per scanline
+        if self._mask & MASK_BACKGROUND == 0:
+            return np.zeros((len(vs), FRAME_WIDTH), dtype=np.uint8)
+
+        if self._cartridge.mirroring is not self._mirroring:
+            self._update_mirroring()
+
+        # The 33 tiles fetched for each scanline, coarse x running over both horizontal nametables
+        x = (((vs & 0x1F) | ((vs >> 5) & 0x20))[:, None] + np.arange(33)) & 0x3F
+        coarse_x = x & 0x1F
+        coarse_y = ((vs >> 5) & 0x1F)[:, None]
+        offsets = np.array(self._nametable_offsets, dtype=np.intp)[((vs >> 10) & 0x02)[:, None] | (x >> 5)]
+
+        vram = self._vram_array
+        tiles = vram[offsets | (coarse_y << 5) | coarse_x].astype(np.intp)
+        attributes = vram[offsets | 0x03C0 | ((coarse_y >> 2) << 3) | (coarse_x >> 2)]
+        attributes = (attributes >> (((coarse_y & 0x02) << 1) | (coarse_x & 0x02))) & 0x03
+
+        tile_cache = self._tile_cache
+        table = 0x100 if self._ctrl & CTRL_BACKGROUND_TABLE != 0 else 0x000
+        fine_y = ((vs >> 12) & 0x07)[:, None]
+        pixels = tile_cache.tiles[tile_cache.pattern_tables[table | tiles], fine_y]
+        pixels = np.where(pixels != 0, pixels | (attributes << 2)[:, :, None], 0).reshape(len(vs), 33 * 8)
+
+        line = np.take_along_axis(pixels, fine_xs[:, None] + np.arange(FRAME_WIDTH), axis=1).astype(np.uint8)
+        if self._mask & MASK_BACKGROUND_LEFT == 0:
+            line[:, 0:8] = 0
+
+        return line
+
+    def _render_sprites(self, scanlines):
+        # Sprite pixels (palette address | SPRITE_BEHIND_BACKGROUND) one row per scanline, None without sprites
+        if self._mask & MASK_SPRITES == 0:
+            return None
+
+        oam = self._oam_array.astype(np.intp)
+        height = 16 if self._ctrl & CTRL_SPRITE_SIZE_16 != 0 else 8
+        rows = scanlines[:, None] - oam[:, 0] - 1
+        is_on_line = (rows >= 0) & (rows < height)
+        # Only the first 8 sprites of a scanline are drawn
+        is_on_line &= np.cumsum(is_on_line, axis=1) <= 8
+        sprites = np.nonzero(is_on_line.any(axis=0))[0]
+        if len(sprites) == 0:
+            return None
+
+        tile_cache = self._tile_cache
+        tiles = tile_cache.tiles
+        pattern_tables = tile_cache.pattern_tables
+        sprite_table = 0x100 if self._ctrl & CTRL_SPRITE_TABLE != 0 else 0x000
+
+        # 8 extra columns for sprites that are partly past the right edge
+        layer = np.zeros((len(scanlines), FRAME_WIDTH + 8), dtype=np.uint8)
+        # Lower OAM indices are drawn last and win, transparent pixels never cover anything
+        for i in sprites[::-1].tolist():
+            line_indices = np.nonzero(is_on_line[:, i])[0]
+            tile, attributes, sprite_x = oam[i, 1:].tolist()
+
+            row = rows[line_indices, i]
+            if attributes & 0x80 != 0:
+                # Vertical flip
+                row = height - 1 - row
+            if height == 16:
+                pattern = ((tile & 0x01) << 8) | (tile & 0xFE) | (row >> 3)
+            else:
+                pattern = sprite_table | tile
+
+            pixels = tiles[pattern_tables[pattern], row & 0x07]
+            if attributes & 0x40 != 0:
+                # Horizontal flip
+                pixels = pixels[:, ::-1]
+            flags = 0x10 | ((attributes & 0x03) << 2) | (SPRITE_BEHIND_BACKGROUND if attributes & 0x20 != 0 else 0)
+            pixels = np.where(pixels != 0, pixels | flags, 0)
+
+            columns = slice(sprite_x, sprite_x + 8)
+            layer[line_indices, columns] = np.where(pixels != 0, pixels, layer[line_indices, columns])
+
+        layer = layer[:, 0:FRAME_WIDTH]
+        if self._mask & MASK_SPRITES_LEFT == 0:
+            layer[:, 0:8] = 0
+
+        return layer
@@ -0,0 +1,164 @@
+import argparse
+from array import array
+
+from nesrs.cartridge import read_ines_rom
+from nesrs.cpu import OP_CODES, OP_CYCLES, CpuAddressingMode
+from nesrs.nes import NES
+
+# Modes whose ops take a cycle more when the indexed address crosses a page
+PAGE_CROSSING_MODES = (CpuAddressingMode.ABSX_, CpuAddressingMode.ABSY_, CpuAddressingMode.IND_Y_)
+
+
+class Profiler(object):
+    # Execution counts and cycles per op code and per PC of the ops a CPU runs through its op table (CPU.set_profiler).
+    # Cycles above OP_CYCLES are penalties: a page crossed by ABS,X, ABS,Y and (IND),Y reads, or a taken branch and
+    # the page it crossed. Interrupts and the ops of recompiled blocks are not counted.
+
+    def __init__(self):
+        self.op_counts = array('Q', bytes(256 * 8))
+        self.op_cycles = array('Q', bytes(256 * 8))
+        # Ops that took more than their OP_CYCLES, taken branches for branch ops
+        self.op_penalized = array('Q', bytes(256 * 8))
+        self.pc_counts = array('Q', bytes(0x10000 * 8))
+        self.pc_cycles = array('Q', bytes(0x10000 * 8))
+        # The op code last executed at every PC
+        self.pc_op_codes = bytearray(0x10000)
+
+    def clear(self):
+        # In place, the instrumented op tables keep counting into the same arrays
+        for counters in (self.op_counts, self.op_cycles, self.op_penalized, self.pc_counts, self.pc_cycles):
+            counters[:] = array('Q', bytes(len(counters) * 8))
+        self.pc_op_codes[:] = bytes(0x10000)
+
+    def instrument(self, cpu, op_table):
+        # The op table with every op wrapped by a counting closure
+        return [self._profile_op(cpu, op, op_code) for op_code, op in enumerate(op_table)]
+
+    def _profile_op(self, cpu, op, op_code):
+        op_counts = self.op_counts
+        op_cycles = self.op_cycles
+        op_penalized = self.op_penalized
+        pc_counts = self.pc_counts
+        pc_cycles = self.pc_cycles
+        pc_op_codes = self.pc_op_codes
+        base_cycles = OP_CYCLES[op_code]
+
+        def profiled():
+            pc = cpu._pc - 1
+            op()
+            cycles = cpu.op_cycles
+            op_counts[op_code] += 1
+            op_cycles[op_code] += cycles
+            pc_counts[pc] += 1
+            pc_cycles[pc] += cycles
+            pc_op_codes[pc] = op_code
+            if cycles != base_cycles:
+                op_penalized[op_code] += 1
+
+        return profiled
+
+    #
+    # Report
+    #
+    @property
+    def instructions(self):
+        return sum(self.op_counts)
+
+    @property
+    def cycles(self):
+        return sum(self.op_cycles)
+
+    def top_pcs(self, count=20):
+        # [(pc, executions, cycles)] by cycles
+        pc_counts = self.pc_counts
+        pc_cycles = self.pc_cycles
+        pcs = sorted((pc for pc in range(0x10000) if pc_counts[pc]), key=pc_cycles.__getitem__, reverse=True)
+        return [(pc, pc_counts[pc], pc_cycles[pc]) for pc in pcs[:count]]
+
+    def top_op_codes(self, count=20):
+        # [(op code, executions, cycles)] by cycles
+        op_codes = sorted((op_code for op_code in range(256) if self.op_counts[op_code]),
+                          key=self.op_cycles.__getitem__, reverse=True)
+        return [(op_code, self.op_counts[op_code], self.op_cycles[op_code]) for op_code in op_codes[:count]]
+
+    def mode_counts(self):
+        # {CpuAddressingMode: (executions, cycles)}, op codes missing from OP_CODES are under None
+        modes = {}
+        for op_code in range(256):
+            if self.op_counts[op_code]:
+                mode = OP_CODES[op_code][1] if op_code in OP_CODES else None
+                count, cycles = modes.get(mode, (0, 0))
+                modes[mode] = (count + self.op_counts[op_code], cycles + self.op_cycles[op_code])
+        return modes
+
+    def page_crossing_cycles(self):
+        # Cycles lost to page crossings by the indexed reads
+        return sum(self.op_penalized[op_code] for op_code, (_, mode) in OP_CODES.items()
+                   if mode in PAGE_CROSSING_MODES)
+
+    def branch_ratios(self):
+        # {op code: (executions, taken)} of the branch ops executed
+        return {op_code: (self.op_counts[op_code], self.op_penalized[op_code])
+                for op_code, (_, mode) in OP_CODES.items()
+                if mode == CpuAddressingMode.REL and self.op_counts[op_code]}
+
+    def report(self, count=20):
+        instructions = self.instructions
+        cycles = self.cycles
+        lines = ['%d instructions, %d cycles, %.3f cycles per instruction' % (
+            instructions, cycles, cycles / instructions if instructions else 0.0)]
+
+        lines.append('')
+        lines.append('Top PCs')
+        for pc, executions, pc_cycles in self.top_pcs(count):
+            lines.append('  %04X %-4s %10d %12d %6.2f%%' % (pc, _op_name(self.pc_op_codes[pc]), executions,
+                                                              pc_cycles, 100.0 * pc_cycles / cycles))
+
+        lines.append('')
+        lines.append('Top op codes')
+        for op_code, executions, op_cycles in self.top_op_codes(count):
+            lines.append('  %02X %-4s %-7s %10d %12d %6.2f%%' % (op_code, _op_name(op_code), _mode_name(op_code),
+                                                                 executions, op_cycles, 100.0 * op_cycles / cycles))
+
+        lines.append('')
+        lines.append('Addressing modes')
+        for mode, (executions, mode_cycles) in sorted(self.mode_counts().items(), key=lambda item: -item[1][1]):
+            lines.append('  %-12s %10d %12d' % (mode.name if mode is not None else 'unsupported', executions,
+                                                mode_cycles))
+
+        lines.append('')
+        lines.append('Page crossing cycles: %d' % self.page_crossing_cycles())
+        lines.append('Branches taken')
+        for op_code, (executions, taken) in sorted(self.branch_ratios().items()):
+            lines.append('  %02X %-4s %10d %10d %6.2f%%' % (op_code, _op_name(op_code), executions, taken,
+                                                            100.0 * taken / executions))
+
+        return '\n'.join(lines)
+
+
+def _op_name(op_code):
+    return OP_CODES[op_code][0].upper() if op_code in OP_CODES else '???'
+
+
+def _mode_name(op_code):
+    return OP_CODES[op_code][1].name if op_code in OP_CODES else ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a ROM and reports where the guest spends its cycles')
+    parser.add_argument('rom')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.rom, 'rb') as rom_file:
+        nes = NES(read_ines_rom(rom_file))
+    profiler = Profiler()
+    nes.cpu.set_profiler(profiler)
+    for _ in range(args.frames):
+        nes.run_frame()
+    print(profiler.report(args.top))
+
+
+if __name__ == '__main__':
+    main()
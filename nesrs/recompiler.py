@@ -0,0 +1,711 @@
+import re
+
+from nesrs.cpu import (OP_CODES, OP_CYCLES, CpuAddressingMode, NZ_FLAGS, ADC_RESULTS, ADC_FLAGS, COMPARE_FLAGS,
+                       ASL_RESULTS, ASL_FLAGS, LSR_RESULTS, LSR_FLAGS, ROL_RESULTS, ROL_FLAGS, ROR_RESULTS, ROR_FLAGS)
+
+# Longest block in instructions
+MAX_BLOCK_LENGTH = 64
+
+OPERAND_LENGTHS = {
+    CpuAddressingMode.ACC: 0,
+    CpuAddressingMode.IMPL: 0,
+    CpuAddressingMode.IMM: 1,
+    CpuAddressingMode.ZP: 1,
+    CpuAddressingMode.ZPX: 1,
+    CpuAddressingMode.ZPY: 1,
+    CpuAddressingMode.REL: 1,
+    CpuAddressingMode.INDX: 1,
+    CpuAddressingMode.IND_Y: 1,
+    CpuAddressingMode.IND_Y_: 1,
+    CpuAddressingMode.ABS: 2,
+    CpuAddressingMode.ABSX: 2,
+    CpuAddressingMode.ABSX_: 2,
+    CpuAddressingMode.ABSY: 2,
+    CpuAddressingMode.ABSY_: 2,
+    CpuAddressingMode.IND: 2,
+    CpuAddressingMode.IND_: 2,
+}
+
+BRANCH_CONDITIONS = {
+    'bcc': 'not p & 0x01',
+    'bcs': 'p & 0x01',
+    'bne': 'not p & 0x02',
+    'beq': 'p & 0x02',
+    'bvc': 'not p & 0x40',
+    'bvs': 'p & 0x40',
+    'bpl': 'not p & 0x80',
+    'bmi': 'p & 0x80',
+}
+
+# Ops that write memory, including the stack
+STORE_OPS = frozenset(['sta', 'stx', 'sty', 'aax', 'asl', 'lsr', 'rol', 'ror', 'inc', 'dec', 'dcp', 'isc', 'slo',
+                       'rla', 'sre', 'rra', 'pha', 'php'])
+
+REGISTERS = ('a', 'x', 'y', 's', 'p')
+_REGISTER_PATTERN = re.compile(r'\b([axysp])\b')
+
+# Names the generated blocks bind as default arguments
+BLOCK_GLOBALS = ('read', 'write', 'ram', 'read_pages', 'view', 'nz_flags', 'adc_results', 'adc_flags',
+                 'compare_flags', 'asl_results', 'asl_flags', 'lsr_results', 'lsr_flags', 'rol_results',
+                 'rol_flags', 'ror_results', 'ror_flags')
+
+# Address kinds
+RAM = 0  # Address expression is an index into CpuMemory._ram
+IO = 1  # Constant address of a PPU, APU or I/O register
+OTHER = 2  # Constant cartridge address or an address only known at run time
+
+
+def _nz(register):
+    return 'p = (p & 0x7D) | nz_flags[%s]' % register
+
+
+class _Exit(object):
+    # Placeholder for the code that writes the registers back and returns, filled in once the block is complete
+    __slots__ = ('indent', 'pc', 'cycles')
+
+    def __init__(self, indent, pc, cycles):
+        self.indent = indent
+        self.pc = pc
+        self.cycles = cycles
+
+
+class _BlockBuilder(object):
+
+    def __init__(self):
+        self.lines = []
+        self.cycles = 0
+        self.has_dynamic_cycles = False
+        self.instruction_count = 0
+
+    def add(self, line, indent=1):
+        self.lines.append('    ' * indent + line)
+
+    def add_cycle(self, condition):
+        self.add('if %s:' % condition)
+        self.add('c += 1', 2)
+        self.has_dynamic_cycles = True
+
+    def add_exit(self, pc, extra_cycles=0, indent=1):
+        self.lines.append(_Exit(indent, pc, self.cycles + extra_cycles))
+
+    def cycles_expression(self, cycles):
+        return 'c + %d' % cycles if self.has_dynamic_cycles else str(cycles)
+
+    def source(self, name, code_check):
+        text = '\n'.join(line.pc if isinstance(line, _Exit) else line for line in self.lines)
+        used = set(_REGISTER_PATTERN.findall(text))
+        registers = [register for register in REGISTERS if register in used]
+
+        source = ['def %s(cpu, %s):' % (name, ', '.join('%s=%s' % (name, name) for name in BLOCK_GLOBALS))]
+        if code_check is not None:
+            source.append('    if view[%d:%d] != %r:' % code_check)
+            source.append('        return -1')
+        for register in registers:
+            source.append('    %s = cpu._%s' % (register, register))
+        if self.has_dynamic_cycles:
+            source.append('    c = 0')
+
+        for line in self.lines:
+            if isinstance(line, _Exit):
+                indent = '    ' * line.indent
+                for register in registers:
+                    source.append('%scpu._%s = %s' % (indent, register, register))
+                source.append('%scpu._pc = %s' % (indent, line.pc))
+                source.append('%sreturn %s' % (indent, self.cycles_expression(line.cycles)))
+            else:
+                source.append(line)
+
+        return '\n'.join(source) + '\n'
+
+
+class Recompiler(object):
+    # Dynamic recompiler. Straight line runs of 6502 code (basic blocks) are translated to Python functions with
+    # the operands, constant addresses and cycle counts folded in, and a whole block runs per call.
+    #
+    # Blocks never cross a 256 byte page and are cached per (page view, PC). PRG ROM bank switches map other views,
+    # so they select other blocks rather than invalidating any. Blocks compiled from writable pages (RAM, PRG RAM)
+    # compare their code bytes on entry and are recompiled after the code changed.
+    #
+    # A block ends at control flow, after stores that may switch banks or modify the running code and around
+    # accesses to constant I/O addresses, so the PPU, caught up by the caller after every block, sees register
+    # accesses with the same timing as with the interpreter. Registers accessed through indexed or indirect
+    # addresses see the PPU as of the start of their block. Interrupts are taken between blocks.
+    #
+    # Compiled blocks bypass the op table, so while a profiler or coverage instruments it (CPU.set_profiler,
+    # CPU.set_coverage) every op runs through the interpreter.
+
+    def __init__(self, cpu):
+        self._cpu = cpu
+        self._cpu_memory = cpu._cpu_memory
+        self._read_pages = self._cpu_memory._read_pages
+        # id(page view) -> (page view, {pc: block function or None when the PC can't be compiled})
+        self._blocks = {}
+
+        # Statistics
+        self.compiled_blocks = 0
+        self.recompiled_blocks = 0
+
+    def execute_block(self):
+        # Executes the block at PC (or a single op through the interpreter) and sets cpu.op_cycles to its cycles
+        cpu = self._cpu
+        if cpu._irq_line:
+            # CLI, PLP and RTI of the last block may have enabled interrupts
+            cpu._poll_irq_line()
+        if cpu._pending_interrupts or cpu._instrumented:
+            cpu.execute_op()
+            return
+
+        pc = cpu._pc
+        view = self._read_pages[pc >> 8]
+        if view is None:
+            cpu.execute_op()
+            return
+
+        cache = self._blocks.get(id(view))
+        if cache is None:
+            cache = self._blocks[id(view)] = (view, {})
+        blocks = cache[1]
+
+        block = blocks.get(pc, False)
+        if block is False:
+            block = blocks[pc] = self._compile(pc, view)
+        if block is None:
+            cpu.execute_op()
+            return
+
+        cycles = block(cpu)
+        if cycles < 0:
+            # The code of a writable page changed
+            self.recompiled_blocks += 1
+            block = blocks[pc] = self._compile(pc, view)
+            if block is None:
+                cpu.execute_op()
+                return
+            cycles = block(cpu)
+        cpu.op_cycles = cycles
+
+    def block_at(self, pc):
+        # The block function at PC, compiling it if needed. None when the op at PC runs through the interpreter.
+        view = self._read_pages[pc >> 8]
+        if view is None:
+            return None
+        self._blocks.setdefault(id(view), (view, {}))
+        blocks = self._blocks[id(view)][1]
+        if pc not in blocks:
+            blocks[pc] = self._compile(pc, view)
+        return blocks[pc]
+
+    def clear(self):
+        self._blocks.clear()
+
+    #
+    # Translation
+    #
+    def _compile(self, pc, view):
+        page = pc >> 8
+        builder = _BlockBuilder()
+        is_writable = not view.readonly
+
+        address = pc
+        while builder.instruction_count < MAX_BLOCK_LENGTH and address >> 8 == page:
+            offset = address & 0xFF
+            op_code = view[offset]
+            if op_code not in OP_CODES:
+                # Unsupported ops always go through the interpreter
+                break
+            op, mode = OP_CODES[op_code]
+            length = 1 + OPERAND_LENGTHS[mode]
+            if offset + length > 0x100:
+                break
+            operand = view[offset + 1] | (view[offset + 2] << 8) if length == 3 else (
+                view[offset + 1] if length == 2 else None)
+
+            is_io = self._is_io_access(mode, operand)
+            if is_io and builder.instruction_count > 0:
+                break
+
+            # The PC wraps past $FFFF, address runs on to the end of the page
+            next_address = (address + length) & 0xFFFF
+            builder.add('# %04X %s' % (address, op.upper()))
+            builder.cycles += OP_CYCLES[op_code]
+            builder.instruction_count += 1
+            ends_block = getattr(self, '_emit_' + op)(builder, mode, operand, address, next_address)
+            address += length
+            if ends_block:
+                break
+
+            if op in STORE_OPS and mode != CpuAddressingMode.ACC:
+                if is_writable:
+                    # The store may have modified this block
+                    break
+                if mode not in (CpuAddressingMode.IMPL, CpuAddressingMode.ZP, CpuAddressingMode.ZPX,
+                                CpuAddressingMode.ZPY):
+                    if mode == CpuAddressingMode.ABS:
+                        if operand >= 0x4020:
+                            # Mapper register
+                            break
+                    else:
+                        # A store to an address only known at run time may switch the bank of this page
+                        builder.add('if read_pages[%d] is not view:' % page)
+                        builder.add_exit(str(next_address), indent=2)
+            if is_io:
+                break
+
+        if builder.instruction_count == 0:
+            return None
+        if not builder.lines or not isinstance(builder.lines[-1], _Exit) or builder.lines[-1].indent != 1:
+            builder.add_exit(str(address & 0xFFFF))
+
+        name = 'block_%04X' % pc
+        code_check = (pc & 0xFF, address - (page << 8), bytes(view[pc & 0xFF:address - (page << 8)])) \
+            if is_writable else None
+        namespace = {
+            'read': self._cpu_memory.read_memory,
+            'write': self._cpu_memory.write_memory,
+            'ram': self._cpu_memory._ram,
+            'read_pages': self._read_pages,
+            'view': view,
+            'nz_flags': NZ_FLAGS,
+            'adc_results': ADC_RESULTS,
+            'adc_flags': ADC_FLAGS,
+            'compare_flags': COMPARE_FLAGS,
+            'asl_results': ASL_RESULTS,
+            'asl_flags': ASL_FLAGS,
+            'lsr_results': LSR_RESULTS,
+            'lsr_flags': LSR_FLAGS,
+            'rol_results': ROL_RESULTS,
+            'rol_flags': ROL_FLAGS,
+            'ror_results': ROR_RESULTS,
+            'ror_flags': ROR_FLAGS,
+        }
+        source = builder.source(name, code_check)
+        exec(compile(source, '<%s>' % name, 'exec'), namespace)
+        block = namespace[name]
+        block.source = source
+        block.instruction_count = builder.instruction_count
+        self.compiled_blocks += 1
+
+        return block
+
+    @staticmethod
+    def _is_io_access(mode, operand):
+        if mode in (CpuAddressingMode.ABS, CpuAddressingMode.ABSX, CpuAddressingMode.ABSX_, CpuAddressingMode.ABSY,
+                    CpuAddressingMode.ABSY_):
+            return 0x2000 <= operand < 0x4020
+        return False
+
+    def _address(self, builder, mode, operand):
+        # Emits the effective address calculation, returns (expression, kind)
+        if mode == CpuAddressingMode.ZP:
+            return str(operand), RAM
+        elif mode == CpuAddressingMode.ZPX:
+            builder.add('ea = (x + %d) & 0xFF' % operand)
+            return 'ea', RAM
+        elif mode == CpuAddressingMode.ZPY:
+            builder.add('ea = (y + %d) & 0xFF' % operand)
+            return 'ea', RAM
+        elif mode == CpuAddressingMode.ABS:
+            if operand < 0x2000:
+                return str(operand & 0x07FF), RAM
+            return str(operand), IO if operand < 0x4020 else OTHER
+        elif mode in (CpuAddressingMode.ABSX, CpuAddressingMode.ABSX_, CpuAddressingMode.ABSY,
+                      CpuAddressingMode.ABSY_):
+            register = 'x' if mode in (CpuAddressingMode.ABSX, CpuAddressingMode.ABSX_) else 'y'
+            if mode in (CpuAddressingMode.ABSX_, CpuAddressingMode.ABSY_):
+                builder.add_cycle('%s > %d' % (register, 0xFF - (operand & 0xFF)))
+            builder.add('ea = (%d + %s) & 0xFFFF' % (operand, register))
+            return 'ea', OTHER
+        elif mode == CpuAddressingMode.INDX:
+            builder.add('t = (%d + x) & 0xFF' % operand)
+            builder.add('ea = (ram[(t + 1) & 0xFF] << 8) | ram[t]')
+            return 'ea', OTHER
+        elif mode in (CpuAddressingMode.IND_Y, CpuAddressingMode.IND_Y_):
+            builder.add('ea = (ram[%d] << 8) | ram[%d]' % ((operand + 1) & 0xFF, operand))
+            if mode == CpuAddressingMode.IND_Y_:
+                builder.add_cycle('(ea & 0xFF) + y > 0xFF')
+            builder.add('ea = (ea + y) & 0xFFFF')
+            return 'ea', OTHER
+
+        raise ValueError('Unexpected addressing mode %s' % mode)
+
+    @staticmethod
+    def _read(address, kind):
+        if kind == RAM:
+            return 'ram[%s]' % address
+        return 'read(%s)' % address
+
+    @staticmethod
+    def _write(builder, address, kind, value):
+        if kind == RAM:
+            builder.add('ram[%s] = %s' % (address, value))
+        else:
+            if address == str(0x4014) or not address.isdigit():
+                # The OAM DMA stall is aligned on the cycle after the write, cpu.op_cycles counts the block up to it
+                builder.add('cpu.op_cycles = %s' % builder.cycles_expression(builder.cycles))
+            builder.add('write(%s, %s)' % (address, value))
+
+    def _load_value(self, builder, mode, operand):
+        # Emits v = the operand value
+        if mode == CpuAddressingMode.IMM:
+            builder.add('v = %d' % operand)
+        else:
+            builder.add('v = %s' % self._read(*self._address(builder, mode, operand)))
+
+    @staticmethod
+    def _push(builder, value):
+        builder.add('ram[0x100 | s] = %s' % value)
+        builder.add('s = (s - 1) & 0xFF')
+
+    @staticmethod
+    def _pop(builder, target):
+        builder.add('s = (s + 1) & 0xFF')
+        builder.add('%s = ram[0x100 | s]' % target)
+
+    def _read_modify_write(self, builder, mode, operand, lines):
+        # lines compute r from v, r is written back
+        if mode == CpuAddressingMode.ACC:
+            builder.add('v = a')
+            for line in lines:
+                builder.add(line)
+            builder.add('a = r')
+            return
+
+        address, kind = self._address(builder, mode, operand)
+        if kind != RAM and address != 'ea':
+            builder.add('ea = %s' % address)
+            address = 'ea'
+        builder.add('v = %s' % self._read(address, kind))
+        for line in lines:
+            builder.add(line)
+        self._write(builder, address, kind, 'r')
+
+    #
+    # Ops, each returns True when it ended the block
+    #
+    def _emit_nop(self, builder, mode, operand, address, next_address):
+        pass
+
+    def _emit_dop(self, builder, mode, operand, address, next_address):
+        if mode != CpuAddressingMode.IMM:
+            address, kind = self._address(builder, mode, operand)
+            if kind != RAM:
+                builder.add(self._read(address, kind))
+
+    _emit_top = _emit_dop
+
+    def _emit_adc(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        self._add(builder, '((p & 0x01) << 16) | (a << 8) | v')
+
+    @staticmethod
+    def _add(builder, index):
+        builder.add('t = %s' % index)
+        builder.add('p = (p & 0x3C) | adc_flags[t]')
+        builder.add('a = adc_results[t]')
+
+    def _emit_sbc(self, builder, mode, operand, address, next_address):
+        # A - value - borrow is A + ~value + carry
+        self._load_value(builder, mode, operand)
+        self._add(builder, '((p & 0x01) << 16) | (a << 8) | (v ^ 0xFF)')
+
+    def _emit_and(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        builder.add('a &= v')
+        builder.add(_nz('a'))
+
+    def _emit_ora(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        builder.add('a |= v')
+        builder.add(_nz('a'))
+
+    def _emit_eor(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        builder.add('a ^= v')
+        builder.add(_nz('a'))
+
+    def _emit_bit(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        builder.add('p = (p & 0x3D) | (v & 0xC0) | (nz_flags[a & v] & 0x02)')
+
+    def _emit_cmp(self, builder, mode, operand, address, next_address):
+        self._compare(builder, mode, operand, 'a')
+
+    def _emit_cpx(self, builder, mode, operand, address, next_address):
+        self._compare(builder, mode, operand, 'x')
+
+    def _emit_cpy(self, builder, mode, operand, address, next_address):
+        self._compare(builder, mode, operand, 'y')
+
+    def _compare(self, builder, mode, operand, register):
+        self._load_value(builder, mode, operand)
+        builder.add('p = (p & 0x7C) | compare_flags[(%s << 8) | v]' % register)
+
+    def _emit_lda(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        builder.add('a = v')
+        builder.add(_nz('a'))
+
+    def _emit_ldx(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        builder.add('x = v')
+        builder.add(_nz('x'))
+
+    def _emit_ldy(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        builder.add('y = v')
+        builder.add(_nz('y'))
+
+    def _emit_lax(self, builder, mode, operand, address, next_address):
+        self._load_value(builder, mode, operand)
+        builder.add('a = x = v')
+        builder.add(_nz('a'))
+
+    def _emit_sta(self, builder, mode, operand, address, next_address):
+        self._write(builder, *self._address(builder, mode, operand), 'a')
+
+    def _emit_stx(self, builder, mode, operand, address, next_address):
+        self._write(builder, *self._address(builder, mode, operand), 'x')
+
+    def _emit_sty(self, builder, mode, operand, address, next_address):
+        self._write(builder, *self._address(builder, mode, operand), 'y')
+
+    def _emit_aax(self, builder, mode, operand, address, next_address):
+        self._write(builder, *self._address(builder, mode, operand), 'a & x')
+
+    def _emit_asl(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = asl_results[v]',
+            'p = (p & 0x7C) | asl_flags[v]',
+        ])
+
+    def _emit_lsr(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = lsr_results[v]',
+            'p = (p & 0x7C) | lsr_flags[v]',
+        ])
+
+    def _emit_rol(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            't = ((p & 0x01) << 8) | v',
+            'r = rol_results[t]',
+            'p = (p & 0x7C) | rol_flags[t]',
+        ])
+
+    def _emit_ror(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            't = ((p & 0x01) << 8) | v',
+            'r = ror_results[t]',
+            'p = (p & 0x7C) | ror_flags[t]',
+        ])
+
+    def _emit_inc(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = (v + 1) & 0xFF',
+            _nz('r'),
+        ])
+
+    def _emit_dec(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = (v - 1) & 0xFF',
+            _nz('r'),
+        ])
+
+    def _emit_dcp(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = (v - 1) & 0xFF',
+            'p = (p & 0x7C) | compare_flags[(a << 8) | r]',
+        ])
+
+    def _emit_isc(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = (v + 1) & 0xFF',
+            't = ((p & 0x01) << 16) | (a << 8) | (r ^ 0xFF)',
+            'p = (p & 0x3C) | adc_flags[t]',
+            'a = adc_results[t]',
+        ])
+
+    def _emit_slo(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = asl_results[v]',
+            'a |= r',
+            'p = (p & 0x7C) | nz_flags[a] | (v >> 7)',
+        ])
+
+    def _emit_rla(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = rol_results[((p & 0x01) << 8) | v]',
+            'a &= r',
+            'p = (p & 0x7C) | nz_flags[a] | (v >> 7)',
+        ])
+
+    def _emit_sre(self, builder, mode, operand, address, next_address):
+        # Z comes from the shifted value, as in CPU._op_sre
+        self._read_modify_write(builder, mode, operand, [
+            'r = lsr_results[v]',
+            'a ^= r',
+            'p = (p & 0x7C) | (a & 0x80) | lsr_flags[v]',
+        ])
+
+    def _emit_rra(self, builder, mode, operand, address, next_address):
+        self._read_modify_write(builder, mode, operand, [
+            'r = ror_results[((p & 0x01) << 8) | v]',
+            't = ((v & 0x01) << 16) | (a << 8) | r',
+            'p = (p & 0x3C) | adc_flags[t]',
+            'a = adc_results[t]',
+        ])
+
+    def _emit_inx(self, builder, mode, operand, address, next_address):
+        builder.add('x = (x + 1) & 0xFF')
+        builder.add(_nz('x'))
+
+    def _emit_iny(self, builder, mode, operand, address, next_address):
+        builder.add('y = (y + 1) & 0xFF')
+        builder.add(_nz('y'))
+
+    def _emit_dex(self, builder, mode, operand, address, next_address):
+        builder.add('x = (x - 1) & 0xFF')
+        builder.add(_nz('x'))
+
+    def _emit_dey(self, builder, mode, operand, address, next_address):
+        builder.add('y = (y - 1) & 0xFF')
+        builder.add(_nz('y'))
+
+    def _emit_tax(self, builder, mode, operand, address, next_address):
+        builder.add('x = a')
+        builder.add(_nz('x'))
+
+    def _emit_tay(self, builder, mode, operand, address, next_address):
+        builder.add('y = a')
+        builder.add(_nz('y'))
+
+    def _emit_tsx(self, builder, mode, operand, address, next_address):
+        builder.add('x = s')
+        builder.add(_nz('x'))
+
+    def _emit_txa(self, builder, mode, operand, address, next_address):
+        builder.add('a = x')
+        builder.add(_nz('a'))
+
+    def _emit_tya(self, builder, mode, operand, address, next_address):
+        builder.add('a = y')
+        builder.add(_nz('a'))
+
+    def _emit_txs(self, builder, mode, operand, address, next_address):
+        builder.add('s = x')
+
+    def _emit_clc(self, builder, mode, operand, address, next_address):
+        builder.add('p &= 0xFE')
+
+    def _emit_cld(self, builder, mode, operand, address, next_address):
+        builder.add('p &= 0xF7')
+
+    def _emit_cli(self, builder, mode, operand, address, next_address):
+        builder.add('p &= 0xFB')
+        # Ends the block, so execute_block polls an asserted /IRQ line before the next op like CPU._op_cli
+        return True
+
+    def _emit_clv(self, builder, mode, operand, address, next_address):
+        builder.add('p &= 0xBF')
+
+    def _emit_sec(self, builder, mode, operand, address, next_address):
+        builder.add('p |= 0x01')
+
+    def _emit_sed(self, builder, mode, operand, address, next_address):
+        builder.add('p |= 0x08')
+
+    def _emit_sei(self, builder, mode, operand, address, next_address):
+        builder.add('p |= 0x04')
+
+    def _emit_pha(self, builder, mode, operand, address, next_address):
+        self._push(builder, 'a')
+
+    def _emit_php(self, builder, mode, operand, address, next_address):
+        self._push(builder, 'p | 0x10')
+
+    def _emit_pla(self, builder, mode, operand, address, next_address):
+        self._pop(builder, 'a')
+        builder.add(_nz('a'))
+
+    def _emit_plp(self, builder, mode, operand, address, next_address):
+        self._pop(builder, 'v')
+        builder.add('p = (v & 0xEF) | 0x20')
+        # May clear I, same as CLI
+        return True
+
+    #
+    # Control flow
+    #
+    def _emit_branch(self, builder, condition, operand, next_address):
+        target = (next_address + (operand if operand < 0x80 else operand - 0x100)) & 0xFFFF
+        builder.add('if %s:' % condition)
+        builder.add_exit(str(target), 2 if (next_address ^ target) & 0xFF00 else 1, indent=2)
+        builder.add_exit(str(next_address))
+        return True
+
+    def _emit_bcc(self, builder, mode, operand, address, next_address):
+        return self._emit_branch(builder, BRANCH_CONDITIONS['bcc'], operand, next_address)
+
+    def _emit_bcs(self, builder, mode, operand, address, next_address):
+        return self._emit_branch(builder, BRANCH_CONDITIONS['bcs'], operand, next_address)
+
+    def _emit_bne(self, builder, mode, operand, address, next_address):
+        return self._emit_branch(builder, BRANCH_CONDITIONS['bne'], operand, next_address)
+
+    def _emit_beq(self, builder, mode, operand, address, next_address):
+        return self._emit_branch(builder, BRANCH_CONDITIONS['beq'], operand, next_address)
+
+    def _emit_bvc(self, builder, mode, operand, address, next_address):
+        return self._emit_branch(builder, BRANCH_CONDITIONS['bvc'], operand, next_address)
+
+    def _emit_bvs(self, builder, mode, operand, address, next_address):
+        return self._emit_branch(builder, BRANCH_CONDITIONS['bvs'], operand, next_address)
+
+    def _emit_bpl(self, builder, mode, operand, address, next_address):
+        return self._emit_branch(builder, BRANCH_CONDITIONS['bpl'], operand, next_address)
+
+    def _emit_bmi(self, builder, mode, operand, address, next_address):
+        return self._emit_branch(builder, BRANCH_CONDITIONS['bmi'], operand, next_address)
+
+    def _emit_jmp(self, builder, mode, operand, address, next_address):
+        if mode == CpuAddressingMode.ABS:
+            builder.add_exit(str(operand))
+        else:
+            if mode == CpuAddressingMode.IND_:
+                # The high byte is read from the start of the same page
+                high_address = (operand & 0xFF00) | ((operand + 1) & 0x00FF)
+            else:
+                high_address = (operand + 1) & 0xFFFF
+            builder.add('t = (read(%d) << 8) | read(%d)' % (high_address, operand))
+            builder.add_exit('t')
+        return True
+
+    def _emit_jsr(self, builder, mode, operand, address, next_address):
+        return_address = (next_address - 1) & 0xFFFF
+        self._push(builder, str(return_address >> 8))
+        self._push(builder, str(return_address & 0xFF))
+        builder.add_exit(str(operand))
+        return True
+
+    def _emit_rts(self, builder, mode, operand, address, next_address):
+        self._pop(builder, 'v')
+        self._pop(builder, 't')
+        builder.add_exit('(((t << 8) | v) + 1) & 0xFFFF')
+        return True
+
+    def _emit_rti(self, builder, mode, operand, address, next_address):
+        self._pop(builder, 'v')
+        builder.add('p = (v & 0xEF) | 0x20')
+        self._pop(builder, 'v')
+        self._pop(builder, 't')
+        builder.add_exit('(t << 8) | v')
+        return True
+
+    def _emit_brk(self, builder, mode, operand, address, next_address):
+        return_address = (next_address + 1) & 0xFFFF
+        self._push(builder, str(return_address >> 8))
+        self._push(builder, str(return_address & 0xFF))
+        builder.add('p |= 0x10')
+        self._push(builder, 'p')
+        builder.add('t = (read(0xFFFF) << 8) | read(0xFFFE)')
+        builder.add_exit('t')
+        return True
@@ -0,0 +1,111 @@
+import bisect
+import collections
+import zlib
+
+
+class _Keyframe(object):
+    # A complete compressed state and the compressed XOR deltas of the snapshots taken after it
+    __slots__ = ('frame', 'data', 'delta_frames', 'deltas', 'size')
+
+    def __init__(self, frame, data):
+        self.frame = frame
+        self.data = data
+        self.delta_frames = []
+        self.deltas = []
+        self.size = len(data)
+
+
+def _xor(state, keyframe_state):
+    return (int.from_bytes(state, 'little') ^ int.from_bytes(keyframe_state, 'little')).to_bytes(len(state), 'little')
+
+
+class Rewind(object):
+    # Ring buffer of NES save states. Every interval frames a snapshot is taken, every keyframe_interval snapshots
+    # the full state is stored, the other snapshots are stored as the XOR against their keyframe. Both are zlib
+    # compressed; the XOR of two close states is mostly zeros and compresses to a few hundred bytes. When the
+    # buffer grows past max_bytes the oldest keyframe is dropped together with its deltas.
+
+    def __init__(self, nes, interval=1, keyframe_interval=60, max_bytes=8 * 1024 * 1024, compression_level=1):
+        self._nes = nes
+        self.interval = interval
+        self.keyframe_interval = keyframe_interval
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+
+        self._keyframes = collections.deque()
+        self._keyframe_state = None
+        self._size = 0
+
+    @property
+    def size(self):
+        # Compressed bytes held
+        return self._size
+
+    @property
+    def frames(self):
+        # Frames that can be sought to, oldest first
+        return [frame for keyframe in self._keyframes for frame in [keyframe.frame] + keyframe.delta_frames]
+
+    def run_frame(self):
+        # NES.run_frame that takes a snapshot every interval frames
+        cycles = self._nes.run_frame()
+        if self._nes.ppu.frame % self.interval == 0:
+            self.capture()
+
+        return cycles
+
+    def capture(self):
+        frame = self._nes.ppu.frame
+        if self._keyframes and frame <= self._last_frame():
+            raise ValueError('Frame %d is not after the last snapshot' % frame)
+
+        state = self._nes.save_state()
+        keyframe = self._keyframes[-1] if self._keyframes else None
+        if keyframe is None or len(keyframe.deltas) + 1 >= self.keyframe_interval:
+            keyframe = _Keyframe(frame, zlib.compress(state, self.compression_level))
+            self._keyframes.append(keyframe)
+            self._keyframe_state = state
+            self._size += keyframe.size
+        else:
+            delta = zlib.compress(_xor(state, self._keyframe_state), self.compression_level)
+            keyframe.delta_frames.append(frame)
+            keyframe.deltas.append(delta)
+            keyframe.size += len(delta)
+            self._size += len(delta)
+
+        while self._size > self.max_bytes and len(self._keyframes) > 1:
+            self._size -= self._keyframes.popleft().size
+
+    def seek(self, frame):
+        # Restores the last snapshot taken at or before frame and drops the newer ones. Returns the restored frame.
+        keyframes = self._keyframes
+        index = bisect.bisect_right([keyframe.frame for keyframe in keyframes], frame) - 1
+        if index < 0:
+            raise ValueError('Frame %d is not recorded' % frame)
+
+        while len(keyframes) > index + 1:
+            self._size -= keyframes.pop().size
+        keyframe = keyframes[index]
+        self._keyframe_state = zlib.decompress(keyframe.data)
+
+        delta_index = bisect.bisect_right(keyframe.delta_frames, frame)
+        for delta in keyframe.deltas[delta_index:]:
+            keyframe.size -= len(delta)
+            self._size -= len(delta)
+        del keyframe.delta_frames[delta_index:]
+        del keyframe.deltas[delta_index:]
+
+        if delta_index == 0:
+            self._nes.load_state(self._keyframe_state)
+            return keyframe.frame
+
+        self._nes.load_state(_xor(zlib.decompress(keyframe.deltas[-1]), self._keyframe_state))
+        return keyframe.delta_frames[-1]
+
+    def rewind(self, frames):
+        # Steps back at least the given number of frames from the current one
+        return self.seek(self._nes.ppu.frame - frames)
+
+    def _last_frame(self):
+        keyframe = self._keyframes[-1]
+        return keyframe.delta_frames[-1] if keyframe.delta_frames else keyframe.frame
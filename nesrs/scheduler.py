@@ -0,0 +1,66 @@
+import heapq
+
+# Deadline of a scheduler without events
+NEVER = 1 << 62
+
+
+class Event(object):
+    __slots__ = ('cycle', 'handler', 'is_cancelled')
+
+    def __init__(self, cycle, handler):
+        self.cycle = cycle
+        self.handler = handler
+        self.is_cancelled = False
+
+
+class Scheduler(object):
+    # Master clock, CPU cycles since power on, and a timeline of events components schedule on it (PPU NMI and
+    # mapper IRQ points, APU frame IRQ, DMA). The CPU runs uninterrupted until next_deadline, then run_due fires
+    # the events that are due, in cycle order and in scheduling order for the same cycle.
+
+    def __init__(self):
+        self.cycles = 0
+        self.next_deadline = NEVER
+
+        # Heap of (cycle, sequence, Event)
+        self._events = []
+        self._sequence = 0
+
+    def schedule(self, cycle, handler):
+        # handler is called with no arguments once cycles >= cycle, returns the Event to cancel it
+        event = Event(cycle, handler)
+        heapq.heappush(self._events, (cycle, self._sequence, event))
+        self._sequence += 1
+        if cycle < self.next_deadline:
+            self.next_deadline = cycle
+
+        return event
+
+    def schedule_in(self, cycles, handler):
+        return self.schedule(self.cycles + cycles, handler)
+
+    def cancel(self, event):
+        # Cancelled events stay in the heap until they reach its top
+        event.is_cancelled = True
+        self._drop_cancelled()
+
+    def clear(self):
+        for _, _, event in self._events:
+            event.is_cancelled = True
+        self._events = []
+        self.next_deadline = NEVER
+
+    def run_due(self):
+        events = self._events
+        while events and events[0][0] <= self.cycles:
+            event = heapq.heappop(events)[2]
+            if not event.is_cancelled:
+                event.is_cancelled = True
+                event.handler()
+        self._drop_cancelled()
+
+    def _drop_cancelled(self):
+        events = self._events
+        while events and events[0][2].is_cancelled:
+            heapq.heappop(events)
+        self.next_deadline = events[0][0] if events else NEVER
@@ -0,0 +1,57 @@
+import struct
+
+# Save states are "<tag><version>" followed by sections, each prefixed with its length. Bump the version whenever
+# the layout of any component state changes.
+STATE_VERSION = 6
+
+_HEADER = struct.Struct('<4sB')
+_SECTION_LENGTH = struct.Struct('<I')
+
+
+def pack_state(tag, *sections):
+    parts = [_HEADER.pack(tag, STATE_VERSION)]
+    for section in sections:
+        parts.append(_SECTION_LENGTH.pack(len(section)))
+        parts.append(section)
+
+    return b''.join(parts)
+
+
+def unpack_state(tag, data, section_count):
+    # Returns the sections of a state packed with pack_state as memoryviews
+    data = memoryview(data)
+    if len(data) < _HEADER.size:
+        raise ValueError('Truncated save state')
+
+    state_tag, version = _HEADER.unpack_from(data)
+    if state_tag != tag:
+        raise ValueError('Expected a %r save state, got %r' % (tag, state_tag))
+    if version != STATE_VERSION:
+        raise ValueError('Unsupported save state version %d' % version)
+
+    sections = []
+    offset = _HEADER.size
+    end = len(data)
+    length_size = _SECTION_LENGTH.size
+    unpack_length = _SECTION_LENGTH.unpack_from
+    while offset < end:
+        if offset + length_size > end:
+            raise ValueError('Truncated save state')
+        length, = unpack_length(data, offset)
+        offset += length_size
+        if offset + length > end:
+            raise ValueError('Truncated save state')
+        sections.append(data[offset:offset + length])
+        offset += length
+
+    if len(sections) != section_count:
+        raise ValueError('Expected %d save state sections, got %d' % (section_count, len(sections)))
+
+    return sections
+
+
+def load_buffer(buffer, data):
+    # Copies data into buffer in place, so memoryviews of the buffer stay valid
+    if len(data) != len(buffer):
+        raise ValueError('Save state buffer is %d bytes, expected %d' % (len(data), len(buffer)))
+    buffer[:] = data
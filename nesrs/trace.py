@@ -0,0 +1,239 @@
+import argparse
+import mmap
+import re
+import struct
+
+# CPU cycle, pc, a, x, y, p, s of the state before an op, 16 bytes
+TRACE_RECORD = struct.Struct('<QHBBBBBx')
+# "NTRC", version, record count
+TRACE_HEADER = struct.Struct('<4sB3xQ')
+TRACE_VERSION = 1
+
+# Records compared at once by first_divergence before it narrows down
+DIFF_CHUNK_RECORDS = 1 << 16
+
+# PPU dots per frame in the SL/CYC columns of the original nestest.log
+_NESTEST_FRAME_DOTS = 341 * 262
+_NESTEST_FIELDS = re.compile(r'A:([0-9A-F]{2}) X:([0-9A-F]{2}) Y:([0-9A-F]{2}) P:([0-9A-F]{2}) SP:([0-9A-F]{2})')
+_NESTEST_CPU_CYCLE = re.compile(r'PPU:.*CYC:(\d+)')
+_NESTEST_PPU_DOT = re.compile(r'CYC:\s*(\d+) SL:\s*(-?\d+)')
+
+
+class Trace(object):
+    # Trace records in execution order, backed by any buffer of packed TRACE_RECORDs
+
+    def __init__(self, data=None):
+        self.data = data if data is not None else bytearray()
+        if len(self.data) % TRACE_RECORD.size != 0:
+            raise ValueError('Trace data is not a whole number of records')
+
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.data) // TRACE_RECORD.size
+
+    def __getitem__(self, index):
+        # (cycle, pc, a, x, y, p, s)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Trace record %d out of range' % index)
+        return TRACE_RECORD.unpack_from(self.data, index * TRACE_RECORD.size)
+
+    def __iter__(self):
+        return TRACE_RECORD.iter_unpack(self.data)
+
+    def save(self, path):
+        with open(path, 'wb') as trace_file:
+            trace_file.write(TRACE_HEADER.pack(b'NTRC', TRACE_VERSION, len(self)))
+            trace_file.write(self.data)
+
+    @staticmethod
+    def load(path):
+        # Memory maps the file, a trace of hundreds of millions of ops is not read into memory
+        with open(path, 'rb') as trace_file:
+            header = trace_file.read(TRACE_HEADER.size)
+            if len(header) < TRACE_HEADER.size:
+                raise ValueError('Truncated trace header')
+            tag, version, count = TRACE_HEADER.unpack(header)
+            if tag != b'NTRC':
+                raise ValueError('Not a trace file')
+            if version != TRACE_VERSION:
+                raise ValueError('Unsupported trace version %d' % version)
+            if count == 0:
+                return Trace()
+            data = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        end = TRACE_HEADER.size + count * TRACE_RECORD.size
+        if len(data) < end:
+            raise ValueError('Truncated trace')
+        trace = Trace(memoryview(data)[TRACE_HEADER.size:end])
+        trace._mmap = data
+        return trace
+
+    #
+    # nestest.log
+    #
+    @staticmethod
+    def from_nestest(lines):
+        # Either log format: CPU cycles in "PPU:...CYC:n", or the original PPU dot and scanline in "CYC:n SL:n",
+        # counted in CPU cycles from the first line
+        data = bytearray()
+        cycle = 0
+        last_dot = None
+        for line in lines:
+            line = line.rstrip()
+            if not line:
+                continue
+            fields = _NESTEST_FIELDS.search(line)
+            if fields is None:
+                raise ValueError('Not a nestest log line: %r' % line)
+            a, x, y, p, s = [int(field, 16) for field in fields.groups()]
+
+            cpu_cycle = _NESTEST_CPU_CYCLE.search(line)
+            if cpu_cycle is not None:
+                cycle = int(cpu_cycle.group(1))
+            else:
+                ppu_dot = _NESTEST_PPU_DOT.search(line)
+                if ppu_dot is None:
+                    raise ValueError('No cycle count in nestest log line: %r' % line)
+                dot = int(ppu_dot.group(2)) * 341 + int(ppu_dot.group(1))
+                if last_dot is not None:
+                    cycle += ((dot - last_dot) % _NESTEST_FRAME_DOTS) // 3
+                last_dot = dot
+
+            data += TRACE_RECORD.pack(cycle, int(line[0:4], 16), a, x, y, p, s)
+
+        return Trace(data)
+
+    def to_nestest(self):
+        # Lines of the current nestest format, without the op bytes and disassembly the trace doesn't have
+        for cycle, pc, a, x, y, p, s in self:
+            yield '%04X%44sA:%02X X:%02X Y:%02X P:%02X SP:%02X PPU:%3d,%3d CYC:%d' % (
+                pc, '', a, x, y, p, s, (cycle * 3) // 341 % 262, (cycle * 3) % 341, cycle)
+
+
+class TraceRecorder(object):
+    # Packs the CPU state before every op into a preallocated buffer: a ring keeping the last capacity records, or
+    # with a path a memory mapped file that keeps the first capacity records.
+
+    def __init__(self, capacity, path=None):
+        self.capacity = capacity
+        self.count = 0
+        self._path = path
+        self._file = None
+        if path is None:
+            self._buffer = bytearray(capacity * TRACE_RECORD.size)
+        else:
+            self._file = open(path, 'w+b')
+            self._file.truncate(TRACE_HEADER.size + capacity * TRACE_RECORD.size)
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+            self._buffer = memoryview(self._mmap)[TRACE_HEADER.size:]
+
+    @property
+    def is_full(self):
+        return self._file is not None and self.count >= self.capacity
+
+    def record(self, cpu, cycle):
+        count = self.count
+        if count >= self.capacity:
+            if self._file is not None:
+                return
+            count %= self.capacity
+        TRACE_RECORD.pack_into(self._buffer, count * TRACE_RECORD.size,
+                               cycle, cpu._pc, cpu._a, cpu._x, cpu._y, cpu._p, cpu._s)
+        self.count += 1
+
+    def trace(self):
+        # A copy of the records in execution order, a file trace can still be closed
+        if self._file is not None:
+            return Trace(bytes(self._buffer[:min(self.count, self.capacity) * TRACE_RECORD.size]))
+        if self.count <= self.capacity:
+            return Trace(self._buffer[:self.count * TRACE_RECORD.size])
+
+        split = (self.count % self.capacity) * TRACE_RECORD.size
+        return Trace(self._buffer[split:] + self._buffer[:split])
+
+    def close(self):
+        # Writes the header of a file trace, Trace.load reads it back
+        if self._file is None:
+            return
+        TRACE_HEADER.pack_into(self._mmap, 0, b'NTRC', TRACE_VERSION, min(self.count, self.capacity))
+        self._buffer.release()
+        self._mmap.close()
+        self._file.close()
+        self._file = None
+        self._buffer = bytearray()
+
+
+def first_divergence(trace1, trace2):
+    # Index of the first record that differs, the length of the shorter trace when one is a prefix of the other,
+    # None when they are the same. Whole chunks are compared as bytes, then the differing chunk is bisected.
+    data1 = memoryview(trace1.data)
+    data2 = memoryview(trace2.data)
+    size = TRACE_RECORD.size
+    count = min(len(trace1), len(trace2))
+
+    for start in range(0, count, DIFF_CHUNK_RECORDS):
+        end = min(start + DIFF_CHUNK_RECORDS, count)
+        if data1[start * size:end * size] == data2[start * size:end * size]:
+            continue
+
+        # The first difference is in [start, end)
+        while end - start > 1:
+            middle = (start + end) // 2
+            if data1[start * size:middle * size] == data2[start * size:middle * size]:
+                start = middle
+            else:
+                end = middle
+        return start
+
+    return count if len(trace1) != len(trace2) else None
+
+
+def _load(path):
+    if path.endswith('.log') or path.endswith('.txt'):
+        with open(path, 'r') as log_file:
+            return Trace.from_nestest(log_file)
+    return Trace.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts and compares CPU traces')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help='nestest .log/.txt to trace or trace to nestest .log/.txt')
+    convert.add_argument('source')
+    convert.add_argument('destination')
+    diff = subparsers.add_parser('diff', help='reports the first divergence between two traces or logs')
+    diff.add_argument('trace1')
+    diff.add_argument('trace2')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        trace = _load(args.source)
+        if args.destination.endswith('.log') or args.destination.endswith('.txt'):
+            with open(args.destination, 'w') as log_file:
+                for line in trace.to_nestest():
+                    log_file.write(line + '\n')
+        else:
+            trace.save(args.destination)
+        return 0
+
+    trace1 = _load(args.trace1)
+    trace2 = _load(args.trace2)
+    index = first_divergence(trace1, trace2)
+    if index is None:
+        print('Same %d records' % len(trace1))
+        return 0
+
+    print('First divergence at record %d' % index)
+    for name, trace in ((args.trace1, trace1), (args.trace2, trace2)):
+        lines = Trace(trace.data[max(0, index - 2) * TRACE_RECORD.size:(index + 1) * TRACE_RECORD.size]).to_nestest()
+        print(name)
+        for line in lines:
+            print('  ' + line)
+    return 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -2,4 +2,11 @@ import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-import nesrs
\ No newline at end of file
+import nesrs
+
+def create_rom(prg_rom, mapper=0, chr_banks=1, chr_mem=None, vertical_mirroring=False):
+    # iNES image of a PRG ROM of 16Kb banks, CHR ROM is chr_mem or chr_banks zeroed 8Kb banks (0 for CHR RAM)
+    chr_mem = bytes(chr_mem) if chr_mem is not None else bytes(chr_banks * 0x2000)
+    flags6 = ((mapper & 0x0F) << 4) | (0x01 if vertical_mirroring else 0x00)
+    return (b'NES\x1a' + bytes([len(prg_rom) >> 14, len(chr_mem) >> 13, flags6, mapper & 0xF0]) + bytes(8) +
+            bytes(prg_rom) + chr_mem)
@@ -0,0 +1,213 @@
+from .context import nesrs
+import nesrs.cpu
+import random
+import unittest
+
+N_FLAG = nesrs.cpu.N_FLAG
+V_FLAG = nesrs.cpu.V_FLAG
+Z_FLAG = nesrs.cpu.Z_FLAG
+C_FLAG = nesrs.cpu.C_FLAG
+
+# The flag computations the lookup tables replaced, (a, value, p) -> (a, p, value written back)
+
+
+def nz(p, value):
+    return (p & ~(N_FLAG | Z_FLAG)) | (value & N_FLAG) | (Z_FLAG if value == 0 else 0)
+
+
+def reference_adc(a, value, p):
+    res = a + value + (p & C_FLAG)
+    p &= ~(N_FLAG | V_FLAG | Z_FLAG | C_FLAG)
+    p |= (res & N_FLAG) | (V_FLAG if (~(a ^ value) & (a ^ (res & 0xFF)) & 0x80) != 0 else 0)
+    p |= (Z_FLAG if (res & 0xFF) == 0 else 0) | (C_FLAG if res > 0xFF else 0)
+    return res & 0xFF, p, value
+
+
+def reference_sbc(a, value, p):
+    res = a - value - (0 if (p & C_FLAG) != 0 else 1)
+    p &= ~(N_FLAG | V_FLAG | Z_FLAG | C_FLAG)
+    p |= (res & N_FLAG) | (V_FLAG if ((a ^ value) & (a ^ (res & 0xFF)) & 0x80) != 0 else 0)
+    p |= (Z_FLAG if (res & 0xFF) == 0 else 0) | (C_FLAG if (res & 0x100) == 0 else 0)
+    return res & 0xFF, p, value
+
+
+def reference_cmp(a, value, p):
+    res = (a - value) & 0xFF
+    return a, nz(p, res) & ~C_FLAG | (C_FLAG if a >= value else 0), value
+
+
+def reference_bit(a, value, p):
+    p &= ~(N_FLAG | V_FLAG | Z_FLAG)
+    return a, p | (value & (N_FLAG | V_FLAG)) | (Z_FLAG if (a & value) == 0 else 0), value
+
+
+def reference_asl(a, value, p):
+    res = (value << 1) & 0xFF
+    return a, nz(p, res) & ~C_FLAG | (value >> 7), res
+
+
+def reference_lsr(a, value, p):
+    res = value >> 1
+    return a, nz(p, res) & ~C_FLAG | (value & 0x01), res
+
+
+def reference_rol(a, value, p):
+    res = ((value << 1) & 0xFF) | (p & C_FLAG)
+    return a, nz(p, res) & ~C_FLAG | (value >> 7), res
+
+
+def reference_ror(a, value, p):
+    res = (value >> 1) | ((p & C_FLAG) << 7)
+    return a, nz(p, res) & ~C_FLAG | (value & 0x01), res
+
+
+def reference_dcp(a, value, p):
+    value = (value - 1) & 0xFF
+    res = a - value
+    p &= ~(N_FLAG | Z_FLAG | C_FLAG)
+    p |= (res & N_FLAG) | (Z_FLAG if res == 0 else 0) | (C_FLAG if (res & 0x100) == 0 else 0)
+    return a, p, value
+
+
+def reference_isc(a, value, p):
+    return reference_sbc(a, (value + 1) & 0xFF, p)
+
+
+def reference_slo(a, value, p):
+    _, p, res = reference_asl(a, value, p)
+    a |= res
+    return a, nz(p, a), res
+
+
+def reference_rla(a, value, p):
+    _, p, res = reference_rol(a, value, p)
+    a &= res
+    return a, nz(p, a), res
+
+
+def reference_sre(a, value, p):
+    _, p, res = reference_lsr(a, value, p)
+    a ^= res
+    # Z stays the one of the shifted value
+    return a, (p & ~N_FLAG) | (a & N_FLAG), res
+
+
+def reference_rra(a, value, p):
+    _, p, res = reference_ror(a, value, p)
+    carry = value & 0x01
+    a, p, _ = reference_adc(a, res, (p & ~C_FLAG) | carry)
+    return a, p, res
+
+
+class FlatMemory(object):
+
+    def __init__(self):
+        self.memory = bytearray(0x10000)
+
+    def read_memory(self, address):
+        return self.memory[address]
+
+    def write_memory(self, address, value):
+        self.memory[address] = value
+
+
+class Alu(unittest.TestCase):
+    cpu_class = nesrs.cpu.CPU
+
+    def assert_op(self, op_code, reference, mode):
+        # Runs the op for every A, operand and carry. The flags the op must not touch take varying values.
+        memory = FlatMemory()
+        cpu = self.cpu_class(memory)
+        ram = memory.memory
+        ram[0] = op_code
+        ram[1] = 0x10
+
+        for carry in range(2):
+            for a in range(0x100):
+                for value in range(0x100):
+                    p = (((a * 7 + value * 13) & 0x7F) << 1) | carry
+                    cpu._a = value if mode == 'acc' else a
+                    cpu._p = p
+                    cpu._pc = 0
+                    if mode == 'imm':
+                        ram[1] = value
+                    else:
+                        ram[0x10] = value
+
+                    cpu.execute_op()
+
+                    expected_a, expected_p, expected_value = reference(a, value, p)
+                    if mode == 'acc':
+                        actual = (cpu._p, cpu._a)
+                        expected = (expected_p, expected_value)
+                    else:
+                        actual = (cpu._a, cpu._p, ram[0x10] if mode == 'zp' else value)
+                        expected = (expected_a, expected_p, expected_value)
+                    if actual != expected:
+                        self.fail('Op %02X a=%02X value=%02X p=%02X: %r != %r' % (
+                            op_code, a, value, p, actual, expected))
+
+                if mode == 'acc':
+                    # The accumulator ops only depend on the value
+                    break
+
+    def test_adc_sbc(self):
+        self.assert_op(0x69, reference_adc, 'imm')
+        self.assert_op(0xE9, reference_sbc, 'imm')
+
+    def test_compare(self):
+        self.assert_op(0xC9, reference_cmp, 'imm')
+
+    def test_logic(self):
+        self.assert_op(0x29, lambda a, value, p: (a & value, nz(p, a & value), value), 'imm')
+        self.assert_op(0x09, lambda a, value, p: (a | value, nz(p, a | value), value), 'imm')
+        self.assert_op(0x49, lambda a, value, p: (a ^ value, nz(p, a ^ value), value), 'imm')
+        self.assert_op(0xA9, lambda a, value, p: (value, nz(p, value), value), 'imm')
+        self.assert_op(0x24, reference_bit, 'zp')
+
+    def test_shifts(self):
+        self.assert_op(0x0A, reference_asl, 'acc')
+        self.assert_op(0x4A, reference_lsr, 'acc')
+        self.assert_op(0x2A, reference_rol, 'acc')
+        self.assert_op(0x6A, reference_ror, 'acc')
+
+    def test_read_modify_write(self):
+        self.assert_op(0xE6, lambda a, value, p: (a, nz(p, (value + 1) & 0xFF), (value + 1) & 0xFF), 'zp')
+        self.assert_op(0xC6, lambda a, value, p: (a, nz(p, (value - 1) & 0xFF), (value - 1) & 0xFF), 'zp')
+        self.assert_op(0xC7, reference_dcp, 'zp')
+        self.assert_op(0xE7, reference_isc, 'zp')
+        self.assert_op(0x07, reference_slo, 'zp')
+        self.assert_op(0x27, reference_rla, 'zp')
+        self.assert_op(0x47, reference_sre, 'zp')
+        self.assert_op(0x67, reference_rra, 'zp')
+
+
+class LazyFlagsAlu(Alu):
+    cpu_class = nesrs.cpu.LazyFlagsCPU
+
+    def test_random_code(self):
+        # Random memory run as code, _p must match the eager CPU after every op
+        rng = random.Random(6502)
+        for _ in range(20):
+            data = bytes(rng.getrandbits(8) for _ in range(0x10000))
+            eager_memory = FlatMemory()
+            eager_memory.memory[:] = data
+            lazy_memory = FlatMemory()
+            lazy_memory.memory[:] = data
+            eager = nesrs.cpu.CPU(eager_memory)
+            lazy = nesrs.cpu.LazyFlagsCPU(lazy_memory)
+            eager.turn_on()
+            lazy.turn_on()
+
+            for _ in range(2000):
+                if eager._pc > 0xFFFC:
+                    break
+                eager.execute_op()
+                lazy.execute_op()
+                self.assertEqual((eager._a, eager._x, eager._y, eager._s, eager._p, eager._pc, eager.op_cycles),
+                                 (lazy._a, lazy._x, lazy._y, lazy._s, lazy._p, lazy._pc, lazy.op_cycles))
+            self.assertEqual(eager_memory.memory, lazy_memory.memory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+from .context import nesrs
+import nesrs.apu
+import nesrs.scheduler
+import unittest
+
+
+def create_apu(sample_rate=None):
+    scheduler = nesrs.scheduler.Scheduler()
+    return scheduler, nesrs.apu.APU(scheduler, sample_rate)
+
+
+def run(scheduler, apu, cycles):
+    # Runs events the way NES.run_cycles does, then catches the APU up
+    end = scheduler.cycles + cycles
+    while scheduler.next_deadline <= end:
+        scheduler.cycles = scheduler.next_deadline
+        scheduler.run_due()
+    scheduler.cycles = end
+    apu.synchronize()
+
+
+class APU(unittest.TestCase):
+
+    def test_length_counter_status(self):
+        scheduler, apu = create_apu()
+        apu.write_register(0x4017, 0x40)
+        apu.write_register(0x4015, 0x01)
+        # Length index 1: 254 half frames
+        apu.write_register(0x4003, 0x08)
+        apu.write_register(0x400F, 0x08)
+        self.assertEqual(apu.read_status(), 0x01)
+
+        apu.write_register(0x4002, 0x40)
+        run(scheduler, apu, 126 * nesrs.apu.FOUR_STEP_CYCLES)
+        self.assertEqual(apu.pulse1.length, 2)
+        run(scheduler, apu, nesrs.apu.FOUR_STEP_CYCLES)
+        self.assertEqual(apu.read_status(), 0x00)
+
+    def test_frame_irq(self):
+        scheduler, apu = create_apu()
+        irqs = []
+        apu.irq_handler = lambda asserted: irqs.append((scheduler.cycles, asserted))
+
+        # The line stays asserted until $4015 is read
+        run(scheduler, apu, 2 * nesrs.apu.FOUR_STEP_CYCLES)
+        self.assertEqual(irqs, [(29829, True)])
+        self.assertEqual(apu.read_status(), 0x40)
+        self.assertEqual(irqs[1:], [(scheduler.cycles, False)])
+        self.assertEqual(apu.read_status(), 0x00)
+
+        apu.write_register(0x4017, 0x40)
+        run(scheduler, apu, 2 * nesrs.apu.FOUR_STEP_CYCLES)
+        self.assertEqual(len(irqs), 2)
+
+    def test_dmc_fetches_and_irq(self):
+        scheduler, apu = create_apu()
+        apu.write_register(0x4017, 0x40)
+        fetches = []
+        irqs = []
+        apu.dma_reader = lambda address: fetches.append((scheduler.cycles, address)) or 0xFF
+        apu.irq_handler = lambda asserted: irqs.append((scheduler.cycles, asserted))
+
+        # IRQ enabled, rate 54 cycles per bit, 17 bytes at $C040
+        apu.write_register(0x4010, 0x8F)
+        apu.write_register(0x4012, 0x01)
+        apu.write_register(0x4013, 0x01)
+        apu.write_register(0x4015, 0x10)
+        self.assertEqual(apu.read_status(), 0x10)
+
+        run(scheduler, apu, 20 * 8 * 54)
+        self.assertEqual(fetches, [(i * 8 * 54, 0xC040 + i) for i in range(17)])
+        self.assertEqual(irqs, [(16 * 8 * 54, True)])
+        self.assertEqual(apu.read_status(), 0x80)
+        # Reading $4015 doesn't acknowledge the DMC IRQ, writing it does
+        apu.write_register(0x4015, 0x00)
+        apu.synchronize()
+        self.assertEqual(irqs[1:], [(scheduler.cycles, False)])
+        # Every bit of 0xFF adds 2 to the output level while it's below 126
+        self.assertEqual(apu.dmc.level, 126)
+
+    @unittest.skipIf(nesrs.apu.np is None, 'numpy is not installed')
+    def test_synthesis(self):
+        # Pulse 1 at 440 Hz (timer 253), constant volume 15, 50% duty
+        registers = [(0x4017, 0x40), (0x4015, 0x01), (0x4000, 0xBF), (0x4002, 0xFD), (0x4003, 0x08)]
+        whole = create_apu(44100)
+        blocks = create_apu(44100)
+        for scheduler, apu in (whole, blocks):
+            for address, value in registers:
+                apu.write_register(address, value)
+
+        run(whole[0], whole[1], 100 * 1790)
+        for _ in range(100):
+            run(blocks[0], blocks[1], 1790)
+        samples = whole[1].read_samples()
+        block_samples = blocks[1].read_samples()
+
+        self.assertEqual(samples.dtype, nesrs.apu.np.int16)
+        # 179000 CPU cycles, 0.1s
+        self.assertEqual(len(samples), 4411)
+        self.assertEqual(len(block_samples), 4411)
+        # 44 periods, the same waveform whatever the block size
+        rises = nesrs.apu.np.count_nonzero(nesrs.apu.np.diff(samples) > 0)
+        self.assertTrue(43 <= rises <= 45)
+        self.assertLess(nesrs.apu.np.count_nonzero(samples != block_samples), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from .context import nesrs, create_rom
+import nesrs.batch
+import nesrs.cartridge
+import nesrs.cpu
+import io
+import random
+import unittest
+
+
+def create_cpu_memory(prg_rom):
+    return nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom))))
+
+
+@unittest.skipIf(nesrs.batch.np is None, 'numpy is not installed')
+class BatchCPU(unittest.TestCase):
+
+    def test_same_as_cpu(self):
+        # Random code from random RAM and registers, every machine must follow the CPU op for op
+        generator = random.Random(1)
+        prg_rom = bytearray(generator.randrange(0x100) for _ in range(0x4000))
+        # JMP $C000 before the vectors, which all point to $C000
+        prg_rom[0x3FF7:0x4000] = bytes([0x4C, 0x00, 0xC0, 0x00, 0xC0, 0x00, 0xC0, 0x00, 0xC0])
+        machines = 64
+        steps = 500
+        interrupts = {generator.randrange(steps): (generator.randrange(machines), generator.choice(['nmi', 'irq']))
+                      for _ in range(40)}
+
+        batch = nesrs.batch.BatchCPU(create_cpu_memory(prg_rom), machines)
+        batch.turn_on()
+        states = []
+        for machine in range(machines):
+            ram = bytes(generator.randrange(0x100) for _ in range(0x800))
+            registers = [generator.randrange(0x100) for _ in range(5)] + [0xC000 + generator.randrange(0x4000)]
+            batch.memory[machine, 0:0x800] = list(ram)
+            (batch.a[machine], batch.x[machine], batch.y[machine], batch.s[machine], batch.p[machine],
+             batch.pc[machine]) = registers
+            states.append((ram, registers))
+
+        for step in range(steps):
+            if step in interrupts:
+                machine, interrupt = interrupts[step]
+                getattr(batch, interrupt)([machine])
+            batch.step()
+
+        for machine, (ram, registers) in enumerate(states):
+            cpu_memory = create_cpu_memory(prg_rom)
+            cpu_memory._ram[:] = ram
+            cpu = nesrs.cpu.CPU(cpu_memory)
+            cpu._a, cpu._x, cpu._y, cpu._s, cpu._p, cpu._pc = registers
+            cycles = 0
+            for step in range(steps):
+                if step in interrupts and interrupts[step][0] == machine:
+                    getattr(cpu, interrupts[step][1])()
+                cpu.execute_op()
+                cycles += cpu.op_cycles
+
+            self.assertEqual(batch.machine_state(machine), (cpu._a, cpu._x, cpu._y, cpu._s, cpu._p, cpu._pc))
+            self.assertEqual(batch.ram(machine), bytes(cpu_memory._ram))
+            self.assertEqual(batch.cycles[machine], cycles)
+
+    def test_pc_wraps(self):
+        # FFFD: LDA $EA00 with its operand in the IRQ vector, FFFF: NOP
+        # 0000: LDA #$FF, PHA, PHA, RTS to $0000
+        prg_rom = bytearray(0x4000)
+        prg_rom[0x3FFD:0x4000] = bytes([0xAD, 0x00, 0xEA])
+        ram = bytes([0xA9, 0xFF, 0x48, 0x48, 0x60]) + bytes(0x7FB)
+        pcs = [0xFFFD, 0xFFFF, 0x0000]
+
+        batch = nesrs.batch.BatchCPU(create_cpu_memory(prg_rom), len(pcs))
+        batch.turn_on()
+        cpus = []
+        for machine, pc in enumerate(pcs):
+            batch.memory[machine, 0:0x800] = list(ram)
+            batch.pc[machine] = pc
+            cpu_memory = create_cpu_memory(prg_rom)
+            cpu_memory._ram[:] = ram
+            cpu = nesrs.cpu.CPU(cpu_memory)
+            cpu.turn_on()
+            cpu.execute_op()
+            cpu._a, cpu._x, cpu._y, cpu._s, cpu._p = batch.machine_state(machine)[:5]
+            cpu._pc = pc
+            cpus.append(cpu)
+
+        for _ in range(12):
+            batch.step()
+            for machine, cpu in enumerate(cpus):
+                cpu.execute_op()
+                self.assertEqual(batch.machine_state(machine), (cpu._a, cpu._x, cpu._y, cpu._s, cpu._p, cpu._pc))
+
+
+if __name__ == '__main__':
+    unittest.main()
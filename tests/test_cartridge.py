@@ -0,0 +1,83 @@
+from .context import nesrs
+import nesrs.cartridge
+import io
+import os
+import tempfile
+import unittest
+
+
+def create_rom(header_bytes, prg_rom_size, chr_rom_size, trainer=False):
+    header = bytearray(16)
+    header[0:4] = b'NES\x1a'
+    for i, value in header_bytes.items():
+        header[i] = value
+
+    prg_rom = bytes(i & 0xFF for i in range(prg_rom_size))
+    chr_rom = bytes((i * 3) & 0xFF for i in range(chr_rom_size))
+
+    return bytes(header) + (bytes(512) if trainer else b'') + prg_rom + chr_rom
+
+
+class Cartridge(unittest.TestCase):
+
+    def test_ines_header(self):
+        rom = create_rom({4: 2, 5: 1, 6: 0x13, 7: 0x00}, 0x8000, 0x2000)
+        cartridge = nesrs.cartridge.read_ines_rom(io.BytesIO(rom))
+        header = cartridge.header
+
+        self.assertFalse(header.is_nes2)
+        self.assertEqual(header.mapper, 0x01)
+        self.assertEqual(header.mirroring, nesrs.cartridge.Mirroring.VERTICAL)
+        self.assertTrue(header.has_battery)
+        self.assertEqual(header.prg_rom_size, 0x8000)
+        self.assertEqual(header.chr_rom_size, 0x2000)
+        self.assertEqual(header.prg_nvram_size, 0x2000)
+        self.assertEqual(len(cartridge._prg_rom), 0x8000)
+        self.assertEqual(len(cartridge._prg_ram), 0x2000)
+        self.assertFalse(cartridge._is_chr_mem_ram)
+        self.assertEqual(cartridge.read_prg_memory(0x8005), 0x05)
+        self.assertEqual(cartridge.read_prg_memory(0xFFFF), 0xFF)
+
+    def test_ines_header_garbage(self):
+        rom = create_rom({4: 1, 6: 0x10, 7: 0x44, 12: ord('D'), 13: ord('u')}, 0x4000, 0)
+        cartridge = nesrs.cartridge.read_ines_rom(io.BytesIO(rom))
+
+        self.assertEqual(cartridge.header.mapper, 1)
+        self.assertTrue(cartridge._is_chr_mem_ram)
+        self.assertEqual(len(cartridge._chr_mem), 0x2000)
+        # 16Kb PRG ROM is mirrored
+        self.assertEqual(cartridge.read_prg_memory(0xC000), cartridge.read_prg_memory(0x8000))
+
+    def test_nes2_header(self):
+        rom = create_rom({4: 2, 5: 0, 6: 0x0C, 7: 0x18, 8: 0x31, 9: 0x00, 10: 0x70, 11: 0x07, 12: 0x01},
+                         0x8000, 0, trainer=True)
+        header = nesrs.cartridge.parse_ines_header(rom[0:16])
+
+        self.assertTrue(header.is_nes2)
+        self.assertEqual(header.mapper, 0x100 | 0x10)
+        self.assertEqual(header.submapper, 3)
+        self.assertEqual(header.mirroring, nesrs.cartridge.Mirroring.FOUR_SCREEN)
+        self.assertTrue(header.has_trainer)
+        self.assertEqual(header.timing, 1)
+        self.assertEqual(header.prg_ram_size, 0)
+        self.assertEqual(header.prg_nvram_size, 64 << 7)
+        self.assertEqual(header.chr_ram_size, 64 << 7)
+
+    def test_mmap(self):
+        rom = create_rom({4: 1, 5: 1}, 0x4000, 0x2000)
+        with tempfile.NamedTemporaryFile(delete=False) as rom_file:
+            rom_file.write(rom)
+        try:
+            with open(rom_file.name, 'rb') as f:
+                cartridge = nesrs.cartridge.read_ines_rom(f, use_mmap=True)
+
+            self.assertEqual(bytes(cartridge._prg_rom), rom[16:16 + 0x4000])
+            self.assertEqual(bytes(cartridge._chr_mem), rom[16 + 0x4000:])
+            del cartridge
+        finally:
+            os.remove(rom_file.name)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, nesrs.cartridge.read_ines_rom, io.BytesIO(b'NES'))
+        self.assertRaises(ValueError, nesrs.cartridge.read_ines_rom,
+                          io.BytesIO(create_rom({4: 2}, 0x4000, 0)))
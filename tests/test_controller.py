@@ -0,0 +1,84 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.controller
+import nesrs.movie
+import nesrs.nes
+import io
+import os
+import tempfile
+import unittest
+
+
+def create_nes():
+    # Reads both controllers in the NMI handler, keeps the buttons of every frame at 0x0300 + frame
+    # C000: LDA #$80, STA $2000, JMP $C005
+    # C010: LDA #$01, STA $4016, LDA #$00, STA $4016, LDX #$08
+    # C01C: LDA $4016, LSR A, ROL $00, LDA $4017, LSR A, ROL $01, DEX, BNE $C01C
+    # C02B: LDX $02, LDA $00, STA $0300,X, LDA $01, STA $0400,X, INC $02, RTI
+    prg_rom = bytearray(0x4000)
+    prg_rom[0x00:0x08] = bytes([0xA9, 0x80, 0x8D, 0x00, 0x20, 0x4C, 0x05, 0xC0])
+    prg_rom[0x10:0x2B] = bytes([
+        0xA9, 0x01, 0x8D, 0x16, 0x40, 0xA9, 0x00, 0x8D, 0x16, 0x40, 0xA2, 0x08,
+        0xAD, 0x16, 0x40, 0x4A, 0x26, 0x00, 0xAD, 0x17, 0x40, 0x4A, 0x26, 0x01, 0xCA, 0xD0, 0xF1,
+    ])
+    prg_rom[0x2B:0x3A] = bytes([
+        0xA6, 0x02, 0xA5, 0x00, 0x9D, 0x00, 0x03, 0xA5, 0x01, 0x9D, 0x00, 0x04, 0xE6, 0x02, 0x40,
+    ])
+    prg_rom[0x3FFA:0x4000] = bytes([0x10, 0xC0, 0x00, 0xC0, 0x10, 0xC0])
+
+    nes = nesrs.nes.NES(nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom))))
+    # No frame IRQ, the program doesn't acknowledge it
+    nes.cpu_memory.write_memory(0x4017, 0x40)
+    return nes
+
+
+def reverse_bits(value):
+    # ROL puts the first button read in bit 7
+    return int('{:08b}'.format(value)[::-1], 2)
+
+
+class Controller(unittest.TestCase):
+
+    def test_shift_register(self):
+        controller = nesrs.controller.Controller()
+        controller.buttons = nesrs.controller.BUTTON_A | nesrs.controller.BUTTON_START | nesrs.controller.BUTTON_RIGHT
+
+        controller.write(1)
+        self.assertEqual([controller.read() & 0x01 for _ in range(3)], [1, 1, 1])
+        controller.write(0)
+        controller.buttons = 0
+        self.assertEqual([controller.read() & 0x01 for _ in range(10)], [1, 0, 0, 1, 0, 0, 0, 1, 1, 1])
+        self.assertEqual(controller.read() & 0xE0, nesrs.controller.OPEN_BUS)
+
+    def test_record_and_play_movie(self):
+        recorder = create_nes()
+        movie = recorder.record_movie()
+        for frame in range(20):
+            recorder.controllers[0].buttons = (frame * 37) & 0xFF
+            recorder.controllers[1].buttons = frame
+            recorder.run_frame()
+        recorder.stop_recording()
+        self.assertEqual(movie.frame_count, 20)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'input.nesm')
+            movie.save(path)
+            loaded = nesrs.movie.Movie.load(path)
+            self.assertEqual(bytes(loaded.data), bytes(movie.data))
+
+            player = create_nes()
+            player.play_movie(loaded)
+            for frame in range(20):
+                player.run_frame()
+            player.stop_movie()
+            ram = bytes(player.cpu_memory._ram)
+            del loaded, player
+
+        self.assertEqual(ram, bytes(recorder.cpu_memory._ram))
+        # The first NMI is at the start of frame 1, the NMI of frame n reads the buttons of frame n
+        self.assertEqual([reverse_bits(value) for value in ram[0x300:0x313]], list(movie.port(0)[1:20]))
+        self.assertEqual([reverse_bits(value) for value in ram[0x400:0x413]], list(range(1, 20)))
+
+
+if __name__ == '__main__':
+    unittest.main()
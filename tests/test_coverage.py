@@ -0,0 +1,109 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.coverage
+import nesrs.cpu
+import nesrs.disasm
+import nesrs.profiler
+import io
+import os
+import tempfile
+import unittest
+
+from nesrs.coverage import EXECUTED, NOT_TAKEN, TAKEN
+
+# In the fixed bank of a UxROM cartridge with 3 16Kb banks
+# C000: LDX #$03
+# C002: DEX
+# C003: BNE $C002
+# C005: BEQ $C007
+# C007: LDA #$01, STA $8000, JSR $8000 (bank 1)
+# C00F: LDA #$00, STA $8000, JSR $8000 (bank 0)
+# C017: JMP $C017
+PROGRAM = bytes([
+    0xA2, 0x03, 0xCA, 0xD0, 0xFD, 0xF0, 0x00, 0xA9, 0x01, 0x8D, 0x00, 0x80, 0x20, 0x00, 0x80, 0xA9, 0x00, 0x8D,
+    0x00, 0x80, 0x20, 0x00, 0x80, 0x4C, 0x17, 0xC0,
+])
+PROGRAM_OFFSETS = [0x00, 0x02, 0x03, 0x05, 0x07, 0x09, 0x0C, 0x0F, 0x11, 0x14, 0x17]
+
+
+def create_cartridge():
+    prg_rom = bytearray(0xC000)
+    # Bank 0: RTS, bank 1: NOP, RTS
+    prg_rom[0x0000] = 0x60
+    prg_rom[0x4000:0x4002] = bytes([0xEA, 0x60])
+    prg_rom[0x8000:0x8000 + len(PROGRAM)] = PROGRAM
+    prg_rom[0xBFFC:0xBFFE] = bytes([0x00, 0xC0])
+    return nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom, mapper=2)))
+
+
+def run(cartridge, coverage):
+    cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(cartridge))
+    cpu.turn_on()
+    cpu.set_coverage(coverage)
+    cpu.run(until_pc=0xC017)
+    cpu.run(instructions=1)
+    return cpu
+
+
+class Coverage(unittest.TestCase):
+
+    def test_collect(self):
+        cartridge = create_cartridge()
+        coverage = nesrs.coverage.Coverage(len(cartridge._prg_rom))
+        run(cartridge, coverage)
+
+        # Both banks mapped at 0x8000 are told apart
+        self.assertEqual(coverage.executed_offsets(),
+                         [0x0000, 0x4000, 0x4001] + [0x8000 + offset for offset in PROGRAM_OFFSETS])
+        self.assertEqual(coverage.data[0x8003], EXECUTED | TAKEN | NOT_TAKEN)
+        self.assertEqual(coverage.data[0x8005], EXECUTED | TAKEN)
+        # The stack pushes of the JSRs are data, not code
+        self.assertEqual(coverage.data[coverage.ram_index(0x0000):], bytes(0x8000))
+
+        report = coverage.report(nesrs.disasm.disassemble(cartridge, False))
+        self.assertIn('Branch directions 3 / 4 (75.0%)', report)
+        self.assertIn('Blocks never executed 0', report)
+
+    def test_merge_and_save(self):
+        first = nesrs.coverage.Coverage(0xC000)
+        second = nesrs.coverage.Coverage(0xC000)
+        first.data[0x10] = EXECUTED
+        first.data[0x20] = EXECUTED | TAKEN
+        second.data[0x20] = EXECUTED | NOT_TAKEN
+        second.data[first.ram_index(0x0300)] = EXECUTED
+        first.merge(second)
+        self.assertEqual(first.executed_offsets(), [0x10, 0x20])
+        self.assertEqual(first.data[0x20], EXECUTED | TAKEN | NOT_TAKEN)
+        self.assertEqual(first.data[first.ram_index(0x0300)], EXECUTED)
+        with self.assertRaises(ValueError):
+            first.merge(nesrs.coverage.Coverage(0x4000))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'coverage.bin')
+            first.save(path)
+            loaded = nesrs.coverage.Coverage.load(path)
+        self.assertEqual(loaded.prg_rom_size, 0xC000)
+        self.assertEqual(loaded.data, first.data)
+
+    def test_with_profiler(self):
+        cartridge = create_cartridge()
+        coverage = nesrs.coverage.Coverage(len(cartridge._prg_rom))
+        profiler = nesrs.profiler.Profiler()
+        cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(cartridge))
+        cpu.turn_on()
+        cpu.set_profiler(profiler)
+        cpu.set_coverage(coverage)
+        cpu.run(until_pc=0xC017)
+        self.assertEqual(len(coverage.executed_offsets()), 3 + len(PROGRAM_OFFSETS) - 1)
+        self.assertEqual(profiler.pc_counts[0xC002], 3)
+
+        # Once stopped nothing is marked, the profiler keeps counting
+        cpu.set_coverage(None)
+        coverage.clear()
+        cpu.run(instructions=10)
+        self.assertEqual(coverage.executed_offsets(), [])
+        self.assertEqual(profiler.pc_counts[0xC017], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
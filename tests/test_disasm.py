@@ -0,0 +1,78 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.disasm
+import io
+import os
+import tempfile
+import unittest
+
+# C000: LDX #$08
+# C002: DEX
+# C003: BNE $C002
+# C005: JSR $C010
+# C008: JMP ($0200)
+# C010: LDA $0300,X
+# C013: RTS
+# C020: RTI (NMI)
+# C021: .DB $02 (KIL, IRQ)
+CODE = [
+    (0x0000, bytes([0xA2, 0x08, 0xCA, 0xD0, 0xFD, 0x20, 0x10, 0xC0, 0x6C, 0x00, 0x02])),
+    (0x0010, bytes([0xBD, 0x00, 0x03, 0x60])),
+    (0x0020, bytes([0x40, 0x02])),
+    (0x3FFA, bytes([0x20, 0xC0, 0x00, 0xC0, 0x21, 0xC0])),
+]
+
+
+def create_cartridge():
+    prg_rom = bytearray(0x4000)
+    for offset, data in CODE:
+        prg_rom[offset:offset + len(data)] = data
+    return nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom)))
+
+
+class Disassembly(unittest.TestCase):
+
+    def test_instruction_table(self):
+        table = nesrs.disasm.InstructionTable(create_cartridge()._prg_rom)
+        self.assertEqual(table.lengths[0:11], bytes([2, 1, 1, 2, 3, 3, 2, 2, 3, 1, 1]))
+        self.assertEqual(table.instruction(0x10), (0xBD, 0x0300, 3))
+        self.assertEqual(table.instruction(0x21), (0x02, None, 1))
+
+    def test_cfg(self):
+        disassembly = nesrs.disasm.Disassembly(create_cartridge()).build()
+        self.assertEqual(disassembly.vectors, (0xC000, 0xC020, 0xC021))
+        blocks = disassembly.blocks
+        self.assertEqual(sorted(blocks), [0xC000, 0xC002, 0xC005, 0xC008, 0xC010, 0xC020, 0xC021])
+
+        self.assertEqual(blocks[0xC000].successors, (0xC002,))
+        self.assertEqual(blocks[0xC002].exit, nesrs.disasm.BRANCH)
+        self.assertEqual(blocks[0xC002].successors, (0xC002, 0xC005))
+        self.assertEqual(blocks[0xC005].exit, nesrs.disasm.CALL)
+        self.assertEqual(blocks[0xC005].successors, (0xC010, 0xC008))
+        self.assertEqual(blocks[0xC008].exit, nesrs.disasm.INDIRECT)
+        self.assertEqual(blocks[0xC010].exit, nesrs.disasm.RETURN)
+        self.assertEqual(blocks[0xC010].instruction_count, 2)
+        self.assertEqual(blocks[0xC021].exit, nesrs.disasm.HALT)
+
+        self.assertEqual(disassembly.format_instruction(0xC003), 'C003  D0 FD     BNE $C002')
+        self.assertEqual(disassembly.format_instruction(0xC008), 'C008  6C 00 02  JMP ($0200)')
+        self.assertEqual(disassembly.format_instruction(0xC010), 'C010  BD 00 03  LDA $0300,X')
+        self.assertIn('C021  02        .DB $02', list(disassembly.listing()))
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            built = nesrs.disasm.disassemble(create_cartridge(), directory)
+            path = os.path.join(directory, built.rom_hash + '.cfg')
+            self.assertTrue(os.path.exists(path))
+
+            cached = nesrs.disasm.disassemble(create_cartridge(), directory)
+            self.assertEqual(cached.vectors, built.vectors)
+            self.assertEqual({address: (block.bank, block.end, block.instruction_count, block.exit, block.successors)
+                              for address, block in cached.blocks.items()},
+                             {address: (block.bank, block.end, block.instruction_count, block.exit, block.successors)
+                              for address, block in built.blocks.items()})
+            self.assertEqual(list(cached.listing()), list(built.listing()))
+
+
+if __name__ == '__main__':
+    unittest.main()
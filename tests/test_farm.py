@@ -0,0 +1,74 @@
+from .context import nesrs, create_rom
+import nesrs.coverage
+import nesrs.farm
+import os
+import tempfile
+import unittest
+
+
+def write_rom(directory, name, value):
+    # Stores value to 0x0010 and spins
+    prg_rom = bytearray(0x4000)
+    prg_rom[0:7] = bytes([0xA9, value, 0x85, 0x10, 0x4C, 0x04, 0xC0])
+    prg_rom[0x3FFA:0x4000] = bytes([0x04, 0xC0, 0x00, 0xC0, 0x04, 0xC0])
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as rom_file:
+        rom_file.write(create_rom(prg_rom))
+    return path
+
+
+class WorkerKiller(object):
+    # A ROM path whose open ends the worker process
+
+    def __fspath__(self):
+        os._exit(1)
+
+
+class Farm(unittest.TestCase):
+
+    def test_results_and_failures(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rom_1 = write_rom(directory, '1.nes', 1)
+            rom_2 = write_rom(directory, '2.nes', 2)
+            jobs = [
+                nesrs.farm.Job(rom_1, frames=2),
+                nesrs.farm.Job(rom_2, cycles=1000),
+                nesrs.farm.Job(rom_1, frames=2, input_script=[(1, 0x0010, 0x07)]),
+                nesrs.farm.Job(os.path.join(directory, 'missing.nes'), frames=1),
+                nesrs.farm.Job(rom_1, frames=1000, timeout=0),
+            ]
+            results = list(nesrs.farm.run_farm(jobs, max_workers=2))
+
+        self.assertEqual(len(results), 5)
+        ok = [result for result in results if result.is_ok]
+        failed = sorted(result.error.split(':')[0] for result in results if not result.is_ok)
+        self.assertEqual(len(ok), 3)
+        self.assertEqual(failed, ['FileNotFoundError', 'JobTimeout'])
+
+        frames = [result for result in ok if result.job.frames == 2]
+        self.assertEqual(frames[0].frames, 2)
+        self.assertNotEqual(frames[0].ram_hash, frames[1].ram_hash)
+        cycles = [result for result in ok if result.job.cycles is not None][0]
+        self.assertGreaterEqual(cycles.cycles, 1000)
+
+    def test_dead_worker(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rom = write_rom(directory, '1.nes', 1)
+            jobs = [nesrs.farm.Job(rom, frames=1) for _ in range(3)]
+            jobs += [nesrs.farm.Job(WorkerKiller(), frames=1)]
+            jobs += [nesrs.farm.Job(rom, frames=1) for _ in range(6)]
+            results = list(nesrs.farm.run_farm(jobs, max_workers=2))
+
+        self.assertEqual(len(results), 10)
+        failed = [result for result in results if not result.is_ok]
+        self.assertEqual(len(failed), 1)
+        self.assertIs(failed[0].job, jobs[3])
+        self.assertEqual(failed[0].error, 'Worker process died')
+
+    def test_coverage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result = nesrs.farm.run_job(nesrs.farm.Job(write_rom(directory, '1.nes', 1), frames=1, coverage=True))
+
+        self.assertTrue(result.is_ok)
+        coverage = nesrs.coverage.Coverage(0x4000, bytearray(result.coverage))
+        self.assertEqual(coverage.executed_offsets(), [0x0000, 0x0002, 0x0004])
@@ -0,0 +1,95 @@
+from .context import nesrs, create_rom
+import nesrs.fuzz
+import nesrs.movie
+import nesrs.nes
+import nesrs.cartridge
+import os
+import random
+import tempfile
+import unittest
+
+# C000: LDA #$01, STA $4016, LDA #$00, STA $4016
+# C00A: LDA $4016
+# C00D: AND #$01
+# C00F: BEQ $C000
+# C011: KIL, when A is pressed
+PROGRAM = bytes([
+    0xA9, 0x01, 0x8D, 0x16, 0x40, 0xA9, 0x00, 0x8D, 0x16, 0x40, 0xAD, 0x16, 0x40, 0x29, 0x01, 0xF0, 0xEF, 0x02,
+])
+
+
+def write_rom(directory):
+    prg_rom = bytearray(0x4000)
+    prg_rom[0:len(PROGRAM)] = PROGRAM
+    prg_rom[0x3FFA:0x4000] = bytes([0x00, 0xC0, 0x00, 0xC0, 0x00, 0xC0])
+    path = os.path.join(directory, 'fuzz.nes')
+    with open(path, 'wb') as rom_file:
+        rom_file.write(create_rom(prg_rom))
+    return path
+
+
+class Fuzz(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.target = nesrs.fuzz.FuzzTarget(write_rom(self.directory.name), warmup_frames=2, max_frames=24,
+                                            snapshot_interval=4)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_run_and_minimize(self):
+        fuzzer = nesrs.fuzz.Fuzzer(self.target)
+        self.assertEqual(fuzzer.run(bytes(20))[1], None)
+
+        data = bytes([0x00] * 9 + [0x90, 0x00, 0x0B] + [0x00] * 8)
+        _, crash = fuzzer.run(data)
+        self.assertEqual(crash, (0x02, 0xC011, 11))
+        # Forks from the snapshot before frame 8 of the parent
+        _, crash = fuzzer.run(data[:8] + bytes([0x01]) + data[9:], data, 8)
+        self.assertEqual(crash, (0x02, 0xC011, 8))
+
+        data, frame = fuzzer.minimize(data, 0x02, 0xC011)
+        self.assertEqual(data, bytes(11) + bytes([0x01]))
+        self.assertEqual(frame, 11)
+
+        # The movie crashes from power on
+        crash = nesrs.fuzz.Crash(self.target, data, 0x02, 0xC011, frame)
+        path = os.path.join(self.directory.name, 'crash.nesm')
+        crash.movie().save(path)
+        with open(self.target.rom_path, 'rb') as rom_file:
+            nes = nesrs.nes.NES(nesrs.cartridge.read_ines_rom(rom_file))
+        nes.play_movie(nesrs.movie.Movie.load(path))
+        nes.cpu.unsupported_op_handler = self.raise_crash
+        with self.assertRaises(nesrs.fuzz.GuestCrash):
+            for _ in range(self.target.warmup_frames + frame + 1):
+                nes.run_frame()
+        self.assertEqual(nes.ppu.frame, self.target.warmup_frames + frame)
+
+    def raise_crash(self, op_code):
+        raise nesrs.fuzz.GuestCrash(op_code, 0)
+
+    def test_mutate(self):
+        rng = random.Random(1)
+        corpus = [bytes(40), bytes(range(60))]
+        for _ in range(200):
+            data, first_changed = nesrs.fuzz.mutate(corpus[rng.randrange(2)], rng, corpus, 2, 30)
+            self.assertTrue(2 <= len(data) <= 60)
+            self.assertEqual(len(data) % 2, 0)
+            self.assertLessEqual(first_changed, len(data) // 2)
+
+    def test_campaign(self):
+        campaign = nesrs.fuzz.Campaign(self.target, initial_frames=4)
+        campaign.run(100, max_workers=2, seed=1, round_iterations=25)
+
+        self.assertEqual(campaign.runs, 100)
+        self.assertEqual(list(campaign.crashes), [(0x02, 0xC011)])
+        crash = campaign.crashes[0x02, 0xC011]
+        self.assertEqual(crash.data, bytes(crash.frame) + bytes([0x01]))
+        # The branch both ways and the KIL
+        self.assertEqual(campaign.coverage.data[0x000F], 0x07)
+        self.assertEqual(campaign.coverage.data[0x0011], 0x01)
+
+
+if __name__ == '__main__':
+    unittest.main()
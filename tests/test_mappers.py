@@ -0,0 +1,139 @@
+from .context import nesrs
+import nesrs.cartridge
+import nesrs.cpu
+import nesrs.mappers
+import io
+import unittest
+
+
+def create_cpu_memory(mapper, prg_rom_16k_banks, chr_rom_8k_banks):
+    # Every byte of an 8Kb PRG bank holds the bank number, every byte of a 1Kb CHR bank holds the bank number
+    header = bytearray(16)
+    header[0:4] = b'NES\x1a'
+    header[4] = prg_rom_16k_banks
+    header[5] = chr_rom_8k_banks
+    header[6] = (mapper & 0x0F) << 4
+    header[7] = mapper & 0xF0
+    prg_rom = b''.join(bytes([i]) * 0x2000 for i in range(prg_rom_16k_banks * 2))
+    chr_rom = b''.join(bytes([i]) * 0x400 for i in range(chr_rom_8k_banks * 8))
+
+    cartridge = nesrs.cartridge.read_ines_rom(io.BytesIO(bytes(header) + prg_rom + chr_rom))
+    return nesrs.cpu.CpuMemory(cartridge), cartridge
+
+
+def prg_banks(cpu_memory):
+    return [cpu_memory.read_memory(address) for address in (0x8000, 0xA000, 0xC000, 0xE000)]
+
+
+def chr_banks(cartridge):
+    return [cartridge.read_chr_memory(address) for address in range(0, 0x2000, 0x400)]
+
+
+def mmc1_write(cpu_memory, address, value):
+    for i in range(5):
+        cpu_memory.write_memory(address, (value >> i) & 0x01)
+
+
+class Mappers(unittest.TestCase):
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, create_cpu_memory, 0xFF, 1, 1)
+
+    def test_nrom(self):
+        cpu_memory, cartridge = create_cpu_memory(0, 1, 1)
+        self.assertIs(type(cartridge), nesrs.cartridge.Cartridge)
+        self.assertEqual(prg_banks(cpu_memory), [0, 1, 0, 1])
+        cpu_memory.write_memory(0x6000, 0x42)
+        self.assertEqual(cpu_memory.read_memory(0x6000), 0x42)
+
+    def test_mmc1(self):
+        cpu_memory, cartridge = create_cpu_memory(1, 8, 4)
+        self.assertIsInstance(cartridge, nesrs.mappers.MMC1)
+        # Power on: last bank fixed at 0xC000
+        self.assertEqual(prg_banks(cpu_memory)[2:], [14, 15])
+
+        mmc1_write(cpu_memory, 0xE000, 0x03)
+        self.assertEqual(prg_banks(cpu_memory), [6, 7, 14, 15])
+
+        # 32Kb mode, 4Kb CHR mode, vertical mirroring
+        mmc1_write(cpu_memory, 0x8000, 0x12)
+        self.assertEqual(prg_banks(cpu_memory), [4, 5, 6, 7])
+        self.assertEqual(cartridge.mirroring, nesrs.cartridge.Mirroring.VERTICAL)
+        mmc1_write(cpu_memory, 0xA000, 0x03)
+        mmc1_write(cpu_memory, 0xC000, 0x05)
+        self.assertEqual(chr_banks(cartridge), [12, 13, 14, 15, 20, 21, 22, 23])
+
+        # Reset bit restores the fixed last bank mode
+        cpu_memory.write_memory(0x8000, 0x80)
+        self.assertEqual(prg_banks(cpu_memory), [6, 7, 14, 15])
+
+        # PRG RAM disable
+        cpu_memory.write_memory(0x6000, 0x42)
+        mmc1_write(cpu_memory, 0xE000, 0x13)
+        self.assertEqual(cpu_memory.read_memory(0x6000), 0)
+        mmc1_write(cpu_memory, 0xE000, 0x03)
+        self.assertEqual(cpu_memory.read_memory(0x6000), 0x42)
+
+    def test_uxrom(self):
+        cpu_memory, cartridge = create_cpu_memory(2, 8, 0)
+        self.assertEqual(prg_banks(cpu_memory), [0, 1, 14, 15])
+        cpu_memory.write_memory(0x8000, 5)
+        self.assertEqual(prg_banks(cpu_memory), [10, 11, 14, 15])
+
+    def test_cnrom(self):
+        cpu_memory, cartridge = create_cpu_memory(3, 2, 4)
+        cpu_memory.write_memory(0x8000, 2)
+        self.assertEqual(chr_banks(cartridge), list(range(16, 24)))
+
+    def test_mmc3(self):
+        cpu_memory, cartridge = create_cpu_memory(4, 8, 8)
+        self.assertEqual(prg_banks(cpu_memory)[2:], [14, 15])
+
+        cpu_memory.write_memory(0x8000, 0x06)
+        cpu_memory.write_memory(0x8001, 3)
+        cpu_memory.write_memory(0x8000, 0x07)
+        cpu_memory.write_memory(0x8001, 9)
+        self.assertEqual(prg_banks(cpu_memory), [3, 9, 14, 15])
+
+        # PRG mode 1 swaps 0x8000 and 0xC000
+        cpu_memory.write_memory(0x8000, 0x46)
+        self.assertEqual(prg_banks(cpu_memory), [14, 9, 3, 15])
+
+        for register, bank in enumerate([10, 20, 30, 31, 32, 33]):
+            cpu_memory.write_memory(0x8000, register)
+            cpu_memory.write_memory(0x8001, bank)
+        self.assertEqual(chr_banks(cartridge), [10, 11, 20, 21, 30, 31, 32, 33])
+        cpu_memory.write_memory(0x8000, 0x80)
+        self.assertEqual(chr_banks(cartridge), [30, 31, 32, 33, 10, 11, 20, 21])
+
+        cpu_memory.write_memory(0xA000, 0x01)
+        self.assertEqual(cartridge.mirroring, nesrs.cartridge.Mirroring.HORIZONTAL)
+
+    def test_mmc3_irq(self):
+        cpu_memory, cartridge = create_cpu_memory(4, 2, 1)
+        irqs = []
+        cartridge.irq_handler = irqs.append
+
+        cpu_memory.write_memory(0xC000, 3)
+        cpu_memory.write_memory(0xC001, 0)
+        cpu_memory.write_memory(0xE001, 0)
+        for scanline in range(4):
+            cartridge.clock_scanline()
+        self.assertEqual(irqs, [True])
+        # /IRQ is held low until $E000 is written
+        for scanline in range(4):
+            cartridge.clock_scanline()
+        self.assertEqual(irqs, [True])
+
+        cpu_memory.write_memory(0xE000, 0)
+        self.assertEqual(irqs, [True, False])
+        for scanline in range(4):
+            cartridge.clock_scanline()
+        self.assertEqual(irqs, [True, False])
+
+    def test_axrom(self):
+        cpu_memory, cartridge = create_cpu_memory(7, 8, 0)
+        self.assertEqual(prg_banks(cpu_memory), [0, 1, 2, 3])
+        cpu_memory.write_memory(0x8000, 0x13)
+        self.assertEqual(prg_banks(cpu_memory), [12, 13, 14, 15])
+        self.assertEqual(cartridge.mirroring, nesrs.cartridge.Mirroring.SINGLE_SCREEN_HIGH)
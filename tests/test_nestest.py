@@ -1,6 +1,8 @@
 from .context import nesrs
 import nesrs.cartridge
 import nesrs.cpu
+import nesrs.recompiler
+import nesrs.trace
 import os
 import unittest
 
@@ -36,6 +38,42 @@ def get_nestest_log_lines(nestest_file):
     return content
 
 
+def get_actual_log_line(cpu, cycles):
+    actual_log_line = ''
+    actual_log_line += to_hex(cpu._pc)
+    actual_log_line += '    '
+    actual_log_line += 'A:' + to_hex(cpu._a)
+    actual_log_line += ' '
+    actual_log_line += 'X:' + to_hex(cpu._x)
+    actual_log_line += ' '
+    actual_log_line += 'Y:' + to_hex(cpu._y)
+    actual_log_line += ' '
+    actual_log_line += 'P:' + to_hex(cpu._p)
+    actual_log_line += ' '
+    actual_log_line += 'SP:' + to_hex(cpu._s)
+    actual_log_line += ' '
+    actual_log_line += 'CYC:' + pad(cycles)
+
+    return actual_log_line
+
+
+def create_nestest_cpu():
+    with open(os.path.join(os.path.dirname(__file__), 'nestest.nes'), 'rb') as nestest_rom_file:
+        cartridge = nesrs.cartridge.read_ines_rom(nestest_rom_file)
+
+    cpu_memory = nesrs.cpu.CpuMemory(cartridge)
+    cpu = nesrs.cpu.CPU(cpu_memory)
+
+    cpu._a = 0x00
+    cpu._x = 0x00
+    cpu._y = 0x00
+    cpu._s = 0xFD
+    cpu._p = 0x24
+    cpu._pc = 0xC000
+
+    return cpu
+
+
 class Nestest(unittest.TestCase):
 
     def test_log(self):
@@ -80,3 +118,38 @@ class Nestest(unittest.TestCase):
 
             cpu.execute_op()
 
+    def test_log_recompiled(self):
+        # The state after every block must match the log line block.instruction_count ops further
+        nestest_log_lines = []
+        with open(os.path.join(os.path.dirname(__file__), 'nestest.log'), 'r') as nestest_file:
+            nestest_log_lines = get_nestest_log_lines(nestest_file)
+
+        cpu = create_nestest_cpu()
+        recompiler = nesrs.recompiler.Recompiler(cpu)
+
+        cycles = 0
+        x = 0
+        while x < len(nestest_log_lines):
+            self.assertEqual(get_actual_log_line(cpu, cycles), nestest_log_lines[x])
+
+            block = recompiler.block_at(cpu._pc)
+            recompiler.execute_block()
+            x += block.instruction_count if block is not None else 1
+            cycles += cpu.op_cycles * 3
+            cycles %= 341
+
+    def test_trace(self):
+        # The same check through the trace subsystem, the cycles are counted from the first op
+        with open(os.path.join(os.path.dirname(__file__), 'nestest.log'), 'r') as nestest_file:
+            expected = nesrs.trace.Trace.from_nestest(nestest_file)
+
+        cpu = create_nestest_cpu()
+        recorder = nesrs.trace.TraceRecorder(len(expected))
+
+        cycles = 0
+        for _ in range(len(expected)):
+            recorder.record(cpu, cycles)
+            cpu.execute_op()
+            cycles += cpu.op_cycles
+
+        self.assertIsNone(nesrs.trace.first_divergence(recorder.trace(), expected))
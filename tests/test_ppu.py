@@ -0,0 +1,199 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.nes
+import nesrs.ppu
+import nesrs.ppu_numpy
+import io
+import unittest
+
+
+def create_nes(ppu_mode, chr_rom=True, recompile=False):
+    # CPU spins in JMP $C000, NMI handler is a bare RTI at $C010
+    prg_rom = bytearray(0x4000)
+    prg_rom[0:3] = bytes([0x4C, 0x00, 0xC0])
+    prg_rom[0x10] = 0x40
+    prg_rom[0x3FFA:0x4000] = bytes([0x10, 0xC0, 0x00, 0xC0, 0x10, 0xC0])
+    chr_mem = bytes(((i * 37) ^ (i >> 3)) & 0xFF for i in range(0x2000)) if chr_rom else b''
+    rom = create_rom(prg_rom, chr_mem=chr_mem, vertical_mirroring=True)
+
+    return nesrs.nes.NES(nesrs.cartridge.read_ines_rom(io.BytesIO(rom)), ppu_mode, recompile=recompile)
+
+
+def fill_screen(ppu):
+    write = ppu.write_register
+    write(0x2006, 0x3F)
+    write(0x2006, 0x00)
+    for i in range(0x20):
+        write(0x2007, (i * 5 + 1) & 0x3F)
+    write(0x2006, 0x20)
+    write(0x2006, 0x00)
+    for i in range(0x800):
+        write(0x2007, (i * 7) & 0xFF)
+    write(0x2003, 0x00)
+    for i in range(64):
+        attributes = (i & 0x03) | (0x20 if i & 0x04 else 0) | (0x40 if i & 0x08 else 0) | (0x80 if i & 0x10 else 0)
+        for value in (i * 3 + 10, i, attributes, i * 4):
+            write(0x2004, value & 0xFF)
+    write(0x2005, 3)
+    write(0x2005, 5)
+    write(0x2000, nesrs.ppu.CTRL_NMI | nesrs.ppu.CTRL_SPRITE_TABLE)
+    write(0x2001, 0x1E)
+
+
+class PPU(unittest.TestCase):
+
+    def test_fast_and_dot_modes_render_the_same_frame(self):
+        framebuffers = []
+        for ppu_mode in (nesrs.ppu.PpuMode.FAST, nesrs.ppu.PpuMode.DOT):
+            nes = create_nes(ppu_mode)
+            fill_screen(nes.ppu)
+            nes.run_frame()
+            nes.run_frame()
+            framebuffers.append(bytes(nes.ppu.framebuffer))
+
+            self.assertEqual(nes.ppu.frame, 2)
+            self.assertNotEqual(nes.ppu._status & nesrs.ppu.STATUS_SPRITE_0_HIT, 0)
+
+        self.assertEqual(framebuffers[0], framebuffers[1])
+        self.assertGreater(len(set(framebuffers[0])), 16)
+
+    @unittest.skipIf(nesrs.ppu_numpy.np is None, 'numpy is not installed')
+    def test_numpy_mode_renders_the_same_frames(self):
+        framebuffers = []
+        for ppu_mode in (nesrs.ppu.PpuMode.FAST, nesrs.ppu.PpuMode.NUMPY):
+            nes = create_nes(ppu_mode)
+            fill_screen(nes.ppu)
+            nes.run_frame()
+            nes.run_frame()
+            frames = [bytes(nes.ppu.framebuffer)]
+
+            # Scroll split, palette write and sprite size change in the middle of the frame
+            while nes.ppu._scanline != 100:
+                nes.step()
+            nes.ppu.write_register(0x2005, 37)
+            nes.ppu.write_register(0x2005, 90)
+            nes.ppu.write_register(0x2006, 0x3F)
+            nes.ppu.write_register(0x2006, 0x05)
+            nes.ppu.write_register(0x2007, 0x16)
+            nes.ppu.write_register(0x2000, nesrs.ppu.CTRL_NMI | nesrs.ppu.CTRL_SPRITE_SIZE_16)
+            nes.ppu.write_register(0x2001, 0x18)
+            nes.run_frame()
+            frames.append(bytes(nes.ppu.framebuffer))
+            frames.append(nes.ppu._status & (nesrs.ppu.STATUS_SPRITE_0_HIT | nesrs.ppu.STATUS_SPRITE_OVERFLOW))
+            framebuffers.append(frames)
+
+        self.assertEqual(framebuffers[0], framebuffers[1])
+
+    @unittest.skipIf(nesrs.ppu_numpy.np is None, 'numpy is not installed')
+    def test_tile_cache_follows_chr_ram_writes(self):
+        ppu = create_nes(nesrs.ppu.PpuMode.NUMPY, chr_rom=False).ppu
+        tile_cache = ppu._tile_cache
+        tile_cache.update()
+        self.assertEqual(tile_cache.tiles[0x101].max(), 0)
+
+        # Tile 1 of the second pattern table, row 2: low plane 0x81, high plane 0x01
+        ppu.write_register(0x2006, 0x10)
+        ppu.write_register(0x2006, 0x12)
+        ppu.write_register(0x2007, 0x81)
+        ppu.write_register(0x2006, 0x10)
+        ppu.write_register(0x2006, 0x1A)
+        ppu.write_register(0x2007, 0x01)
+        tile_cache.update()
+
+        self.assertEqual(tile_cache.tiles[tile_cache.pattern_tables[0x101]][2].tolist(), [1, 0, 0, 0, 0, 0, 0, 3])
+        self.assertEqual(tile_cache.tiles[0x101].sum(), 4)
+
+    def test_frame_timing_and_nmi(self):
+        nes = create_nes(nesrs.ppu.PpuMode.FAST)
+        nmis = []
+        nes.ppu.nmi_handler = lambda: nmis.append(nes.cycles)
+        nes.ppu.write_register(0x2000, nesrs.ppu.CTRL_NMI)
+        nes.run_frame()
+        nes.run_frame()
+        nes.run_frame()
+
+        self.assertEqual(len(nmis), 3)
+        # 262 * 341 / 3 CPU cycles per frame with rendering disabled
+        self.assertTrue(abs((nmis[2] - nmis[1]) - 29780.67) <= 3)
+
+    def test_vram_access(self):
+        ppu = create_nes(nesrs.ppu.PpuMode.FAST).ppu
+
+        ppu.write_register(0x2006, 0x24)
+        ppu.write_register(0x2006, 0x10)
+        ppu.write_register(0x2007, 0x55)
+        # Vertical mirroring: 0x2C10 mirrors 0x2410
+        ppu.write_register(0x2006, 0x2C)
+        ppu.write_register(0x2006, 0x10)
+        ppu.read_register(0x2007)
+        self.assertEqual(ppu.read_register(0x2007), 0x55)
+
+        # 0x3F10 mirrors 0x3F00, palette reads are not buffered
+        ppu.write_register(0x2006, 0x3F)
+        ppu.write_register(0x2006, 0x10)
+        ppu.write_register(0x2007, 0x2A)
+        ppu.write_register(0x2006, 0x3F)
+        ppu.write_register(0x2006, 0x00)
+        self.assertEqual(ppu.read_register(0x2007) & 0x3F, 0x2A)
+
+        # Increment by 32
+        ppu.write_register(0x2000, nesrs.ppu.CTRL_INCREMENT_32)
+        ppu.write_register(0x2006, 0x20)
+        ppu.write_register(0x2006, 0x00)
+        ppu.write_register(0x2007, 0x01)
+        self.assertEqual(ppu._v, 0x2020)
+
+    def test_status_read_clears_vblank_and_toggle(self):
+        ppu = create_nes(nesrs.ppu.PpuMode.FAST).ppu
+        ppu._status = nesrs.ppu.STATUS_VBLANK
+        ppu.write_register(0x2005, 0x10)
+
+        self.assertNotEqual(ppu.read_register(0x2002) & nesrs.ppu.STATUS_VBLANK, 0)
+        self.assertEqual(ppu.read_register(0x2002) & nesrs.ppu.STATUS_VBLANK, 0)
+        self.assertEqual(ppu._w, 0)
+
+    def test_oam_dma(self):
+        # 0300: LDA #$02
+        # 0302: STA $4014
+        nes = create_nes(nesrs.ppu.PpuMode.FAST)
+        memory = nes.cpu_memory
+        for i in range(0x100):
+            memory.write_memory(0x0200 + i, (i * 3) & 0xFF)
+        for i, value in enumerate([0xA9, 0x02, 0x8D, 0x14, 0x40]):
+            memory.write_memory(0x0300 + i, value)
+        nes.step()
+        nes.ppu.write_register(0x2003, 0x10)
+        nes.cpu._pc = 0x0300
+        nes.step()
+
+        cycles = nes.cycles
+        self.assertEqual(nes.step(), 4)
+        # 513 stall cycles, plus one when the DMA starts on an odd cycle
+        self.assertEqual(nes.cycles - cycles, 4 + 513 + (cycles & 1))
+        # Copied starting at OAMADDR
+        self.assertEqual(bytes(nes.ppu._oam), bytes(memory._ram[0x2F0:0x300]) + bytes(memory._ram[0x200:0x2F0]))
+        self.assertEqual(nes.ppu._oam_address, 0x10)
+
+    def test_oam_dma_indexed(self):
+        # 0300: LDX #$14
+        # 0302: STA $4000,X
+        # 0305: JMP $0300
+        for recompile in (False, True):
+            nes = create_nes(nesrs.ppu.PpuMode.FAST, recompile=recompile)
+            for i, value in enumerate([0xA2, 0x14, 0x9D, 0x00, 0x40, 0x4C, 0x00, 0x03]):
+                nes.cpu_memory.write_memory(0x0300 + i, value)
+            nes.step()
+
+            # Starting on both even and odd cycles
+            stalls = set()
+            for _ in range(2):
+                nes.cpu._pc = 0x0300
+                cycles = nes.cycles
+                nes.step()
+                self.assertEqual(nes.step(), 5)
+                # The op takes 5 cycles, the DMA takes one more when it starts on an odd cycle
+                stall = nes.cycles - cycles - 2 - 5
+                self.assertEqual(stall, 513 + ((cycles + 2 + 5) & 1))
+                stalls.add(stall)
+                nes.step()
+            self.assertEqual(stalls, {513, 514})
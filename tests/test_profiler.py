@@ -0,0 +1,57 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.cpu
+import nesrs.profiler
+import io
+import unittest
+
+# C000: LDX #$00
+# C002: LDA $02F0,X
+# C005: INX
+# C006: BNE $C002
+# C008: JMP $C008
+PROGRAM = bytes([0xA2, 0x00, 0xBD, 0xF0, 0x02, 0xE8, 0xD0, 0xFA, 0x4C, 0x08, 0xC0])
+
+
+def create_cpu():
+    prg_rom = bytearray(0x4000)
+    prg_rom[0:len(PROGRAM)] = PROGRAM
+    prg_rom[0x3FFC:0x3FFE] = bytes([0x00, 0xC0])
+
+    cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom)))))
+    cpu.turn_on()
+    return cpu
+
+
+class Profiler(unittest.TestCase):
+
+    def test_counts(self):
+        cpu = create_cpu()
+        profiler = nesrs.profiler.Profiler()
+        cpu.set_profiler(profiler)
+        cycles, _ = cpu.run(until_pc=0xC008)
+
+        self.assertEqual(profiler.instructions, 1 + 3 * 256)
+        self.assertEqual(profiler.cycles, cycles)
+        self.assertEqual(profiler.top_pcs(1), [(0xC002, 256, 4 * 256 + 240)])
+        self.assertEqual(profiler.top_op_codes(1), [(0xBD, 256, 4 * 256 + 240)])
+        self.assertEqual(profiler.pc_op_codes[0xC006], 0xD0)
+        # X from 0x10 on crosses into page 3
+        self.assertEqual(profiler.page_crossing_cycles(), 240)
+        self.assertEqual(profiler.branch_ratios(), {0xD0: (256, 255)})
+        self.assertEqual(profiler.mode_counts()[nesrs.cpu.CpuAddressingMode.IMPL], (256, 2 * 256))
+        self.assertIn('Page crossing cycles: 240', profiler.report())
+
+        # Stopping leaves the counters as they were
+        cpu.set_profiler(None)
+        cpu.run(instructions=10)
+        self.assertEqual(profiler.instructions, 1 + 3 * 256)
+
+        profiler.clear()
+        cpu.set_profiler(profiler)
+        cpu.run(instructions=10)
+        self.assertEqual(profiler.top_pcs(), [(0xC008, 10, 30)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.coverage
+import nesrs.cpu
+import nesrs.nes
+import nesrs.recompiler
+import io
+import random
+import unittest
+
+
+def create_cpu(prg_rom, mapper=0):
+    cartridge = nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom, mapper)))
+    cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(cartridge))
+    cpu.turn_on()
+
+    return cpu
+
+
+def cpu_state(cpu):
+    return cpu._a, cpu._x, cpu._y, cpu._s, cpu._p, cpu._pc, bytes(cpu._cpu_memory._ram)
+
+
+class Recompiler(unittest.TestCase):
+
+    def assert_same_as_interpreter(self, prg_rom, mapper=0, blocks=5000, ram=None, pc=None, irq_line=False):
+        interpreter = create_cpu(prg_rom, mapper)
+        cpu = create_cpu(prg_rom, mapper)
+        if irq_line:
+            interpreter.set_irq_line(nesrs.cpu.IRQ_SOURCE_CARTRIDGE, True)
+            cpu.set_irq_line(nesrs.cpu.IRQ_SOURCE_CARTRIDGE, True)
+        if ram is not None:
+            interpreter._cpu_memory._ram[:] = ram
+            cpu._cpu_memory._ram[:] = ram
+        if pc is not None:
+            interpreter._pc = pc
+            cpu._pc = pc
+        recompiler = nesrs.recompiler.Recompiler(cpu)
+
+        interpreter_cycles = 0
+        cycles = 0
+        for _ in range(blocks):
+            recompiler.execute_block()
+            cycles += cpu.op_cycles
+            while interpreter_cycles < cycles:
+                interpreter.execute_op()
+                interpreter_cycles += interpreter.op_cycles
+
+            self.assertEqual(interpreter_cycles, cycles)
+            self.assertEqual(cpu_state(interpreter), cpu_state(cpu))
+
+        return recompiler
+
+    def test_loop(self):
+        # C000: LDX #$00
+        # C002: INX
+        # C003: BNE $C002
+        # C005: JMP $C005
+        prg_rom = bytearray(0x4000)
+        prg_rom[0:8] = bytes([0xA2, 0x00, 0xE8, 0xD0, 0xFD, 0x4C, 0x05, 0xC0])
+        prg_rom[0x3FFC:0x3FFE] = bytes([0x00, 0xC0])
+
+        recompiler = self.assert_same_as_interpreter(prg_rom, blocks=300)
+        self.assertEqual(recompiler.compiled_blocks, 3)
+        self.assertEqual(recompiler.block_at(0xC000).instruction_count, 3)
+
+    def test_self_modifying_code(self):
+        # C000: LDX #$00
+        # C002: LDA $C100,X
+        # C005: STA $0200,X
+        # C008: INX
+        # C009: BNE $C002
+        # C00B: JMP $0200
+        # 0200: LDA #$01
+        # 0202: INC $0201
+        # 0205: JMP $0200
+        prg_rom = bytearray(0x4000)
+        prg_rom[0:14] = bytes([0xA2, 0x00, 0xBD, 0x00, 0xC1, 0x9D, 0x00, 0x02, 0xE8, 0xD0, 0xF7, 0x4C, 0x00, 0x02])
+        prg_rom[0x100:0x108] = bytes([0xA9, 0x01, 0xEE, 0x01, 0x02, 0x4C, 0x00, 0x02])
+        prg_rom[0x3FFC:0x3FFE] = bytes([0x00, 0xC0])
+
+        recompiler = self.assert_same_as_interpreter(prg_rom, blocks=2000)
+        self.assertGreater(recompiler.recompiled_blocks, 0)
+
+    def test_pc_wraps(self):
+        # FF00: NOPs up to FFFF, 0000: JMP $FF80
+        # FF80: LDX #$00, NOPs, FFFE: BNE (not taken), 0000: JMP $FF80
+        ram = bytearray(0x800)
+        ram[0:3] = bytes([0x4C, 0x80, 0xFF])
+        prg_rom = bytearray([0xEA] * 0x4000)
+        self.assert_same_as_interpreter(prg_rom, blocks=20, ram=ram, pc=0xFF00)
+
+        prg_rom[0x3F80:0x3F82] = bytes([0xA2, 0x00])
+        prg_rom[0x3FFE:0x4000] = bytes([0xD0, 0x10])
+        self.assert_same_as_interpreter(prg_rom, blocks=20, ram=ram, pc=0xFF00)
+
+    def test_irq_line(self):
+        # C000: CLI, SEI, JMP $C000 and C006: PLP, PHP, JMP $C006 with the /IRQ line held
+        # C100: INC $10, RTI
+        prg_rom = bytearray(0x4000)
+        prg_rom[0:12] = bytes([0x58, 0x78, 0x4C, 0x00, 0xC0, 0x00, 0x28, 0x08, 0x4C, 0x06, 0xC0, 0x00])
+        prg_rom[0x100:0x103] = bytes([0xE6, 0x10, 0x40])
+        prg_rom[0x3FFC:0x4000] = bytes([0x00, 0xC0, 0x00, 0xC1])
+
+        recompiler = self.assert_same_as_interpreter(prg_rom, blocks=40, irq_line=True)
+        self.assertGreater(recompiler._cpu_memory._ram[0x10], 0)
+
+        # The P pulled first has I clear
+        ram = bytearray(0x800)
+        ram[0x100] = 0x20
+        recompiler = self.assert_same_as_interpreter(prg_rom, blocks=40, ram=ram, pc=0xC006, irq_line=True)
+        self.assertGreater(recompiler._cpu_memory._ram[0x10], 0)
+
+    def test_prg_ram_enable(self):
+        # 6000: NOP, JMP $6000 in the PRG RAM of an MMC1 cartridge
+        cpu = create_cpu(bytearray(0x8000), mapper=1)
+        for i, value in enumerate([0xEA, 0x4C, 0x00, 0x60]):
+            cpu._cpu_memory.write_memory(0x6000 + i, value)
+        cpu._pc = 0x6000
+        recompiler = nesrs.recompiler.Recompiler(cpu)
+        recompiler.execute_block()
+
+        # Enabled again, PRG RAM maps the same page views and the block is reused
+        cartridge = cpu._cpu_memory._cartridge
+        for _ in range(10):
+            cartridge._set_prg_ram_enabled(False)
+            cartridge._set_prg_ram_enabled(True)
+            recompiler.execute_block()
+        self.assertEqual(cpu._pc, 0x6000)
+        self.assertEqual(len(recompiler._blocks), 1)
+        self.assertEqual(recompiler.compiled_blocks, 1)
+
+    def test_random_code(self):
+        # Random PRG ROM and RAM run as code, with UxROM bank switches on stores to the PRG ROM
+        rng = random.Random(6502)
+        for _ in range(20):
+            prg_rom = bytearray(rng.getrandbits(8) for _ in range(0x10000))
+            ram = bytearray(rng.getrandbits(8) for _ in range(0x800))
+            self.assert_same_as_interpreter(prg_rom, mapper=2, blocks=3000, ram=ram)
+
+    def test_nes(self):
+        # C000: INC $00,X
+        # C002: INX
+        # C003: JMP $C000
+        prg_rom = bytearray(0x4000)
+        prg_rom[0:6] = bytes([0xF6, 0x00, 0xE8, 0x4C, 0x00, 0xC0])
+        prg_rom[0x3FFC:0x3FFE] = bytes([0x00, 0xC0])
+        rom = create_rom(prg_rom)
+
+        interpreted = nesrs.nes.NES(nesrs.cartridge.read_ines_rom(io.BytesIO(rom)))
+        recompiled = nesrs.nes.NES(nesrs.cartridge.read_ines_rom(io.BytesIO(rom)), recompile=True)
+        for _ in range(3):
+            interpreted.run_frame()
+            recompiled.run_frame()
+        while interpreted.cycles < recompiled.cycles:
+            interpreted.step()
+
+        self.assertEqual(interpreted.cycles, recompiled.cycles)
+        self.assertEqual(cpu_state(interpreted.cpu), cpu_state(recompiled.cpu))
+
+    def test_coverage(self):
+        # C000: INX
+        # C001: BNE $C000
+        # C003: JMP $C000
+        prg_rom = bytearray(0x4000)
+        prg_rom[0:6] = bytes([0xE8, 0xD0, 0xFD, 0x4C, 0x00, 0xC0])
+        prg_rom[0x3FFC:0x3FFE] = bytes([0x00, 0xC0])
+        nes = nesrs.nes.NES(nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom))), recompile=True)
+        coverage = nesrs.coverage.Coverage(len(prg_rom))
+        nes.cpu.set_coverage(coverage)
+        nes.run_frame()
+
+        # Marked by the interpreter, nothing is compiled
+        self.assertEqual(coverage.executed_offsets(), [0x0000, 0x0001, 0x0003])
+        self.assertEqual(coverage.data[0x0001], nesrs.coverage.EXECUTED | nesrs.coverage.TAKEN |
+                         nesrs.coverage.NOT_TAKEN)
+        self.assertEqual(nes.recompiler.compiled_blocks, 0)
+
+        nes.cpu.set_coverage(None)
+        nes.run_frame()
+        self.assertGreater(nes.recompiler.compiled_blocks, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
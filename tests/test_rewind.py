@@ -0,0 +1,42 @@
+from .context import nesrs
+from .test_state import create_nes
+import nesrs.rewind
+import unittest
+
+
+class Rewind(unittest.TestCase):
+
+    def test_seek_restores_recorded_frames(self):
+        nes = create_nes()
+        rewind = nesrs.rewind.Rewind(nes, interval=2, keyframe_interval=4)
+        states = {}
+        for i in range(20):
+            rewind.run_frame()
+            if nes.ppu.frame % 2 == 0:
+                states[nes.ppu.frame] = nes.save_state()
+
+        self.assertEqual(rewind.frames, sorted(states))
+        self.assertEqual(rewind.seek(13), 12)
+        self.assertEqual(nes.save_state(), states[12])
+        self.assertEqual(rewind.frames[-1], 12)
+
+        # Recording continues from the restored frame
+        rewind.run_frame()
+        rewind.run_frame()
+        self.assertEqual(nes.save_state(), states[14])
+        self.assertEqual(rewind.rewind(6), 8)
+        self.assertEqual(nes.save_state(), states[8])
+
+        with self.assertRaises(ValueError):
+            rewind.seek(1)
+
+    def test_memory_is_bounded(self):
+        nes = create_nes()
+        rewind = nesrs.rewind.Rewind(nes, keyframe_interval=5, max_bytes=4096)
+        for i in range(40):
+            rewind.run_frame()
+
+        self.assertLessEqual(rewind.size, 4096)
+        self.assertEqual(rewind.frames[-1], 40)
+        self.assertGreater(rewind.frames[0], 1)
+        self.assertEqual(rewind.seek(rewind.frames[0]), rewind.frames[0])
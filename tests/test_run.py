@@ -0,0 +1,161 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.cpu
+import nesrs.recompiler
+import io
+import unittest
+
+# C000: LDX #$00
+# C002: INX
+# C003: BNE $C002
+# C005: JMP $C005
+PROGRAM = [0xA2, 0x00, 0xE8, 0xD0, 0xFD, 0x4C, 0x05, 0xC0]
+
+
+def create_cpu():
+    prg_rom = bytearray(0x4000)
+    prg_rom[0:len(PROGRAM)] = bytes(PROGRAM)
+    prg_rom[0x3FFC] = 0x00
+    prg_rom[0x3FFD] = 0xC0
+    cartridge = nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom)))
+    cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(cartridge))
+    cpu.turn_on()
+
+    return cpu
+
+
+class Run(unittest.TestCase):
+
+    def test_instructions(self):
+        cpu = create_cpu()
+        self.assertEqual(cpu.run(instructions=5), (12, nesrs.cpu.StopReason.INSTRUCTIONS))
+        self.assertEqual(cpu._x, 2)
+        self.assertEqual(cpu._pc, 0xC002)
+
+    def test_cycles(self):
+        cpu = create_cpu()
+        cycles, reason = cpu.run(cycles=100)
+        self.assertEqual(reason, nesrs.cpu.StopReason.CYCLES)
+        self.assertTrue(100 <= cycles < 103)
+
+    def test_until_pc(self):
+        cpu = create_cpu()
+        cycles, reason = cpu.run_until(0xC005)
+        self.assertEqual(reason, nesrs.cpu.StopReason.PC)
+        self.assertEqual(cpu._x, 0)
+        # LDX + 256 * INX + 255 taken BNE + 1 not taken BNE
+        self.assertEqual(cycles, 2 + 256 * 2 + 255 * 3 + 2)
+
+    def test_breakpoints(self):
+        cpu = create_cpu()
+        cpu.run(breakpoints=[0xC003])
+        self.assertEqual(cpu._x, 1)
+        cpu.run(breakpoints=[0xC003])
+        self.assertEqual(cpu._x, 2)
+
+    def test_predicate(self):
+        cpu = create_cpu()
+        cycles, reason = cpu.run_until(lambda c: c._x == 0x10, cycles=10000)
+        self.assertEqual(reason, nesrs.cpu.StopReason.PREDICATE)
+        self.assertEqual(cpu._x, 0x10)
+
+    def test_interrupt_priority(self):
+        cpu = create_cpu()
+        cpu._p &= ~nesrs.cpu.I_FLAG
+        cpu.irq()
+        cpu.nmi()
+        self.assertEqual(cpu.pending_interrupt, nesrs.cpu.InterruptType.NMI)
+
+        # The IRQ requested with the NMI stays pending, then is dropped as the NMI disabled interrupts
+        cpu.execute_op()
+        self.assertEqual(cpu.pending_interrupt, nesrs.cpu.InterruptType.IRQ)
+        cpu.execute_op()
+        self.assertIsNone(cpu.pending_interrupt)
+        self.assertEqual(cpu._s, 0xFF - 3)
+
+        cpu.nmi()
+        cpu.reset()
+        self.assertEqual(cpu.pending_interrupt, nesrs.cpu.InterruptType.RESET)
+        cpu.execute_op()
+        self.assertEqual(cpu._pc, 0xC000)
+        self.assertIsNone(cpu.pending_interrupt)
+
+    def test_irq_line(self):
+        # C000: SEI, NOP, CLI, NOP, JMP $C004
+        # C010: RTI (the IRQ handler)
+        prg_rom = bytearray(0x4000)
+        prg_rom[0:7] = bytes([0x78, 0xEA, 0x58, 0xEA, 0x4C, 0x04, 0xC0])
+        prg_rom[0x10] = 0x40
+        prg_rom[0x3FFC:0x4000] = bytes([0x00, 0xC0, 0x10, 0xC0])
+        cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom)))))
+        cpu.turn_on()
+        cpu._p &= ~nesrs.cpu.I_FLAG
+
+        # Asserted while interrupts are disabled, the IRQ is taken right after CLI
+        cpu.execute_op()
+        cpu.set_irq_line(nesrs.cpu.IRQ_SOURCE_APU, True)
+        self.assertEqual(cpu.run(until_pc=0xC010, instructions=10)[1], nesrs.cpu.StopReason.PC)
+        self.assertEqual(cpu._s, 0xFF - 3)
+        self.assertEqual([cpu._cpu_memory.read_memory(0x01FF), cpu._cpu_memory.read_memory(0x01FE)], [0xC0, 0x03])
+
+        # Still asserted after RTI, the handler runs again until the source is acknowledged
+        cpu.execute_op()
+        cpu.execute_op()
+        self.assertEqual(cpu._pc, 0xC010)
+        cpu.set_irq_line(nesrs.cpu.IRQ_SOURCE_APU, False)
+        cpu.execute_op()
+        cpu.execute_op()
+        self.assertEqual(cpu._pc, 0xC004)
+        self.assertIsNone(cpu.pending_interrupt)
+
+    def test_nmi_before_irq(self):
+        # C000: NOP, JMP $C000
+        # C100: NOP, RTI (the NMI handler)
+        # C200: RTI (the IRQ handler)
+        prg_rom = bytearray(0x4000)
+        prg_rom[0:4] = bytes([0xEA, 0x4C, 0x00, 0xC0])
+        prg_rom[0x100:0x102] = bytes([0xEA, 0x40])
+        prg_rom[0x200] = 0x40
+        prg_rom[0x3FFA:0x4000] = bytes([0x00, 0xC1, 0x00, 0xC0, 0x00, 0xC2])
+        cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom)))))
+        cpu.turn_on()
+        cpu._p &= ~nesrs.cpu.I_FLAG
+
+        # The NMI handler runs with interrupts disabled, the held IRQ is taken after its RTI
+        cpu.set_irq_line(nesrs.cpu.IRQ_SOURCE_APU, True)
+        cpu.nmi()
+        pcs = []
+        while len(pcs) < 4:
+            cpu.execute_op()
+            if cpu.op_cycles:
+                pcs.append(cpu._pc)
+        self.assertEqual(pcs, [0xC100, 0xC101, 0xC000, 0xC200])
+
+    def test_pc_wraps(self):
+        # C000: LDA #$FF, PHA, PHA, RTS to $0000
+        # 0000: LDX #$42, JMP $C006
+        # C006: JMP $FFFF, LDA # at $FFFF with its operand at $0000
+        prg_rom = bytearray(0x4000)
+        prg_rom[0:9] = bytes([0xA9, 0xFF, 0x48, 0x48, 0x60, 0xEA, 0x4C, 0xFF, 0xFF])
+        prg_rom[0x3FFC:0x4000] = bytes([0x00, 0xC0, 0x00, 0xA9])
+        for recompile in (False, True):
+            cpu = nesrs.cpu.CPU(nesrs.cpu.CpuMemory(nesrs.cartridge.read_ines_rom(io.BytesIO(create_rom(prg_rom)))))
+            cpu.turn_on()
+            for address, value in enumerate([0xA2, 0x42, 0x4C, 0x06, 0xC0]):
+                cpu._cpu_memory.write_memory(address, value)
+            # Recompiled blocks run up to the RTS at once
+            execute = nesrs.recompiler.Recompiler(cpu).execute_block if recompile else cpu.execute_op
+            for _ in range(1 if recompile else 4):
+                execute()
+            self.assertEqual(cpu._pc, 0x0000)
+            for _ in range(1 if recompile else 2):
+                execute()
+            self.assertEqual((cpu._pc, cpu._x), (0xC006, 0x42))
+
+            execute()
+            execute()
+            self.assertEqual((cpu._pc, cpu._a), (0x0001, 0xA2))
+
+    def test_no_stop_condition(self):
+        cpu = create_cpu()
+        self.assertRaises(ValueError, cpu.run)
@@ -0,0 +1,148 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.nes
+import nesrs.ppu
+import nesrs.scheduler
+import io
+import unittest
+
+
+def create_nes(mapper, code, ppu_mode=nesrs.ppu.PpuMode.FAST):
+    # code is (address, bytes) pairs in 0xC000 - 0xFFFF, 32Kb PRG ROM so the MMC3 fixed bank holds 0xE000 - 0xFFFF
+    prg_rom = bytearray(0x8000)
+    for address, data in code:
+        prg_rom[address - 0x8000:address - 0x8000 + len(data)] = data
+    rom = create_rom(prg_rom, mapper, chr_mem=bytes(range(256)) * 32)
+
+    return nesrs.nes.NES(nesrs.cartridge.read_ines_rom(io.BytesIO(rom)), ppu_mode)
+
+
+# Reset code, the APU frame IRQ is not part of the interleaving run_frames_per_op reproduces
+INHIBIT_FRAME_IRQ = bytes([
+    0xA9, 0x40, 0x8D, 0x17, 0x40,      # E300 LDA #$40, STA $4017
+    0x4C, 0x00, 0xE0,                  # E305 JMP $E000
+])
+
+# NMI and rendering on, polls $2002 and changes the scroll and the mask mid-frame
+NMI_PROGRAM = [
+    (0xE000, bytes([
+        0xA9, 0x80, 0x8D, 0x00, 0x20,  # E000 LDA #$80, STA $2000
+        0xA9, 0x1E, 0x8D, 0x01, 0x20,  # E005 LDA #$1E, STA $2001
+        0xAD, 0x02, 0x20,              # E00A LDA $2002
+        0x85, 0x10,                    # E00D STA $10
+        0xE6, 0x00,                    # E00F INC $00
+        0xA5, 0x00,                    # E011 LDA $00
+        0x8D, 0x05, 0x20,              # E013 STA $2005
+        0x29, 0x1F,                    # E016 AND #$1F
+        0x09, 0x08,                    # E018 ORA #$08
+        0x8D, 0x01, 0x20,              # E01A STA $2001
+        0x4C, 0x0A, 0xE0,              # E01D JMP $E00A
+    ])),
+    (0xE100, bytes([
+        0xE6, 0x01,                    # E100 INC $01
+        0xAD, 0x02, 0x20,              # E102 LDA $2002
+        0x85, 0x02,                    # E105 STA $02
+        0x40,                          # E107 RTI
+    ])),
+    (0xE300, INHIBIT_FRAME_IRQ),
+    (0xFFFA, bytes([0x00, 0xE1, 0x00, 0xE3, 0x00, 0xE2])),
+]
+
+# MMC3 scanline IRQ every 16 scanlines, acknowledged and re-enabled by the handler
+IRQ_PROGRAM = [
+    (0xE000, bytes([
+        0xA9, 0x18, 0x8D, 0x01, 0x20,  # E000 LDA #$18, STA $2001
+        0xA9, 0x10, 0x8D, 0x00, 0xC0,  # E005 LDA #$10, STA $C000
+        0x8D, 0x01, 0xC0,              # E00A STA $C001
+        0x8D, 0x01, 0xE0,              # E00D STA $E001
+        0x58,                          # E010 CLI
+        0xE6, 0x00,                    # E011 INC $00
+        0x4C, 0x11, 0xE0,              # E013 JMP $E011
+    ])),
+    (0xE200, bytes([
+        0xE6, 0x03,                    # E200 INC $03
+        0xA5, 0x00,                    # E202 LDA $00
+        0x8D, 0x05, 0x20,              # E204 STA $2005
+        0x8D, 0x00, 0xE0,              # E207 STA $E000
+        0x8D, 0x01, 0xE0,              # E20A STA $E001
+        0x40,                          # E20D RTI
+    ])),
+    (0xE300, INHIBIT_FRAME_IRQ),
+    (0xFFFA, bytes([0x00, 0xE1, 0x00, 0xE3, 0x00, 0xE2])),
+]
+
+
+def run_frames_per_op(nes, frames):
+    # The PPU run after every op, the interleaving the scheduler has to reproduce
+    cpu = nes.cpu
+    ppu = nes.ppu
+    cycles = 0
+    for _ in range(frames):
+        frame = ppu.frame
+        while ppu.frame == frame:
+            cpu.execute_op()
+            ppu.run(cpu.op_cycles * 3)
+            cycles += cpu.op_cycles
+
+    return cycles
+
+
+def nes_state(nes):
+    cpu = nes.cpu
+    return (cpu._a, cpu._x, cpu._y, cpu._s, cpu._p, cpu._pc, bytes(nes.cpu_memory._ram), bytes(nes.ppu.framebuffer),
+            nes.ppu.save_state())
+
+
+class Scheduler(unittest.TestCase):
+
+    def test_events_in_order(self):
+        scheduler = nesrs.scheduler.Scheduler()
+        fired = []
+        scheduler.schedule(30, lambda: fired.append('c'))
+        scheduler.schedule(10, lambda: fired.append('a'))
+        scheduler.schedule(10, lambda: fired.append('b'))
+        cancelled = scheduler.schedule(5, lambda: fired.append('cancelled'))
+        scheduler.cancel(cancelled)
+        self.assertEqual(scheduler.next_deadline, 10)
+
+        scheduler.cycles = 29
+        scheduler.run_due()
+        self.assertEqual(fired, ['a', 'b'])
+        self.assertEqual(scheduler.next_deadline, 30)
+
+        scheduler.schedule_in(1, lambda: fired.append('d'))
+        scheduler.cycles = 30
+        scheduler.run_due()
+        self.assertEqual(fired, ['a', 'b', 'c', 'd'])
+        self.assertEqual(scheduler.next_deadline, nesrs.scheduler.NEVER)
+
+    def assert_same_as_per_op(self, mapper, code, ppu_mode=nesrs.ppu.PpuMode.FAST, frames=4):
+        scheduled = create_nes(mapper, code, ppu_mode)
+        per_op = create_nes(mapper, code, ppu_mode)
+
+        cycles = sum(scheduled.run_frame() for _ in range(frames))
+
+        self.assertEqual(cycles, run_frames_per_op(per_op, frames))
+        self.assertEqual(scheduled.cycles, cycles)
+        self.assertEqual(nes_state(scheduled), nes_state(per_op))
+
+    def test_nmi(self):
+        self.assert_same_as_per_op(0, NMI_PROGRAM)
+        self.assert_same_as_per_op(0, NMI_PROGRAM, nesrs.ppu.PpuMode.DOT, frames=2)
+
+    def test_mapper_irq(self):
+        self.assert_same_as_per_op(4, IRQ_PROGRAM)
+
+    def test_run_cycles(self):
+        nes = create_nes(4, IRQ_PROGRAM)
+        self.assertGreaterEqual(nes.run_cycles(50000), 50000)
+        self.assertEqual(nes.scheduler.next_deadline, nes.scheduler._events[0][0])
+
+        per_op = create_nes(4, IRQ_PROGRAM)
+        while per_op.cycles < nes.cycles:
+            per_op.step()
+        self.assertEqual(nes_state(nes), nes_state(per_op))
+
+
+if __name__ == '__main__':
+    unittest.main()
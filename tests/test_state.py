@@ -0,0 +1,72 @@
+from .context import nesrs, create_rom
+import nesrs.cartridge
+import nesrs.nes
+import nesrs.state
+import io
+import unittest
+
+
+def create_nes():
+    # MMC3 with CHR RAM, the program keeps switching PRG banks and writing RAM, PRG RAM and CHR RAM
+    prg_rom = bytearray(0x10000)
+    program = bytes([
+        0xE8,              # C000 INX
+        0x8E, 0x00, 0x80,  # C001 STX $8000
+        0x8E, 0x01, 0x80,  # C004 STX $8001
+        0x86, 0x20,        # C007 STX $20
+        0x8E, 0x00, 0x61,  # C009 STX $6100
+        0x8E, 0x06, 0x20,  # C00C STX $2006
+        0x8E, 0x07, 0x20,  # C00F STX $2007
+        0x4C, 0x00, 0xC0,  # C012 JMP $C000
+    ])
+    prg_rom[0xC000:0xC000 + len(program)] = program
+    prg_rom[0xFFFA:0x10000] = bytes([0x00, 0xC0, 0x00, 0xC0, 0x00, 0xC0])
+    rom = create_rom(prg_rom, mapper=4, chr_banks=0)
+
+    return nesrs.nes.NES(nesrs.cartridge.read_ines_rom(io.BytesIO(rom)))
+
+
+class SaveState(unittest.TestCase):
+
+    def test_restore_replays_the_same_run(self):
+        nes = create_nes()
+        for i in range(5000):
+            nes.step()
+        state = nes.save_state()
+        for i in range(5000):
+            nes.step()
+        expected = nes.save_state()
+
+        restored = create_nes()
+        restored.load_state(state)
+        self.assertEqual(restored.save_state(), state)
+        for i in range(5000):
+            restored.step()
+        self.assertEqual(restored.save_state(), expected)
+        self.assertEqual(restored.cpu_memory.read_memory(0x0020), nes.cpu_memory.read_memory(0x0020))
+        self.assertEqual(restored.cpu_memory.read_memory(0x8000), nes.cpu_memory.read_memory(0x8000))
+
+    def test_component_states(self):
+        nes = create_nes()
+        nes.run_frame()
+        cpu_state = nes.cpu.save_state()
+        ram = bytes(nes.cpu_memory._ram)
+
+        nes.run_frame()
+        nes.cpu.load_state(cpu_state)
+        self.assertEqual(nes.cpu.save_state(), cpu_state)
+        self.assertNotEqual(bytes(nes.cpu_memory._ram), ram)
+
+        with self.assertRaises(ValueError):
+            nes.cpu_memory.load_state(cpu_state)
+
+    def test_version_and_truncation(self):
+        state = bytearray(create_nes().save_state())
+
+        state[4] = nesrs.state.STATE_VERSION + 1
+        with self.assertRaises(ValueError):
+            create_nes().load_state(state)
+
+        state[4] = nesrs.state.STATE_VERSION
+        with self.assertRaises(ValueError):
+            create_nes().load_state(state[:-10])
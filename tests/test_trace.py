@@ -0,0 +1,92 @@
+from .context import nesrs
+from .test_scheduler import NMI_PROGRAM, create_nes
+import nesrs.trace
+import os
+import tempfile
+import unittest
+
+NESTEST_LINES = [
+    'C000  4C F5 C5  JMP $C5F5                       A:00 X:00 Y:00 P:24 SP:FD CYC:  0 SL:241',
+    'C5F5  A2 00     LDX #$00                        A:00 X:00 Y:00 P:24 SP:FD CYC:  9 SL:241',
+    'C5F7  86 00     STX $00 = 00                    A:00 X:00 Y:00 P:26 SP:FD CYC: 15 SL:241',
+    'C5F9  86 10     STX $10 = 00                    A:00 X:00 Y:00 P:26 SP:FD CYC: 24 SL:241',
+]
+
+
+def trace_frames(frames, recorder):
+    nes = create_nes(0, NMI_PROGRAM)
+    nes.set_trace(recorder)
+    for _ in range(frames):
+        nes.run_frame()
+    return nes
+
+
+class Trace(unittest.TestCase):
+
+    def test_record(self):
+        recorder = nesrs.trace.TraceRecorder(100000)
+        nes = trace_frames(2, recorder)
+        trace = recorder.trace()
+
+        self.assertEqual(len(trace), recorder.count)
+        cycle, pc, a, x, y, p, s = trace[0]
+        self.assertEqual(pc, 0xE300)
+        # Cycles only go forward, the last op ends before the frame did
+        self.assertEqual(sorted(record[0] for record in trace), [record[0] for record in trace])
+        self.assertLess(trace[-1][0], nes.cycles)
+
+    def test_ring(self):
+        whole = nesrs.trace.TraceRecorder(100000)
+        ring = nesrs.trace.TraceRecorder(1000)
+        trace_frames(1, whole)
+        trace_frames(1, ring)
+
+        # The ring keeps the last records
+        self.assertEqual(ring.count, whole.count)
+        self.assertEqual(bytes(ring.trace().data), bytes(whole.trace().data[-1000 * nesrs.trace.TRACE_RECORD.size:]))
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.bin')
+            recorder = nesrs.trace.TraceRecorder(1000, path)
+            trace_frames(1, recorder)
+            self.assertTrue(recorder.is_full)
+            recorded = recorder.trace()
+            recorder.close()
+            self.assertEqual(len(recorded), 1000)
+
+            expected = nesrs.trace.TraceRecorder(100000)
+            trace_frames(1, expected)
+            trace = nesrs.trace.Trace.load(path)
+            self.assertEqual(len(trace), 1000)
+            self.assertEqual(bytes(trace.data), bytes(expected.trace().data[:1000 * nesrs.trace.TRACE_RECORD.size]))
+            self.assertEqual(bytes(trace.data), bytes(recorded.data))
+            trace.data.release()
+            trace._mmap.close()
+
+    def test_nestest_round_trip(self):
+        trace = nesrs.trace.Trace.from_nestest(NESTEST_LINES)
+        self.assertEqual([record[0] for record in trace], [0, 3, 5, 8])
+        self.assertEqual(trace[2], (5, 0xC5F7, 0x00, 0x00, 0x00, 0x26, 0xFD))
+
+        lines = list(trace.to_nestest())
+        self.assertEqual(lines[1][48:], 'A:00 X:00 Y:00 P:24 SP:FD PPU:  0,  9 CYC:3')
+        self.assertEqual(bytes(nesrs.trace.Trace.from_nestest(lines).data), bytes(trace.data))
+
+    def test_first_divergence(self):
+        recorder = nesrs.trace.TraceRecorder(100000)
+        trace_frames(1, recorder)
+        trace = recorder.trace()
+        self.assertIsNone(nesrs.trace.first_divergence(trace, trace))
+
+        for index in (0, 1, 1234, len(trace) - 1):
+            data = bytearray(trace.data)
+            data[index * nesrs.trace.TRACE_RECORD.size + 9] ^= 0x01
+            self.assertEqual(nesrs.trace.first_divergence(trace, nesrs.trace.Trace(data)), index)
+
+        prefix = nesrs.trace.Trace(trace.data[:100 * nesrs.trace.TRACE_RECORD.size])
+        self.assertEqual(nesrs.trace.first_divergence(prefix, trace), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()